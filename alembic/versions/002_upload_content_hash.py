@@ -0,0 +1,31 @@
+"""Add content checksum to uploads
+
+Revision ID: 002_upload_content_hash
+Revises: 001_full_schema
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002_upload_content_hash'
+down_revision = '001_full_schema'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        ALTER TABLE `uploads`
+            ADD COLUMN `content_sha256` char(64) COLLATE utf8mb4_unicode_ci DEFAULT NULL AFTER `duration_seconds`,
+            ADD KEY `idx_upload_sha256` (`content_sha256`)
+    """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        ALTER TABLE `uploads`
+            DROP KEY `idx_upload_sha256`,
+            DROP COLUMN `content_sha256`
+    """)
@@ -0,0 +1,43 @@
+"""Add resumable upload sessions
+
+Revision ID: 003_upload_sessions
+Revises: 002_upload_content_hash
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '003_upload_sessions'
+down_revision = '002_upload_content_hash'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS `upload_sessions` (
+            `id` char(36) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `user_id` int unsigned NOT NULL,
+            `note_id` int unsigned DEFAULT NULL,
+            `original_file_name` varchar(255) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `file_type` varchar(100) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `storage_path` varchar(512) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `total_size_bytes` bigint unsigned NOT NULL,
+            `received_bytes` bigint unsigned NOT NULL DEFAULT '0',
+            `content_sha256` char(64) COLLATE utf8mb4_unicode_ci DEFAULT NULL,
+            `status` enum('uploading','completed','finalized') COLLATE utf8mb4_unicode_ci NOT NULL DEFAULT 'uploading',
+            `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            `updated_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`id`),
+            KEY `idx_user_status` (`user_id`,`status`),
+            KEY `note_id` (`note_id`),
+            CONSTRAINT `upload_sessions_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE,
+            CONSTRAINT `upload_sessions_ibfk_2` FOREIGN KEY (`note_id`) REFERENCES `notes` (`id`) ON DELETE SET NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Resumable chunked uploads'
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `upload_sessions`")
@@ -0,0 +1,36 @@
+"""Add AI result cache
+
+Revision ID: 004_ai_result_cache
+Revises: 003_upload_sessions
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004_ai_result_cache'
+down_revision = '003_upload_sessions'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS `ai_result_cache` (
+            `id` bigint NOT NULL AUTO_INCREMENT,
+            `cache_key` char(64) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `prompt_version` varchar(64) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `result` json NOT NULL,
+            `hit_count` int NOT NULL DEFAULT '0',
+            `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+            `last_hit_at` timestamp NULL DEFAULT NULL,
+            PRIMARY KEY (`id`),
+            UNIQUE KEY `cache_key` (`cache_key`),
+            KEY `idx_prompt_version` (`prompt_version`)
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Generated notes keyed by input content'
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `ai_result_cache`")
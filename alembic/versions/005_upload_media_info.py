@@ -0,0 +1,45 @@
+"""Store probed media info on uploads
+
+Revision ID: 005_upload_media_info
+Revises: 004_ai_result_cache
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005_upload_media_info'
+down_revision = '004_ai_result_cache'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        ALTER TABLE `uploads`
+            MODIFY COLUMN `duration_seconds` decimal(10,2) unsigned DEFAULT NULL,
+            ADD COLUMN `codec` varchar(50) COLLATE utf8mb4_unicode_ci DEFAULT NULL AFTER `duration_seconds`,
+            ADD COLUMN `bitrate` int unsigned DEFAULT NULL AFTER `codec`
+    """)
+    op.execute("""
+        ALTER TABLE `upload_sessions`
+            ADD COLUMN `duration_seconds` decimal(10,2) unsigned DEFAULT NULL AFTER `content_sha256`,
+            ADD COLUMN `codec` varchar(50) COLLATE utf8mb4_unicode_ci DEFAULT NULL AFTER `duration_seconds`,
+            ADD COLUMN `bitrate` int unsigned DEFAULT NULL AFTER `codec`
+    """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        ALTER TABLE `upload_sessions`
+            DROP COLUMN `bitrate`,
+            DROP COLUMN `codec`,
+            DROP COLUMN `duration_seconds`
+    """)
+    op.execute("""
+        ALTER TABLE `uploads`
+            DROP COLUMN `bitrate`,
+            DROP COLUMN `codec`,
+            MODIFY COLUMN `duration_seconds` int unsigned DEFAULT NULL
+    """)
@@ -0,0 +1,31 @@
+"""Store speech optimization results on uploads
+
+Revision ID: 006_upload_speech_optimization
+Revises: 005_upload_media_info
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '006_upload_speech_optimization'
+down_revision = '005_upload_media_info'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        ALTER TABLE `uploads`
+            ADD COLUMN `speech_removed_seconds` decimal(10,2) DEFAULT NULL AFTER `bitrate`,
+            ADD COLUMN `speech_timestamp_map` json DEFAULT NULL AFTER `speech_removed_seconds`
+    """)
+
+
+def downgrade() -> None:
+    op.execute("""
+        ALTER TABLE `uploads`
+            DROP COLUMN `speech_timestamp_map`,
+            DROP COLUMN `speech_removed_seconds`
+    """)
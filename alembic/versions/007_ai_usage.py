@@ -0,0 +1,51 @@
+"""Record token and latency usage of AI calls
+
+Revision ID: 007_ai_usage
+Revises: 006_upload_speech_optimization
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '007_ai_usage'
+down_revision = '006_upload_speech_optimization'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS `ai_usage` (
+            `id` bigint NOT NULL AUTO_INCREMENT,
+            `note_id` int DEFAULT NULL,
+            `chat_message_id` int DEFAULT NULL,
+            `user_id` int DEFAULT NULL,
+            `call_type` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `model` varchar(64) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `provider` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `prompt_tokens` int NOT NULL DEFAULT '0',
+            `audio_tokens` int NOT NULL DEFAULT '0',
+            `output_tokens` int NOT NULL DEFAULT '0',
+            `total_tokens` int NOT NULL DEFAULT '0',
+            `finish_reason` varchar(20) COLLATE utf8mb4_unicode_ci DEFAULT NULL,
+            `queue_wait_seconds` decimal(10,2) DEFAULT NULL,
+            `rate_limit_wait_seconds` decimal(10,2) NOT NULL DEFAULT '0.00',
+            `upload_seconds` decimal(10,2) DEFAULT NULL,
+            `generation_seconds` decimal(10,2) NOT NULL,
+            `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (`id`),
+            KEY `idx_created_at` (`created_at`),
+            KEY `idx_note_id` (`note_id`),
+            KEY `idx_chat_message_id` (`chat_message_id`),
+            KEY `idx_user_id` (`user_id`),
+            CONSTRAINT `ai_usage_ibfk_1` FOREIGN KEY (`note_id`) REFERENCES `notes` (`id`) ON DELETE SET NULL,
+            CONSTRAINT `ai_usage_ibfk_2` FOREIGN KEY (`chat_message_id`) REFERENCES `chat_messages` (`id`) ON DELETE SET NULL,
+            CONSTRAINT `ai_usage_ibfk_3` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE SET NULL
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Tokens and latency of every AI call'
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `ai_usage`")
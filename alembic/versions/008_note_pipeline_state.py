@@ -0,0 +1,35 @@
+"""Persist note pipeline state so retries resume at the failed stage
+
+Revision ID: 008_note_pipeline_state
+Revises: 007_ai_usage
+Create Date: 2026-10-16
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '008_note_pipeline_state'
+down_revision = '007_ai_usage'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.execute("""
+        CREATE TABLE IF NOT EXISTS `note_pipeline_states` (
+            `note_id` int NOT NULL,
+            `stage` varchar(20) COLLATE utf8mb4_unicode_ci NOT NULL,
+            `state` json NOT NULL,
+            `attempts` int NOT NULL DEFAULT '0',
+            `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+            `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            PRIMARY KEY (`note_id`),
+            KEY `idx_updated_at` (`updated_at`),
+            CONSTRAINT `note_pipeline_states_ibfk_1` FOREIGN KEY (`note_id`) REFERENCES `notes` (`id`) ON DELETE CASCADE
+        ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci COMMENT='Last completed processing stage of each note'
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TABLE IF EXISTS `note_pipeline_states`")
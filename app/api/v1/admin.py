@@ -17,6 +17,8 @@ from app.db.models import (
 )
 from app.services.monitoring_service import monitoring_service
 from app.services.queue_service import queue_manager
+from app.services.usage_service import usage_service
+from app.services.chat_concurrency import chat_concurrency
 
 router = APIRouter()
 
@@ -337,6 +339,69 @@ async def get_detailed_queue_status(
         )
 
 
+@router.get("/dashboard/speech-optimization")
+async def get_speech_optimization_stats(
+    hours: int = 24,
+    current_user: User = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    دریافت آمار حذف سکوت و بهینه‌سازی صوت
+
+    Args:
+        hours: بازه زمانی (ساعت)
+
+    Returns:
+        ثانیه‌های حذف‌شده از صوت‌های آپلودی
+    """
+    check_admin_access(current_user)
+
+    return await monitoring_service.get_speech_optimization_stats(db, time_window_hours=hours)
+
+
+@router.get("/dashboard/ai-usage")
+async def get_ai_usage_stats(
+    hours: int = 24,
+    limit: int = 10,
+    current_user: User = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    دریافت آمار مصرف توکن و زمان فراخوانی‌های هوش مصنوعی
+
+    Args:
+        hours: بازه زمانی (ساعت)
+        limit: تعداد یادداشت‌های پرهزینه / کند
+
+    Returns:
+        مجموع توکن‌ها و زمان‌ها به تفکیک نوع فراخوانی و مدل
+    """
+    check_admin_access(current_user)
+
+    try:
+        return await usage_service.get_summary(db, time_window_hours=hours, limit=limit)
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"خطا در دریافت آمار مصرف: {str(e)}"
+        )
+
+
+@router.get("/dashboard/chat-concurrency")
+async def get_chat_concurrency_stats(
+    current_user: User = Depends(get_current_user_from_cookie)
+):
+    """
+    دریافت آمار همزمانی چت در این پروسه API
+
+    Returns:
+        چت‌های در حال پاسخ، کارهای بازیابی در حال اجرا و در صف و میانگین زمان‌ها
+    """
+    check_admin_access(current_user)
+
+    return chat_concurrency.get_stats()
+
+
 @router.get("/dashboard/revenue-chart")
 async def get_revenue_chart(
     days: int = 30,
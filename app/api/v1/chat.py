@@ -20,6 +20,8 @@ from app.crud import chat as chat_crud
 from app.crud import notebook as notebook_crud
 from app.services.rag_service import chat_with_notebook, format_chat_history_for_gemini
 from app.services.vector_service import get_notebook_stats
+from app.services.usage_service import usage_service
+from app.services.chat_concurrency import chat_concurrency
 
 router = APIRouter()
 
@@ -60,6 +62,7 @@ async def send_chat_message(
 
     try:
         # دریافت پاسخ از RAG
+        usage_records = usage_service.start_collecting()
         ai_response = await chat_with_notebook(
             notebook_id=notebook_id,
             user_query=message_data.message,
@@ -69,10 +72,12 @@ async def send_chat_message(
         # ذخیره پاسخ AI
         assistant_message = await chat_crud.add_message(db, session.id, "model", ai_response)
 
-        return ChatResponse(
+        response = ChatResponse(
             user_message=ChatMessageResponse.model_validate(user_message),
             assistant_message=ChatMessageResponse.model_validate(assistant_message)
         )
+        await usage_service.save_async(db, usage_records, chat_message_id=assistant_message.id, user_id=current_user.id)
+        return response
 
     except Exception as e:
         # در صورت خطا، پیام خطا ذخیره نمی‌شود ولی پیام کاربر باقی می‌ماند
@@ -153,7 +158,7 @@ async def get_index_status(
     # بررسی دسترسی
     await verify_notebook_access(notebook_id, current_user, db)
 
-    stats = get_notebook_stats(notebook_id)
+    stats = await chat_concurrency.run_retrieval(get_notebook_stats, notebook_id)
 
     return NotebookIndexStatus(
         notebook_id=notebook_id,
@@ -2,18 +2,21 @@ from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File,
 from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.session import get_db
-from app.schemas.note import NoteCreate, NoteUpdate, NoteResponse, NoteListResponse, UploadResponse
+from app.schemas.note import NoteCreate, NoteUpdate, NoteResponse, NoteListResponse, UploadResponse, NoteProgressResponse
 from app.crud import note as note_crud
 from app.crud import notebook as notebook_crud
 from app.core.dependencies import get_current_user_from_cookie
 from app.core.config import settings
 from app.db.models import User, NoteStatus
-from app.worker.tasks_with_credits_fixed import process_file_with_credits
 from app.services.pdf_service import generate_note_pdf, generate_notebook_pdf
+from app.services.storage_service import upload_storage, UploadTooLargeError, is_allowed_upload_type
+from app.services.media_service import media_probe
+from app.services.credit_service import credit_manager, InsufficientCreditsError
+from app.services.progress_service import note_progress
+from app.services.queue_service import queue_manager, RateLimitExceededError
 from typing import List, Optional
+import asyncio
 import os
-import uuid
-import aiofiles
 from urllib.parse import quote
 
 router = APIRouter()
@@ -26,20 +29,16 @@ async def upload_file(
     db: AsyncSession = Depends(get_db)
 ):
     """Upload a file (to be associated with a note later)"""
-    # Create uploads directory if it doesn't exist
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-
-    # Generate unique filename
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-
-    # Save file
-    async with aiofiles.open(file_path, 'wb') as f:
-        content = await file.read()
-        await f.write(content)
+    # Stream file to disk in bounded chunks
+    try:
+        stored = await upload_storage.save_upload_file(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
 
-    file_size = len(content)
+    media_info = await media_probe.probe_upload(stored['storage_path'], file.content_type)
 
     # For now, we'll return the upload info
     # The note will be created in a separate endpoint
@@ -47,9 +46,11 @@ async def upload_file(
         "id": 0,  # Temporary ID
         "note_id": 0,  # Will be set when note is created
         "original_file_name": file.filename,
-        "storage_path": file_path,
+        "storage_path": stored['storage_path'],
         "file_type": file.content_type or "application/octet-stream",
-        "file_size_bytes": file_size,
+        "file_size_bytes": stored['file_size_bytes'],
+        "duration_seconds": media_info['duration_seconds'],
+        "content_sha256": stored['content_sha256'],
         "created_at": None
     }
 
@@ -72,23 +73,54 @@ async def create_note(
             detail="Notebook not found"
         )
 
-    # Validate files (only audio and image)
-    allowed_types = [
-        'audio/', 'image/',
-        'video/',  # برای ویس که به صورت ویدیو ذخیره میشه
-        'application/octet-stream'  # بعضی مرورگرها این رو میفرستن
-    ]
+    # Check the queue's rate limits before anything is stored
+    try:
+        await queue_manager.check_user_rate_limit(db, current_user.id)
+    except RateLimitExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
 
+    # Validate files (only audio and image)
     for file in files:
-        content_type = file.content_type or ''
-        if not any(content_type.startswith(t) for t in allowed_types):
-            # Check by extension if content_type not reliable
-            ext = os.path.splitext(file.filename)[1].lower()
-            if ext not in ['.mp3', '.wav', '.m4a', '.ogg', '.webm', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail=f"فایل {file.filename} فرمت مجاز نیست. فقط فایل‌های صوتی و تصویری مجاز هستند."
-                )
+        if not is_allowed_upload_type(file.filename, file.content_type):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"فایل {file.filename} فرمت مجاز نیست. فقط فایل‌های صوتی و تصویری مجاز هستند."
+            )
+
+    # Stream all files to disk before creating the note so an oversized
+    # file does not leave an empty note behind
+    stored_files = []
+    try:
+        for file in files:
+            stored = await upload_storage.save_upload_file(file)
+            stored_files.append((file, stored))
+    except UploadTooLargeError as e:
+        # Stored files may be shared with a request that has not committed
+        # its Upload row yet; gc_upload_store removes them after a grace period
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+    # Probe durations once, concurrently, and reject what the user cannot pay for
+    media_infos = await asyncio.gather(*(
+        media_probe.probe_upload(stored['storage_path'], file.content_type)
+        for file, stored in stored_files
+    ))
+    required_credits = credit_manager.estimate_upload_credits([
+        (file.content_type, info['duration_seconds'])
+        for (file, _), info in zip(stored_files, media_infos)
+    ])
+    try:
+        await credit_manager.ensure_sufficient_credits(db, current_user.id, required_credits)
+    except InsufficientCreditsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e)
+        )
 
     # Create note with Jalali date (no conversion needed)
     note_data = NoteCreate(
@@ -99,33 +131,24 @@ async def create_note(
 
     db_note = await note_crud.create_note(db, note_data, current_user.id, NoteStatus.processing)
 
-    # Save all uploaded files
-    os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
-
-    for file in files:
-        file_extension = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_extension}"
-        file_path = os.path.join(settings.UPLOAD_DIR, unique_filename)
-
-        async with aiofiles.open(file_path, 'wb') as f:
-            content = await file.read()
-            await f.write(content)
-
-        file_size = len(content)
-
-        # Create upload record for each file
+    # Create upload record for each file
+    for (file, stored), media_info in zip(stored_files, media_infos):
         await note_crud.create_upload(
             db=db,
             note_id=db_note.id,
             user_id=current_user.id,
             original_file_name=file.filename,
-            storage_path=file_path,
+            storage_path=stored['storage_path'],
             file_type=file.content_type or "application/octet-stream",
-            file_size_bytes=file_size
+            file_size_bytes=stored['file_size_bytes'],
+            duration_seconds=media_info['duration_seconds'],
+            content_sha256=stored['content_sha256'],
+            codec=media_info['codec'],
+            bitrate=media_info['bitrate']
         )
 
-    # Trigger background processing with credit management
-    process_file_with_credits.delay(db_note.id)
+    # Queue processing with credit management
+    await queue_manager.submit_note(db, db_note.id, current_user.id, required_credits)
 
     return NoteResponse.from_db_model(db_note)
 
@@ -194,6 +217,31 @@ async def get_note_raw(
     }
 
 
+@router.get("/{note_id}/progress", response_model=NoteProgressResponse)
+async def get_note_progress(
+    note_id: int,
+    current_user: User = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get live processing progress (stage, partial title, note length so far)"""
+    note = await note_crud.get_note_by_id(db, note_id, current_user.id)
+    if not note:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found"
+        )
+
+    progress = await asyncio.to_thread(note_progress.get, note_id) or {}
+    return NoteProgressResponse(
+        note_id=note.id,
+        status=note.status.value if hasattr(note.status, 'value') else note.status,
+        stage=progress.get('stage'),
+        title=progress.get('title'),
+        note_chars=progress.get('note_chars', 0),
+        updated_at=progress.get('updated_at')
+    )
+
+
 @router.get("/{note_id}", response_model=NoteResponse)
 async def get_note(
     note_id: int,
@@ -93,13 +93,14 @@ async def get_note_queue_status(
 
         # Get position
         position = await queue_manager.get_queue_position(note_id)
+        estimated_wait = await queue_manager.estimate_wait_minutes(db, note_id)
 
         return NoteQueueStatusResponse(
             note_id=note_id,
             status=queue_entry.status.value,
             priority=queue_entry.priority,
             position=position if position > 0 else 0,
-            estimated_wait_minutes=max(0, position * 2)
+            estimated_wait_minutes=estimated_wait
         )
 
     except HTTPException:
@@ -0,0 +1,309 @@
+"""
+Resumable Upload API Endpoints
+
+Protocol:
+1. POST /sessions                 -> create a session for one file
+2. PUT  /sessions/{id}            -> send bytes with "Content-Range: bytes start-end/total"
+3. GET  /sessions/{id}            -> query the offset to resume from after a dropped connection
+4. POST /finalize                 -> turn completed sessions into a note and queue processing
+"""
+import asyncio
+import os
+import re
+
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import get_db
+from app.core.dependencies import get_current_user_from_cookie
+from app.core.config import settings
+from app.db.models import User, Note, NoteStatus, Upload, UploadSessionStatus
+from app.crud import notebook as notebook_crud
+from app.crud import upload_session as upload_session_crud
+from app.schemas.note import NoteResponse
+from app.schemas.upload_session import (
+    UploadSessionCreate,
+    UploadSessionResponse,
+    UploadFinalizeRequest
+)
+from app.services.storage_service import upload_storage, UploadTooLargeError, is_allowed_upload_type
+from app.services.media_service import media_probe
+from app.services.credit_service import credit_manager, InsufficientCreditsError
+from app.services.queue_service import queue_manager, RateLimitExceededError
+
+router = APIRouter()
+
+CONTENT_RANGE_PATTERN = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+async def get_owned_session(db: AsyncSession, session_id: str, user: User):
+    """Get an upload session or raise 404"""
+    session = await upload_session_crud.get_upload_session(db, session_id, user.id)
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+    return session
+
+
+async def complete_session(db: AsyncSession, session) -> None:
+    """
+    Move a fully received file into the store and mark its session completed
+
+    Safe to repeat: a session whose completion failed part way is completed
+    by the next PUT, GET or finalize. If the received file is gone, the
+    session is reset so the client uploads it again.
+    """
+    if session.status != UploadSessionStatus.uploading or session.received_bytes != session.total_size_bytes:
+        return
+
+    temp_path = session.storage_path
+    content_sha256 = session.content_sha256
+    if content_sha256 is None and os.path.exists(temp_path):
+        content_sha256 = await asyncio.to_thread(upload_storage.hash_file, temp_path)
+        # Saved before the move, so a retry can still find the stored file
+        await upload_session_crud.set_content_hash(db, session.id, content_sha256)
+
+    object_path = None
+    if content_sha256:
+        if os.path.exists(temp_path):
+            try:
+                await asyncio.to_thread(upload_storage.commit_to_store, temp_path, content_sha256)
+            except FileNotFoundError:
+                # Moved by a concurrent request for the same session
+                pass
+        object_path = upload_storage.build_object_path(content_sha256, os.path.splitext(temp_path)[1])
+
+    if object_path and os.path.exists(object_path):
+        media_info = await media_probe.probe_upload(object_path, session.file_type)
+        await upload_session_crud.mark_completed(db, session.id, content_sha256, object_path, media_info)
+    else:
+        await upload_session_crud.reset_offset(db, session.id)
+    await db.refresh(session)
+
+
+@router.post("/sessions", response_model=UploadSessionResponse, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_data: UploadSessionCreate,
+    current_user: User = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """Start a resumable upload for one file"""
+    if not is_allowed_upload_type(session_data.file_name, session_data.file_type):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"فایل {session_data.file_name} فرمت مجاز نیست. فقط فایل‌های صوتی و تصویری مجاز هستند."
+        )
+
+    if session_data.total_size_bytes > settings.MAX_UPLOAD_SIZE:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"حجم فایل {session_data.file_name} بیش از حد مجاز است ({settings.MAX_UPLOAD_SIZE // (1024 * 1024)} مگابایت)"
+        )
+
+    session = await upload_session_crud.create_upload_session(
+        db,
+        user_id=current_user.id,
+        original_file_name=session_data.file_name,
+        file_type=session_data.file_type,
+        storage_path=upload_storage.build_temp_path(session_data.file_name),
+        total_size_bytes=session_data.total_size_bytes
+    )
+    return UploadSessionResponse.from_db_model(session)
+
+
+@router.get("/sessions/{session_id}", response_model=UploadSessionResponse)
+async def get_upload_session(
+    session_id: str,
+    current_user: User = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """Get upload progress (received_bytes is the offset to resume from)"""
+    session = await get_owned_session(db, session_id, current_user)
+    await complete_session(db, session)
+    return UploadSessionResponse.from_db_model(session)
+
+
+@router.put("/sessions/{session_id}", response_model=UploadSessionResponse)
+async def upload_chunk(
+    session_id: str,
+    request: Request,
+    current_user: User = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """Upload a byte range of the file"""
+    session = await get_owned_session(db, session_id, current_user)
+    await complete_session(db, session)
+
+    if session.status != UploadSessionStatus.uploading:
+        # Already complete - let the client move on to finalize
+        return UploadSessionResponse.from_db_model(session)
+
+    match = CONTENT_RANGE_PATTERN.match(request.headers.get("content-range", ""))
+    if not match:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Content-Range header is required (bytes start-end/total)"
+        )
+
+    start, end, total = (int(g) for g in match.groups())
+    if total != session.total_size_bytes or end < start or end >= total:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Invalid byte range for this upload"
+        )
+
+    if start != session.received_bytes:
+        # Client is out of sync - tell it where to resume from
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail={"message": "Unexpected offset", "received_bytes": session.received_bytes}
+        )
+
+    try:
+        written = await upload_storage.write_range(
+            session.storage_path,
+            offset=start,
+            stream=request.stream(),
+            max_length=end - start + 1
+        )
+    except UploadTooLargeError as e:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=str(e)
+        )
+
+    # Keep whatever arrived, even if the connection dropped mid-chunk
+    new_offset = start + written['bytes_written']
+    if new_offset > start:
+        advanced = await upload_session_crud.advance_offset(db, session.id, start, new_offset)
+        if not advanced:
+            await db.refresh(session)
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail={"message": "Concurrent upload for this session", "received_bytes": session.received_bytes}
+            )
+
+    await db.refresh(session)
+    # Last chunk: move the finished file into the content-addressed store
+    await complete_session(db, session)
+    return UploadSessionResponse.from_db_model(session)
+
+
+@router.post("/finalize", response_model=NoteResponse, status_code=status.HTTP_201_CREATED)
+async def finalize_upload(
+    finalize_data: UploadFinalizeRequest,
+    current_user: User = Depends(get_current_user_from_cookie),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Create a note from completed upload sessions and queue it for processing
+
+    Safe to retry: a second finalize for the same sessions returns the
+    existing note and does not queue processing again.
+    """
+    notebook = await notebook_crud.get_notebook_by_id(db, finalize_data.notebook_id, current_user.id)
+    if not notebook:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Notebook not found"
+        )
+
+    session_ids = list(dict.fromkeys(finalize_data.session_ids))
+    sessions = await upload_session_crud.get_upload_sessions(db, session_ids, current_user.id)
+    if len(sessions) != len(session_ids):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Upload session not found"
+        )
+
+    existing_note = await _get_finalized_note(db, sessions)
+    if existing_note:
+        return NoteResponse.from_db_model(existing_note)
+
+    for session in sessions:
+        await complete_session(db, session)
+
+    if any(s.status != UploadSessionStatus.completed for s in sessions):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="All files must be fully uploaded before finalizing"
+        )
+
+    required_credits = credit_manager.estimate_upload_credits([
+        (s.file_type, s.duration_seconds) for s in sessions
+    ])
+    try:
+        await credit_manager.ensure_sufficient_credits(db, current_user.id, required_credits)
+    except InsufficientCreditsError as e:
+        raise HTTPException(
+            status_code=status.HTTP_402_PAYMENT_REQUIRED,
+            detail=str(e)
+        )
+
+    try:
+        await queue_manager.check_user_rate_limit(db, current_user.id)
+    except RateLimitExceededError as e:
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=str(e)
+        )
+
+    db_note = Note(
+        notebook_id=finalize_data.notebook_id,
+        user_id=current_user.id,
+        title=finalize_data.title,
+        session_date=finalize_data.session_date,
+        status=NoteStatus.processing
+    )
+    db.add(db_note)
+    await db.flush()
+
+    claimed = await upload_session_crud.claim_for_note(db, session_ids, current_user.id, db_note.id)
+    if not claimed:
+        # Another finalize request won the race
+        await db.rollback()
+        sessions = await upload_session_crud.get_upload_sessions(db, session_ids, current_user.id)
+        existing_note = await _get_finalized_note(db, sessions)
+        if existing_note:
+            return NoteResponse.from_db_model(existing_note)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload sessions are already being finalized"
+        )
+
+    for session in sessions:
+        db.add(Upload(
+            note_id=db_note.id,
+            user_id=current_user.id,
+            original_file_name=session.original_file_name,
+            storage_path=session.storage_path,
+            file_type=session.file_type,
+            file_size_bytes=session.total_size_bytes,
+            duration_seconds=session.duration_seconds,
+            codec=session.codec,
+            bitrate=session.bitrate,
+            content_sha256=session.content_sha256
+        ))
+
+    await db.commit()
+    await db.refresh(db_note)
+
+    # Only the request that claimed the sessions reaches this point
+    await queue_manager.submit_note(db, db_note.id, current_user.id, required_credits)
+
+    return NoteResponse.from_db_model(db_note)
+
+
+async def _get_finalized_note(db: AsyncSession, sessions):
+    """Return the note all sessions were finalized into, if any"""
+    note_ids = {s.note_id for s in sessions if s.status == UploadSessionStatus.finalized}
+    if len(note_ids) != 1 or not all(s.status == UploadSessionStatus.finalized for s in sessions):
+        return None
+
+    note_id = note_ids.pop()
+    if note_id is None:
+        return None
+
+    return await db.get(Note, note_id)
@@ -5,6 +5,8 @@ from functools import lru_cache
 class Settings(BaseSettings):
     # Database
     DATABASE_URL: str
+    WORKER_DB_POOL_SIZE: int = 5  # Async connections kept open per Celery worker process
+    WORKER_DB_MAX_OVERFLOW: int = 5
 
     # Security
     SECRET_KEY: str
@@ -16,16 +18,58 @@ class Settings(BaseSettings):
     GEMINI_API_KEY: str  # Real Google API key from .env
     GEMINI_TRANSCRIPTION_MODEL: str = "gemini-2.5-flash"  # Model for note generation
     GEMINI_CHAT_MODEL: str = "gemini-2.5-flash"  # Model for RAG chat
+    GEMINI_UPLOAD_CONCURRENCY: int = 4  # Files uploaded to the File API at once per note
+    GEMINI_FILE_POLL_INITIAL_SECONDS: float = 0.5  # First readiness check delay, doubled each time
+    GEMINI_FILE_POLL_MAX_SECONDS: float = 8.0
+    GEMINI_FILE_PROCESSING_TIMEOUT_SECONDS: int = 30  # Continue anyway after this
+    GEMINI_RESPONSE_SCHEMA_ENABLED: bool = True  # Constrain note output to {"title", "note"} JSON
+    GEMINI_MAX_CONTINUATION_ROUNDS: int = 3  # Extra calls when a note stops at MAX_TOKENS
+    GEMINI_STREAMING_ENABLED: bool = True  # Stream note generation and publish live progress
+    NOTE_PROGRESS_PUBLISH_INTERVAL_SECONDS: float = 1.0
+    NOTE_PROGRESS_TTL_SECONDS: int = 3600
+    REMOTE_FILE_REUSE_ENABLED: bool = True  # Reuse File API uploads across retries of a note
+    REMOTE_FILE_EXPIRY_MARGIN_SECONDS: int = 3600  # Stop reusing a remote file this long before it expires
+    REMOTE_FILE_JANITOR_INTERVAL_MINUTES: int = 30
+    REMOTE_FILE_JANITOR_MAX_AGE_HOURS: int = 6  # Delete remote files of notes left unfinished this long
+
+    # AI Provider ("gemini", or "fake" for offline load tests and benchmarks)
+    AI_PROVIDER: str = "gemini"
+    FAKE_AI_SEED: int = 0
+    FAKE_AI_UPLOAD_LATENCY_SECONDS: float = 0.5
+    FAKE_AI_FILE_PROCESSING_SECONDS: float = 1.0  # Uploads stay PROCESSING this long
+    FAKE_AI_GENERATE_LATENCY_SECONDS: float = 2.0  # Before the first chunk / the response
+    FAKE_AI_CHUNK_LATENCY_SECONDS: float = 0.05
+    FAKE_AI_STREAM_CHUNKS: int = 20
+    FAKE_AI_NOTE_CHARS: int = 6000
+    FAKE_AI_FAILURE_RATE: float = 0.0  # Share of calls failing with a 503
+    FAKE_AI_RATE_LIMIT_RATE: float = 0.0  # Share of calls starting a burst of 429s
+    FAKE_AI_RATE_LIMIT_BURST: int = 5  # Consecutive 429s per burst
+    FAKE_AI_TRUNCATION_RATE: float = 0.0  # Share of notes cut at MAX_TOKENS
+
+    # AI Rate Limiting (token buckets in Redis, shared by all workers and the API)
+    AI_RATE_LIMIT_ENABLED: bool = True
+    AI_RATE_LIMIT_RPM: int = 1000  # Requests per minute per model (the project's quota)
+    AI_RATE_LIMIT_TPM: int = 1000000  # Input tokens per minute per model
+    AI_RATE_LIMIT_CHAT_RESERVE: float = 0.2  # Share of the bucket note generation leaves for chat
+    AI_RATE_LIMIT_FILE_TOKENS: int = 8000  # Estimate per uploaded file until usage is reported
+    AI_RATE_LIMIT_CHAT_MAX_WAIT_SECONDS: int = 20
+    AI_RATE_LIMIT_BATCH_MAX_WAIT_SECONDS: int = 300
+    AI_RATE_LIMIT_INCREASE_STEP: float = 0.01  # AIMD: added to the multiplier per successful call
+    AI_RATE_LIMIT_DECREASE_FACTOR: float = 0.5  # AIMD: multiplier factor on a 429
+    AI_RATE_LIMIT_MIN_MULTIPLIER: float = 0.1
+    AI_RATE_LIMIT_DECREASE_COOLDOWN_SECONDS: float = 5.0  # One decrease per burst of 429s
 
     # Redis & Celery
     REDIS_URL: str
     CELERY_BROKER_URL: str
     CELERY_RESULT_BACKEND: str
+    NOTE_PIPELINE_STAGED: bool = True  # Route note stages to their own queues; off runs them in one worker
 
     # Application
     APP_NAME: str = "Neviso"
     UPLOAD_DIR: str = "./uploads"
     MAX_UPLOAD_SIZE: int = 104857600  # 100MB
+    UPLOAD_CHUNK_SIZE: int = 1048576  # 1MB - bytes held in memory per upload while streaming to disk
 
     # SMS
     SMS_API_KEY: str = "mock-sms-api-key"
@@ -46,17 +90,65 @@ class Settings(BaseSettings):
     MAX_USER_UPLOADS_PER_MINUTE: int = 3
     MAX_USER_UPLOADS_PER_DAY: int = 50
     QUEUE_PROCESSOR_INTERVAL: int = 10  # seconds
+    QUEUE_CLAIM_BATCH_SIZE: int = 5  # Notes a dispatcher claims per run
+    QUEUE_LEASE_SECONDS: int = 60  # Processing slot lease, renewed by the worker's heartbeat
+    QUEUE_LEASE_HEARTBEAT_SECONDS: int = 15
+    QUEUE_HANDOFF_MAX_SECONDS: int = 21600  # A note not picked up by its next stage or retry within this long is requeued
+    QUEUE_LEASE_REAPER_INTERVAL_SECONDS: int = 10  # How often expired leases are requeued
+    QUEUE_MINUTES_PER_MEDIA_MINUTE: float = 0.2  # Processing time per minute of audio/video (ETA)
+    QUEUE_NOTE_OVERHEAD_MINUTES: float = 1.0  # Fixed processing time per note (ETA)
 
     # Credit Calculation
     IMAGE_CREDIT_COST: float = 0.5  # minutes per image
     MAX_RETRY_ATTEMPTS: int = 3
 
+    # Audio Transcoding (ffmpeg)
+    FFMPEG_MAX_CONCURRENCY: int = 2  # ffmpeg processes per host, shared by all worker processes
+    FFMPEG_SLOT_DIR: str = "/tmp/neviso-ffmpeg-slots"  # Lock files used to share the limit
+    FFMPEG_TIMEOUT_SECONDS: int = 300
+
+    # Speech Optimization (enabled per plan with the "speech_optimization" feature)
+    SPEECH_OPTIMIZATION_ENABLED: bool = True  # Global switch
+    SPEECH_SILENCE_THRESHOLD_DB: int = -35  # Quieter than this counts as silence
+    SPEECH_MIN_SILENCE_SECONDS: float = 1.5  # Shorter pauses are kept
+    SPEECH_SILENCE_PADDING_SECONDS: float = 0.3  # Kept around each speech segment
+    SPEECH_TEMPO: float = 1.0  # Speed-up factor (pitch preserved), 1.0 = off
+
+    # Image Optimization (photos of slides / whiteboards)
+    IMAGE_OPTIMIZATION_ENABLED: bool = True
+    IMAGE_MAX_EDGE: int = 2048  # Longest edge in pixels after downscaling
+    IMAGE_OUTPUT_FORMAT: str = "webp"  # webp or jpeg
+    IMAGE_QUALITY: int = 80
+    IMAGE_DOCUMENT_CROP: bool = False  # Crop to the detected document/whiteboard region
+
+    # Video Preprocessing
+    VIDEO_PREPROCESSING_POLICY: str = "auto"  # original, audio, audio_frames or auto
+    VIDEO_AUDIO_BITRATE: str = "32k"  # Opus bitrate of the extracted speech track
+    VIDEO_SCENE_THRESHOLD: float = 0.3  # ffmpeg scene score (0-1) that starts a new keyframe
+    VIDEO_MAX_FRAMES: int = 30  # Keyframes sampled per video
+    VIDEO_FRAME_MAX_EDGE: int = 1280  # Longest keyframe edge in pixels
+    VIDEO_MIN_DISTINCT_FRAMES: int = 2  # auto: fewer distinct frames means audio only
+
+    # Segmented Processing (long recordings)
+    SEGMENTED_PROCESSING_ENABLED: bool = True
+    SEGMENT_MIN_TOTAL_MINUTES: int = 45  # Notes with more audio than this are segmented
+    SEGMENT_MINUTES: int = 20  # Target segment length
+    SEGMENT_CUT_WINDOW_SECONDS: int = 60  # Look this far around each mark for a silence to cut at
+    SEGMENT_MAX_CONCURRENT_CALLS: int = 4  # Concurrent generate calls per note
+    SEGMENT_MAX_OUTPUT_TOKENS: int = 32000  # Output limit per segment call
+    SEGMENT_MAX_RETRIES: int = 2  # Retries per segment before the note fails
+
+    # AI Result Cache
+    AI_RESULT_CACHE_ENABLED: bool = True  # Reuse notes generated from identical files
+    AI_RESULT_CACHE_CHARGE_CREDITS: bool = True  # Whether a cache hit still consumes credits
+
     # RAG Chat Settings
     CHROMA_PERSIST_DIRECTORY: str = "./chroma_db"
     EMBEDDING_MODEL: str = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
     RAG_TOP_K: int = 5  # Number of relevant chunks to retrieve
     RAG_CHUNK_SIZE: int = 500  # Characters per chunk
     RAG_CHUNK_OVERLAP: int = 50  # Overlap between chunks
+    RAG_RETRIEVAL_WORKERS: int = 2  # Threads per API process for embedding and vector search
 
     class Config:
         env_file = ".env"
@@ -114,13 +114,12 @@ async def update_note(
     if content_updated:
         try:
             from app.services.vector_service import index_note as index_note_for_rag
+            from app.services.chat_concurrency import chat_concurrency
             content = db_note.user_edited_text or db_note.gemini_output_text
             if content:
-                index_note_for_rag(
-                    notebook_id=db_note.notebook_id,
-                    note_id=db_note.id,
-                    title=db_note.title,
-                    html_content=content
+                # Embedding is CPU bound: run it off the event loop
+                await chat_concurrency.run_retrieval(
+                    index_note_for_rag, db_note.notebook_id, db_note.id, db_note.title, content
                 )
         except Exception as e:
             # Don't fail the update if indexing fails
@@ -143,7 +142,8 @@ async def delete_note(db: AsyncSession, note_id: int, user_id: int) -> bool:
     # Remove from RAG index
     try:
         from app.services.vector_service import delete_note_from_index
-        delete_note_from_index(notebook_id, note_id)
+        from app.services.chat_concurrency import chat_concurrency
+        await chat_concurrency.run_retrieval(delete_note_from_index, notebook_id, note_id)
     except Exception as e:
         # Don't fail the delete if index removal fails
         print(f"[NOTE CRUD] Warning: Failed to remove note {note_id} from index: {e}")
@@ -190,7 +190,10 @@ async def create_upload(
     storage_path: str,
     file_type: str,
     file_size_bytes: int,
-    duration_seconds: Optional[int] = None
+    duration_seconds: Optional[float] = None,
+    content_sha256: Optional[str] = None,
+    codec: Optional[str] = None,
+    bitrate: Optional[int] = None
 ) -> Upload:
     """Create upload record"""
     db_upload = Upload(
@@ -200,7 +203,10 @@ async def create_upload(
         storage_path=storage_path,
         file_type=file_type,
         file_size_bytes=file_size_bytes,
-        duration_seconds=duration_seconds
+        duration_seconds=duration_seconds,
+        content_sha256=content_sha256,
+        codec=codec,
+        bitrate=bitrate
     )
     db.add(db_upload)
     await db.commit()
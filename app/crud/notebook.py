@@ -65,7 +65,8 @@ async def delete_notebook(db: AsyncSession, notebook_id: int, user_id: int) -> b
     # Delete RAG index for this notebook
     try:
         from app.services.vector_service import delete_notebook_index
-        delete_notebook_index(notebook_id)
+        from app.services.chat_concurrency import chat_concurrency
+        await chat_concurrency.run_retrieval(delete_notebook_index, notebook_id)
     except Exception as e:
         # Don't fail the delete if index removal fails
         print(f"[NOTEBOOK CRUD] Warning: Failed to delete notebook {notebook_id} index: {e}")
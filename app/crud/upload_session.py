@@ -0,0 +1,155 @@
+"""
+CRUD operations for resumable upload sessions
+"""
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, update
+from typing import List, Optional
+import uuid
+
+from app.db.models import UploadSession, UploadSessionStatus
+
+
+async def create_upload_session(
+    db: AsyncSession,
+    user_id: int,
+    original_file_name: str,
+    file_type: str,
+    storage_path: str,
+    total_size_bytes: int
+) -> UploadSession:
+    """Create a new resumable upload session"""
+    session = UploadSession(
+        id=str(uuid.uuid4()),
+        user_id=user_id,
+        original_file_name=original_file_name,
+        file_type=file_type,
+        storage_path=storage_path,
+        total_size_bytes=total_size_bytes,
+        received_bytes=0,
+        status=UploadSessionStatus.uploading
+    )
+    db.add(session)
+    await db.commit()
+    await db.refresh(session)
+    return session
+
+
+async def get_upload_session(db: AsyncSession, session_id: str, user_id: int) -> Optional[UploadSession]:
+    """Get an upload session owned by a user"""
+    result = await db.execute(
+        select(UploadSession)
+        .where(UploadSession.id == session_id, UploadSession.user_id == user_id)
+    )
+    return result.scalar_one_or_none()
+
+
+async def get_upload_sessions(db: AsyncSession, session_ids: List[str], user_id: int) -> List[UploadSession]:
+    """Get several upload sessions owned by a user"""
+    result = await db.execute(
+        select(UploadSession)
+        .where(UploadSession.id.in_(session_ids), UploadSession.user_id == user_id)
+    )
+    return list(result.scalars().all())
+
+
+async def advance_offset(
+    db: AsyncSession,
+    session_id: str,
+    expected_offset: int,
+    new_offset: int
+) -> bool:
+    """
+    Move received_bytes forward only if nobody else moved it in the meantime
+
+    Returns:
+        True if this request owned the range, False on a concurrent write
+    """
+    result = await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.received_bytes == expected_offset,
+            UploadSession.status == UploadSessionStatus.uploading
+        )
+        .values(received_bytes=new_offset)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def set_content_hash(db: AsyncSession, session_id: str, content_sha256: str) -> bool:
+    """Remember the checksum of a fully received file before it is moved into the store"""
+    result = await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.status == UploadSessionStatus.uploading,
+            UploadSession.received_bytes == UploadSession.total_size_bytes
+        )
+        .values(content_sha256=content_sha256)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def reset_offset(db: AsyncSession, session_id: str) -> bool:
+    """Restart an upload whose received file was lost"""
+    result = await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.status == UploadSessionStatus.uploading
+        )
+        .values(received_bytes=0, content_sha256=None)
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def mark_completed(
+    db: AsyncSession,
+    session_id: str,
+    content_sha256: str,
+    storage_path: str,
+    media_info: Optional[dict] = None
+) -> bool:
+    """Mark a fully received session as completed and point it at the stored file"""
+    media_info = media_info or {}
+    result = await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id == session_id,
+            UploadSession.status == UploadSessionStatus.uploading,
+            UploadSession.received_bytes == UploadSession.total_size_bytes
+        )
+        .values(
+            status=UploadSessionStatus.completed,
+            content_sha256=content_sha256,
+            storage_path=storage_path,
+            duration_seconds=media_info.get('duration_seconds'),
+            codec=media_info.get('codec'),
+            bitrate=media_info.get('bitrate')
+        )
+    )
+    await db.commit()
+    return result.rowcount == 1
+
+
+async def claim_for_note(db: AsyncSession, session_ids: List[str], user_id: int, note_id: int) -> bool:
+    """
+    Atomically attach completed sessions to a note (does not commit)
+
+    Only one finalize request can move a session from completed to
+    finalized, so the caller that gets True is the only one allowed to
+    queue processing for the note.
+    """
+    result = await db.execute(
+        update(UploadSession)
+        .where(
+            UploadSession.id.in_(session_ids),
+            UploadSession.user_id == user_id,
+            UploadSession.status == UploadSessionStatus.completed
+        )
+        .values(status=UploadSessionStatus.finalized, note_id=note_id)
+    )
+    return result.rowcount == len(session_ids)
@@ -169,7 +169,12 @@ class Upload(Base):
     storage_path = Column(String(512), nullable=False)
     file_type = Column(String(20), nullable=False)
     file_size_bytes = Column(BigInteger, nullable=False)
-    duration_seconds = Column(Integer, nullable=True)
+    duration_seconds = Column(DECIMAL(10, 2), nullable=True)  # Probed once at ingest (audio/video)
+    codec = Column(String(50), nullable=True)
+    bitrate = Column(Integer, nullable=True)  # bits per second
+    speech_removed_seconds = Column(DECIMAL(10, 2), nullable=True)  # Silence/tempo savings when speech-optimized
+    speech_timestamp_map = Column(JSON, nullable=True)  # Optimized audio time -> original time segments
+    content_sha256 = Column(String(64), nullable=True, index=True)  # Hex SHA-256 computed during ingest
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
 
     # Relationships
@@ -177,6 +182,37 @@ class Upload(Base):
     user = relationship("User", back_populates="uploads")
 
 
+class UploadSessionStatus(str, enum.Enum):
+    uploading = "uploading"
+    completed = "completed"
+    finalized = "finalized"
+
+
+class UploadSession(Base):
+    """آپلود چندتکه قابل ادامه - هر session یک فایل است"""
+    __tablename__ = "upload_sessions"
+
+    id = Column(String(36), primary_key=True)  # UUID token used in upload URLs
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="SET NULL"), nullable=True)  # Set on finalize
+    original_file_name = Column(String(255), nullable=False)
+    file_type = Column(String(100), nullable=False)
+    storage_path = Column(String(512), nullable=False)
+    total_size_bytes = Column(BigInteger, nullable=False)
+    received_bytes = Column(BigInteger, default=0, nullable=False)
+    content_sha256 = Column(String(64), nullable=True)  # Computed when the last chunk arrives
+    duration_seconds = Column(DECIMAL(10, 2), nullable=True)  # Probed when the last chunk arrives
+    codec = Column(String(50), nullable=True)
+    bitrate = Column(Integer, nullable=True)
+    status = Column(Enum(UploadSessionStatus), default=UploadSessionStatus.uploading, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+    # Relationships
+    user = relationship("User")
+    note = relationship("Note")
+
+
 class NotificationType(str, enum.Enum):
     note_completed = "note_completed"
     note_failed = "note_failed"
@@ -272,6 +308,54 @@ class ProcessingQueue(Base):
     user = relationship("User")
 
 
+class AIResultCache(Base):
+    """نتیجه ذخیره‌شده پردازش هوش مصنوعی برای ورودی‌های یکسان"""
+    __tablename__ = "ai_result_cache"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    cache_key = Column(String(64), nullable=False, unique=True)  # SHA-256 of input hashes + prompt version
+    prompt_version = Column(String(64), nullable=False)
+    result = Column(JSON, nullable=False)  # Raw {"title": ..., "note": ...} from the model
+    hit_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    last_hit_at = Column(TIMESTAMP, nullable=True)
+
+
+class AIUsage(Base):
+    """مصرف توکن و زمان هر فراخوانی مدل هوش مصنوعی"""
+    __tablename__ = "ai_usage"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="SET NULL"), nullable=True)
+    chat_message_id = Column(Integer, ForeignKey("chat_messages.id", ondelete="SET NULL"), nullable=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="SET NULL"), nullable=True)
+    call_type = Column(String(20), nullable=False)  # note, continuation, segment, segment_merge, chat
+    model = Column(String(64), nullable=False)
+    provider = Column(String(20), nullable=False)
+    prompt_tokens = Column(Integer, default=0, nullable=False)
+    audio_tokens = Column(Integer, default=0, nullable=False)  # Part of prompt_tokens
+    output_tokens = Column(Integer, default=0, nullable=False)
+    total_tokens = Column(Integer, default=0, nullable=False)
+    finish_reason = Column(String(20), nullable=True)
+    queue_wait_seconds = Column(DECIMAL(10, 2), nullable=True)  # Set on the first call of a worker attempt
+    rate_limit_wait_seconds = Column(DECIMAL(10, 2), default=0, nullable=False)
+    upload_seconds = Column(DECIMAL(10, 2), nullable=True)
+    generation_seconds = Column(DECIMAL(10, 2), nullable=False)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+
+
+class NotePipelineState(Base):
+    """وضعیت ذخیره‌شده پردازش یادداشت برای ادامه از آخرین مرحله"""
+    __tablename__ = "note_pipeline_states"
+
+    note_id = Column(Integer, ForeignKey("notes.id", ondelete="CASCADE"), primary_key=True)
+    stage = Column(String(20), nullable=False)  # Last completed stage of note_pipeline
+    state = Column(JSON, nullable=False)  # Input of the next stage (prepared files, model output, ...)
+    attempts = Column(Integer, default=0, nullable=False)  # Times processing resumed from this state
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
+
+
 class UserQuota(Base):
     """محدودیت‌های کاربر"""
     __tablename__ = "user_quotas"
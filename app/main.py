@@ -10,7 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 # Import routers
 # تغییر مهم: استفاده از payments_new به عنوان payments
-from app.api.v1 import auth, plans, payments_new as payments, notebooks, notes, export, users, notifications, credits, chat
+from app.api.v1 import auth, plans, payments_new as payments, notebooks, notes, export, users, notifications, credits, chat, uploads
 
 app = FastAPI(title=settings.APP_NAME)
 
@@ -35,6 +35,7 @@ app.include_router(plans.router, prefix="/api/v1/plans", tags=["Plans"])
 app.include_router(payments.router, prefix="/api/v1/payments", tags=["Payments"])
 app.include_router(notebooks.router, prefix="/api/v1/notebooks", tags=["Notebooks"])
 app.include_router(notes.router, prefix="/api/v1/notes", tags=["Notes"])
+app.include_router(uploads.router, prefix="/api/v1/uploads", tags=["Uploads"])
 app.include_router(export.router, prefix="/api/v1/export", tags=["Export"])
 app.include_router(users.router, prefix="/api/v1/users", tags=["Users"])
 app.include_router(notifications.router, prefix="/api/v1/notifications", tags=["Notifications"])
@@ -82,6 +82,15 @@ class NoteListResponse(BaseModel):
         from_attributes = True
 
 
+class NoteProgressResponse(BaseModel):
+    note_id: int
+    status: str
+    stage: Optional[str] = None  # preparing, uploading, generating, retrying, completed, failed
+    title: Optional[str] = None  # Partial title while the note is generated
+    note_chars: int = 0  # Characters of the note generated so far
+    updated_at: Optional[float] = None  # Unix time of the last progress update
+
+
 class UploadResponse(BaseModel):
     id: int
     note_id: int
@@ -89,7 +98,9 @@ class UploadResponse(BaseModel):
     storage_path: str
     file_type: str
     file_size_bytes: int
-    created_at: datetime
+    duration_seconds: Optional[float] = None
+    content_sha256: Optional[str] = None
+    created_at: Optional[datetime] = None
 
     class Config:
         from_attributes = True
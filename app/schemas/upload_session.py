@@ -0,0 +1,43 @@
+from pydantic import BaseModel, Field
+from typing import List, Optional
+from datetime import datetime
+
+
+class UploadSessionCreate(BaseModel):
+    file_name: str = Field(..., min_length=1, max_length=255)
+    file_type: str = Field("application/octet-stream", max_length=100)
+    total_size_bytes: int = Field(..., gt=0)
+
+
+class UploadSessionResponse(BaseModel):
+    id: str
+    original_file_name: str
+    file_type: str
+    total_size_bytes: int
+    received_bytes: int  # Offset the client should resume from
+    status: str
+    duration_seconds: Optional[float] = None  # Known once the upload is complete
+    note_id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    @classmethod
+    def from_db_model(cls, session):
+        """Convert database model to response schema"""
+        return cls(
+            id=session.id,
+            original_file_name=session.original_file_name,
+            file_type=session.file_type,
+            total_size_bytes=session.total_size_bytes,
+            received_bytes=session.received_bytes,
+            status=session.status.value if hasattr(session.status, 'value') else session.status,
+            duration_seconds=float(session.duration_seconds) if session.duration_seconds is not None else None,
+            note_id=session.note_id,
+            created_at=session.created_at
+        )
+
+
+class UploadFinalizeRequest(BaseModel):
+    title: str = Field(..., min_length=1, max_length=255)
+    notebook_id: int
+    session_date: Optional[str] = None  # Jalali date format: YYYY/MM/DD
+    session_ids: List[str] = Field(..., min_length=1)
@@ -0,0 +1,366 @@
+"""
+AI Provider - The model API behind note generation and chat
+
+Everything the pipeline needs from the model API goes through an
+AIProvider: File API upload/lookup/delete, generation (plain and streamed)
+and chat. AI_PROVIDER selects the implementation:
+
+- gemini: the Google Gemini API (google.generativeai)
+- fake:   a local, deterministic stand-in with configurable latency and
+          failures (see fake_ai_provider), for load tests and benchmarks
+          without the live API
+
+Provider calls block like the SDK does; async callers run them in a thread.
+Chat also has chat_async, which awaits the API natively (Gemini's async
+client) so the API server's event loop is never blocked by a chat answer.
+The Gemini client is configured on first use instead of at import time.
+Generation and chat calls pass through the cluster-wide rate limiter
+(ai_rate_limiter) unless AI_RATE_LIMIT_ENABLED is off.
+"""
+import asyncio
+import enum
+import logging
+import threading
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from functools import lru_cache
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+AI_PROVIDERS = ('gemini', 'fake')
+
+
+class FileState(enum.Enum):
+    """Processing state of an uploaded file (same names as the File API)"""
+    STATE_UNSPECIFIED = 0
+    PROCESSING = 1
+    ACTIVE = 2
+    FAILED = 10
+
+
+class FinishReason(str, enum.Enum):
+    """Why a generation stopped"""
+    STOP = 'STOP'
+    MAX_TOKENS = 'MAX_TOKENS'
+    SAFETY = 'SAFETY'
+    OTHER = 'OTHER'
+
+
+@dataclass
+class RemoteFile:
+    """A file uploaded to the provider, usable as a content part"""
+    name: str
+    state: FileState
+    mime_type: Optional[str] = None
+    uri: Optional[str] = None
+    expiration_time: Optional[datetime] = None
+    raw: object = field(default=None, repr=False)  # Provider's own handle
+
+
+@dataclass
+class GenerationResult:
+    """Text and metadata of a finished generation"""
+    text: str
+    finish_reason: FinishReason = FinishReason.STOP
+    usage: Dict[str, int] = field(default_factory=dict)  # prompt_tokens, audio_tokens, output_tokens, total_tokens
+    rate_limit_wait_seconds: float = 0.0  # Set by the rate limiter
+
+
+class GenerationStream:
+    """
+    Text chunks of a streamed generation
+
+    Iterate to receive the chunks; result() is available once the stream
+    is exhausted.
+    """
+
+    def __init__(self, chunks: Iterator[str], finish: Callable[[str], GenerationResult]):
+        self._chunks = chunks
+        self._finish = finish
+        self._texts: List[str] = []
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> str:
+        text = next(self._chunks)
+        self._texts.append(text)
+        return text
+
+    def result(self) -> GenerationResult:
+        """Result of the complete stream"""
+        return self._finish(''.join(self._texts))
+
+
+class AIProvider(ABC):
+    """Model API used by note generation and chat"""
+
+    name = ''
+
+    @abstractmethod
+    def upload_file(self, path: str, mime_type: str) -> RemoteFile:
+        """Upload a local file for use in generation requests"""
+
+    @abstractmethod
+    def get_file(self, name: str) -> RemoteFile:
+        """Current state of an uploaded file"""
+
+    @abstractmethod
+    def delete_file(self, name: str) -> None:
+        """Delete an uploaded file"""
+
+    @abstractmethod
+    def generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationResult:
+        """
+        Generate a response
+
+        Args:
+            model_name: Model to use
+            contents: A prompt, a list of parts (text and RemoteFile) or a
+                list of {'role', 'parts'} turns
+            system_instruction: Optional system instruction
+            generation_config: Gemini-style generation config dict
+            request_options: e.g. {'timeout': 900}
+        """
+
+    @abstractmethod
+    def stream_generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationStream:
+        """Same as generate, returning the response as a stream of text chunks"""
+
+    @abstractmethod
+    def chat(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        """
+        Answer the next message of a conversation
+
+        Args:
+            history: Earlier turns as {'role': 'user'|'model', 'parts': [text]}
+        """
+
+    async def chat_async(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        """Same as chat, awaited without blocking the event loop"""
+        return await asyncio.to_thread(self.chat, model_name, system_instruction, history, message)
+
+
+# Gemini finish_reason values
+GEMINI_FINISH_REASONS = {
+    1: FinishReason.STOP,
+    2: FinishReason.MAX_TOKENS,
+    3: FinishReason.SAFETY,
+}
+
+
+class GeminiProvider(AIProvider):
+    """Google Gemini API through google.generativeai"""
+
+    name = 'gemini'
+
+    def __init__(self):
+        self._configured = False
+        self._lock = threading.Lock()
+
+    @property
+    def genai(self):
+        """The SDK module, configured with our API key on first use"""
+        import google.generativeai as genai
+
+        if not self._configured:
+            with self._lock:
+                if not self._configured:
+                    genai.configure(api_key=settings.GEMINI_API_KEY)
+                    self._configured = True
+        return genai
+
+    @staticmethod
+    def _to_remote_file(handle) -> RemoteFile:
+        """Wrap a File API handle"""
+        try:
+            state = FileState[handle.state.name]
+        except (KeyError, AttributeError):
+            state = FileState.STATE_UNSPECIFIED
+        return RemoteFile(
+            name=handle.name,
+            state=state,
+            mime_type=getattr(handle, 'mime_type', None),
+            uri=getattr(handle, 'uri', None),
+            expiration_time=getattr(handle, 'expiration_time', None),
+            raw=handle
+        )
+
+    @classmethod
+    def _to_sdk_contents(cls, contents):
+        """Replace RemoteFile parts with the SDK's file handles"""
+        if isinstance(contents, RemoteFile):
+            return contents.raw if contents.raw is not None else {
+                'file_data': {'mime_type': contents.mime_type, 'file_uri': contents.uri}
+            }
+        if isinstance(contents, dict) and 'parts' in contents:
+            return {**contents, 'parts': cls._to_sdk_contents(contents['parts'])}
+        if isinstance(contents, (list, tuple)):
+            return [cls._to_sdk_contents(part) for part in contents]
+        return contents
+
+    @staticmethod
+    def _result(response, text: str) -> GenerationResult:
+        """Finish reason and token usage of an SDK response"""
+        try:
+            finish_reason = GEMINI_FINISH_REASONS.get(int(response.candidates[0].finish_reason), FinishReason.OTHER)
+        except Exception:
+            finish_reason = FinishReason.OTHER
+
+        usage = {}
+        metadata = getattr(response, 'usage_metadata', None)
+        if metadata is not None:
+            usage = {
+                'prompt_tokens': getattr(metadata, 'prompt_token_count', 0) or 0,
+                'audio_tokens': sum(
+                    getattr(detail, 'token_count', 0) or 0
+                    for detail in getattr(metadata, 'prompt_tokens_details', None) or []
+                    if getattr(getattr(detail, 'modality', None), 'name', '') == 'AUDIO'
+                ),
+                'output_tokens': getattr(metadata, 'candidates_token_count', 0) or 0,
+                'total_tokens': getattr(metadata, 'total_token_count', 0) or 0,
+            }
+        return GenerationResult(text=text, finish_reason=finish_reason, usage=usage)
+
+    @staticmethod
+    def _response_text(response) -> str:
+        """Text of a complete response"""
+        try:
+            return response.text
+        except Exception:
+            # Fallback to candidates
+            try:
+                return response.candidates[0].content.parts[0].text
+            except Exception:
+                raise Exception("Could not extract text from Gemini response")
+
+    def _model(self, model_name: str, system_instruction: Optional[str] = None):
+        return self.genai.GenerativeModel(model_name=model_name, system_instruction=system_instruction)
+
+    def upload_file(self, path: str, mime_type: str) -> RemoteFile:
+        return self._to_remote_file(self.genai.upload_file(path=path, mime_type=mime_type))
+
+    def get_file(self, name: str) -> RemoteFile:
+        return self._to_remote_file(self.genai.get_file(name))
+
+    def delete_file(self, name: str) -> None:
+        self.genai.delete_file(name)
+
+    def generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationResult:
+        response = self._model(model_name, system_instruction).generate_content(
+            self._to_sdk_contents(contents),
+            generation_config=generation_config,
+            request_options=request_options
+        )
+        return self._result(response, self._response_text(response))
+
+    def stream_generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationStream:
+        response = self._model(model_name, system_instruction).generate_content(
+            self._to_sdk_contents(contents),
+            generation_config=generation_config,
+            request_options=request_options,
+            stream=True
+        )
+
+        def chunks():
+            for chunk in response:
+                try:
+                    text = chunk.text
+                except Exception:
+                    # Chunks without text parts (e.g. the final metadata chunk)
+                    continue
+                if text:
+                    yield text
+
+        return GenerationStream(chunks(), lambda text: self._result(response, text))
+
+    def chat(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        # Reconfigure before every chat: some libraries (like sentence-transformers,
+        # used for embeddings) can interfere with the SDK's HTTP client settings
+        self.genai.configure(api_key=settings.GEMINI_API_KEY)
+        chat = self._model(model_name, system_instruction).start_chat(history=history)
+        response = chat.send_message(message)
+        return self._result(response, self._response_text(response))
+
+    async def chat_async(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        self.genai.configure(api_key=settings.GEMINI_API_KEY)
+        chat = self._model(model_name, system_instruction).start_chat(history=history)
+        response = await chat.send_message_async(message)
+        return self._result(response, self._response_text(response))
+
+
+@lru_cache()
+def get_ai_provider() -> AIProvider:
+    """The provider selected by AI_PROVIDER (created once per process)"""
+    provider_name = (settings.AI_PROVIDER or '').lower()
+    if provider_name == 'fake':
+        from app.services.fake_ai_provider import FakeAIProvider
+
+        logger.warning("[AI PROVIDER] Using the fake AI provider - no real model is called")
+        provider = FakeAIProvider()
+    else:
+        if provider_name != 'gemini':
+            logger.warning(f"[AI PROVIDER] Unknown AI_PROVIDER '{provider_name}', using 'gemini'")
+        provider = GeminiProvider()
+
+    if settings.AI_RATE_LIMIT_ENABLED:
+        from app.services.ai_rate_limiter import RateLimitedProvider
+
+        provider = RateLimitedProvider(provider)
+    return provider
@@ -0,0 +1,389 @@
+"""
+AI Rate Limiter - Cluster-wide token bucket for model API calls
+
+Every Celery worker and every API process calls the model independently,
+so without coordination they only find out about the quota from 429s -
+and then all retry at once. The limiter keeps one token bucket per model
+in Redis, shared by every process and refilled continuously:
+
+- requests per minute (AI_RATE_LIMIT_RPM)
+- input tokens per minute (AI_RATE_LIMIT_TPM), reserved from an estimate
+  before the call and corrected with the reported usage afterwards
+
+Calls go through one of two lanes. The chat lane may use the whole bucket;
+the batch lane (note generation) stops while less than AI_RATE_LIMIT_CHAT_RESERVE
+of it is left, so interactive chat keeps headroom when notes saturate the quota.
+
+Both limits are scaled by a shared multiplier adjusted with AIMD: every
+successful call adds AI_RATE_LIMIT_INCREASE_STEP (up to 1.0), every 429
+multiplies it by AI_RATE_LIMIT_DECREASE_FACTOR (at most once per cooldown,
+since one burst produces many 429s). Throughput then settles just below the
+real quota instead of oscillating around it.
+
+Only generation and chat calls are limited; File API calls pass through.
+Workers wait in their thread (acquire); the API's chat_async waits with
+asyncio (acquire_async) so the event loop keeps serving other requests.
+Redis errors are logged and the call is allowed (fail open).
+"""
+import asyncio
+import logging
+import random
+import time
+from typing import Dict, List, Optional
+
+import redis
+
+from app.core.config import settings
+from app.services.ai_provider import AIProvider, GenerationResult, GenerationStream, RemoteFile
+
+logger = logging.getLogger(__name__)
+
+CHAT_LANE = 'chat'
+BATCH_LANE = 'batch'
+
+# Take tokens from the bucket, or report how long to wait for them
+ACQUIRE_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local multiplier = tonumber(redis.call('HGET', KEYS[2], 'multiplier') or '1')
+local rpm = tonumber(ARGV[1]) * multiplier
+local tpm = tonumber(ARGV[2]) * multiplier
+local reserve = tonumber(ARGV[4])
+
+local bucket = redis.call('HMGET', KEYS[1], 'requests', 'tokens', 'updated_at')
+local requests = tonumber(bucket[1]) or rpm
+local tokens = tonumber(bucket[2]) or tpm
+local updated_at = tonumber(bucket[3]) or now
+local elapsed = math.max(now - updated_at, 0)
+requests = math.min(rpm, requests + elapsed * rpm / 60)
+tokens = math.min(tpm, tokens + elapsed * tpm / 60)
+
+-- A request larger than the bucket would never fit: let it take what the lane may use
+local wanted = math.min(tonumber(ARGV[3]), tpm * (1 - reserve))
+local need_requests = 1 + reserve * rpm
+local need_tokens = wanted + reserve * tpm
+local wait = 0
+if requests < need_requests then
+    wait = (need_requests - requests) * 60 / rpm
+end
+if tokens < need_tokens then
+    wait = math.max(wait, (need_tokens - tokens) * 60 / tpm)
+end
+
+local granted = 0
+if wait == 0 then
+    granted = 1
+    requests = requests - 1
+    tokens = tokens - wanted
+end
+redis.call('HSET', KEYS[1], 'requests', requests, 'tokens', tokens, 'updated_at', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return {granted, tostring(wait)}
+"""
+
+# Additive increase on success, multiplicative decrease on a 429
+ADJUST_SCRIPT = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local multiplier = tonumber(redis.call('HGET', KEYS[1], 'multiplier') or '1')
+
+if ARGV[1] == 'throttled' then
+    local decreased_at = tonumber(redis.call('HGET', KEYS[1], 'decreased_at') or '0')
+    if now - decreased_at >= tonumber(ARGV[5]) then
+        multiplier = math.max(tonumber(ARGV[4]), multiplier * tonumber(ARGV[3]))
+        redis.call('HSET', KEYS[1], 'decreased_at', now)
+    end
+elseif multiplier < 1 then
+    multiplier = math.min(1, multiplier + tonumber(ARGV[2]))
+end
+redis.call('HSET', KEYS[1], 'multiplier', multiplier)
+redis.call('EXPIRE', KEYS[1], 86400)
+return tostring(multiplier)
+"""
+
+
+class AIRateLimitTimeout(Exception):
+    """No capacity became free within the lane's maximum wait"""
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """True if the API rejected a call because of its quota (HTTP 429)"""
+    error_str = str(error).lower()
+    return (
+        '429' in error_str
+        or 'resource has been exhausted' in error_str
+        or 'resourceexhausted' in type(error).__name__.lower()
+    )
+
+
+class AIRateLimiter:
+    """Shared token buckets and AIMD multipliers in Redis"""
+
+    BUCKET_KEY = "neviso:ai_rate_limit:{model}:bucket"
+    AIMD_KEY = "neviso:ai_rate_limit:{model}:aimd"
+
+    def __init__(self):
+        self._redis_client = None
+        self._scripts = None
+
+    @property
+    def redis_client(self):
+        """Redis connection, created on first use"""
+        if self._redis_client is None:
+            self._redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        return self._redis_client
+
+    @property
+    def scripts(self) -> Dict:
+        """Lua scripts, registered on first use"""
+        if self._scripts is None:
+            self._scripts = {
+                'acquire': self.redis_client.register_script(ACQUIRE_SCRIPT),
+                'adjust': self.redis_client.register_script(ADJUST_SCRIPT),
+            }
+        return self._scripts
+
+    @staticmethod
+    def lane_settings(lane: str) -> Dict:
+        """Reserve left untouched and maximum wait of a lane"""
+        if lane == CHAT_LANE:
+            return {'reserve': 0.0, 'max_wait': settings.AI_RATE_LIMIT_CHAT_MAX_WAIT_SECONDS}
+        return {'reserve': settings.AI_RATE_LIMIT_CHAT_RESERVE, 'max_wait': settings.AI_RATE_LIMIT_BATCH_MAX_WAIT_SECONDS}
+
+    def try_acquire(self, model_name: str, lane: str, tokens: int) -> float:
+        """
+        Take one request and tokens from the bucket if they are available
+
+        Returns:
+            0 if granted, otherwise seconds until they should be
+        """
+        granted, wait = self.scripts['acquire'](
+            keys=[self.BUCKET_KEY.format(model=model_name), self.AIMD_KEY.format(model=model_name)],
+            args=[
+                settings.AI_RATE_LIMIT_RPM,
+                settings.AI_RATE_LIMIT_TPM,
+                max(int(tokens), 0),
+                self.lane_settings(lane)['reserve']
+            ]
+        )
+        return 0.0 if int(granted) else max(float(wait), 0.01)
+
+    def _next_sleep(self, lane: str, started: float, wait: float) -> float:
+        """Seconds to sleep before trying again, or raise once the lane's maximum wait is exceeded"""
+        max_wait = self.lane_settings(lane)['max_wait']
+        if time.monotonic() - started + wait > max_wait:
+            raise AIRateLimitTimeout(
+                f"429 AI rate limit: no capacity for the {lane} lane within {max_wait}s"
+            )
+        # Jitter so waiting processes do not all retry at the same moment
+        return wait + random.uniform(0, min(wait, 1.0) * 0.2)
+
+    def acquire(self, model_name: str, lane: str, tokens: int) -> float:
+        """
+        Block until the call may be made (runs in a worker thread)
+
+        Returns:
+            Seconds waited
+
+        Raises:
+            AIRateLimitTimeout: If the lane's maximum wait was exceeded
+        """
+        started = time.monotonic()
+        while True:
+            try:
+                wait = self.try_acquire(model_name, lane, tokens)
+            except Exception as e:
+                logger.warning(f"[RATE LIMIT] Limiter unavailable, allowing call: {str(e)}")
+                return time.monotonic() - started
+            if wait == 0:
+                return time.monotonic() - started
+            time.sleep(self._next_sleep(lane, started, wait))
+
+    async def acquire_async(self, model_name: str, lane: str, tokens: int) -> float:
+        """Same as acquire, waiting without blocking the event loop"""
+        started = time.monotonic()
+        while True:
+            try:
+                wait = await asyncio.to_thread(self.try_acquire, model_name, lane, tokens)
+            except Exception as e:
+                logger.warning(f"[RATE LIMIT] Limiter unavailable, allowing call: {str(e)}")
+                return time.monotonic() - started
+            if wait == 0:
+                return time.monotonic() - started
+            await asyncio.sleep(self._next_sleep(lane, started, wait))
+
+    def reconcile(self, model_name: str, estimated_tokens: int, actual_tokens: int) -> None:
+        """Correct the bucket once the real input token count is known"""
+        if not actual_tokens or actual_tokens == estimated_tokens:
+            return
+        try:
+            self.redis_client.hincrbyfloat(
+                self.BUCKET_KEY.format(model=model_name), 'tokens', estimated_tokens - actual_tokens
+            )
+        except Exception as e:
+            logger.warning(f"[RATE LIMIT] Could not reconcile tokens: {str(e)}")
+
+    def _adjust(self, model_name: str, outcome: str) -> Optional[float]:
+        try:
+            return float(self.scripts['adjust'](
+                keys=[self.AIMD_KEY.format(model=model_name)],
+                args=[
+                    outcome,
+                    settings.AI_RATE_LIMIT_INCREASE_STEP,
+                    settings.AI_RATE_LIMIT_DECREASE_FACTOR,
+                    settings.AI_RATE_LIMIT_MIN_MULTIPLIER,
+                    settings.AI_RATE_LIMIT_DECREASE_COOLDOWN_SECONDS
+                ]
+            ))
+        except Exception as e:
+            logger.warning(f"[RATE LIMIT] Could not update limit multiplier: {str(e)}")
+            return None
+
+    def record_success(self, model_name: str) -> Optional[float]:
+        """Additive increase after a call the API accepted"""
+        return self._adjust(model_name, 'success')
+
+    def record_throttled(self, model_name: str) -> Optional[float]:
+        """Multiplicative decrease after a 429"""
+        multiplier = self._adjust(model_name, 'throttled')
+        if multiplier is not None:
+            logger.warning(f"[RATE LIMIT] 429 from {model_name}, limit multiplier now {multiplier:.2f}")
+        return multiplier
+
+    def get_multiplier(self, model_name: str) -> float:
+        """Current AIMD multiplier of a model (1.0 = full configured quota)"""
+        try:
+            value = self.redis_client.hget(self.AIMD_KEY.format(model=model_name), 'multiplier')
+        except Exception:
+            return 1.0
+        return float(value) if value else 1.0
+
+
+# Singleton instance
+ai_rate_limiter = AIRateLimiter()
+
+
+class RateLimitedProvider(AIProvider):
+    """Provider wrapper that passes generation and chat calls through the limiter"""
+
+    def __init__(self, provider: AIProvider, limiter: AIRateLimiter = ai_rate_limiter):
+        self.provider = provider
+        self.limiter = limiter
+        self.name = provider.name
+
+    @staticmethod
+    def estimate_tokens(contents, system_instruction: Optional[str] = None) -> int:
+        """Rough input token count of a request, before the API reports it"""
+        def count(part) -> int:
+            if isinstance(part, str):
+                return len(part) // 4
+            if isinstance(part, RemoteFile):
+                return settings.AI_RATE_LIMIT_FILE_TOKENS
+            if isinstance(part, dict):
+                return count(part.get('parts', []))
+            if isinstance(part, (list, tuple)):
+                return sum(count(item) for item in part)
+            return 0
+        return count(contents) + len(system_instruction or '') // 4
+
+    def _settle(self, model_name: str, estimated: int, waited: float, result: GenerationResult) -> GenerationResult:
+        result.rate_limit_wait_seconds = waited
+        self.limiter.record_success(model_name)
+        self.limiter.reconcile(model_name, estimated, result.usage.get('prompt_tokens', 0))
+        return result
+
+    def _call(self, lane: str, model_name: str, estimated: int, call, *args, **kwargs):
+        """
+        Wait for capacity, make the call and feed its outcome back
+
+        Returns:
+            Tuple of (call result, seconds waited for capacity)
+        """
+        waited = self.limiter.acquire(model_name, lane, estimated)
+        if waited >= 1:
+            logger.info(f"[RATE LIMIT] {lane} call to {model_name} waited {waited:.1f}s")
+        try:
+            return call(*args, **kwargs), waited
+        except Exception as e:
+            if is_rate_limit_error(e):
+                self.limiter.record_throttled(model_name)
+            raise
+
+    async def _call_async(self, lane: str, model_name: str, estimated: int, call, *args, **kwargs):
+        """Same as _call for a coroutine function"""
+        waited = await self.limiter.acquire_async(model_name, lane, estimated)
+        if waited >= 1:
+            logger.info(f"[RATE LIMIT] {lane} call to {model_name} waited {waited:.1f}s")
+        try:
+            return await call(*args, **kwargs), waited
+        except Exception as e:
+            if is_rate_limit_error(e):
+                await asyncio.to_thread(self.limiter.record_throttled, model_name)
+            raise
+
+    def upload_file(self, path: str, mime_type: str) -> RemoteFile:
+        return self.provider.upload_file(path, mime_type)
+
+    def get_file(self, name: str) -> RemoteFile:
+        return self.provider.get_file(name)
+
+    def delete_file(self, name: str) -> None:
+        self.provider.delete_file(name)
+
+    def generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationResult:
+        estimated = self.estimate_tokens(contents, system_instruction)
+        result, waited = self._call(
+            BATCH_LANE, model_name, estimated, self.provider.generate, model_name, contents,
+            system_instruction=system_instruction, generation_config=generation_config,
+            request_options=request_options
+        )
+        return self._settle(model_name, estimated, waited, result)
+
+    def stream_generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationStream:
+        estimated = self.estimate_tokens(contents, system_instruction)
+        stream, waited = self._call(
+            BATCH_LANE, model_name, estimated, self.provider.stream_generate, model_name, contents,
+            system_instruction=system_instruction, generation_config=generation_config,
+            request_options=request_options
+        )
+        return GenerationStream(stream, lambda text: self._settle(model_name, estimated, waited, stream.result()))
+
+    def chat(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        estimated = self.estimate_tokens([history, message], system_instruction)
+        result, waited = self._call(
+            CHAT_LANE, model_name, estimated, self.provider.chat, model_name, system_instruction, history, message
+        )
+        return self._settle(model_name, estimated, waited, result)
+
+    async def chat_async(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        estimated = self.estimate_tokens([history, message], system_instruction)
+        result, waited = await self._call_async(
+            CHAT_LANE, model_name, estimated, self.provider.chat_async, model_name, system_instruction, history, message
+        )
+        return await asyncio.to_thread(self._settle, model_name, estimated, waited, result)
@@ -1,12 +1,23 @@
-import google.generativeai as genai
+import asyncio
+import hashlib
 import time
 import json
 import mimetypes
 import os
-import subprocess
 import tempfile
 from typing import Dict, List, Optional, Tuple
 from app.core.config import settings
+from app.services.ai_provider import get_ai_provider, FinishReason, GenerationResult
+from app.services.media_headers import read_media_info
+from app.services.transcode_service import transcode_pool, TranscodeTimeoutError
+from app.services.speech_optimizer import optimize_speech_file
+from app.services.image_optimizer import optimize_image
+from app.services.video_preprocessor import preprocess_video, get_video_policy
+from app.services.remote_file_registry import remote_file_registry
+from app.services.note_stream_parser import NoteEnvelopeParser, parse_note_output
+from app.services.progress_service import note_progress
+from app.services.usage_service import usage_service
+from app.services.html_processor import html_processor
 from app.services.exceptions import (
     QuotaExceededError,
     InvalidFormatError,
@@ -17,9 +28,6 @@ from app.services.exceptions import (
     UnknownAIError
 )
 
-# Configure Gemini with direct API key (for file upload support)
-genai.configure(api_key=settings.GEMINI_API_KEY)
-
 # Add additional MIME types that may not be in the standard library
 mimetypes.add_type('audio/x-m4a', '.m4a')
 mimetypes.add_type('audio/mp4', '.m4a')
@@ -84,12 +92,14 @@ def get_mime_type(file_path: str) -> str:
     return mime_map.get(ext, 'application/octet-stream')
 
 
-def compress_audio_file(file_path: str, target_bitrate: str = "48k") -> Tuple[str, bool]:
+async def compress_audio_file(file_path: str, target_bitrate: str = "48k") -> Tuple[str, bool]:
     """
     Compress an audio file using ffmpeg to reduce size before upload.
 
     Uses opus codec with low bitrate optimized for speech recognition.
     Only compresses audio files; returns original path for non-audio files.
+    ffmpeg runs through the shared transcode pool, so this never blocks the
+    event loop and the host-wide ffmpeg limit is respected.
 
     Args:
         file_path: Path to the original file
@@ -116,13 +126,14 @@ def compress_audio_file(file_path: str, target_bitrate: str = "48k") -> Tuple[st
         print(f"[COMPRESS] File is small ({original_size_mb:.2f} MB), skipping compression")
         return file_path, False
 
+    temp_path = None
     try:
         # Create temporary file for compressed output
         # Use .ogg extension for opus codec
         temp_fd, temp_path = tempfile.mkstemp(suffix='.ogg')
         os.close(temp_fd)
 
-        # ffmpeg command for audio compression
+        # ffmpeg arguments for audio compression
         # -y: overwrite output
         # -i: input file
         # -vn: no video (strip video if present)
@@ -130,8 +141,7 @@ def compress_audio_file(file_path: str, target_bitrate: str = "48k") -> Tuple[st
         # -ar 16000: 16kHz sample rate (good for speech recognition)
         # -c:a libopus: use opus codec (best quality/size ratio)
         # -b:a: target bitrate
-        cmd = [
-            'ffmpeg',
+        args = [
             '-y',
             '-i', file_path,
             '-vn',
@@ -142,16 +152,18 @@ def compress_audio_file(file_path: str, target_bitrate: str = "48k") -> Tuple[st
             temp_path
         ]
 
+        # Known duration lets the pool report percentage progress
+        header_info = await asyncio.to_thread(read_media_info, file_path)
+
         print(f"[COMPRESS] Running ffmpeg compression...")
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            timeout=300  # 5 minute timeout
+        result = await transcode_pool.run_ffmpeg(
+            args,
+            label=os.path.basename(file_path),
+            duration_seconds=header_info['duration_seconds'] if header_info else None
         )
 
-        if result.returncode != 0:
-            print(f"[COMPRESS] ffmpeg failed: {result.stderr}")
+        if result['returncode'] != 0:
+            print(f"[COMPRESS] ffmpeg failed: {result['stderr']}")
             # Clean up temp file on failure
             if os.path.exists(temp_path):
                 os.remove(temp_path)
@@ -164,6 +176,7 @@ def compress_audio_file(file_path: str, target_bitrate: str = "48k") -> Tuple[st
 
         print(f"[COMPRESS] Compressed size: {compressed_size_mb:.2f} MB")
         print(f"[COMPRESS] Size reduction: {reduction:.1f}%")
+        print(f"[COMPRESS] Waited {result['wait_seconds']:.1f}s for a slot, encoded in {result['run_seconds']:.1f}s")
 
         # Only use compressed file if it's actually smaller
         if compressed_size >= original_size:
@@ -174,14 +187,14 @@ def compress_audio_file(file_path: str, target_bitrate: str = "48k") -> Tuple[st
         print(f"[COMPRESS] ✓ Using compressed file: {temp_path}")
         return temp_path, True
 
-    except subprocess.TimeoutExpired:
+    except TranscodeTimeoutError:
         print(f"[COMPRESS] ffmpeg timed out, using original file")
-        if os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.remove(temp_path)
         return file_path, False
     except Exception as e:
         print(f"[COMPRESS] Compression error: {str(e)}, using original file")
-        if 'temp_path' in locals() and os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             os.remove(temp_path)
         return file_path, False
 
@@ -332,7 +345,462 @@ Output **must be ONLY** a valid JSON object in the following structure (Strictly
 # """
 
 
-async def process_files_with_gemini(file_paths: List[str]) -> Dict[str, str]:
+# Generation settings shared by every note request
+GENERATION_CONFIG = {
+    "max_output_tokens": 100000,
+    "temperature": 0.4,
+    "top_p": 0.95,
+}
+
+# Output contract enforced by the API when GEMINI_RESPONSE_SCHEMA_ENABLED is on
+NOTE_RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string"},
+        "note": {"type": "string"},
+    },
+    "required": ["title", "note"],
+}
+
+
+def get_note_generation_config(max_output_tokens: Optional[int] = None) -> Dict:
+    """Generation config for note requests (with the JSON schema if enabled)"""
+    generation_config = dict(GENERATION_CONFIG)
+    if max_output_tokens:
+        generation_config["max_output_tokens"] = max_output_tokens
+    if settings.GEMINI_RESPONSE_SCHEMA_ENABLED:
+        generation_config["response_mime_type"] = "application/json"
+        generation_config["response_schema"] = NOTE_RESPONSE_SCHEMA
+    return generation_config
+
+
+def get_preparation_settings(speech_optimization: bool = False) -> Dict:
+    """Settings that change what is uploaded for an input file"""
+    return {
+        "image_optimization": [
+            settings.IMAGE_MAX_EDGE,
+            settings.IMAGE_OUTPUT_FORMAT,
+            settings.IMAGE_QUALITY,
+            settings.IMAGE_DOCUMENT_CROP,
+        ] if settings.IMAGE_OPTIMIZATION_ENABLED else None,
+        "video_preprocessing": [
+            get_video_policy(),
+            settings.VIDEO_AUDIO_BITRATE,
+            settings.VIDEO_SCENE_THRESHOLD,
+            settings.VIDEO_MAX_FRAMES,
+            settings.VIDEO_FRAME_MAX_EDGE,
+            settings.VIDEO_MIN_DISTINCT_FRAMES,
+        ],
+        "speech_optimization": [
+            settings.SPEECH_SILENCE_THRESHOLD_DB,
+            settings.SPEECH_MIN_SILENCE_SECONDS,
+            settings.SPEECH_SILENCE_PADDING_SECONDS,
+            settings.SPEECH_TEMPO,
+        ] if speech_optimization else None,
+    }
+
+
+def get_preparation_version(speech_optimization: bool = False, compress: bool = True) -> str:
+    """
+    Fingerprint of how input files are prepared before upload
+
+    Remote files are reused only while this value is unchanged.
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    fingerprint = json.dumps(
+        {**get_preparation_settings(speech_optimization), "compress": compress},
+        sort_keys=True
+    )
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+def get_prompt_version(speech_optimization: bool = False, segmented: bool = False) -> str:
+    """
+    Fingerprint of everything besides the input files that shapes a note
+
+    Cached results are keyed by this value, so editing the system
+    instruction, the model, the generation settings or the image / video /
+    speech optimization / segmentation settings invalidates them. Segmented
+    notes upload plain audio segments, so only the silence detection used to
+    cut them counts, not the speech optimization toggle.
+
+    Args:
+        speech_optimization: Whether audio is trimmed/sped up before upload
+        segmented: Whether the note is generated segment by segment
+
+    Returns:
+        Hex SHA-256 digest
+    """
+    fingerprint = json.dumps({
+        "model": settings.GEMINI_TRANSCRIPTION_MODEL,
+        "system_instruction": SYSTEM_INSTRUCTION,
+        "generation_config": get_note_generation_config(),
+        **get_preparation_settings(speech_optimization and not segmented),
+        "segmented": [
+            settings.SEGMENT_MINUTES,
+            settings.SEGMENT_CUT_WINDOW_SECONDS,
+            settings.SEGMENT_MAX_OUTPUT_TOKENS,
+            settings.SPEECH_SILENCE_THRESHOLD_DB,
+            settings.SPEECH_MIN_SILENCE_SECONDS,
+        ] if segmented else None,
+    }, sort_keys=True)
+    return hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+
+async def prepare_file_for_upload(file_path: str, speech_optimization: bool = False) -> Dict:
+    """
+    Shrink a file before upload (image/video preprocessing, speech optimization or plain compression)
+
+    Args:
+        file_path: Original file
+        speech_optimization: Trim silence / speed up audio files
+
+    Returns:
+        Dict with path, is_temporary, speech (optimizer stats or None),
+        extra_paths (further temporary files to upload, e.g. video keyframes)
+        and labels (text part sent before each file, None for no label)
+    """
+    if get_mime_type(file_path).startswith('video/'):
+        processed = await preprocess_video(file_path, speech_optimization)
+        if processed:
+            return {
+                'path': processed['path'],
+                'is_temporary': True,
+                'speech': processed['speech'],
+                'extra_paths': processed['extra_paths'],
+                'labels': processed['labels']
+            }
+        return {'path': file_path, 'is_temporary': False, 'speech': None}
+
+    if get_mime_type(file_path).startswith('image/'):
+        if not settings.IMAGE_OPTIMIZATION_ENABLED:
+            return {'path': file_path, 'is_temporary': False, 'speech': None}
+        path, is_temporary = await asyncio.to_thread(optimize_image, file_path)
+        return {'path': path, 'is_temporary': is_temporary, 'speech': None}
+
+    if speech_optimization and get_mime_type(file_path).startswith('audio/'):
+        optimized = await optimize_speech_file(file_path)
+        if optimized:
+            return {'path': optimized['path'], 'is_temporary': True, 'speech': optimized}
+        print(f"[COMPRESS] Speech optimization unavailable for {file_path}, using plain compression")
+
+    path, is_temporary = await compress_audio_file(file_path)
+    return {'path': path, 'is_temporary': is_temporary, 'speech': None}
+
+
+async def prepare_files(
+    file_paths: List[str],
+    indexes: List[int],
+    speech_optimization: bool = False,
+    compress: bool = True
+) -> Dict[int, Dict]:
+    """
+    Prepare several input files for upload concurrently
+
+    Args:
+        file_paths: All input files of the note
+        indexes: Positions in file_paths to prepare
+        speech_optimization: Trim silence / speed up audio files
+        compress: Off to upload the files unchanged
+
+    Returns:
+        prepare_file_for_upload outcome per index (the original file when
+        its preparation failed)
+    """
+    if not compress:
+        return {i: {'path': file_paths[i], 'is_temporary': False, 'speech': None} for i in indexes}
+
+    # All files are compressed concurrently; the transcode pool caps ffmpeg per host
+    outcomes = await asyncio.gather(
+        *(prepare_file_for_upload(file_paths[i], speech_optimization) for i in indexes),
+        return_exceptions=True
+    )
+    prepared = {}
+    for file_index, outcome in zip(indexes, outcomes):
+        if isinstance(outcome, BaseException):
+            print(f"[GEMINI]   ⚠ Compression of file {file_index + 1} failed ({outcome}), using original")
+            outcome = {'path': file_paths[file_index], 'is_temporary': False, 'speech': None}
+        prepared[file_index] = outcome
+    return prepared
+
+
+def temporary_paths(outcome: Dict) -> List[str]:
+    """Files created by preparing one input file (to delete after upload)"""
+    paths = [outcome['path']] if outcome['is_temporary'] else []
+    return paths + list(outcome.get('extra_paths', []))
+
+
+def classify_upload_error(upload_error: Exception) -> Exception:
+    """Map a File API upload failure to one of our AI exceptions"""
+    error_str = str(upload_error).lower()
+    if "quota" in error_str or "limit" in error_str or "exceeded" in error_str:
+        return QuotaExceededError()
+    elif "invalid" in error_str or "format" in error_str or "unsupported" in error_str:
+        return InvalidFormatError()
+    elif "network" in error_str or "connection" in error_str or "timeout" in error_str:
+        return NetworkError()
+    elif "too large" in error_str or "size" in error_str:
+        return FileTooLargeError()
+    return UnknownAIError(f"خطا در آپلود فایل: {str(upload_error)}")
+
+
+async def upload_file_to_gemini(
+    file_path: str,
+    is_temporary: bool,
+    original_path: str,
+    index: int,
+    total: int,
+    semaphore: asyncio.Semaphore
+) -> Tuple[object, float]:
+    """
+    Upload one file to the Gemini File API once a slot in the semaphore is free
+
+    Returns:
+        Tuple of (uploaded file handle, upload duration in seconds)
+
+    Raises:
+        QuotaExceededError, InvalidFormatError, NetworkError, FileTooLargeError
+        or UnknownAIError depending on the failure
+    """
+    async with semaphore:
+        print(f"[GEMINI]   Uploading file {index}/{total}: {file_path}")
+        if is_temporary:
+            print(f"[GEMINI]   (compressed from: {original_path})")
+        mime_type = get_mime_type(file_path)
+        print(f"[GEMINI]   Detected MIME type: {mime_type}")
+
+        started = time.monotonic()
+        try:
+            # SDK calls are blocking - keep them off the event loop
+            uploaded_file = await asyncio.to_thread(get_ai_provider().upload_file, file_path, mime_type)
+        except Exception as upload_error:
+            print(f"[GEMINI]   ✗ Failed to upload file {index}: {str(upload_error)}")
+            raise classify_upload_error(upload_error)
+        upload_seconds = time.monotonic() - started
+
+    print(f"[GEMINI]   ✓ File {index} uploaded in {upload_seconds:.1f}s: {uploaded_file.name}")
+    return uploaded_file, upload_seconds
+
+
+async def wait_for_file_ready(uploaded_file, index: int, deadline: float) -> Tuple[object, float]:
+    """
+    Poll an uploaded file until it leaves PROCESSING, backing off exponentially
+
+    Args:
+        uploaded_file: Handle returned by the provider's upload_file
+        index: File number for log lines
+        deadline: time.monotonic() value after which we continue anyway
+
+    Returns:
+        Tuple of (latest file handle, seconds spent waiting)
+
+    Raises:
+        ContentGenerationError: If Gemini failed to process the file
+    """
+    started = time.monotonic()
+    delay = settings.GEMINI_FILE_POLL_INITIAL_SECONDS
+
+    while uploaded_file.state.name == "PROCESSING":
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            print(f"[GEMINI]   ⚠ Warning: File {index} still processing, continuing anyway...")
+            break
+        print(f"[GEMINI]   Waiting {min(delay, remaining):.1f}s for file {index} to be processed...")
+        await asyncio.sleep(min(delay, remaining))
+        delay = min(delay * 2, settings.GEMINI_FILE_POLL_MAX_SECONDS)
+        uploaded_file = await asyncio.to_thread(get_ai_provider().get_file, uploaded_file.name)
+
+    if uploaded_file.state.name == "FAILED":
+        print(f"[GEMINI]   ✗ File {index} processing failed")
+        raise ContentGenerationError("پردازش فایل در سرور Gemini با خطا مواجه شد")
+
+    print(f"[GEMINI]   ✓ File {index} ready: {uploaded_file.state.name}")
+    return uploaded_file, time.monotonic() - started
+
+
+async def get_registered_files(
+    note_id: Optional[int],
+    fingerprint: Optional[str]
+) -> Optional[Tuple[List, Optional[Dict], Optional[List]]]:
+    """
+    Remote files registered for one input file, if all of them are still usable
+
+    Returns:
+        Tuple of (remote file handles, speech stats, labels) or None
+    """
+    if note_id is None or not fingerprint:
+        return None
+    entry = await asyncio.to_thread(remote_file_registry.get, note_id, fingerprint)
+    if not entry:
+        return None
+
+    try:
+        remote_files = await asyncio.gather(*(
+            asyncio.to_thread(get_ai_provider().get_file, name) for name in entry['remote_names']
+        ))
+    except Exception as e:
+        print(f"[GEMINI]   Registered remote file is gone ({str(e)}), uploading again")
+        remote_file_registry.forget(note_id, fingerprint)
+        return None
+
+    if any(remote_file.state.name == "FAILED" for remote_file in remote_files):
+        remote_file_registry.forget(note_id, fingerprint)
+        return None
+    return remote_files, entry.get('speech'), entry.get('labels')
+
+
+async def find_registered_files(
+    file_paths: List[str],
+    note_id: Optional[int],
+    content_hashes: Optional[List[Optional[str]]],
+    speech_optimization: bool = False,
+    compress: bool = True
+) -> Tuple[List[Optional[str]], Dict[int, Tuple[List, Optional[Dict], Optional[List]]]]:
+    """
+    Remote files an earlier attempt of the note uploaded and that can be reused
+
+    Returns:
+        Tuple of (registry fingerprint per input file, get_registered_files
+        entry per reusable file index)
+    """
+    fingerprints = [None] * len(file_paths)
+    if note_id is not None and content_hashes and settings.REMOTE_FILE_REUSE_ENABLED:
+        preparation_version = get_preparation_version(speech_optimization, compress)
+        fingerprints = [
+            remote_file_registry.build_fingerprint(content_hash, preparation_version)
+            for content_hash in content_hashes
+        ]
+    registered = await asyncio.gather(*(
+        get_registered_files(note_id, fingerprint) for fingerprint in fingerprints
+    ))
+    return fingerprints, {i: entry for i, entry in enumerate(registered) if entry is not None}
+
+
+# Sent after a response stopped at MAX_TOKENS
+CONTINUATION_PROMPT = (
+    "Your previous answer was cut off because it reached the output limit. "
+    "Continue the JSON output exactly where it stopped. Do not repeat anything already written, "
+    "do not start a new JSON object and do not add code fences."
+)
+
+# Longest repeated text removed from the start of a continuation
+MAX_CONTINUATION_OVERLAP = 500
+MIN_CONTINUATION_OVERLAP = 20
+
+
+def is_max_tokens(response: GenerationResult) -> bool:
+    """True if the response stopped because it hit the output token limit"""
+    return response.finish_reason == FinishReason.MAX_TOKENS
+
+
+def build_content_parts(prompt: str, uploaded_files: List, labels: List[Optional[str]]) -> List:
+    """Prompt followed by the files, each after its label (e.g. a keyframe's position)"""
+    content_parts = [prompt]
+    for uploaded_file, label in zip(uploaded_files, labels):
+        if label:
+            content_parts.append(label)
+        content_parts.append(uploaded_file)
+    return content_parts
+
+
+def build_continuation_contents(content_parts: List, generated_text: str) -> List[Dict]:
+    """Conversation asking the model to continue its truncated answer"""
+    return [
+        {'role': 'user', 'parts': list(content_parts)},
+        {'role': 'model', 'parts': [generated_text]},
+        {'role': 'user', 'parts': [CONTINUATION_PROMPT]},
+    ]
+
+
+def stitch_continuation(previous: str, continuation: str) -> str:
+    """
+    Append a continuation to truncated output
+
+    A code fence the model opened the continuation with is dropped, and so is
+    text it repeated from the end of the previous output.
+    """
+    if continuation.lstrip().startswith('```'):
+        stripped = continuation.lstrip()
+        continuation = stripped[stripped.find('\n') + 1:] if '\n' in stripped else ''
+
+    longest = min(len(previous), len(continuation), MAX_CONTINUATION_OVERLAP)
+    for size in range(longest, MIN_CONTINUATION_OVERLAP - 1, -1):
+        if previous.endswith(continuation[:size]):
+            return previous + continuation[size:]
+    return previous + continuation
+
+
+async def stream_note_generation(
+    content_parts: List,
+    generation_config: Dict,
+    request_options: Dict,
+    note_id: Optional[int] = None,
+    parser: Optional[NoteEnvelopeParser] = None
+) -> Tuple[GenerationResult, NoteEnvelopeParser, str, Optional[Exception]]:
+    """
+    Generate a note as a stream, parsing the JSON envelope as chunks arrive
+
+    The partial title and note length are published to the note's progress
+    key at most every NOTE_PROGRESS_PUBLISH_INTERVAL_SECONDS. Pass the
+    parser of an earlier round to keep feeding it (continuations).
+
+    Returns:
+        Tuple of (response, parser, text received, error that interrupted
+        the stream or None)
+
+    Raises:
+        Exception: If the request fails before any chunk arrives
+    """
+    parser = parser or NoteEnvelopeParser()
+    chunks = []
+    last_published = 0.0
+
+    stream = await asyncio.to_thread(
+        get_ai_provider().stream_generate,
+        settings.GEMINI_TRANSCRIPTION_MODEL,
+        content_parts,
+        system_instruction=SYSTEM_INSTRUCTION,
+        generation_config=generation_config,
+        request_options=request_options
+    )
+
+    try:
+        while True:
+            # The stream blocks on the network; StopIteration can't cross to_thread
+            text = await asyncio.to_thread(next, stream, None)
+            if text is None:
+                break
+            chunks.append(text)
+            parser.feed(text)
+
+            if time.monotonic() - last_published >= settings.NOTE_PROGRESS_PUBLISH_INTERVAL_SECONDS:
+                last_published = time.monotonic()
+                note_progress.publish(
+                    note_id, 'generating', title=parser.get('title'), note_chars=len(parser.get('note'))
+                )
+    except Exception as stream_error:
+        interrupted = GenerationResult(text=''.join(chunks), finish_reason=FinishReason.OTHER)
+        return interrupted, parser, ''.join(chunks), stream_error
+
+    note_progress.publish(note_id, 'generating', title=parser.get('title'), note_chars=len(parser.get('note')))
+    print(f"[GEMINI]   Streamed {len(chunks)} chunk(s), {parser.chars_consumed} chars")
+    return stream.result(), parser, ''.join(chunks), None
+
+
+async def process_files_with_gemini(
+    file_paths: List[str],
+    speech_optimization: bool = False,
+    prepared_files: Optional[List[Dict]] = None,
+    prompt: Optional[str] = None,
+    compress: bool = True,
+    max_output_tokens: Optional[int] = None,
+    note_id: Optional[int] = None,
+    content_hashes: Optional[List[Optional[str]]] = None,
+    call_type: str = 'note',
+    prepared_uploads: Optional[List[Optional[Dict]]] = None
+) -> Dict[str, str]:
     """
     Process multiple files with Gemini AI and return structured JSON content
 
@@ -340,6 +808,19 @@ async def process_files_with_gemini(file_paths: List[str]) -> Dict[str, str]:
 
     Args:
         file_paths: List of paths to local files to process
+        speech_optimization: Trim silence / speed up audio before upload
+        prepared_files: If given, filled with one dict per input file with
+            speech optimization stats ('speech', None when not optimized)
+        prompt: User prompt sent with the files (default depends on file count)
+        compress: Compress audio before upload (off for already encoded segments)
+        max_output_tokens: Override GENERATION_CONFIG's output limit
+        note_id: Note the files belong to; with content_hashes enables
+            reusing remote files registered by an earlier attempt
+        content_hashes: SHA-256 of each input file, aligned with file_paths
+        call_type: Label of the generation call in the usage records
+        prepared_uploads: prepare_files outcomes made earlier (e.g. by the
+            pipeline's preprocess stage), aligned with file_paths; files
+            without one are prepared here
 
     Returns:
         Dictionary with 'title' and 'note' keys (and optionally other fields)
@@ -354,52 +835,69 @@ async def process_files_with_gemini(file_paths: List[str]) -> Dict[str, str]:
             print(f"[GEMINI] File {i}: {path}")
         print("=" * 80)
 
-        print("[GEMINI] Step 1/5: Compressing audio files...")
+        # Reuse remote files uploaded by an earlier attempt of this note
+        fingerprints, reused = await find_registered_files(
+            file_paths, note_id, content_hashes, speech_optimization, compress
+        )
+        if reused:
+            print(f"[GEMINI] Reusing remote files of {len(reused)}/{len(file_paths)} input file(s)")
+
+        print("[GEMINI] Step 1/5: Compressing audio and image files...")
+        note_progress.publish(note_id, 'preparing')
 
         # Compress audio files before upload to reduce size and upload time
-        files_to_upload = []  # List of (path, is_temporary) tuples
+        files_to_upload = []  # List of (path, is_temporary, original_path, file_index) tuples
         temp_files_to_cleanup = []  # Track temp files for cleanup
-
-        for i, file_path in enumerate(file_paths, 1):
-            print(f"[GEMINI]   Processing file {i}/{len(file_paths)} for compression: {file_path}")
-            compressed_path, is_temp = compress_audio_file(file_path)
-            files_to_upload.append((compressed_path, is_temp))
-            if is_temp:
-                temp_files_to_cleanup.append(compressed_path)
+        speech_stats = {i: entry[1] for i, entry in reused.items()}
+        part_labels = {i: entry[2] for i, entry in reused.items()}
+        pending = [i for i in range(len(file_paths)) if i not in reused]
+
+        # Files prepared by the pipeline's preprocess stage are used as they are
+        prepared = {}
+        for file_index, outcome in enumerate(prepared_uploads or []):
+            if outcome is None:
+                continue
+            if file_index in pending:
+                prepared[file_index] = outcome
+            else:
+                # Remote files were reused after all
+                temp_files_to_cleanup.extend(temporary_paths(outcome))
+
+        compress_started = time.monotonic()
+        prepared.update(await prepare_files(
+            file_paths, [i for i in pending if i not in prepared], speech_optimization, compress
+        ))
+        for file_index in pending:
+            file_path = file_paths[file_index]
+            outcome = prepared[file_index]
+            files_to_upload.append((outcome['path'], outcome['is_temporary'], file_path, file_index))
+            if outcome['is_temporary']:
+                temp_files_to_cleanup.append(outcome['path'])
+            # Video keyframes are uploaded right after their audio track
+            for extra_path in outcome.get('extra_paths', []):
+                files_to_upload.append((extra_path, True, file_path, file_index))
+                temp_files_to_cleanup.append(extra_path)
+            speech_stats[file_index] = outcome['speech']
+            part_labels[file_index] = outcome.get('labels')
+        if prepared_files is not None:
+            for file_index, file_path in enumerate(file_paths):
+                prepared_files.append({'file_path': file_path, 'speech': speech_stats.get(file_index)})
+        print(f"[GEMINI]   Compression finished in {time.monotonic() - compress_started:.1f}s")
 
         print(f"[GEMINI] Step 2/5: Uploading {len(files_to_upload)} file(s) to Gemini...")
+        note_progress.publish(note_id, 'uploading')
 
-        # Upload files to Gemini File API
-        uploaded_files = []
+        # Upload files to Gemini File API concurrently (bounded per note)
+        upload_started = time.monotonic()
+        semaphore = asyncio.Semaphore(max(1, settings.GEMINI_UPLOAD_CONCURRENCY))
         try:
-            for i, (file_path_to_upload, is_temp) in enumerate(files_to_upload, 1):
-                original_path = file_paths[i-1]
-                print(f"[GEMINI]   Uploading file {i}/{len(files_to_upload)}: {file_path_to_upload}")
-                if is_temp:
-                    print(f"[GEMINI]   (compressed from: {original_path})")
-                try:
-                    # Get MIME type for the file
-                    mime_type = get_mime_type(file_path_to_upload)
-                    print(f"[GEMINI]   Detected MIME type: {mime_type}")
-
-                    uploaded_file = genai.upload_file(path=file_path_to_upload, mime_type=mime_type)
-                    uploaded_files.append(uploaded_file)
-                    print(f"[GEMINI]   ✓ File {i} uploaded: {uploaded_file.name}")
-                except Exception as upload_error:
-                    error_str = str(upload_error).lower()
-                    print(f"[GEMINI]   ✗ Failed to upload file {i}: {str(upload_error)}")
-
-                    # Classify the error
-                    if "quota" in error_str or "limit" in error_str or "exceeded" in error_str:
-                        raise QuotaExceededError()
-                    elif "invalid" in error_str or "format" in error_str or "unsupported" in error_str:
-                        raise InvalidFormatError()
-                    elif "network" in error_str or "connection" in error_str or "timeout" in error_str:
-                        raise NetworkError()
-                    elif "too large" in error_str or "size" in error_str:
-                        raise FileTooLargeError()
-                    else:
-                        raise UnknownAIError(f"خطا در آپلود فایل: {str(upload_error)}")
+            upload_results = await asyncio.gather(
+                *(
+                    upload_file_to_gemini(path, is_temp, original_path, i, len(files_to_upload), semaphore)
+                    for i, (path, is_temp, original_path, _) in enumerate(files_to_upload, 1)
+                ),
+                return_exceptions=True
+            )
         finally:
             # Cleanup temporary compressed files after upload (success or failure)
             for temp_file in temp_files_to_cleanup:
@@ -410,71 +908,112 @@ async def process_files_with_gemini(file_paths: List[str]) -> Dict[str, str]:
                 except Exception as cleanup_error:
                     print(f"[GEMINI]   Warning: Failed to cleanup temp file {temp_file}: {cleanup_error}")
 
-        print(f"[GEMINI] Step 3/5: Waiting for file processing (max 30s)...")
-
-        # Wait for files to be processed
-        max_wait = 30  # seconds
-        start_time = time.time()
-
-        for i, uploaded_file in enumerate(uploaded_files, 1):
-            while uploaded_file.state.name == "PROCESSING":
-                if time.time() - start_time > max_wait:
-                    print(f"[GEMINI]   ⚠ Warning: File {i} still processing after {max_wait}s, continuing anyway...")
-                    break
-                print(f"[GEMINI]   Waiting for file {i} to be processed...")
-                time.sleep(1)
-                uploaded_file = genai.get_file(uploaded_file.name)
-
-            if uploaded_file.state.name == "FAILED":
-                print(f"[GEMINI]   ✗ File {i} processing failed")
-                raise ContentGenerationError("پردازش فایل در سرور Gemini با خطا مواجه شد")
-
-            print(f"[GEMINI]   ✓ File {i} ready: {uploaded_file.state.name}")
+        for outcome in upload_results:
+            if isinstance(outcome, BaseException):
+                raise outcome
+        print(f"[GEMINI]   All uploads finished in {time.monotonic() - upload_started:.1f}s")
+
+        # Keep input order: every input file contributes its remote files in turn
+        remote_by_file = {i: list(entry[0]) for i, entry in reused.items()}
+        upload_seconds = {}
+        for (_, _, _, file_index), (uploaded_file, seconds) in zip(files_to_upload, upload_results):
+            remote_by_file.setdefault(file_index, []).append(uploaded_file)
+            upload_seconds[uploaded_file.name] = seconds
+        uploaded_files = [f for i in range(len(file_paths)) for f in remote_by_file.get(i, [])]
+        labels = []
+        for i in range(len(file_paths)):
+            file_count = len(remote_by_file.get(i, []))
+            labels.extend((list(part_labels.get(i) or []) + [None] * file_count)[:file_count])
+
+        for file_index in pending:
+            if fingerprints[file_index] and remote_by_file.get(file_index):
+                remote_files = remote_by_file[file_index]
+                remote_file_registry.register(
+                    note_id,
+                    fingerprints[file_index],
+                    [f.name for f in remote_files],
+                    remote_file_registry.expiry_from_handles(remote_files),
+                    speech=speech_stats.get(file_index),
+                    labels=part_labels.get(file_index)
+                )
+
+        max_wait = settings.GEMINI_FILE_PROCESSING_TIMEOUT_SECONDS
+        print(f"[GEMINI] Step 3/5: Waiting for file processing (max {max_wait}s)...")
+
+        # Poll every file in parallel with exponential backoff
+        deadline = time.monotonic() + max_wait
+        ready_results = await asyncio.gather(*(
+            wait_for_file_ready(uploaded_file, i, deadline)
+            for i, uploaded_file in enumerate(uploaded_files, 1)
+        ))
+        uploaded_files = [uploaded_file for uploaded_file, _ in ready_results]
+
+        for i, (uploaded_file, processing_seconds) in enumerate(ready_results, 1):
+            reused_file = uploaded_file.name not in upload_seconds
+            print(
+                f"[METRICS] gemini_file index={i} upload_seconds={upload_seconds.get(uploaded_file.name, 0.0):.2f} "
+                f"processing_seconds={processing_seconds:.2f} reused={reused_file}"
+            )
 
-        print("[GEMINI] Step 4/5: Initializing Gemini model...")
+        print("[GEMINI] Step 4/5: Building the request...")
+        print(f"[GEMINI]   Model: {settings.GEMINI_TRANSCRIPTION_MODEL} (provider: {get_ai_provider().name})")
 
-        # Initialize model with system instruction
-        try:
-            model = genai.GenerativeModel(
-                model_name=settings.GEMINI_TRANSCRIPTION_MODEL,
-                system_instruction=SYSTEM_INSTRUCTION
-            )
-            print(f"[GEMINI]   ✓ Model initialized ({settings.GEMINI_TRANSCRIPTION_MODEL})")
-        except Exception as model_error:
-            print(f"[GEMINI]   ✗ Failed to initialize model: {str(model_error)}")
-            raise
-
-        # Create prompt with uploaded files
-        if len(file_paths) > 1:
-            prompt = f"I'm providing you with {len(file_paths)} files. Please analyze all of them and create ONE comprehensive note combining information from all sources."
-        else:
-            prompt = "Please analyze this file and create a structured note."
+        # Create prompt with uploaded files (callers may pass their own)
+        if not prompt:
+            if len(file_paths) > 1:
+                prompt = f"I'm providing you with {len(file_paths)} files. Please analyze all of them and create ONE comprehensive note combining information from all sources."
+            else:
+                prompt = "Please analyze this file and create a structured note."
 
         print(f"[GEMINI] Step 5/5: Generating content from {len(uploaded_files)} file(s)...")
         print(f"[GEMINI]   Using prompt: {prompt[:100]}...")
 
         try:
             # Send files and prompt to model with increased output limit
-            content_parts = [prompt] + uploaded_files
+            content_parts = build_content_parts(prompt, uploaded_files, labels)
 
-            # Configure generation with higher token limit and timeout
-            generation_config = {
-                "max_output_tokens": 100000,
-                "temperature": 0.4,
-                "top_p": 0.95,
-            }
+            # Configure generation with higher token limit, JSON schema and timeout
+            generation_config = get_note_generation_config(max_output_tokens)
 
             # Set request timeout to 15 minutes for long files
             request_options = {
                 "timeout": 900  # 15 minutes in seconds
             }
 
-            response = model.generate_content(
-                content_parts,
-                generation_config=generation_config,
-                request_options=request_options
+            note_progress.publish(note_id, 'generating', title='', note_chars=0)
+            generation_started = time.monotonic()
+            if settings.GEMINI_STREAMING_ENABLED:
+                response, stream_parser, streamed_text, stream_error = await stream_note_generation(
+                    content_parts, generation_config, request_options, note_id
+                )
+            else:
+                response = await asyncio.to_thread(
+                    get_ai_provider().generate,
+                    settings.GEMINI_TRANSCRIPTION_MODEL,
+                    content_parts,
+                    system_instruction=SYSTEM_INSTRUCTION,
+                    generation_config=generation_config,
+                    request_options=request_options
+                )
+                stream_error = None
+
+            # Recorded even when the stream broke off: the call was made (and billed)
+            usage_service.record(
+                call_type, settings.GEMINI_TRANSCRIPTION_MODEL, get_ai_provider().name, response,
+                generation_seconds=time.monotonic() - generation_started,
+                upload_seconds=sum(upload_seconds.values())
             )
-
+            if stream_error is not None:
+                partial_note = stream_parser.get('note')
+                if not partial_note:
+                    raise stream_error
+                # Keep whatever arrived instead of losing the whole generation
+                print(f"[GEMINI]   ⚠ Stream interrupted after {len(streamed_text)} chars: {str(stream_error)}")
+                return {
+                    'title': stream_parser.get('title') or 'Transcription',
+                    'note': html_processor.repair_truncated_html(partial_note),
+                    'partial': True
+                }
             print("[GEMINI]   ✓ Content generation completed")
         except Exception as gen_error:
             error_str = str(gen_error).lower()
@@ -492,33 +1031,87 @@ async def process_files_with_gemini(file_paths: List[str]) -> Dict[str, str]:
             else:
                 raise ContentGenerationError(f"خطا در تولید محتوا: {str(gen_error)}")
 
+        generated_text = response.text
+
+        # Output cut at MAX_TOKENS: ask the model to continue with the same uploaded files
+        continuation_rounds = 0
+        interrupted = False
+        # A schema would force each continuation to start a new JSON object
+        continuation_config = {
+            key: value for key, value in generation_config.items()
+            if key not in ('response_mime_type', 'response_schema')
+        }
+        while is_max_tokens(response) and continuation_rounds < settings.GEMINI_MAX_CONTINUATION_ROUNDS:
+            continuation_rounds += 1
+            print(
+                f"[GEMINI]   Output truncated at {len(generated_text)} chars, continuation round "
+                f"{continuation_rounds}/{settings.GEMINI_MAX_CONTINUATION_ROUNDS}"
+            )
+            contents = build_continuation_contents(content_parts, generated_text)
+            continuation = ''
+            generation_started = time.monotonic()
+            try:
+                if settings.GEMINI_STREAMING_ENABLED:
+                    response, _, continuation, stream_error = await stream_note_generation(
+                        contents, continuation_config, request_options, note_id, parser=stream_parser
+                    )
+                    interrupted = stream_error is not None
+                else:
+                    response = await asyncio.to_thread(
+                        get_ai_provider().generate,
+                        settings.GEMINI_TRANSCRIPTION_MODEL,
+                        contents,
+                        system_instruction=SYSTEM_INSTRUCTION,
+                        generation_config=continuation_config,
+                        request_options=request_options
+                    )
+                    continuation = response.text
+                usage_service.record(
+                    'continuation', settings.GEMINI_TRANSCRIPTION_MODEL, get_ai_provider().name, response,
+                    generation_seconds=time.monotonic() - generation_started
+                )
+            except Exception as continuation_error:
+                print(f"[GEMINI]   ⚠ Continuation failed: {str(continuation_error)}")
+                interrupted = True
+
+            generated_text = stitch_continuation(generated_text, continuation)
+            if settings.GEMINI_STREAMING_ENABLED:
+                # Re-read the stitched text so overlap the model repeated is not counted twice
+                stream_parser = NoteEnvelopeParser()
+                stream_parser.feed(generated_text)
+            if interrupted:
+                break
+
+        if interrupted or is_max_tokens(response):
+            # Still incomplete: keep what was generated, closing any open HTML
+            truncated_parser = NoteEnvelopeParser()
+            truncated_parser.feed(generated_text)
+            if truncated_parser.get('note'):
+                print(f"[GEMINI]   ⚠ Output still incomplete after {continuation_rounds} continuation round(s)")
+                return {
+                    'title': truncated_parser.get('title') or 'Transcription',
+                    'note': html_processor.repair_truncated_html(truncated_parser.get('note')),
+                    'partial': True
+                }
+        elif continuation_rounds:
+            print(f"[GEMINI]   ✓ Output completed after {continuation_rounds} continuation round(s)")
+
         # Parse the response
         print("[GEMINI] Parsing Gemini response...")
 
         # Check for finish reason to detect truncation
-        try:
-            finish_reason = response.candidates[0].finish_reason
-            print(f"[GEMINI]   Finish reason: {finish_reason}")
-            if finish_reason == 1:  # STOP - normal completion
-                print("[GEMINI]   ✓ Response completed normally")
-            elif finish_reason == 2:  # MAX_TOKENS - truncated
-                print("[GEMINI]   ⚠ WARNING: Response truncated due to MAX_TOKENS limit!")
-            elif finish_reason == 3:  # SAFETY - blocked by safety
-                print("[GEMINI]   ⚠ WARNING: Response blocked by safety filters")
-            else:
-                print(f"[GEMINI]   ⚠ WARNING: Unexpected finish reason: {finish_reason}")
-        except Exception as e:
-            print(f"[GEMINI]   Could not check finish reason: {e}")
+        finish_reason = response.finish_reason
+        print(f"[GEMINI]   Finish reason: {finish_reason.value}")
+        if finish_reason == FinishReason.STOP:  # Normal completion
+            print("[GEMINI]   ✓ Response completed normally")
+        elif finish_reason == FinishReason.MAX_TOKENS:  # Truncated
+            print("[GEMINI]   ⚠ WARNING: Response truncated due to MAX_TOKENS limit!")
+        elif finish_reason == FinishReason.SAFETY:  # Blocked by safety
+            print("[GEMINI]   ⚠ WARNING: Response blocked by safety filters")
+        else:
+            print(f"[GEMINI]   ⚠ WARNING: Unexpected finish reason: {finish_reason.value}")
 
-        try:
-            processed_text = response.text.strip()
-        except:
-            # Fallback to candidates
-            try:
-                processed_text = response.candidates[0].content.parts[0].text.strip()
-            except:
-                print("[GEMINI]   ✗ Could not extract text from response")
-                raise Exception("Could not extract text from Gemini response")
+        processed_text = generated_text.strip()
 
         print(f"[GEMINI]   Raw response length: {len(processed_text)} characters")
         print(f"[GEMINI]   First 200 chars: {processed_text[:200]}...")
@@ -541,6 +1134,16 @@ async def process_files_with_gemini(file_paths: List[str]) -> Dict[str, str]:
             print("[GEMINI]   Removed ``` suffix")
         processed_text = processed_text.strip()
 
+        # The streamed envelope was already decoded chunk by chunk
+        if settings.GEMINI_STREAMING_ENABLED and stream_parser.complete and 'note' in stream_parser.fields:
+            result = stream_parser.result()
+            result.setdefault('title', "Untitled Note")
+            print(f"[GEMINI]   ✓ Streamed JSON parsed incrementally (note: {len(result['note'])} chars)")
+            print("=" * 80)
+            print("[GEMINI] ✓ Processing completed successfully")
+            print("=" * 80)
+            return result
+
         # Parse JSON
         print("[GEMINI] Attempting to parse JSON...")
         print(f"[GEMINI] Text to parse (first 500 chars): {processed_text[:500]}...")
@@ -576,79 +1179,22 @@ async def process_files_with_gemini(file_paths: List[str]) -> Dict[str, str]:
             print(f"[GEMINI]   ✗ Standard JSON parsing failed: {str(e)}")
             print(f"[GEMINI]   Error at line {e.lineno}, column {e.colno}")
 
-            # Try to fix common JSON issues
-            print("[GEMINI]   Attempting to fix JSON formatting issues...")
-
-            # Strategy: Use regex to extract title and note separately
-            import re
-
-            try:
-                # Extract title using regex
-                title_match = re.search(r'"title"\s*:\s*"([^"]+)"', processed_text)
-                if not title_match:
-                    print("[GEMINI]   ✗ Could not extract title")
-                    title = "Transcription"
-                else:
-                    title = title_match.group(1)
-                    print(f"[GEMINI]   ✓ Extracted title: {title[:100]}...")
-
-                # Extract note - find "note": " and extract until the last "
-                # Strategy: Find the pattern "note": " and then find matching closing quote
-
-                # Find where "note" field starts
-                note_field_match = re.search(r'"note"\s*:\s*"', processed_text)
-                if not note_field_match:
-                    print("[GEMINI]   ✗ Could not find 'note' field")
-                    return {
-                        "title": title,
-                        "note": f"<p>{processed_text}</p>"
-                    }
-
-                # The content starts right after "note": "
-                note_content_start = note_field_match.end()
-
-                # Now find the closing quote. We need to be careful because there might be escaped quotes
-                # Look for the pattern ",\n  "summary" or just }\n to find the end
-                # Try to find either the next field or the closing brace
-
-                # Method: Find the last quote before either "summary" or the final }
-                summary_match = re.search(r'",?\s*"summary"', processed_text[note_content_start:])
-                closing_brace_match = re.search(r'"\s*}', processed_text[note_content_start:])
-
-                if summary_match:
-                    # Note ends just before ",  "summary"
-                    note_content_end = note_content_start + summary_match.start()
-                elif closing_brace_match:
-                    # Note ends just before "  }
-                    note_content_end = note_content_start + closing_brace_match.start()
-                else:
-                    # Fallback: use the last quote in the document
-                    note_content_end = processed_text.rfind('"')
-
-                note_html = processed_text[note_content_start:note_content_end]
-
-                # Unescape any escaped characters
-                note_html = note_html.replace('\\"', '"')
-                note_html = note_html.replace('\\n', '\n')
-                note_html = note_html.replace('\\t', '\t')
-                note_html = note_html.replace('\\\\', '\\')
-
-                print(f"[GEMINI]   ✓ Extracted note (length: {len(note_html)} chars)")
-                print(f"[GEMINI]   Note preview: {note_html[:200]}...")
-
-                return {
-                    "title": title,
-                    "note": note_html
-                }
-
-            except Exception as fix_error:
-                print(f"[GEMINI]   ✗ Failed to fix JSON: {str(fix_error)}")
-                print(f"[GEMINI]   Returning raw text as fallback")
+            # Recover the fields with the tolerant single-pass parser
+            fields, closed = parse_note_output(processed_text)
+            if not fields.get('note'):
+                print("[GEMINI]   ✗ Could not find 'note' field, returning raw text as fallback")
                 return {
-                    "title": "Transcription",
+                    "title": fields.get('title') or "Transcription",
                     "note": f"<p>{processed_text}</p>"
                 }
 
+            note_html = fields['note'] if closed else html_processor.repair_truncated_html(fields['note'])
+            print(f"[GEMINI]   ✓ Recovered note with tolerant parser (length: {len(note_html)} chars)")
+            return {
+                "title": fields.get('title') or "Transcription",
+                "note": note_html
+            }
+
     except Exception as e:
         print("=" * 80)
         print(f"[GEMINI] ✗ ERROR: {str(e)}")
@@ -675,11 +1221,51 @@ async def process_file_with_gemini(file_path: str) -> Dict[str, str]:
     return await process_files_with_gemini([file_path])
 
 
+async def generate_json_from_text(prompt: str, max_output_tokens: int = 8192, call_type: str = 'text_json') -> Dict:
+    """
+    Run a text-only generation that must answer with a JSON object
+
+    Args:
+        prompt: Full prompt including the data to work on
+        max_output_tokens: Output limit for this call
+        call_type: Label of the call in the usage records
+
+    Returns:
+        Parsed JSON object
+
+    Raises:
+        ContentGenerationError: If the response is not a JSON object
+    """
+    generation_started = time.monotonic()
+    response = await asyncio.to_thread(
+        get_ai_provider().generate,
+        settings.GEMINI_TRANSCRIPTION_MODEL,
+        prompt,
+        generation_config={
+            "max_output_tokens": max_output_tokens,
+            "temperature": GENERATION_CONFIG["temperature"],
+            "response_mime_type": "application/json",
+        },
+        request_options={"timeout": 300}
+    )
+    usage_service.record(
+        call_type, settings.GEMINI_TRANSCRIPTION_MODEL, get_ai_provider().name, response,
+        generation_seconds=time.monotonic() - generation_started
+    )
+
+    try:
+        result = json.loads(response.text)
+    except (ValueError, AttributeError) as e:
+        raise ContentGenerationError(f"پاسخ نامعتبر از مدل: {str(e)}")
+    if not isinstance(result, dict):
+        raise ContentGenerationError("پاسخ نامعتبر از مدل")
+    return result
+
+
 def test_gemini_connection() -> bool:
-    """Test if Gemini API is configured correctly"""
+    """Test if the AI provider is configured correctly"""
     try:
-        model = genai.GenerativeModel(settings.GEMINI_TRANSCRIPTION_MODEL)
-        response = model.generate_content("Hello")
+        get_ai_provider().generate(settings.GEMINI_TRANSCRIPTION_MODEL, "Hello")
         return True
     except Exception as e:
         print(f"Gemini connection test failed: {str(e)}")
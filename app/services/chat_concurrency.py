@@ -0,0 +1,130 @@
+"""
+Chat Concurrency - Keeps chat off the API event loop and measures it
+
+Chat answers used to run the embedding model, the Chroma search and the
+model call directly in the event loop, so one slow answer stalled every
+other request of the process. Now:
+
+- the model call is awaited natively (AIProvider.chat_async)
+- embedding and vector search, which are CPU bound, run in a dedicated
+  thread pool of RAG_RETRIEVAL_WORKERS threads, so they neither block the
+  loop nor take over the default executor used by other to_thread calls;
+  the API's other vector store calls (re-indexing an edited note, removing
+  deleted notes and notebooks) use the same pool
+
+The admin dashboard reads the per-process counters: chats in flight,
+retrieval jobs running and queued, and their average wait and duration.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, Dict, Optional
+
+from app.core.config import settings
+
+
+class ChatConcurrency:
+    """Bounded retrieval executor and in-process chat counters"""
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._counters = {
+            'chats_in_flight': 0,
+            'chats_peak': 0,
+            'chats_completed': 0,
+            'chats_failed': 0,
+            'chat_seconds_total': 0.0,
+            'retrieval_running': 0,
+            'retrieval_queued': 0,
+            'retrieval_completed': 0,
+            'retrieval_queue_seconds_total': 0.0,
+            'retrieval_seconds_total': 0.0,
+        }
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        """Retrieval thread pool, created on first use"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(settings.RAG_RETRIEVAL_WORKERS, 1),
+                    thread_name_prefix='rag-retrieval'
+                )
+            return self._executor
+
+    def _add(self, **changes) -> None:
+        with self._lock:
+            for key, value in changes.items():
+                self._counters[key] += value
+            self._counters['chats_peak'] = max(self._counters['chats_peak'], self._counters['chats_in_flight'])
+
+    async def run_retrieval(self, func: Callable, *args):
+        """
+        Run a blocking embedding / vector store call in the retrieval pool
+
+        Returns:
+            Result of func(*args)
+        """
+        submitted = time.monotonic()
+        self._add(retrieval_queued=1)
+
+        def job():
+            started = time.monotonic()
+            self._add(retrieval_queued=-1, retrieval_running=1, retrieval_queue_seconds_total=started - submitted)
+            try:
+                return func(*args)
+            finally:
+                self._add(
+                    retrieval_running=-1,
+                    retrieval_completed=1,
+                    retrieval_seconds_total=time.monotonic() - started
+                )
+
+        return await asyncio.get_running_loop().run_in_executor(self.executor, job)
+
+    @asynccontextmanager
+    async def track_chat(self):
+        """Count a chat answer while it is being produced"""
+        started = time.monotonic()
+        self._add(chats_in_flight=1)
+        completed = False
+        try:
+            yield
+            completed = True
+        finally:
+            if completed:
+                self._add(chats_in_flight=-1, chats_completed=1, chat_seconds_total=time.monotonic() - started)
+            else:
+                # Errors and cancelled requests (client went away)
+                self._add(chats_in_flight=-1, chats_failed=1)
+
+    def get_stats(self) -> Dict:
+        """Counters of this API process"""
+        with self._lock:
+            counters = dict(self._counters)
+        completed_chats = counters['chats_completed']
+        completed_retrievals = counters['retrieval_completed']
+        return {
+            'chats_in_flight': counters['chats_in_flight'],
+            'chats_peak': counters['chats_peak'],
+            'chats_completed': completed_chats,
+            'chats_failed': counters['chats_failed'],
+            'avg_chat_seconds': round(counters['chat_seconds_total'] / completed_chats, 2) if completed_chats else 0.0,
+            'retrieval_workers': max(settings.RAG_RETRIEVAL_WORKERS, 1),
+            'retrieval_running': counters['retrieval_running'],
+            'retrieval_queued': counters['retrieval_queued'],
+            'retrieval_completed': completed_retrievals,
+            'avg_retrieval_queue_seconds': round(
+                counters['retrieval_queue_seconds_total'] / completed_retrievals, 3
+            ) if completed_retrievals else 0.0,
+            'avg_retrieval_seconds': round(
+                counters['retrieval_seconds_total'] / completed_retrievals, 3
+            ) if completed_retrievals else 0.0,
+        }
+
+
+# Singleton instance
+chat_concurrency = ChatConcurrency()
@@ -17,6 +17,7 @@ from app.db.models import (
     Note, Upload
 )
 from app.core.config import settings
+from app.services.media_service import media_probe, MediaProbeError, is_timed_media
 
 logger = logging.getLogger(__name__)
 
@@ -45,6 +46,8 @@ class CreditManager:
         """
         Get duration of audio/video file in seconds
 
+        Only used for uploads whose duration was not stored at ingest.
+
         Args:
             file_path: Path to the file
             file_type: Type of file (audio/video)
@@ -55,67 +58,56 @@ class CreditManager:
         Raises:
             CreditCalculationError: If duration cannot be determined
         """
+        if file_type not in ['audio', 'video']:
+            # For images, return 0 (will be calculated differently)
+            return 0
+
+        if not os.path.exists(file_path):
+            raise CreditCalculationError(f"File not found: {file_path}")
+
         try:
-            # For audio/video files, we need to extract duration
-            # Using ffprobe (part of ffmpeg)
-            if file_type in ['audio', 'video']:
-                import subprocess
-                import json
-
-                # Check if file exists
-                if not os.path.exists(file_path):
-                    raise CreditCalculationError(f"File not found: {file_path}")
-
-                # Use ffprobe to get duration
-                cmd = [
-                    'ffprobe',
-                    '-v', 'quiet',
-                    '-print_format', 'json',
-                    '-show_format',
-                    file_path
-                ]
-
-                result = subprocess.run(
-                    cmd,
-                    capture_output=True,
-                    text=True,
-                    timeout=30
-                )
+            info = await media_probe.probe(file_path)
+        except MediaProbeError as e:
+            logger.error(f"Error getting file duration: {str(e)}")
+            raise CreditCalculationError(f"Could not process file: {str(e)}")
 
-                if result.returncode != 0:
-                    logger.error(f"ffprobe failed: {result.stderr}")
-                    raise CreditCalculationError("Could not determine file duration")
+        duration = info['duration_seconds']
+        logger.info(f"File duration: {duration} seconds ({duration/60:.2f} minutes)")
+        return duration
 
-                # Parse JSON output
-                data = json.loads(result.stdout)
-                duration = float(data.get('format', {}).get('duration', 0))
+    @staticmethod
+    def credits_for_media(file_type: str, duration_seconds: Optional[float]) -> float:
+        """
+        Calculate credits for a file from its type and known duration
 
-                if duration <= 0:
-                    raise CreditCalculationError("Invalid file duration")
+        Args:
+            file_type: Type of file (MIME type or simple type)
+            duration_seconds: Stored duration for audio/video files
 
-                logger.info(f"File duration: {duration} seconds ({duration/60:.2f} minutes)")
-                return duration
+        Returns:
+            Credits required in minutes
 
-            else:
-                # For images, return 0 (will be calculated differently)
-                return 0
+        Raises:
+            CreditCalculationError: If the type is unsupported or duration is unknown
+        """
+        file_type_lower = (file_type or '').lower()
 
-        except subprocess.TimeoutExpired:
-            logger.error("ffprobe timeout")
-            raise CreditCalculationError("Timeout while reading file")
+        if is_timed_media(file_type_lower):
+            if not duration_seconds or float(duration_seconds) <= 0:
+                raise CreditCalculationError("Invalid file duration")
+            return float(duration_seconds) / 60.0
 
-        except FileNotFoundError:
-            logger.error("ffprobe not found. Install ffmpeg.")
-            raise CreditCalculationError("Media processing tool not available")
+        if file_type_lower.startswith('image/') or file_type_lower == 'image':
+            # Fixed cost per image
+            return settings.IMAGE_CREDIT_COST
 
-        except Exception as e:
-            logger.error(f"Error getting file duration: {str(e)}", exc_info=True)
-            raise CreditCalculationError(f"Could not process file: {str(e)}")
+        raise CreditCalculationError(f"Unsupported file type: {file_type}")
 
     @staticmethod
     async def calculate_file_credits(
         file_path: str,
-        file_type: str
+        file_type: str,
+        duration_seconds: Optional[float] = None
     ) -> float:
         """
         Calculate credits required for a file
@@ -123,6 +115,7 @@ class CreditManager:
         Args:
             file_path: Path to the file
             file_type: Type of file (MIME type or simple type)
+            duration_seconds: Duration stored at ingest (probed now if missing)
 
         Returns:
             Credits required in minutes
@@ -134,28 +127,14 @@ class CreditManager:
             # Parse file type - handle MIME types like 'audio/mpeg', 'video/mp4', 'image/jpeg'
             file_type_lower = file_type.lower()
 
-            if file_type_lower.startswith('audio/') or file_type_lower.startswith('video/') or file_type in ['audio', 'video']:
+            if is_timed_media(file_type_lower) and not duration_seconds:
                 # Determine main type for duration extraction
                 main_type = 'audio' if file_type_lower.startswith('audio/') or file_type == 'audio' else 'video'
+                duration_seconds = await CreditManager.get_file_duration(file_path, main_type)
 
-                # Get duration in seconds
-                duration_seconds = await CreditManager.get_file_duration(
-                    file_path, main_type
-                )
-                # Convert to minutes and round up
-                credits = duration_seconds / 60.0
-                logger.info(f"Calculated credits for {file_type}: {credits:.2f} minutes")
-                return credits
-
-            elif file_type_lower.startswith('image/') or file_type == 'image':
-                # Fixed cost per image
-                credits = settings.IMAGE_CREDIT_COST
-                logger.info(f"Calculated credits for image: {credits} minutes")
-                return credits
-
-            else:
-                logger.error(f"Unknown file type: {file_type}")
-                raise CreditCalculationError(f"Unsupported file type: {file_type}")
+            credits = CreditManager.credits_for_media(file_type, duration_seconds)
+            logger.info(f"Calculated credits for {file_type}: {credits:.2f} minutes")
+            return credits
 
         except Exception as e:
             logger.error(f"Credit calculation failed: {str(e)}", exc_info=True)
@@ -190,11 +169,16 @@ class CreditManager:
             total_credits = 0.0
 
             for upload in uploads:
+                duration_seconds = upload.duration_seconds
+                if is_timed_media(upload.file_type) and not duration_seconds:
+                    # Uploaded before durations were stored - probe once and keep it
+                    main_type = 'audio' if upload.file_type.lower().startswith('audio') else 'video'
+                    duration_seconds = await CreditManager.get_file_duration(upload.storage_path, main_type)
+                    upload.duration_seconds = duration_seconds
+                    await db.commit()
+
                 # Calculate credits for each file
-                credits = await CreditManager.calculate_file_credits(
-                    upload.storage_path,
-                    upload.file_type
-                )
+                credits = CreditManager.credits_for_media(upload.file_type, duration_seconds)
                 total_credits += credits
 
             logger.info(f"Total credits for note {note_id}: {total_credits:.2f} minutes")
@@ -262,6 +246,78 @@ class CreditManager:
             logger.error(f"Error getting user balance: {str(e)}", exc_info=True)
             raise
 
+    @staticmethod
+    def estimate_upload_credits(files: List[Tuple[str, Optional[float]]]) -> float:
+        """
+        Estimate credits for files that are not attached to a note yet
+
+        Files whose duration could not be probed are skipped; the worker
+        charges them once it has measured them.
+
+        Args:
+            files: (file_type, duration_seconds) pairs
+
+        Returns:
+            Estimated credits in minutes
+        """
+        total = 0.0
+        for file_type, duration_seconds in files:
+            try:
+                total += CreditManager.credits_for_media(file_type, duration_seconds)
+            except CreditCalculationError:
+                continue
+        return total
+
+    @staticmethod
+    async def ensure_sufficient_credits(
+        db: AsyncSession,
+        user_id: int,
+        required: float
+    ) -> None:
+        """
+        Check the user can pay for an upload before it is queued
+
+        Args:
+            db: Database session
+            user_id: User ID
+            required: Required credits in minutes
+
+        Raises:
+            InsufficientCreditsError: If balance is lower than required
+        """
+        if required <= 0:
+            return
+
+        balance = await CreditManager.get_user_balance(db, user_id)
+        if balance['total_minutes'] < required:
+            raise InsufficientCreditsError(
+                f"اعتبار کافی نیست. موجودی: {balance['total_minutes']:.1f} دقیقه، نیاز: {required:.1f} دقیقه"
+            )
+
+    @staticmethod
+    async def get_note_charge(db: AsyncSession, note_id: int) -> float:
+        """
+        Credits a note has paid and not been refunded
+
+        Args:
+            db: Database session
+            note_id: Note ID
+
+        Returns:
+            Deducted minus refunded credits in minutes
+        """
+        result = await db.execute(
+            select(CreditTransaction.transaction_type, func.sum(CreditTransaction.amount))
+            .where(
+                CreditTransaction.note_id == note_id,
+                CreditTransaction.transaction_type.in_([TransactionType.deduct, TransactionType.refund])
+            )
+            .group_by(CreditTransaction.transaction_type)
+        )
+        totals = {transaction_type: Decimal(str(amount or 0)) for transaction_type, amount in result.all()}
+        charged = totals.get(TransactionType.deduct, Decimal(0)) - totals.get(TransactionType.refund, Decimal(0))
+        return float(max(charged, Decimal(0)))
+
     @staticmethod
     async def deduct_credits(
         db: AsyncSession,
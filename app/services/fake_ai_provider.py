@@ -0,0 +1,293 @@
+"""
+Fake AI Provider - Local stand-in for the model API (AI_PROVIDER=fake)
+
+Lets the whole pipeline run, be load-tested and be benchmarked without the
+live API and without spend. Responses are deterministic for the same input,
+and so is the sequence of injected faults for a given FAKE_AI_SEED and call
+order:
+
+- FAKE_AI_*_LATENCY_SECONDS:  time spent per upload, per generation and per
+                              streamed chunk (blocking, like the SDK)
+- FAKE_AI_FILE_PROCESSING_SECONDS: uploads stay PROCESSING this long
+- FAKE_AI_FAILURE_RATE:       share of calls failing with a 503
+- FAKE_AI_RATE_LIMIT_RATE:    share of calls that start a burst of
+                              FAKE_AI_RATE_LIMIT_BURST consecutive 429s
+- FAKE_AI_TRUNCATION_RATE:    share of note generations cut at MAX_TOKENS
+                              (a continuation request receives the rest)
+
+Notes are {"title", "note"} JSON of about FAKE_AI_NOTE_CHARS characters;
+JSON requests without a schema get {"title", "overview"}.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.ai_provider import (
+    AIProvider,
+    FileState,
+    FinishReason,
+    GenerationResult,
+    GenerationStream,
+    RemoteFile,
+)
+
+FAKE_FILE_LIFETIME = timedelta(hours=48)
+
+SENTENCES = [
+    "The lecture opens with a short review of the previous session.",
+    "Key definitions are introduced together with a worked example.",
+    "The speaker compares both approaches and lists their trade-offs.",
+    "A common mistake is pointed out and corrected step by step.",
+    "The section ends with a summary of the main formulas.",
+    "Students are asked to practise the method on the exercise sheet.",
+]
+
+
+class FakeAIError(Exception):
+    """Injected API failure (the message mimics the real API's)"""
+
+
+class FakeAIProvider(AIProvider):
+    """Deterministic offline provider with configurable latency and faults"""
+
+    name = 'fake'
+
+    def __init__(self, seed: Optional[int] = None):
+        self._random = random.Random(settings.FAKE_AI_SEED if seed is None else seed)
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict] = {}
+        self._rate_limited_calls = 0
+        self.calls: Dict[str, int] = {}
+
+    def _draw_fault(self, kind: str) -> Optional[str]:
+        """Count the call and draw its injected fault, if any"""
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            if self._rate_limited_calls:
+                self._rate_limited_calls -= 1
+                return 'rate_limit'
+            if self._random.random() < settings.FAKE_AI_RATE_LIMIT_RATE:
+                self._rate_limited_calls = max(settings.FAKE_AI_RATE_LIMIT_BURST - 1, 0)
+                return 'rate_limit'
+            if self._random.random() < settings.FAKE_AI_FAILURE_RATE:
+                return 'failure'
+            return None
+
+    @staticmethod
+    def _raise_fault(fault: Optional[str]) -> None:
+        if fault == 'rate_limit':
+            raise FakeAIError("429 Resource has been exhausted (e.g. check quota).")
+        if fault == 'failure':
+            raise FakeAIError("503 The service is currently unavailable.")
+
+    def _begin_call(self, kind: str, latency: float) -> None:
+        """Count the call, sleep its latency and raise any injected fault"""
+        fault = self._draw_fault(kind)
+        if latency > 0:
+            time.sleep(latency)
+        self._raise_fault(fault)
+
+    async def _begin_call_async(self, kind: str, latency: float) -> None:
+        """Same as _begin_call, sleeping without blocking the event loop"""
+        fault = self._draw_fault(kind)
+        if latency > 0:
+            await asyncio.sleep(latency)
+        self._raise_fault(fault)
+
+    def _truncate(self) -> bool:
+        with self._lock:
+            return self._random.random() < settings.FAKE_AI_TRUNCATION_RATE
+
+    # File API
+
+    def upload_file(self, path: str, mime_type: str) -> RemoteFile:
+        self._begin_call('upload', settings.FAKE_AI_UPLOAD_LATENCY_SECONDS)
+        with open(path, 'rb') as f:
+            digest = hashlib.sha256(f.read()).hexdigest()
+        with self._lock:
+            name = f"files/fake-{digest[:12]}-{len(self._files)}"
+            self._files[name] = {
+                'mime_type': mime_type,
+                'size': os.path.getsize(path),
+                'digest': digest,
+                'ready_at': time.monotonic() + settings.FAKE_AI_FILE_PROCESSING_SECONDS,
+                'expiration_time': datetime.now(timezone.utc) + FAKE_FILE_LIFETIME,
+            }
+        return self.get_file(name)
+
+    def get_file(self, name: str) -> RemoteFile:
+        entry = self._files.get(name)
+        if entry is None:
+            raise FakeAIError(f"404 File {name} not found.")
+        ready = time.monotonic() >= entry['ready_at']
+        return RemoteFile(
+            name=name,
+            state=FileState.ACTIVE if ready else FileState.PROCESSING,
+            mime_type=entry['mime_type'],
+            uri=f"fake://{name}",
+            expiration_time=entry['expiration_time']
+        )
+
+    def delete_file(self, name: str) -> None:
+        with self._lock:
+            if self._files.pop(name, None) is None:
+                raise FakeAIError(f"404 File {name} not found.")
+
+    # Generation
+
+    @staticmethod
+    def _flatten(contents) -> List:
+        """All parts of a prompt, part list or list of turns"""
+        if isinstance(contents, dict):
+            return FakeAIProvider._flatten(contents.get('parts', []))
+        if isinstance(contents, (list, tuple)):
+            return [part for item in contents for part in FakeAIProvider._flatten(item)]
+        return [contents]
+
+    @staticmethod
+    def _split_continuation(contents):
+        """(original contents, text generated so far) of a continuation request"""
+        if (
+            isinstance(contents, list) and len(contents) >= 3
+            and all(isinstance(turn, dict) for turn in contents)
+            and contents[-2].get('role') == 'model'
+        ):
+            return contents[0].get('parts', []), ''.join(str(part) for part in contents[-2].get('parts', []))
+        return contents, None
+
+    def _answer(self, contents, generation_config: Optional[Dict]) -> str:
+        """Deterministic full answer for the given contents"""
+        parts = self._flatten(contents)
+        prompt = ' '.join(part for part in parts if isinstance(part, str))
+        files = [part for part in parts if isinstance(part, RemoteFile)]
+        seed = hashlib.sha256(
+            (prompt + '|' + '|'.join(self._files.get(f.name, {}).get('digest', f.name) for f in files)).encode('utf-8')
+        ).hexdigest()
+        rng = random.Random(seed)
+
+        config = generation_config or {}
+        title = f"Fake note {seed[:8]}" + (f" ({len(files)} files)" if files else "")
+        if config.get('response_mime_type') == 'application/json' and 'response_schema' not in config:
+            return json.dumps({'title': title, 'overview': f"<p>{rng.choice(SENTENCES)}</p>"}, ensure_ascii=False)
+
+        sections = []
+        length = 0
+        while length < settings.FAKE_AI_NOTE_CHARS:
+            section = f"<h2>Section {len(sections) + 1}</h2><p>" + ' '.join(
+                rng.choice(SENTENCES) for _ in range(4)
+            ) + "</p>"
+            sections.append(section)
+            length += len(section)
+        return json.dumps({'title': title, 'note': ''.join(sections)}, ensure_ascii=False)
+
+    def _complete(self, contents, generation_config: Optional[Dict]) -> GenerationResult:
+        """Answer, continuation or truncated answer, with rough token usage"""
+        original, generated = self._split_continuation(contents)
+        answer = self._answer(original, generation_config)
+        max_chars = (generation_config or {}).get('max_output_tokens', 0) * 4
+
+        if generated is not None and answer.startswith(generated):
+            text = answer[len(generated):]
+        else:
+            text = answer
+        finish_reason = FinishReason.STOP
+        if generated is None and len(text) > 200 and self._truncate():
+            text = text[:len(text) // 2]
+            finish_reason = FinishReason.MAX_TOKENS
+        if max_chars and len(text) > max_chars:
+            text = text[:max_chars]
+            finish_reason = FinishReason.MAX_TOKENS
+
+        parts = self._flatten(contents)
+        file_tokens = {
+            part.name: self._files.get(part.name, {}).get('size', 0) // 1000
+            for part in parts if isinstance(part, RemoteFile)
+        }
+        audio_tokens = sum(
+            tokens for name, tokens in file_tokens.items()
+            if self._files.get(name, {}).get('mime_type', '').startswith('audio/')
+        )
+        prompt_tokens = sum(len(part) // 4 for part in parts if isinstance(part, str)) + sum(file_tokens.values())
+        output_tokens = len(text) // 4
+        return GenerationResult(
+            text=text,
+            finish_reason=finish_reason,
+            usage={
+                'prompt_tokens': prompt_tokens,
+                'audio_tokens': audio_tokens,
+                'output_tokens': output_tokens,
+                'total_tokens': prompt_tokens + output_tokens,
+            }
+        )
+
+    def generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationResult:
+        self._begin_call('generate', settings.FAKE_AI_GENERATE_LATENCY_SECONDS)
+        return self._complete(contents, generation_config)
+
+    def stream_generate(
+        self,
+        model_name: str,
+        contents,
+        system_instruction: Optional[str] = None,
+        generation_config: Optional[Dict] = None,
+        request_options: Optional[Dict] = None
+    ) -> GenerationStream:
+        self._begin_call('stream', settings.FAKE_AI_GENERATE_LATENCY_SECONDS)
+        result = self._complete(contents, generation_config)
+        chunk_size = max(len(result.text) // max(settings.FAKE_AI_STREAM_CHUNKS, 1), 1)
+
+        def chunks():
+            for start in range(0, len(result.text), chunk_size):
+                if settings.FAKE_AI_CHUNK_LATENCY_SECONDS > 0:
+                    time.sleep(settings.FAKE_AI_CHUNK_LATENCY_SECONDS)
+                yield result.text[start:start + chunk_size]
+
+        return GenerationStream(chunks(), lambda text: result)
+
+    @staticmethod
+    def _chat_answer(system_instruction: str, history: List[Dict], message: str) -> GenerationResult:
+        rng = random.Random(hashlib.sha256(f"{len(history)}|{message}".encode('utf-8')).hexdigest())
+        text = f"Fake answer to: {message[:80]}\n- " + "\n- ".join(rng.choice(SENTENCES) for _ in range(3))
+        prompt_tokens = (len(system_instruction) + len(message)) // 4
+        return GenerationResult(
+            text=text,
+            usage={
+                'prompt_tokens': prompt_tokens,
+                'output_tokens': len(text) // 4,
+                'total_tokens': prompt_tokens + len(text) // 4,
+            }
+        )
+
+    def chat(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        self._begin_call('chat', settings.FAKE_AI_GENERATE_LATENCY_SECONDS)
+        return self._chat_answer(system_instruction, history, message)
+
+    async def chat_async(
+        self,
+        model_name: str,
+        system_instruction: str,
+        history: List[Dict],
+        message: str
+    ) -> GenerationResult:
+        await self._begin_call_async('chat', settings.FAKE_AI_GENERATE_LATENCY_SECONDS)
+        return self._chat_answer(system_instruction, history, message)
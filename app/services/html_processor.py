@@ -255,6 +255,37 @@ class HTMLProcessor:
             # Return original HTML if processing fails
             return html
 
+    @staticmethod
+    def repair_truncated_html(html: str) -> str:
+        """
+        Make HTML that was cut off mid-stream well-formed
+
+        A trailing partial tag or entity is dropped and every element left
+        open is closed.
+
+        Args:
+            html: HTML that may end anywhere
+
+        Returns:
+            Well-formed HTML
+        """
+        try:
+            if not html:
+                return html
+
+            # "<h2 cla" or "</stro" at the very end
+            last_open = html.rfind('<')
+            if last_open > html.rfind('>'):
+                html = html[:last_open]
+            # "&nbs" at the very end
+            html = re.sub(r'&#?\w*$', '', html)
+
+            return str(BeautifulSoup(html, 'html.parser'))
+
+        except Exception as e:
+            logger.error(f"Error repairing truncated HTML: {str(e)}", exc_info=True)
+            return html
+
     @staticmethod
     def strip_dangerous_tags(html: str) -> str:
         """
@@ -0,0 +1,183 @@
+"""
+Image Optimizer - Shrinks photos of slides and whiteboards before upload
+
+Steps (Pillow):
+1. Apply EXIF orientation so the model sees the photo upright
+2. Optionally crop to the document/whiteboard region
+3. Downscale so the longest edge is at most IMAGE_MAX_EDGE
+4. Re-encode as WebP or JPEG without metadata (EXIF, GPS, thumbnails);
+   if that is not smaller, send the original with its metadata removed
+"""
+import logging
+import os
+import tempfile
+from typing import Optional, Tuple
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Edge pixels brighter than this (0-255) count as content when cropping
+EDGE_THRESHOLD = 40
+# Crop only if the detected region keeps at least this share of the photo
+MIN_CROP_AREA_RATIO = 0.3
+# Rows/columns with fewer edge pixels than this share are treated as background
+MIN_EDGE_DENSITY = 0.05
+
+
+def detect_document_box(image) -> Optional[Tuple[int, int, int, int]]:
+    """
+    Find the region of a photo that holds the document or whiteboard
+
+    A light-weight heuristic: edges are found on a small grayscale copy and
+    the outermost rows and columns with a meaningful share of edge pixels
+    (ignoring a thin border) bound the content region. Returns None when the
+    region is too small to trust or would not remove anything.
+
+    Args:
+        image: PIL image (already upright)
+
+    Returns:
+        (left, top, right, bottom) box in image coordinates, or None
+    """
+    from PIL import Image, ImageFilter
+
+    preview = image.convert('L')
+    preview.thumbnail((512, 512))
+    edges = preview.filter(ImageFilter.FIND_EDGES).point(lambda p: 255 if p > EDGE_THRESHOLD else 0)
+
+    border = 2
+    edges = edges.crop((border, border, edges.width - border, edges.height - border))
+    width, height = edges.size
+
+    # Share of edge pixels per column / row; isolated noise stays below the cut-off
+    column_density = edges.resize((width, 1), Image.BOX).tobytes()
+    row_density = edges.resize((1, height), Image.BOX).tobytes()
+    columns = [x for x, value in enumerate(column_density) if value > 255 * MIN_EDGE_DENSITY]
+    rows = [y for y, value in enumerate(row_density) if value > 255 * MIN_EDGE_DENSITY]
+    if not columns or not rows:
+        return None
+
+    left, top, right, bottom = columns[0], rows[0], columns[-1] + 1, rows[-1] + 1
+    area_ratio = ((right - left) * (bottom - top)) / float(width * height)
+    if area_ratio < MIN_CROP_AREA_RATIO or area_ratio > 0.95:
+        return None
+
+    scale_x = image.width / float(preview.width)
+    scale_y = image.height / float(preview.height)
+    return (
+        int((left + border) * scale_x),
+        int((top + border) * scale_y),
+        min(image.width, int((right + border) * scale_x)),
+        min(image.height, int((bottom + border) * scale_y))
+    )
+
+
+def strip_metadata(image, file_path: str) -> Optional[str]:
+    """
+    Copy an image without its EXIF/XMP metadata, keeping format and quality
+
+    JPEGs keep their quantization tables and other formats are saved
+    losslessly, so only the metadata changes.
+
+    Args:
+        image: Opened PIL image (not converted)
+        file_path: Original image path (for the extension)
+
+    Returns:
+        Temporary path, or None when the image carries no metadata
+    """
+    if not image.getexif() and 'exif' not in image.info and 'xmp' not in image.info:
+        return None
+
+    options = {'icc_profile': image.info.get('icc_profile')} if image.info.get('icc_profile') else {}
+    if image.format == 'JPEG':
+        options['quality'] = 'keep'
+    elif image.format == 'WEBP':
+        options['lossless'] = True
+
+    temp_fd, temp_path = tempfile.mkstemp(suffix=os.path.splitext(file_path)[1].lower())
+    os.close(temp_fd)
+    # No exif= argument: metadata is dropped
+    image.save(temp_path, format=image.format, **options)
+    return temp_path
+
+
+def optimize_image(file_path: str) -> Tuple[str, bool]:
+    """
+    Normalize and shrink an image for upload (blocking)
+
+    Args:
+        file_path: Original image
+
+    Returns:
+        Tuple of (path_to_use, is_temporary) like compress_audio_file
+    """
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        logger.warning("[IMAGE] Pillow is not installed, uploading original image")
+        return file_path, False
+
+    original_size = os.path.getsize(file_path)
+    output_format = settings.IMAGE_OUTPUT_FORMAT.lower()
+    suffix = '.webp' if output_format == 'webp' else '.jpg'
+    temp_path = None
+
+    try:
+        with Image.open(file_path) as image:
+            if getattr(image, 'n_frames', 1) > 1:
+                # Animated GIF/WebP - keep as is
+                return file_path, False
+
+            upright = ImageOps.exif_transpose(image)
+            changed = upright.size != image.size or image.getexif().get(0x0112, 1) != 1
+
+            if settings.IMAGE_DOCUMENT_CROP:
+                box = detect_document_box(upright)
+                if box:
+                    upright = upright.crop(box)
+                    changed = True
+
+            max_edge = settings.IMAGE_MAX_EDGE
+            if max(upright.size) > max_edge:
+                upright.thumbnail((max_edge, max_edge), Image.LANCZOS)
+                changed = True
+
+            if output_format == 'webp':
+                if upright.mode not in ('RGB', 'RGBA'):
+                    upright = upright.convert('RGBA' if 'A' in upright.getbands() else 'RGB')
+            elif upright.mode != 'RGB':
+                upright = upright.convert('RGB')
+
+            temp_fd, temp_path = tempfile.mkstemp(suffix=suffix)
+            os.close(temp_fd)
+            # No exif= argument: metadata is dropped
+            upright.save(
+                temp_path,
+                format='WEBP' if output_format == 'webp' else 'JPEG',
+                quality=settings.IMAGE_QUALITY,
+                optimize=True
+            )
+
+            optimized_size = os.path.getsize(temp_path)
+            if optimized_size >= original_size and not changed:
+                os.remove(temp_path)
+                temp_path = strip_metadata(image, file_path)
+                if temp_path is None:
+                    logger.info(f"[IMAGE] {file_path}: re-encoding did not help, using original")
+                    return file_path, False
+                logger.info(f"[IMAGE] {file_path}: re-encoding did not help, using original without metadata")
+                return temp_path, True
+
+        logger.info(
+            f"[IMAGE] {os.path.basename(file_path)}: {original_size / 1024:.0f} KB -> "
+            f"{optimized_size / 1024:.0f} KB ({output_format})"
+        )
+        return temp_path, True
+
+    except Exception as e:
+        logger.warning(f"[IMAGE] Optimization failed for {file_path}: {str(e)}, using original")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return file_path, False
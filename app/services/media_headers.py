@@ -0,0 +1,423 @@
+"""
+Container Header Reader
+Reads the duration of accepted audio/video formats directly from file headers
+
+Supported containers:
+    WAV            fmt byte rate + data chunk size
+    MP3            Xing/Info or VBRI frame count, otherwise CBR from the first frame
+    MP4/M4A/MOV    mvhd timescale and duration
+    Ogg            Opus/Vorbis granule position of the last page
+    WebM/Matroska  Segment Info Duration and TimecodeScale
+
+Everything else returns None so the caller can fall back to ffprobe.
+All functions are blocking file reads of a few kilobytes.
+"""
+import logging
+import os
+import struct
+from typing import BinaryIO, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Bytes inspected at the start of an MP3 when looking for the first frame
+MP3_SYNC_SEARCH_BYTES = 64 * 1024
+# Largest possible Ogg page (header + 255 segments of 255 bytes)
+OGG_MAX_PAGE_SIZE = 65307
+
+
+def read_media_info(file_path: str) -> Optional[Dict]:
+    """
+    Read duration (and codec/bitrate where cheap) from container headers
+
+    Args:
+        file_path: Path to the media file
+
+    Returns:
+        Dict with duration_seconds, codec and bitrate, or None if the
+        container is unknown or its header does not carry a duration
+    """
+    try:
+        file_size = os.path.getsize(file_path)
+        with open(file_path, 'rb') as f:
+            head = f.read(16)
+            f.seek(0)
+
+            if head[:4] == b'RIFF' and head[8:12] == b'WAVE':
+                info = _read_wav(f)
+            elif head[:4] == b'OggS':
+                info = _read_ogg(f, file_size)
+            elif head[:4] == b'\x1a\x45\xdf\xa3':
+                info = _read_matroska(f, file_size)
+            elif head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+                info = _read_mp4(f, file_size)
+            elif head[:3] == b'ID3' or _is_mp3_sync(head):
+                info = _read_mp3(f, file_size)
+            else:
+                info = None
+    except (OSError, ValueError, TypeError, IndexError, struct.error) as e:
+        logger.debug(f"Header read failed for {file_path}: {str(e)}")
+        return None
+
+    if not info or not info.get('duration_seconds') or info['duration_seconds'] <= 0:
+        return None
+
+    if not info.get('bitrate'):
+        info['bitrate'] = int(file_size * 8 / info['duration_seconds'])
+    return info
+
+
+# ============================================================
+# WAV
+# ============================================================
+
+def _read_wav(f: BinaryIO) -> Optional[Dict]:
+    """Duration = data chunk size / byte rate"""
+    f.seek(12)
+    byte_rate = None
+    codec = None
+
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            return None
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+        if chunk_id == b'fmt ':
+            fmt = f.read(chunk_size)
+            audio_format, _, _, byte_rate, _, bits = struct.unpack('<HHIIHH', fmt[:16])
+            codec = f"pcm_s{bits}le" if audio_format == 1 else None
+            f.seek(chunk_size % 2, os.SEEK_CUR)
+        elif chunk_id == b'data':
+            if not byte_rate:
+                return None
+            if chunk_size == 0xFFFFFFFF:
+                # Streamed WAV without a final size - use what is on disk
+                data_start = f.tell()
+                chunk_size = f.seek(0, os.SEEK_END) - data_start
+            return {
+                'duration_seconds': chunk_size / byte_rate,
+                'codec': codec,
+                'bitrate': byte_rate * 8
+            }
+        else:
+            # Chunks are word aligned
+            f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)
+
+
+# ============================================================
+# MP3
+# ============================================================
+
+_MP3_BITRATES = {
+    # (version is MPEG1, layer) -> kbps by index
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_MP3_SAMPLE_RATES = {
+    3: [44100, 48000, 32000],  # MPEG1
+    2: [22050, 24000, 16000],  # MPEG2
+    0: [11025, 12000, 8000],   # MPEG2.5
+}
+
+
+def _is_mp3_sync(data: bytes) -> bool:
+    """Check for an MPEG audio frame sync at the start of data"""
+    return len(data) >= 2 and data[0] == 0xFF and (data[1] & 0xE0) == 0xE0
+
+
+def _parse_mp3_header(data: bytes) -> Optional[Dict]:
+    """Parse a 4-byte MPEG audio frame header"""
+    if len(data) < 4 or not _is_mp3_sync(data):
+        return None
+
+    version_bits = (data[1] >> 3) & 0x03
+    layer_bits = (data[1] >> 1) & 0x03
+    bitrate_index = data[2] >> 4
+    sample_rate_index = (data[2] >> 2) & 0x03
+    padding = (data[2] >> 1) & 0x01
+    channel_mode = data[3] >> 6
+
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    sample_rate = _MP3_SAMPLE_RATES[version_bits][sample_rate_index]
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or mpeg1:
+        samples_per_frame = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        samples_per_frame = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+
+    return {
+        'mpeg1': mpeg1,
+        'layer': layer,
+        'bitrate': bitrate,
+        'sample_rate': sample_rate,
+        'samples_per_frame': samples_per_frame,
+        'frame_length': frame_length,
+        'mono': channel_mode == 3,
+    }
+
+
+def _read_mp3(f: BinaryIO, file_size: int) -> Optional[Dict]:
+    """Duration from a Xing/Info or VBRI frame count, else CBR estimate"""
+    audio_start = 0
+    header = f.read(10)
+    if header[:3] == b'ID3':
+        # ID3v2 size is a 28-bit syncsafe integer, plus an optional 10-byte footer
+        tag_size = (header[6] << 21) | (header[7] << 14) | (header[8] << 7) | header[9]
+        audio_start = 10 + tag_size + (10 if header[5] & 0x10 else 0)
+
+    f.seek(audio_start)
+    buffer = f.read(MP3_SYNC_SEARCH_BYTES)
+
+    # Find the first frame whose successor is also a valid frame
+    frame = None
+    offset = 0
+    for offset in range(len(buffer) - 4):
+        candidate = _parse_mp3_header(buffer[offset:offset + 4])
+        if not candidate:
+            continue
+        next_offset = offset + candidate['frame_length']
+        if next_offset + 4 <= len(buffer) and not _parse_mp3_header(buffer[next_offset:next_offset + 4]):
+            continue
+        frame = candidate
+        break
+
+    if not frame:
+        return None
+
+    codec = 'mp3' if frame['layer'] == 3 else f"mp{frame['layer']}"
+    frame_data = buffer[offset:offset + frame['frame_length']]
+
+    # Xing/Info sits right after the side information
+    if frame['mpeg1']:
+        side_info = 17 if frame['mono'] else 32
+    else:
+        side_info = 9 if frame['mono'] else 17
+    xing_offset = 4 + side_info
+    tag = frame_data[xing_offset:xing_offset + 4]
+    if tag in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', frame_data[xing_offset + 4:xing_offset + 8])[0]
+        if flags & 0x01:
+            frames = struct.unpack('>I', frame_data[xing_offset + 8:xing_offset + 12])[0]
+            return {
+                'duration_seconds': frames * frame['samples_per_frame'] / frame['sample_rate'],
+                'codec': codec,
+                'bitrate': None
+            }
+
+    # VBRI (Fraunhofer) sits 32 bytes after the header
+    if frame_data[36:40] == b'VBRI':
+        frames = struct.unpack('>I', frame_data[50:54])[0]
+        return {
+            'duration_seconds': frames * frame['samples_per_frame'] / frame['sample_rate'],
+            'codec': codec,
+            'bitrate': None
+        }
+
+    # No VBR header: treat as constant bitrate
+    audio_bytes = file_size - audio_start - offset
+    if file_size >= 128:
+        f.seek(file_size - 128)
+        if f.read(3) == b'TAG':
+            audio_bytes -= 128
+
+    return {
+        'duration_seconds': audio_bytes * 8 / frame['bitrate'],
+        'codec': codec,
+        'bitrate': frame['bitrate']
+    }
+
+
+# ============================================================
+# MP4 / M4A / MOV
+# ============================================================
+
+def _iter_boxes(f: BinaryIO, start: int, end: int):
+    """Yield (type, payload_start, box_end) for ISO BMFF boxes in a range"""
+    position = start
+    while position + 8 <= end:
+        f.seek(position)
+        size, box_type = struct.unpack('>I4s', f.read(8))
+        header_size = 8
+        if size == 1:
+            size = struct.unpack('>Q', f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - position
+        if size < header_size:
+            return
+        yield box_type, position + header_size, position + size
+        position += size
+
+
+def _read_mp4(f: BinaryIO, file_size: int) -> Optional[Dict]:
+    """Duration = mvhd duration / timescale"""
+    for box_type, payload_start, box_end in _iter_boxes(f, 0, file_size):
+        if box_type != b'moov':
+            continue
+        for child_type, child_start, _ in _iter_boxes(f, payload_start, box_end):
+            if child_type != b'mvhd':
+                continue
+            f.seek(child_start)
+            version = f.read(4)[0]
+            if version == 1:
+                _, _, timescale, duration = struct.unpack('>QQIQ', f.read(28))
+            else:
+                _, _, timescale, duration = struct.unpack('>IIII', f.read(16))
+            if not timescale or duration in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                return None
+            return {'duration_seconds': duration / timescale, 'codec': None, 'bitrate': None}
+        return None
+    return None
+
+
+# ============================================================
+# Ogg (Opus / Vorbis)
+# ============================================================
+
+def _read_ogg(f: BinaryIO, file_size: int) -> Optional[Dict]:
+    """Duration = granule position of the last page / sample rate"""
+    first_page = f.read(OGG_MAX_PAGE_SIZE)
+    serial = first_page[14:18]
+    segment_count = first_page[26]
+    packet = first_page[27 + segment_count:]
+
+    if packet[:8] == b'OpusHead':
+        codec = 'opus'
+        # Opus granules always count 48 kHz samples
+        sample_rate = 48000
+        pre_skip = struct.unpack('<H', packet[10:12])[0]
+    elif packet[:7] == b'\x01vorbis':
+        codec = 'vorbis'
+        sample_rate = struct.unpack('<I', packet[12:16])[0]
+        pre_skip = 0
+    else:
+        return None
+
+    if not sample_rate:
+        return None
+
+    tail_start = max(0, file_size - OGG_MAX_PAGE_SIZE)
+    f.seek(tail_start)
+    tail = f.read()
+
+    # Walk backwards to the last page of the same logical stream
+    position = tail.rfind(b'OggS')
+    while position != -1:
+        page = tail[position:position + 27]
+        if len(page) == 27 and page[14:18] == serial:
+            granule = struct.unpack('<q', page[6:14])[0]
+            if granule > 0:
+                return {
+                    'duration_seconds': max(0, granule - pre_skip) / sample_rate,
+                    'codec': codec,
+                    'bitrate': None
+                }
+        position = tail.rfind(b'OggS', 0, position)
+
+    return None
+
+
+# ============================================================
+# WebM / Matroska
+# ============================================================
+
+_EBML_SEGMENT = 0x18538067
+_EBML_INFO = 0x1549A966
+_EBML_CLUSTER = 0x1F43B675
+_EBML_TIMECODE_SCALE = 0x2AD7B1
+_EBML_DURATION = 0x4489
+
+
+def _read_vint(f: BinaryIO, keep_marker: bool) -> Optional[tuple]:
+    """
+    Read an EBML variable-size integer
+
+    Returns:
+        (value, length, is_unknown_size) or None at end of file
+    """
+    first = f.read(1)
+    if not first:
+        return None
+    first = first[0]
+
+    length = 1
+    mask = 0x80
+    while length <= 8 and not (first & mask):
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable-size integer")
+
+    value = first if keep_marker else first & (mask - 1)
+    rest = f.read(length - 1)
+    for byte in rest:
+        value = (value << 8) | byte
+
+    all_ones = (1 << (7 * length)) - 1
+    return value, length, (not keep_marker and value == all_ones)
+
+
+def _read_matroska(f: BinaryIO, file_size: int) -> Optional[Dict]:
+    """Duration = Info/Duration * TimecodeScale (nanoseconds)"""
+    # Skip the EBML header element
+    element_id = _read_vint(f, keep_marker=True)
+    size = _read_vint(f, keep_marker=False)
+    f.seek(size[0], os.SEEK_CUR)
+
+    element_id = _read_vint(f, keep_marker=True)
+    if not element_id or element_id[0] != _EBML_SEGMENT:
+        return None
+    segment_size = _read_vint(f, keep_marker=False)
+    segment_end = file_size if segment_size[2] else min(file_size, f.tell() + segment_size[0])
+
+    while f.tell() < segment_end:
+        element_id = _read_vint(f, keep_marker=True)
+        size = _read_vint(f, keep_marker=False)
+        if not element_id or not size:
+            return None
+
+        if element_id[0] == _EBML_CLUSTER or size[2]:
+            # Media data reached before Info - header carries no duration
+            return None
+
+        if element_id[0] != _EBML_INFO:
+            f.seek(size[0], os.SEEK_CUR)
+            continue
+
+        info_end = f.tell() + size[0]
+        timecode_scale = 1000000
+        duration = None
+        while f.tell() < info_end:
+            child_id = _read_vint(f, keep_marker=True)
+            child_size = _read_vint(f, keep_marker=False)
+            if not child_id or not child_size:
+                break
+            data = f.read(child_size[0])
+            if child_id[0] == _EBML_TIMECODE_SCALE:
+                timecode_scale = int.from_bytes(data, 'big')
+            elif child_id[0] == _EBML_DURATION:
+                duration = struct.unpack('>f' if len(data) == 4 else '>d', data)[0]
+
+        if duration is None:
+            return None
+        return {
+            'duration_seconds': duration * timecode_scale / 1e9,
+            'codec': None,
+            'bitrate': None
+        }
+
+    return None
@@ -0,0 +1,169 @@
+"""
+Media Probe Service
+Reads duration, codec and bitrate of uploaded audio/video files once at ingest
+"""
+import asyncio
+import json
+import logging
+from typing import Dict, Optional
+
+from app.services.media_headers import read_media_info
+
+logger = logging.getLogger(__name__)
+
+
+class MediaProbeError(Exception):
+    """Raised when a media file cannot be probed"""
+    pass
+
+
+def is_timed_media(file_type: Optional[str]) -> bool:
+    """
+    Check whether a file type is billed by duration (audio/video)
+
+    Args:
+        file_type: MIME type or simple type ('audio', 'video', 'image')
+
+    Returns:
+        True for audio and video files
+    """
+    file_type = (file_type or '').lower()
+    return file_type.startswith(('audio/', 'video/')) or file_type in ('audio', 'video')
+
+
+class MediaProbe:
+    """
+    Reads media info without blocking the event loop
+
+    Container headers are parsed in-process for the formats we accept;
+    ffprobe is only spawned for containers the header reader does not know.
+
+    Results are stored on the Upload row so credit calculation, queue ETA
+    and balance checks never need to spawn a process again.
+    """
+
+    PROBE_TIMEOUT_SECONDS = 30
+
+    @staticmethod
+    async def probe(file_path: str) -> Dict:
+        """
+        Probe a media file, reading container headers before trying ffprobe
+
+        Args:
+            file_path: Path to the file
+
+        Returns:
+            Dict with duration_seconds (float), codec (str) and bitrate (int, bits/s)
+
+        Raises:
+            MediaProbeError: If neither the headers nor ffprobe give a duration
+        """
+        info = await asyncio.to_thread(read_media_info, file_path)
+        if info:
+            return info
+        return await MediaProbe.probe_with_ffprobe(file_path)
+
+    @staticmethod
+    async def probe_with_ffprobe(file_path: str) -> Dict:
+        """
+        Probe a media file with ffprobe
+
+        Args:
+            file_path: Path to the file
+
+        Returns:
+            Dict with duration_seconds (float), codec (str) and bitrate (int, bits/s)
+
+        Raises:
+            MediaProbeError: If ffprobe is missing, fails or reports no duration
+        """
+        cmd = [
+            'ffprobe',
+            '-v', 'quiet',
+            '-print_format', 'json',
+            '-show_format',
+            '-show_streams',
+            file_path
+        ]
+
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+        except FileNotFoundError:
+            raise MediaProbeError("ffprobe not found. Install ffmpeg.")
+
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(),
+                timeout=MediaProbe.PROBE_TIMEOUT_SECONDS
+            )
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise MediaProbeError("Timeout while reading file")
+
+        if process.returncode != 0:
+            raise MediaProbeError(f"ffprobe failed: {stderr.decode(errors='ignore').strip()}")
+
+        try:
+            data = json.loads(stdout)
+        except ValueError:
+            raise MediaProbeError("Could not parse ffprobe output")
+
+        fmt = data.get('format', {})
+        try:
+            duration = float(fmt.get('duration', 0))
+        except (TypeError, ValueError):
+            duration = 0
+        if duration <= 0:
+            raise MediaProbeError("Invalid file duration")
+
+        # Prefer the audio stream: that is what gets transcribed
+        streams = data.get('streams', [])
+        stream = next((s for s in streams if s.get('codec_type') == 'audio'), None)
+        stream = stream or (streams[0] if streams else {})
+
+        bitrate = stream.get('bit_rate') or fmt.get('bit_rate')
+
+        return {
+            'duration_seconds': duration,
+            'codec': stream.get('codec_name'),
+            'bitrate': int(bitrate) if bitrate and str(bitrate).isdigit() else None
+        }
+
+    @staticmethod
+    async def probe_upload(file_path: str, file_type: Optional[str]) -> Dict:
+        """
+        Probe an uploaded file if it is audio/video, never raising
+
+        A failed probe is not fatal at ingest: the worker falls back to
+        probing the file when it calculates credits.
+
+        Args:
+            file_path: Stored file path
+            file_type: MIME type sent by the client
+
+        Returns:
+            Dict with duration_seconds, codec and bitrate (values may be None)
+        """
+        empty = {'duration_seconds': None, 'codec': None, 'bitrate': None}
+        if not is_timed_media(file_type):
+            return empty
+
+        try:
+            info = await MediaProbe.probe(file_path)
+            logger.info(
+                f"Probed {file_path}: {info['duration_seconds']:.1f}s, "
+                f"codec={info['codec']}, bitrate={info['bitrate']}"
+            )
+            return info
+        except MediaProbeError as e:
+            logger.warning(f"Could not probe {file_path}: {str(e)}")
+            return empty
+
+
+# Singleton instance
+media_probe = MediaProbe()
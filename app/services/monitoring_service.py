@@ -10,7 +10,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.models import (
     ProcessingQueue, QueueStatus,
     Payment, PaymentStatus,
-    Note, NoteStatus
+    Note, NoteStatus, Upload
 )
 from app.core.config import settings
 
@@ -204,6 +204,53 @@ class MonitoringService:
                 'error': str(e)
             }
 
+    @staticmethod
+    async def get_speech_optimization_stats(
+        db: AsyncSession,
+        time_window_hours: int = 24
+    ) -> Dict:
+        """
+        Get how much audio speech optimization removed before upload
+
+        Args:
+            time_window_hours: Time window to check
+
+        Returns:
+            Stats dict
+        """
+        try:
+            since = datetime.utcnow() - timedelta(hours=time_window_hours)
+            result = await db.execute(
+                select(
+                    func.count(Upload.id),
+                    func.coalesce(func.sum(Upload.duration_seconds), 0),
+                    func.coalesce(func.sum(Upload.speech_removed_seconds), 0)
+                )
+                .where(
+                    and_(
+                        Upload.created_at >= since,
+                        Upload.speech_removed_seconds.isnot(None)
+                    )
+                )
+            )
+            optimized_count, original_seconds, removed_seconds = result.one()
+            original_seconds = float(original_seconds or 0)
+            removed_seconds = float(removed_seconds or 0)
+
+            return {
+                'time_window_hours': time_window_hours,
+                'optimized_uploads': optimized_count,
+                'original_seconds': round(original_seconds, 2),
+                'removed_seconds': round(removed_seconds, 2),
+                'removed_percent': round(removed_seconds * 100 / original_seconds, 2) if original_seconds else 0
+            }
+
+        except Exception as e:
+            logger.error(f"Error getting speech optimization stats: {str(e)}", exc_info=True)
+            return {
+                'error': str(e)
+            }
+
     @staticmethod
     async def get_system_health(db: AsyncSession) -> Dict:
         """
@@ -0,0 +1,264 @@
+"""
+Note Stream Parser - Incremental parser for the {"title": ..., "note": ...} envelope
+
+The model streams its JSON answer in chunks. NoteEnvelopeParser consumes
+each chunk as it arrives, in one linear pass over the text, and keeps the
+decoded value of every top-level string field so far - so the title and
+the growing note are known long before the response is complete, and a
+stream that is cut short still yields everything that arrived.
+
+The parser is tolerant of the ways model output breaks JSON: anything
+before the opening brace (e.g. a ```json fence) or after the closing one is
+ignored, raw newlines and unknown escapes are kept, and a quote inside a
+value only ends it when a ',' + next key or the closing brace follows -
+so unescaped quotes in HTML attributes do not cut the note short.
+Non-string values are skipped.
+"""
+from typing import Dict, List, Optional, Tuple
+
+SIMPLE_ESCAPES = {
+    '"': '"',
+    '\\': '\\',
+    '/': '/',
+    'b': '\b',
+    'f': '\f',
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+}
+
+# Parser states
+_BEFORE_OBJECT = 'before_object'
+_EXPECT_KEY = 'expect_key'
+_IN_KEY = 'in_key'
+_EXPECT_COLON = 'expect_colon'
+_EXPECT_VALUE = 'expect_value'
+_IN_STRING_VALUE = 'in_string_value'
+_IN_OTHER_VALUE = 'in_other_value'
+_AFTER_QUOTE = 'after_quote'  # Quote seen in a value; does the value end here?
+_AFTER_QUOTE_COMMA = 'after_quote_comma'
+_DONE = 'done'
+
+_STREAMING_VALUE_STATES = (_IN_STRING_VALUE, _AFTER_QUOTE, _AFTER_QUOTE_COMMA)
+
+
+class NoteEnvelopeParser:
+    """Incrementally decodes the top-level string fields of a JSON object"""
+
+    def __init__(self):
+        self.state = _BEFORE_OBJECT
+        self.fields: Dict[str, str] = {}
+        self.current_key: Optional[str] = None
+        self._buffer: List[str] = []  # Decoded characters of the current key/value
+        self._pending_escape: Optional[str] = None  # Escape sequence split across chunks
+        self._pending_surrogate: Optional[int] = None
+        self._other_depth = 0  # Nesting inside a skipped non-string value
+        self._other_in_string = False
+        self._other_escape = False
+        self._after_quote: List[str] = []  # Text after a quote while deciding if the value ended
+        self.chars_consumed = 0
+
+    @property
+    def complete(self) -> bool:
+        """True once the closing brace of the object has been read"""
+        return self.state == _DONE
+
+    def feed(self, text: str) -> None:
+        """Consume the next chunk of model output"""
+        self.chars_consumed += len(text)
+        i = 0
+        length = len(text)
+
+        while i < length:
+            state = self.state
+
+            if state in (_IN_KEY, _IN_STRING_VALUE):
+                i = self._read_string(text, i)
+                continue
+
+            char = text[i]
+            i += 1
+
+            if state == _BEFORE_OBJECT:
+                if char == '{':
+                    self.state = _EXPECT_KEY
+            elif state == _EXPECT_KEY:
+                if char == '"':
+                    self.state = _IN_KEY
+                elif char == '}':
+                    self.state = _DONE
+            elif state == _EXPECT_COLON:
+                if char == ':':
+                    self.state = _EXPECT_VALUE
+            elif state == _EXPECT_VALUE:
+                if char == '"':
+                    self.state = _IN_STRING_VALUE
+                    self.fields[self.current_key] = ''
+                elif not char.isspace():
+                    self.state = _IN_OTHER_VALUE
+                    self._other_depth = 1 if char in '{[' else 0
+                    self._other_in_string = False
+                    if self._other_depth == 0 and char in ',}':
+                        self._end_other_value(char)
+            elif state == _IN_OTHER_VALUE:
+                self._read_other(char)
+            elif state in (_AFTER_QUOTE, _AFTER_QUOTE_COMMA):
+                self._read_after_quote(char)
+            elif state == _DONE:
+                break
+
+    def _read_string(self, text: str, i: int) -> int:
+        """Copy string characters up to the next quote/backslash in bulk"""
+        length = len(text)
+        while i < length:
+            if self._pending_escape is not None:
+                i = self._read_escape(text, i)
+                continue
+
+            quote = text.find('"', i)
+            backslash = text.find('\\', i)
+            stops = [p for p in (quote, backslash) if p != -1]
+            stop = min(stops) if stops else length
+
+            if stop > i:
+                self._flush_surrogate()
+                self._buffer.append(text[i:stop])
+            if stop == length:
+                return length
+
+            if text[stop] == '\\':
+                self._pending_escape = ''
+                i = stop + 1
+                continue
+
+            # Quote: always ends a key; a value only if the object continues after it
+            self._flush_surrogate()
+            if self.state == _IN_KEY:
+                self.current_key = ''.join(self._buffer)
+                self._buffer = []
+                self.state = _EXPECT_COLON
+            else:
+                self._after_quote = ['"']
+                self.state = _AFTER_QUOTE
+            return stop + 1
+        return i
+
+    def _read_after_quote(self, char: str) -> None:
+        """Decide whether the quote before char closed the current value"""
+        if char.isspace():
+            self._after_quote.append(char)
+        elif self.state == _AFTER_QUOTE and char == ',':
+            self._after_quote.append(char)
+            self.state = _AFTER_QUOTE_COMMA
+        elif char == '}':
+            self._end_string_value()
+            self.state = _DONE
+        elif self.state == _AFTER_QUOTE_COMMA and char == '"':
+            self._end_string_value()
+            self.state = _IN_KEY
+        else:
+            # An unescaped quote inside the value: keep it as text
+            self._buffer.append(''.join(self._after_quote) + char)
+            self._after_quote = []
+            self.state = _IN_STRING_VALUE
+
+    def _end_string_value(self) -> None:
+        """Store the finished value of the current key"""
+        self.fields[self.current_key] = ''.join(self._buffer)
+        self._buffer = []
+        self._after_quote = []
+
+    def _read_escape(self, text: str, i: int) -> int:
+        """Decode one escape sequence, possibly continued from the last chunk"""
+        sequence = self._pending_escape
+        if not sequence:
+            sequence = text[i]
+            i += 1
+            if sequence != 'u':
+                self._pending_escape = None
+                self._flush_surrogate()
+                # Unknown escapes keep the character (tolerant)
+                self._buffer.append(SIMPLE_ESCAPES.get(sequence, sequence))
+                return i
+
+        needed = 5 - len(sequence)  # 'u' + 4 hex digits
+        sequence += text[i:i + needed]
+        i += min(needed, len(text) - i)
+        if len(sequence) < 5:
+            self._pending_escape = sequence
+            return i
+
+        self._pending_escape = None
+        try:
+            code = int(sequence[1:], 16)
+        except ValueError:
+            self._buffer.append(sequence[1:])
+            return i
+
+        if 0xD800 <= code <= 0xDBFF:
+            self._flush_surrogate()
+            self._pending_surrogate = code
+            return i
+        if 0xDC00 <= code <= 0xDFFF and self._pending_surrogate is not None:
+            code = 0x10000 + ((self._pending_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._pending_surrogate = None
+        self._flush_surrogate()
+        self._buffer.append(chr(code))
+        return i
+
+    def _flush_surrogate(self) -> None:
+        """Emit a lone high surrogate as the replacement character"""
+        if self._pending_surrogate is not None:
+            self._pending_surrogate = None
+            self._buffer.append('�')
+
+    def _read_other(self, char: str) -> None:
+        """Skip a number, literal, array or object value"""
+        if self._other_in_string:
+            if self._other_escape:
+                self._other_escape = False
+            elif char == '\\':
+                self._other_escape = True
+            elif char == '"':
+                self._other_in_string = False
+        elif char == '"':
+            self._other_in_string = True
+        elif char in '{[':
+            self._other_depth += 1
+        elif char in '}]' and self._other_depth > 0:
+            self._other_depth -= 1
+        elif self._other_depth == 0 and char in ',}':
+            self._end_other_value(char)
+
+    def _end_other_value(self, char: str) -> None:
+        """Finish a skipped value at a top-level ',' or '}'"""
+        self.state = _DONE if char == '}' else _EXPECT_KEY
+
+    def get(self, key: str, default: str = '') -> str:
+        """Decoded value of a field so far (partial while it is streaming)"""
+        if key not in self.fields:
+            return default
+        if self.state in _STREAMING_VALUE_STATES and key == self.current_key:
+            # The field currently being streamed
+            self._buffer = [''.join(self._buffer)]
+            return self._buffer[0]
+        return self.fields[key]
+
+    def result(self) -> Dict[str, str]:
+        """Snapshot of every string field seen so far"""
+        return {key: self.get(key) for key in self.fields}
+
+
+def parse_note_output(text: str) -> Tuple[Dict[str, str], bool]:
+    """
+    Recover the string fields of a complete or truncated model answer
+
+    Args:
+        text: Raw model output (may be fenced, malformed or cut off)
+
+    Returns:
+        Tuple of (fields found, whether the object was closed)
+    """
+    parser = NoteEnvelopeParser()
+    parser.feed(text)
+    return parser.result(), parser.complete
@@ -0,0 +1,91 @@
+"""
+Pipeline State - Last completed stage of each note, for resuming retries
+
+After every note_pipeline stage the worker stores which stage finished and
+the input of the next one: prepared (compressed) file paths after
+preprocess, the raw model response after ai_generate. A retry then starts at
+the stage that failed instead of charging, compressing, uploading and
+generating again. Remote file names live in the remote file registry, which
+ai_generate consults on every attempt.
+
+The state is removed when the note finishes, fails for good or stops (for
+example on insufficient credits). Saving errors are logged; the note then
+simply retries from an earlier stage.
+"""
+import logging
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import select, delete
+from sqlalchemy.orm import Session
+
+from app.db.models import NotePipelineState
+
+logger = logging.getLogger(__name__)
+
+
+class PipelineStateStore:
+    """Per-note pipeline checkpoints in the note_pipeline_states table"""
+
+    @staticmethod
+    def save(db: Session, note_id: int, stage: str, state: Dict) -> bool:
+        """
+        Record that a stage of the note completed
+
+        Args:
+            stage: Completed stage
+            state: Input of the next stage (JSON-serializable)
+
+        Returns:
+            True if the checkpoint was written
+        """
+        try:
+            entry = db.get(NotePipelineState, note_id)
+            if entry is None:
+                db.add(NotePipelineState(note_id=note_id, stage=stage, state=state))
+            else:
+                entry.stage = stage
+                entry.state = state
+            db.commit()
+            return True
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[PIPELINE] Could not save state of note {note_id} after {stage}: {str(e)}")
+            return False
+
+    @staticmethod
+    def load(db: Session, note_id: int) -> Optional[Tuple[str, Dict, int]]:
+        """
+        Last checkpoint of a note
+
+        Returns:
+            Tuple of (completed stage, next stage's input, times resumed),
+            or None if the note has to start from the beginning
+        """
+        entry = db.execute(
+            select(NotePipelineState).where(NotePipelineState.note_id == note_id)
+        ).scalar_one_or_none()
+        if entry is None:
+            return None
+        return entry.stage, dict(entry.state), entry.attempts
+
+    @staticmethod
+    def mark_resumed(db: Session, note_id: int) -> None:
+        """Count a retry that continues from the checkpoint"""
+        entry = db.get(NotePipelineState, note_id)
+        if entry is not None:
+            entry.attempts += 1
+            db.commit()
+
+    @staticmethod
+    def clear(db: Session, note_id: int) -> None:
+        """Forget the note's checkpoint (finished, failed for good or stopped)"""
+        try:
+            db.execute(delete(NotePipelineState).where(NotePipelineState.note_id == note_id))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[PIPELINE] Could not clear state of note {note_id}: {str(e)}")
+
+
+# Singleton instance
+pipeline_state = PipelineStateStore()
@@ -0,0 +1,70 @@
+"""
+Note Progress - Live processing progress of notes, shared through Redis
+
+The worker publishes the current stage (preparing, uploading, generating,
+completed, failed) and, while the note is streamed from the model, the
+partial title and the note length so far. The API reads it to show the
+note being produced instead of a spinner.
+
+Progress is best effort: Redis errors are logged and never fail a note.
+"""
+import json
+import logging
+import time
+from typing import Dict, Optional
+
+import redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class NoteProgress:
+    """Publishes and reads per-note progress in Redis"""
+
+    PROGRESS_KEY = "neviso:note_progress:{note_id}"
+
+    def __init__(self):
+        self._redis_client = None
+
+    @property
+    def redis_client(self):
+        """Redis connection, created on first use"""
+        if self._redis_client is None:
+            self._redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        return self._redis_client
+
+    def publish(self, note_id: Optional[int], stage: str, **fields) -> None:
+        """
+        Replace a note's progress
+
+        Args:
+            note_id: Note being processed (ignored if None)
+            stage: Current stage name
+            **fields: Extra values, e.g. title and note_chars
+        """
+        if note_id is None:
+            return
+        progress = {'stage': stage, 'updated_at': time.time(), **fields}
+        try:
+            self.redis_client.set(
+                self.PROGRESS_KEY.format(note_id=note_id),
+                json.dumps(progress, ensure_ascii=False),
+                ex=settings.NOTE_PROGRESS_TTL_SECONDS
+            )
+        except Exception as e:
+            logger.warning(f"[PROGRESS] Could not publish progress for note {note_id}: {str(e)}")
+
+    def get(self, note_id: int) -> Optional[Dict]:
+        """Latest progress of a note, or None if nothing was published"""
+        try:
+            raw = self.redis_client.get(self.PROGRESS_KEY.format(note_id=note_id))
+        except Exception as e:
+            logger.warning(f"[PROGRESS] Could not read progress for note {note_id}: {str(e)}")
+            return None
+        return json.loads(raw) if raw else None
+
+
+# Singleton instance
+note_progress = NoteProgress()
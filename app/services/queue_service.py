@@ -5,19 +5,86 @@ Handles processing queue with priority, rate limiting, and capacity management
 import redis
 import logging
 import json
+import threading
+from contextlib import contextmanager
 from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 from sqlalchemy import select, and_, func
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
 from app.db.models import (
     ProcessingQueue, QueueStatus, UserQuota,
-    UserSubscription, SubscriptionStatus, Note
+    UserSubscription, SubscriptionStatus, Note, Upload
 )
 from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Processing slots are leases: a sorted set of note_id -> expiry (Redis
+# server time), so a worker that dies stops holding its slot once its lease
+# runs out, without anyone decrementing a counter.
+LEASE_NOW = """
+local now_parts = redis.call('TIME')
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+"""
+
+# Pop up to ARGV[2] notes if live leases leave slots free and lease them for
+# ARGV[3] seconds, in one server-side step; returns member, score pairs,
+# highest score first
+CLAIM_SCRIPT = LEASE_NOW + """
+local live = redis.call('ZCOUNT', KEYS[2], '(' .. now, '+inf')
+local count = math.min(tonumber(ARGV[1]) - live, tonumber(ARGV[2]))
+if count <= 0 then
+    return {}
+end
+local popped = redis.call('ZPOPMAX', KEYS[1], count)
+for i = 1, #popped, 2 do
+    redis.call('ZADD', KEYS[2], now + tonumber(ARGV[3]), popped[i])
+end
+return popped
+"""
+
+# Extend a held lease to at least ARGV[2] seconds from now (never shortens
+# it, never revives a released one)
+RENEW_SCRIPT = LEASE_NOW + """
+local expire_at = redis.call('ZSCORE', KEYS[1], ARGV[1])
+if not expire_at then
+    return 0
+end
+redis.call('ZADD', KEYS[1], math.max(tonumber(expire_at), now + tonumber(ARGV[2])), ARGV[1])
+return 1
+"""
+
+# Record that a leased note was handed to its next stage or retry: ARGV[2]
+# seconds from now it counts as lost (hash of note_id -> deadline)
+HANDOFF_SCRIPT = LEASE_NOW + """
+if not redis.call('ZSCORE', KEYS[1], ARGV[1]) then
+    return 0
+end
+redis.call('HSET', KEYS[2], ARGV[1], now + tonumber(ARGV[2]))
+return 1
+"""
+
+# Keep the leases of pending hand-offs alive for ARGV[1] seconds (dropping
+# lost ones), then remove and return leases that ran out
+REAP_SCRIPT = LEASE_NOW + """
+local handoffs = redis.call('HGETALL', KEYS[2])
+for i = 1, #handoffs, 2 do
+    local expire_at = redis.call('ZSCORE', KEYS[1], handoffs[i])
+    if not expire_at or tonumber(handoffs[i + 1]) <= now then
+        redis.call('HDEL', KEYS[2], handoffs[i])
+    else
+        redis.call('ZADD', KEYS[1], math.max(tonumber(expire_at), now + tonumber(ARGV[1])), handoffs[i])
+    end
+end
+local expired = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', now)
+for i = 1, #expired do
+    redis.call('ZREM', KEYS[1], expired[i])
+end
+return expired
+"""
+
 
 class QueueError(Exception):
     """Base exception for queue errors"""
@@ -41,11 +108,27 @@ class QueueManager:
     - Rate limiting per user
     - Concurrent processing limits
     - Retry mechanism with exponential backoff
+
+    Claiming checks capacity, pops notes and takes their slots in one Lua
+    script, so several dispatchers can claim from the same queue without
+    claiming a note twice or going over MAX_CONCURRENT_PROCESSING.
+
+    A slot is a lease of QUEUE_LEASE_SECONDS that the worker processing the
+    note renews (hold_lease) and releases when the note is done. Capacity
+    counts live leases only, and reap_expired_leases requeues the notes of
+    workers that died, seconds after their lease ran out.
+
+    While a claimed note waits in its Celery queue, between pipeline stages
+    and during a retry countdown no worker holds the note, so the dispatcher
+    or worker hands it off (hand_off) and the reaper keeps its lease alive
+    until a worker starts it, or until QUEUE_HANDOFF_MAX_SECONDS pass and the
+    message is considered lost.
     """
 
     # Redis keys
     QUEUE_KEY = "neviso:processing_queue"
-    PROCESSING_KEY = "neviso:processing_count"
+    LEASES_KEY = "neviso:processing_leases"
+    HANDOFFS_KEY = "neviso:processing_handoffs"
     USER_RATE_LIMIT_KEY = "neviso:rate_limit:user:{user_id}"
     USER_DAILY_COUNT_KEY = "neviso:daily_count:user:{user_id}"
 
@@ -62,6 +145,108 @@ class QueueManager:
         except Exception as e:
             logger.error(f"Failed to connect to Redis: {str(e)}")
             raise QueueError(f"Redis connection failed: {str(e)}")
+        self._scripts = None
+
+    @property
+    def scripts(self) -> Dict:
+        """Lua scripts, registered on first use"""
+        if self._scripts is None:
+            self._scripts = {
+                'claim': self.redis_client.register_script(CLAIM_SCRIPT),
+                'renew': self.redis_client.register_script(RENEW_SCRIPT),
+                'handoff': self.redis_client.register_script(HANDOFF_SCRIPT),
+                'reap': self.redis_client.register_script(REAP_SCRIPT),
+            }
+        return self._scripts
+
+    def _live_lease_bound(self) -> str:
+        """Score bound of leases that have not run out (Redis server time)"""
+        seconds, microseconds = self.redis_client.time()
+        return f"({seconds + microseconds / 1000000}"
+
+    def count_live_leases(self) -> int:
+        """Notes currently holding a processing slot"""
+        return int(self.redis_client.zcount(self.LEASES_KEY, self._live_lease_bound(), "+inf"))
+
+    def renew_lease(self, note_id: int, seconds: Optional[int] = None) -> bool:
+        """
+        Extend a note's lease (no-op for notes that hold none)
+
+        Args:
+            note_id: Note ID
+            seconds: Minimum time left on the lease (QUEUE_LEASE_SECONDS by default)
+
+        Returns:
+            True if the note holds a lease
+        """
+        try:
+            return bool(self.scripts['renew'](
+                keys=[self.LEASES_KEY],
+                args=[note_id, seconds or settings.QUEUE_LEASE_SECONDS]
+            ))
+        except Exception as e:
+            logger.warning(f"Could not renew lease of note {note_id}: {str(e)}")
+            return False
+
+    def hand_off(self, note_id: int, delay_seconds: int = 0) -> bool:
+        """
+        Keep a note's slot while it waits for its next stage or retry
+
+        The reaper renews the lease until a worker starts the note again
+        (hold_lease), for up to QUEUE_HANDOFF_MAX_SECONDS after the delay.
+
+        Args:
+            note_id: Note ID
+            delay_seconds: Countdown before the next task may start
+
+        Returns:
+            True if the note holds a lease
+        """
+        try:
+            return bool(self.scripts['handoff'](
+                keys=[self.LEASES_KEY, self.HANDOFFS_KEY],
+                args=[note_id, delay_seconds + settings.QUEUE_HANDOFF_MAX_SECONDS]
+            ))
+        except Exception as e:
+            logger.warning(f"Could not hand off note {note_id}: {str(e)}")
+            return False
+
+    def release_leases(self, note_ids: List[int]) -> None:
+        """Free the processing slots of notes"""
+        if note_ids:
+            members = [str(note_id) for note_id in note_ids]
+            self.redis_client.zrem(self.LEASES_KEY, *members)
+            self.redis_client.hdel(self.HANDOFFS_KEY, *members)
+
+    @contextmanager
+    def hold_lease(self, note_id: int):
+        """
+        Renew a note's lease every QUEUE_LEASE_HEARTBEAT_SECONDS while it is processed
+
+        The heartbeat runs in a thread, so stages that block their event
+        loop still keep the lease.
+        """
+        stopped = threading.Event()
+
+        def heartbeat():
+            while not stopped.wait(settings.QUEUE_LEASE_HEARTBEAT_SECONDS):
+                if not self.renew_lease(note_id):
+                    # Not claimed from the queue, or already released
+                    return
+
+        if not self.renew_lease(note_id):
+            yield
+            return
+        # Picked up: the worker keeps the lease from here on
+        self.redis_client.hdel(self.HANDOFFS_KEY, str(note_id))
+
+        thread = threading.Thread(target=heartbeat, name=f"lease-{note_id}", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stopped.set()
+            thread.join()
 
     async def check_user_rate_limit(
         self,
@@ -188,6 +373,7 @@ class QueueManager:
             result = await db.execute(
                 select(UserSubscription)
                 .join(UserSubscription.plan)
+                .options(selectinload(UserSubscription.plan))
                 .where(
                     and_(
                         UserSubscription.user_id == user_id,
@@ -287,6 +473,7 @@ class QueueManager:
 
             # Get queue position
             position = await self.get_queue_position(note_id)
+            estimated_wait = await self.estimate_wait_minutes(db, note_id)
 
             logger.info(
                 f"Added note {note_id} to queue. Priority: {priority}, Position: {position}"
@@ -297,7 +484,7 @@ class QueueManager:
                 'status': QueueStatus.waiting.value,
                 'priority': priority,
                 'position': position,
-                'estimated_wait_minutes': position * 2  # Rough estimate
+                'estimated_wait_minutes': estimated_wait
             }
 
         except RateLimitExceededError:
@@ -307,6 +494,38 @@ class QueueManager:
             logger.error(f"Error adding to queue: {str(e)}", exc_info=True)
             raise QueueError(f"Could not add to queue: {str(e)}")
 
+    async def submit_note(
+        self,
+        db: AsyncSession,
+        note_id: int,
+        user_id: int,
+        estimated_credits: Optional[float] = None
+    ) -> None:
+        """
+        Queue a new note and wake the dispatcher (process_queue)
+
+        Processing starts as soon as a slot is free. If the note cannot be
+        queued (e.g. Redis is down), it is sent to the worker directly so it
+        is never left unprocessed.
+
+        Args:
+            db: Database session
+            note_id: Note ID
+            user_id: User ID
+            estimated_credits: Estimated credits required
+        """
+        from app.worker.tasks_with_credits import process_queue
+        from app.worker.tasks_with_credits_fixed import process_file_with_credits
+
+        try:
+            await self.add_to_queue(db, note_id, user_id, estimated_credits)
+        except QueueError as e:
+            logger.warning(f"Could not queue note {note_id}, processing it directly: {str(e)}")
+            process_file_with_credits.delay(note_id)
+            return
+
+        process_queue.delay()
+
     async def get_queue_position(self, note_id: int) -> int:
         """
         Get position of note in queue
@@ -326,77 +545,139 @@ class QueueManager:
             logger.error(f"Error getting queue position: {str(e)}")
             return -1
 
-    async def get_next_task(
-        self,
-        db: AsyncSession
-    ) -> Optional[Dict]:
+    async def estimate_wait_minutes(self, db: AsyncSession, note_id: int) -> int:
         """
-        Get next task from queue based on priority and capacity
+        Estimate how long a note waits before processing starts
+
+        Uses the durations stored on the uploads of the notes ahead in the
+        queue, spread over the available processing slots.
 
         Args:
             db: Database session
+            note_id: Note ID
 
         Returns:
-            Task dict or None if no tasks available or at capacity
+            Estimated wait in minutes (0 if not queued)
         """
         try:
-            # Check current processing count
-            processing_count = int(self.redis_client.get(self.PROCESSING_KEY) or 0)
+            rank = self.redis_client.zrevrank(self.QUEUE_KEY, str(note_id))
+            if not rank:
+                return 0
 
-            if processing_count >= settings.MAX_CONCURRENT_PROCESSING:
-                logger.debug(f"At capacity: {processing_count}/{settings.MAX_CONCURRENT_PROCESSING}")
-                return None
+            ahead_ids = [int(n) for n in self.redis_client.zrevrange(self.QUEUE_KEY, 0, rank - 1)]
+            result = await db.execute(
+                select(func.coalesce(func.sum(Upload.duration_seconds), 0))
+                .where(Upload.note_id.in_(ahead_ids))
+            )
+            media_minutes = float(result.scalar() or 0) / 60.0
 
-            # Get highest priority item from Redis
-            items = self.redis_client.zrevrange(self.QUEUE_KEY, 0, 0)
+            work_minutes = (
+                media_minutes * settings.QUEUE_MINUTES_PER_MEDIA_MINUTE
+                + len(ahead_ids) * settings.QUEUE_NOTE_OVERHEAD_MINUTES
+            )
+            return int(round(work_minutes / max(1, settings.MAX_CONCURRENT_PROCESSING)))
 
-            if not items:
-                logger.debug("No items in queue")
-                return None
+        except Exception as e:
+            logger.error(f"Error estimating wait time: {str(e)}")
+            return 0
 
-            note_id = int(items[0])
+    async def claim_tasks(
+        self,
+        db: AsyncSession,
+        count: int = 1
+    ) -> List[Dict]:
+        """
+        Claim up to count tasks from the queue based on priority and capacity
 
-            # Get queue entry from database
-            result = await db.execute(
-                select(ProcessingQueue)
-                .where(
-                    and_(
-                        ProcessingQueue.note_id == note_id,
-                        ProcessingQueue.status == QueueStatus.waiting
+        Each claimed note gets a lease of QUEUE_LEASE_SECONDS. Notes popped
+        from Redis that are no longer waiting in the database are dropped and
+        their leases freed. If the database update fails, the
+        popped notes go back into the queue with their scores.
+
+        Args:
+            db: Database session
+            count: Maximum number of tasks to claim
+
+        Returns:
+            Task dicts, highest priority first (empty if no tasks available
+            or at capacity)
+        """
+        try:
+            popped = self.scripts['claim'](
+                keys=[self.QUEUE_KEY, self.LEASES_KEY],
+                args=[settings.MAX_CONCURRENT_PROCESSING, count, settings.QUEUE_LEASE_SECONDS]
+            )
+            if not popped:
+                logger.debug("No items in queue or at capacity")
+                return []
+
+            scores = {int(popped[i]): float(popped[i + 1]) for i in range(0, len(popped), 2)}
+
+            try:
+                # Get queue entries from database
+                result = await db.execute(
+                    select(ProcessingQueue)
+                    .where(
+                        and_(
+                            ProcessingQueue.note_id.in_(list(scores)),
+                            ProcessingQueue.status == QueueStatus.waiting
+                        )
                     )
                 )
-            )
-            queue_entry = result.scalar_one_or_none()
-
-            if not queue_entry:
-                # Remove from Redis if not in DB
-                self.redis_client.zrem(self.QUEUE_KEY, str(note_id))
-                # Try again recursively
-                return await self.get_next_task(db)
-
-            # Update status to processing
-            queue_entry.status = QueueStatus.processing
-            queue_entry.started_at = datetime.utcnow()
-            await db.commit()
+                entries = {entry.note_id: entry for entry in result.scalars().all()}
 
-            # Remove from Redis queue
-            self.redis_client.zrem(self.QUEUE_KEY, str(note_id))
+                # Update status to processing
+                started_at = datetime.utcnow()
+                for queue_entry in entries.values():
+                    queue_entry.status = QueueStatus.processing
+                    queue_entry.started_at = started_at
+                await db.commit()
+            except Exception:
+                await db.rollback()
+                # Put the notes back so another dispatcher can claim them
+                self.redis_client.zadd(self.QUEUE_KEY, {str(note_id): score for note_id, score in scores.items()})
+                self.release_leases(list(scores))
+                raise
+
+            stale = [note_id for note_id in scores if note_id not in entries]
+            if stale:
+                # Removed from Redis but no longer waiting in DB
+                logger.warning(f"Dropped {len(stale)} stale queue item(s)")
+                self.release_leases(stale)
+
+            tasks = []
+            for note_id in scores:
+                queue_entry = entries.get(note_id)
+                if queue_entry is None:
+                    continue
+                logger.info(f"Got next task: note_id={note_id}, priority={queue_entry.priority}")
+                tasks.append({
+                    'note_id': note_id,
+                    'user_id': queue_entry.user_id,
+                    'priority': queue_entry.priority,
+                    'queue_id': queue_entry.id
+                })
+            return tasks
 
-            # Increment processing counter
-            self.redis_client.incr(self.PROCESSING_KEY)
+        except Exception as e:
+            logger.error(f"Error claiming tasks: {str(e)}", exc_info=True)
+            return []
 
-            logger.info(f"Got next task: note_id={note_id}, priority={queue_entry.priority}")
+    async def get_next_task(
+        self,
+        db: AsyncSession
+    ) -> Optional[Dict]:
+        """
+        Get next task from queue based on priority and capacity
 
-            return {
-                'note_id': note_id,
-                'user_id': queue_entry.user_id,
-                'priority': queue_entry.priority,
-                'queue_id': queue_entry.id
-            }
+        Args:
+            db: Database session
 
-        except Exception as e:
-            logger.error(f"Error getting next task: {str(e)}", exc_info=True)
-            return None
+        Returns:
+            Task dict or None if no tasks available or at capacity
+        """
+        tasks = await self.claim_tasks(db, 1)
+        return tasks[0] if tasks else None
 
     async def mark_completed(
         self,
@@ -428,12 +709,8 @@ class QueueManager:
                     queue_entry.error_message = error_message
                 await db.commit()
 
-            # Decrement processing counter
-            self.redis_client.decr(self.PROCESSING_KEY)
-
-            # Ensure counter doesn't go negative
-            if int(self.redis_client.get(self.PROCESSING_KEY) or 0) < 0:
-                self.redis_client.set(self.PROCESSING_KEY, 0)
+            # Free the processing slot
+            self.release_leases([note_id])
 
             logger.info(f"Marked note {note_id} as {'completed' if success else 'failed'}")
 
@@ -483,8 +760,8 @@ class QueueManager:
                 {str(note_id): score}
             )
 
-            # Decrement processing counter
-            self.redis_client.decr(self.PROCESSING_KEY)
+            # Free the processing slot
+            self.release_leases([note_id])
 
             logger.info(f"Scheduled retry for note {note_id}. Retry count: {queue_entry.retry_count}")
 
@@ -505,8 +782,8 @@ class QueueManager:
             # Queue length from Redis
             queue_length = self.redis_client.zcard(self.QUEUE_KEY)
 
-            # Processing count
-            processing_count = int(self.redis_client.get(self.PROCESSING_KEY) or 0)
+            # Processing count (live leases)
+            processing_count = self.count_live_leases()
 
             # Get counts by status from database
             result = await db.execute(
@@ -533,6 +810,50 @@ class QueueManager:
             logger.error(f"Error getting queue stats: {str(e)}", exc_info=True)
             return {}
 
+    async def reap_expired_leases(self, db: AsyncSession) -> int:
+        """
+        Requeue notes whose worker stopped renewing their lease
+
+        Leases of handed-off notes are renewed first. Notes over
+        MAX_RETRY_ATTEMPTS are marked failed instead.
+
+        Args:
+            db: Database session
+
+        Returns:
+            Number of expired leases
+        """
+        try:
+            expired = [int(note_id) for note_id in self.scripts['reap'](
+                keys=[self.LEASES_KEY, self.HANDOFFS_KEY],
+                args=[settings.QUEUE_LEASE_SECONDS]
+            )]
+
+            for note_id in expired:
+                result = await db.execute(
+                    select(ProcessingQueue).where(ProcessingQueue.note_id == note_id)
+                )
+                queue_entry = result.scalar_one_or_none()
+                if not queue_entry or queue_entry.status != QueueStatus.processing:
+                    continue
+
+                logger.warning(f"Lease of note {note_id} expired")
+                if queue_entry.retry_count < settings.MAX_RETRY_ATTEMPTS:
+                    await self.retry_task(db, note_id, delay_seconds=0)
+                else:
+                    await self.mark_completed(
+                        db,
+                        note_id,
+                        success=False,
+                        error_message="Processing lease expired"
+                    )
+
+            return len(expired)
+
+        except Exception as e:
+            logger.error(f"Error reaping expired leases: {str(e)}", exc_info=True)
+            return 0
+
     async def cleanup_stale_tasks(
         self,
         db: AsyncSession,
@@ -559,6 +880,12 @@ class QueueManager:
             )
             stale_tasks = result.scalars().all()
 
+            # Long notes whose worker still renews the lease are not stale
+            live = {int(note_id) for note_id in self.redis_client.zrangebyscore(
+                self.LEASES_KEY, self._live_lease_bound(), "+inf"
+            )}
+            stale_tasks = [task for task in stale_tasks if task.note_id not in live]
+
             for task in stale_tasks:
                 logger.warning(f"Found stale task: note_id={task.note_id}")
 
@@ -1,13 +1,12 @@
 """
 سرویس RAG برای چت با دفتر
 """
-# Import and configure Gemini FIRST before any other imports
-from app.services.gemini_config import configure_gemini
-configure_gemini()
-
-import google.generativeai as genai
+import time
 from typing import List, Optional
 from app.core.config import settings
+from app.services.ai_provider import get_ai_provider
+from app.services.chat_concurrency import chat_concurrency
+from app.services.usage_service import usage_service
 from app.services.vector_service import search as vector_search
 
 # System instruction برای چت
@@ -57,8 +56,14 @@ async def chat_with_notebook(
     """
     print(f"[RAG] Processing query for notebook {notebook_id}: {user_query[:100]}...")
 
-    # ۱. جستجو در vector store
-    relevant_chunks = vector_search(notebook_id, user_query)
+    async with chat_concurrency.track_chat():
+        return await _answer(notebook_id, user_query, chat_history)
+
+
+async def _answer(notebook_id: int, user_query: str, chat_history: Optional[List[dict]]) -> str:
+    """بازیابی context و دریافت پاسخ (بدنه chat_with_notebook)"""
+    # ۱. جستجو در vector store (embedding و جستجو CPU-bound هستند و در thread pool جدا اجرا می‌شوند)
+    relevant_chunks = await chat_concurrency.run_retrieval(vector_search, notebook_id, user_query)
 
     # ۲. ساخت context از chunks
     if relevant_chunks:
@@ -78,21 +83,19 @@ async def chat_with_notebook(
     # ۳. ساخت system instruction با context
     system_instruction = CHAT_SYSTEM_INSTRUCTION.format(context=context)
 
-    # ۴. Reconfigure Gemini (needed after embedding service runs)
-    configure_gemini()
-
-    # ۵. ایجاد مدل
-    model = genai.GenerativeModel(
-        model_name=settings.GEMINI_CHAT_MODEL,
-        system_instruction=system_instruction
-    )
-
-    # ۵. شروع چت با history
-    chat = model.start_chat(history=chat_history or [])
-
-    # ۶. ارسال پیام و دریافت پاسخ
+    # ۴. ارسال پیام همراه با history و دریافت پاسخ
     try:
-        response = chat.send_message(user_query)
+        started = time.monotonic()
+        response = await get_ai_provider().chat_async(
+            settings.GEMINI_CHAT_MODEL,
+            system_instruction,
+            chat_history or [],
+            user_query
+        )
+        usage_service.record(
+            'chat', settings.GEMINI_CHAT_MODEL, get_ai_provider().name, response,
+            generation_seconds=time.monotonic() - started
+        )
         print(f"[RAG] Response generated: {len(response.text)} chars")
         return response.text
     except Exception as e:
@@ -105,7 +108,7 @@ async def get_relevant_context(notebook_id: int, query: str) -> str:
     فقط دریافت context مرتبط (بدون چت)
     برای debug یا نمایش به کاربر
     """
-    chunks = vector_search(notebook_id, query)
+    chunks = await chat_concurrency.run_retrieval(vector_search, notebook_id, query)
 
     if not chunks:
         return "محتوای مرتبطی یافت نشد."
@@ -0,0 +1,182 @@
+"""
+Remote File Registry - Reuse Gemini File API uploads across retries
+
+Files uploaded to the Gemini File API stay valid for about 48 hours, but a
+retried or re-generated note used to compress and upload every file again.
+The registry remembers, per note and input file, the remote file names that
+file was uploaded as (keyed by the file's content hash plus the
+preparation settings), so the next attempt can use them directly.
+
+Redis layout:
+    neviso:remote_file:{note_id}:{fingerprint}  JSON entry, expires with the remote files
+    neviso:remote_files:note:{note_id}          set of the note's entry keys
+    neviso:remote_files:notes                   sorted set note_id -> first registration time
+
+Registry errors are logged and never fail note processing.
+"""
+import hashlib
+import json
+import logging
+import time
+from typing import Dict, List, Optional
+
+import redis
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Used when the SDK does not report an expiration time
+DEFAULT_REMOTE_FILE_LIFETIME_SECONDS = 47 * 3600
+
+
+class RemoteFileRegistry:
+    """Tracks Gemini File API handles per note in Redis"""
+
+    ENTRY_KEY = "neviso:remote_file:{note_id}:{fingerprint}"
+    NOTE_KEY = "neviso:remote_files:note:{note_id}"
+    NOTES_KEY = "neviso:remote_files:notes"
+
+    def __init__(self):
+        self._redis_client = None
+
+    @property
+    def redis_client(self):
+        """Redis connection, created on first use"""
+        if self._redis_client is None:
+            self._redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+        return self._redis_client
+
+    @staticmethod
+    def build_fingerprint(content_hash: Optional[str], preparation_version: str) -> Optional[str]:
+        """
+        Key for one input file as it was prepared for upload
+
+        Args:
+            content_hash: SHA-256 of the original upload
+            preparation_version: Fingerprint of compression/optimization settings
+
+        Returns:
+            Hex fingerprint, or None for legacy uploads without a content hash
+        """
+        if not content_hash:
+            return None
+        return hashlib.sha256(f"{preparation_version}\n{content_hash}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def expiry_from_handles(remote_files: List) -> float:
+        """Earliest expiration (epoch seconds) of a list of File API handles"""
+        expiries = []
+        for remote_file in remote_files:
+            expiration_time = getattr(remote_file, 'expiration_time', None)
+            if expiration_time is not None:
+                try:
+                    expiries.append(expiration_time.timestamp())
+                except (AttributeError, ValueError, OSError):
+                    pass
+        return min(expiries) if expiries else time.time() + DEFAULT_REMOTE_FILE_LIFETIME_SECONDS
+
+    def get(self, note_id: int, fingerprint: str) -> Optional[Dict]:
+        """
+        Registered entry for a note's input file
+
+        Returns:
+            Dict with remote_names, speech, labels and expire_at, or None
+        """
+        try:
+            raw = self.redis_client.get(self.ENTRY_KEY.format(note_id=note_id, fingerprint=fingerprint))
+        except Exception as e:
+            logger.warning(f"[REMOTE FILES] Lookup failed for note {note_id}: {str(e)}")
+            return None
+        if not raw:
+            return None
+        entry = json.loads(raw)
+        if entry.get('expire_at', 0) - settings.REMOTE_FILE_EXPIRY_MARGIN_SECONDS <= time.time():
+            return None
+        return entry
+
+    def register(
+        self,
+        note_id: int,
+        fingerprint: str,
+        remote_names: List[str],
+        expire_at: float,
+        speech: Optional[Dict] = None,
+        labels: Optional[List[Optional[str]]] = None
+    ) -> None:
+        """
+        Remember the remote files an input file was uploaded as
+
+        The entry expires REMOTE_FILE_EXPIRY_MARGIN_SECONDS before the
+        earliest remote file does.
+        """
+        ttl = int(expire_at - time.time() - settings.REMOTE_FILE_EXPIRY_MARGIN_SECONDS)
+        if ttl <= 0:
+            return
+
+        entry_key = self.ENTRY_KEY.format(note_id=note_id, fingerprint=fingerprint)
+        note_key = self.NOTE_KEY.format(note_id=note_id)
+        entry = {'remote_names': remote_names, 'expire_at': expire_at, 'speech': speech, 'labels': labels}
+        try:
+            pipe = self.redis_client.pipeline()
+            pipe.set(entry_key, json.dumps(entry), ex=ttl)
+            pipe.sadd(note_key, entry_key)
+            pipe.expire(note_key, DEFAULT_REMOTE_FILE_LIFETIME_SECONDS)
+            pipe.zadd(self.NOTES_KEY, {str(note_id): time.time()}, nx=True)
+            pipe.execute()
+        except Exception as e:
+            logger.warning(f"[REMOTE FILES] Could not register files for note {note_id}: {str(e)}")
+
+    def forget(self, note_id: int, fingerprint: str) -> None:
+        """Drop an entry whose remote files are gone or unusable"""
+        entry_key = self.ENTRY_KEY.format(note_id=note_id, fingerprint=fingerprint)
+        try:
+            self.redis_client.delete(entry_key)
+            self.redis_client.srem(self.NOTE_KEY.format(note_id=note_id), entry_key)
+        except Exception as e:
+            logger.warning(f"[REMOTE FILES] Could not forget entry for note {note_id}: {str(e)}")
+
+    def release_note(self, note_id: int) -> int:
+        """
+        Delete a finished note's remote files and registry entries
+
+        Returns:
+            Number of remote files deleted
+        """
+        from app.services.ai_provider import get_ai_provider
+
+        note_key = self.NOTE_KEY.format(note_id=note_id)
+        deleted = 0
+        try:
+            entry_keys = self.redis_client.smembers(note_key)
+            for entry_key in entry_keys:
+                raw = self.redis_client.get(entry_key)
+                for remote_name in (json.loads(raw)['remote_names'] if raw else []):
+                    try:
+                        get_ai_provider().delete_file(remote_name)
+                        deleted += 1
+                    except Exception as e:
+                        # Already expired or deleted
+                        logger.info(f"[REMOTE FILES] Could not delete {remote_name}: {str(e)}")
+            self.redis_client.delete(note_key, *entry_keys)
+            self.redis_client.zrem(self.NOTES_KEY, str(note_id))
+        except Exception as e:
+            logger.warning(f"[REMOTE FILES] Release failed for note {note_id}: {str(e)}")
+            return deleted
+
+        if deleted:
+            logger.info(f"[REMOTE FILES] Deleted {deleted} remote file(s) of note {note_id}")
+        return deleted
+
+    def stale_notes(self, older_than_seconds: float) -> List[int]:
+        """Notes whose first upload was registered more than older_than_seconds ago"""
+        try:
+            note_ids = self.redis_client.zrangebyscore(self.NOTES_KEY, 0, time.time() - older_than_seconds)
+        except Exception as e:
+            logger.warning(f"[REMOTE FILES] Could not list stale notes: {str(e)}")
+            return []
+        return [int(note_id) for note_id in note_ids]
+
+
+# Singleton instance
+remote_file_registry = RemoteFileRegistry()
@@ -0,0 +1,91 @@
+"""
+AI Result Cache - Reuse generated notes for identical inputs
+
+Notes are keyed by the SHA-256 of every input file (in upload order) plus
+the prompt version, so a retry or another user uploading the same
+recording gets the stored result instead of a new model call.
+"""
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.db.models import AIResultCache
+
+logger = logging.getLogger(__name__)
+
+
+class ResultCache:
+    """Durable cache of model output in the ai_result_cache table"""
+
+    @staticmethod
+    def build_cache_key(content_hashes: List[Optional[str]], prompt_version: str) -> Optional[str]:
+        """
+        Build the cache key for a set of input files
+
+        Args:
+            content_hashes: SHA-256 of each input file, in processing order
+            prompt_version: Fingerprint of model, instruction and settings
+
+        Returns:
+            Hex key, or None if any file has no content hash (legacy uploads)
+        """
+        if not content_hashes or any(not h for h in content_hashes):
+            return None
+
+        material = "\n".join([prompt_version] + list(content_hashes))
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_result(db: Session, cache_key: str) -> Optional[Dict]:
+        """
+        Get a cached result and record the hit
+
+        Returns:
+            Stored model output or None on a miss
+        """
+        entry = db.execute(
+            select(AIResultCache).where(AIResultCache.cache_key == cache_key)
+        ).scalar_one_or_none()
+        if not entry:
+            return None
+
+        db.execute(
+            update(AIResultCache)
+            .where(AIResultCache.id == entry.id)
+            .values(hit_count=AIResultCache.hit_count + 1, last_hit_at=datetime.now())
+        )
+        db.commit()
+        return dict(entry.result)
+
+    @staticmethod
+    def store_result(db: Session, cache_key: str, prompt_version: str, result: Dict) -> bool:
+        """
+        Store model output for later reuse
+
+        A concurrent worker may store the same key first; that is not an
+        error since both results came from identical inputs.
+
+        Returns:
+            True if a new entry was written
+        """
+        db.add(AIResultCache(
+            cache_key=cache_key,
+            prompt_version=prompt_version,
+            result=result
+        ))
+        try:
+            db.commit()
+            return True
+        except IntegrityError:
+            db.rollback()
+            logger.info(f"[CACHE] Result for {cache_key[:12]} already stored")
+            return False
+
+
+# Singleton instance
+result_cache = ResultCache()
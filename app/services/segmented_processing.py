@@ -0,0 +1,246 @@
+"""
+Segmented Processing - Map/reduce note generation for long recordings
+
+Long audio is cut at silences close to every SEGMENT_MINUTES mark. Each
+segment becomes its own bounded generate call (map, run concurrently and
+retried on its own); a small reduce call then writes the title and an
+overview from the partial notes' headings, and the partial notes are
+joined in order. No single call has to produce the whole note, so long
+lectures are neither truncated nor retried from scratch.
+"""
+import asyncio
+import logging
+import os
+import re
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.speech_optimizer import detect_silences
+from app.services.transcode_service import transcode_pool
+
+logger = logging.getLogger(__name__)
+
+HEADING_PATTERN = re.compile(r"<h[12][^>]*>(.*?)</h[12]>", re.IGNORECASE | re.DOTALL)
+TAG_PATTERN = re.compile(r"<[^>]+>")
+
+
+def should_segment(files: List[Tuple[str, str, Optional[float]]]) -> bool:
+    """
+    Decide whether a note goes through the segmented pipeline
+
+    Only notes made entirely of audio with known durations qualify; images
+    and slides need to be seen together with the whole lecture.
+
+    Args:
+        files: (storage_path, file_type, duration_seconds) per upload
+
+    Returns:
+        True if the total audio is longer than SEGMENT_MIN_TOTAL_MINUTES
+    """
+    if not settings.SEGMENTED_PROCESSING_ENABLED or not files:
+        return False
+    if any(not (file_type or '').lower().startswith('audio') or not duration for _, file_type, duration in files):
+        return False
+    total_seconds = sum(float(duration) for _, _, duration in files)
+    return total_seconds > settings.SEGMENT_MIN_TOTAL_MINUTES * 60
+
+
+def plan_segments(
+    duration_seconds: float,
+    silences: List[Tuple[float, float]],
+    segment_seconds: float,
+    window_seconds: float
+) -> List[Tuple[float, float]]:
+    """
+    Choose segment boundaries near every segment_seconds mark
+
+    The cut is placed in the middle of the silence closest to the mark
+    (within window_seconds), or exactly at the mark if there is none.
+    A short tail is folded into the last segment.
+
+    Returns:
+        Consecutive (start, end) pairs covering the whole recording
+    """
+    midpoints = sorted((start + end) / 2 for start, end in silences)
+    cuts = []
+    position = 0.0
+
+    while duration_seconds - position > segment_seconds * 1.25:
+        target = position + segment_seconds
+        nearby = [m for m in midpoints if abs(m - target) <= window_seconds and m > position]
+        cut = min(nearby, key=lambda m: abs(m - target)) if nearby else target
+        cuts.append(cut)
+        position = cut
+
+    boundaries = [0.0] + cuts + [duration_seconds]
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+
+def format_timestamp(seconds: float) -> str:
+    """Format seconds as H:MM:SS or MM:SS"""
+    seconds = int(seconds)
+    hours, remainder = divmod(seconds, 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}" if hours else f"{minutes:02d}:{secs:02d}"
+
+
+def extract_headings(note_html: str) -> List[str]:
+    """Return the plain text of h1/h2 headings in a partial note"""
+    return [
+        TAG_PATTERN.sub('', heading).strip()
+        for heading in HEADING_PATTERN.findall(note_html or '')
+        if TAG_PATTERN.sub('', heading).strip()
+    ]
+
+
+async def cut_segment(file_path: str, start: float, end: float) -> str:
+    """
+    Encode one segment of a recording as speech Opus
+
+    Returns:
+        Temporary file path (caller deletes)
+    """
+    temp_fd, temp_path = tempfile.mkstemp(suffix='.ogg')
+    os.close(temp_fd)
+
+    result = await transcode_pool.run_ffmpeg(
+        [
+            '-y',
+            '-ss', f"{start:.3f}",
+            '-t', f"{end - start:.3f}",
+            '-i', file_path,
+            '-vn',
+            '-ac', '1',
+            '-ar', '16000',
+            '-c:a', 'libopus',
+            '-b:a', '32k',
+            temp_path
+        ],
+        label=f"segment {os.path.basename(file_path)} {format_timestamp(start)}",
+        duration_seconds=end - start
+    )
+    if result['returncode'] != 0:
+        os.remove(temp_path)
+        raise RuntimeError(f"ffmpeg failed to cut segment: {result['stderr'][-500:]}")
+    return temp_path
+
+
+async def _map_segment(index: int, total: int, segment: Dict, semaphore: asyncio.Semaphore) -> Dict:
+    """Generate the partial note for one segment, retrying only this segment"""
+    from app.services.ai_service import process_files_with_gemini
+
+    prompt = (
+        f"This audio is part {index} of {total} of one recording "
+        f"(from {format_timestamp(segment['start'])} to {format_timestamp(segment['end'])} of the full recording). "
+        "Create a structured note for this part only. Do not write an introduction or "
+        "conclusion for the whole recording; the parts will be joined in order."
+    )
+
+    async with semaphore:
+        for attempt in range(settings.SEGMENT_MAX_RETRIES + 1):
+            try:
+                logger.info(f"[SEGMENT] Generating part {index}/{total} (attempt {attempt + 1})")
+                return await process_files_with_gemini(
+                    [segment['path']],
+                    prompt=prompt,
+                    compress=False,
+                    max_output_tokens=settings.SEGMENT_MAX_OUTPUT_TOKENS,
+                    call_type='segment'
+                )
+            except Exception as e:
+                if attempt == settings.SEGMENT_MAX_RETRIES:
+                    raise
+                delay = 2 ** attempt * 5
+                logger.warning(f"[SEGMENT] Part {index}/{total} failed ({str(e)}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+
+async def _reduce(partials: List[Dict]) -> Dict:
+    """Ask for a title and an overview from the partial notes' headings"""
+    from app.services.ai_service import generate_json_from_text
+
+    outline = "\n".join(
+        f"Part {i}: {partial.get('title', '')}\n" + "\n".join(f"  - {h}" for h in extract_headings(partial.get('note', '')))
+        for i, partial in enumerate(partials, 1)
+    )
+    prompt = (
+        "The following are the titles and section headings of consecutive parts of ONE recorded "
+        "lecture or meeting, in order.\n\n"
+        f"{outline}\n\n"
+        "Return a JSON object with two keys, written in the same language as the headings:\n"
+        '- "title": a formal title for the whole recording\n'
+        '- "overview": short HTML (<h2> and <ul>/<li> only) listing the main topics covered'
+    )
+    return await generate_json_from_text(prompt, max_output_tokens=2048, call_type='segment_merge')
+
+
+async def process_segmented(files: List[Tuple[str, str, Optional[float]]]) -> Dict[str, str]:
+    """
+    Generate one note for long recordings with concurrent per-segment calls
+
+    Args:
+        files: (storage_path, file_type, duration_seconds) per upload, in order
+
+    Returns:
+        Dictionary with 'title' and 'note' keys like process_files_with_gemini,
+        plus 'partial' if any part was cut short
+    """
+    segments = []
+    try:
+        # Plan cut points for every file (silence detection runs concurrently)
+        silences_per_file = await asyncio.gather(*(
+            detect_silences(path, float(duration)) for path, _, duration in files
+        ))
+        planned = []
+        for (path, _, duration), silences in zip(files, silences_per_file):
+            for start, end in plan_segments(
+                float(duration),
+                silences,
+                settings.SEGMENT_MINUTES * 60,
+                settings.SEGMENT_CUT_WINDOW_SECONDS
+            ):
+                planned.append({'source': path, 'start': start, 'end': end})
+
+        logger.info(f"[SEGMENT] Cutting {len(files)} file(s) into {len(planned)} segment(s)")
+        paths = await asyncio.gather(
+            *(cut_segment(s['source'], s['start'], s['end']) for s in planned),
+            return_exceptions=True
+        )
+        for segment, path in zip(planned, paths):
+            if not isinstance(path, BaseException):
+                segment['path'] = path
+                segments.append(segment)
+        # Raise only after every cut file is tracked for cleanup
+        for path in paths:
+            if isinstance(path, BaseException):
+                raise path
+
+        # Map: one bounded call per segment
+        semaphore = asyncio.Semaphore(max(1, settings.SEGMENT_MAX_CONCURRENT_CALLS))
+        partials = await asyncio.gather(*(
+            _map_segment(i, len(segments), segment, semaphore)
+            for i, segment in enumerate(segments, 1)
+        ))
+
+        # Reduce: title + overview; the partial notes are joined in order
+        try:
+            summary = await _reduce(partials)
+        except Exception as e:
+            logger.warning(f"[SEGMENT] Reduce step failed ({str(e)}), using first part's title")
+            summary = {}
+
+        title = summary.get('title') or partials[0].get('title', 'Transcription')
+        note_html = (summary.get('overview') or '') + "".join(p.get('note', '') for p in partials)
+
+        logger.info(f"[SEGMENT] Merged {len(partials)} part(s) into one note ({len(note_html)} chars)")
+        merged = {'title': title, 'note': note_html}
+        if any(p.get('partial') for p in partials):
+            # One part cut short leaves a gap in the whole note
+            merged['partial'] = True
+        return merged
+
+    finally:
+        for segment in segments:
+            if os.path.exists(segment['path']):
+                os.remove(segment['path'])
@@ -0,0 +1,286 @@
+"""
+Speech Optimizer - Shrinks lecture audio before it is sent to the model
+
+Three optional steps, all done by ffmpeg through the transcode pool:
+1. Silence trimming: silencedetect finds pauses, only speech segments are kept
+2. Tempo-up: atempo speeds speech up without changing pitch
+3. Bitrate from duration: longer recordings get a lower Opus bitrate
+
+Trimming shifts every timestamp, so a timestamp map is returned that turns
+a position in the optimized audio back into a position in the original.
+"""
+import asyncio
+import logging
+import os
+import re
+import tempfile
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.media_headers import read_media_info
+from app.services.transcode_service import transcode_pool
+
+logger = logging.getLogger(__name__)
+
+# (max optimized duration in seconds, Opus bitrate) - first match wins
+BITRATE_TIERS = [
+    (20 * 60, "32k"),
+    (60 * 60, "24k"),
+    (None, "16k"),
+]
+
+SILENCE_START_PATTERN = re.compile(r"silence_start:\s*(-?[\d.]+)")
+SILENCE_END_PATTERN = re.compile(r"silence_end:\s*(-?[\d.]+)")
+
+
+def parse_silences(ffmpeg_stderr: str, duration_seconds: float) -> List[Tuple[float, float]]:
+    """
+    Parse silencedetect output into (start, end) pairs
+
+    A silence still open at the end of the file is closed at duration_seconds.
+    """
+    silences = []
+    start = None
+    for line in ffmpeg_stderr.splitlines():
+        start_match = SILENCE_START_PATTERN.search(line)
+        if start_match:
+            start = max(0.0, float(start_match.group(1)))
+            continue
+        end_match = SILENCE_END_PATTERN.search(line)
+        if end_match and start is not None:
+            silences.append((start, float(end_match.group(1))))
+            start = None
+
+    if start is not None:
+        silences.append((start, duration_seconds))
+    return silences
+
+
+def build_speech_segments(
+    silences: List[Tuple[float, float]],
+    duration_seconds: float,
+    padding_seconds: float
+) -> List[Tuple[float, float]]:
+    """
+    Invert silences into the (start, end) segments to keep
+
+    Each segment is padded so words at the edges are not clipped;
+    segments that touch after padding are merged.
+    """
+    segments = []
+    position = 0.0
+    for silence_start, silence_end in sorted(silences):
+        if silence_start > position:
+            segments.append((position, silence_start))
+        position = max(position, silence_end)
+    if position < duration_seconds:
+        segments.append((position, duration_seconds))
+
+    padded = []
+    for start, end in segments:
+        start = max(0.0, start - padding_seconds)
+        end = min(duration_seconds, end + padding_seconds)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], max(padded[-1][1], end))
+        else:
+            padded.append((start, end))
+    return padded
+
+
+def build_timestamp_map(segments: List[Tuple[float, float]], tempo: float = 1.0) -> List[Dict]:
+    """
+    Describe where each kept segment lands in the optimized audio
+
+    Returns:
+        List of {'output_start', 'source_start', 'source_end'} in seconds
+    """
+    timestamp_map = []
+    output_position = 0.0
+    for start, end in segments:
+        timestamp_map.append({
+            'output_start': round(output_position, 3),
+            'source_start': round(start, 3),
+            'source_end': round(end, 3),
+        })
+        output_position += (end - start) / tempo
+    return timestamp_map
+
+
+def map_to_source(output_seconds: float, timestamp_map: List[Dict], tempo: float = 1.0) -> float:
+    """
+    Convert a position in the optimized audio to the original recording
+
+    Args:
+        output_seconds: Time reported against the optimized audio
+        timestamp_map: Map from build_timestamp_map
+        tempo: Tempo factor used when optimizing
+
+    Returns:
+        Time in the original recording
+    """
+    if not timestamp_map:
+        return output_seconds
+
+    entry = timestamp_map[0]
+    for candidate in timestamp_map:
+        if candidate['output_start'] > output_seconds:
+            break
+        entry = candidate
+
+    source = entry['source_start'] + (output_seconds - entry['output_start']) * tempo
+    return min(max(source, entry['source_start']), entry['source_end'])
+
+
+def map_to_output(source_seconds: float, timestamp_map: List[Dict], tempo: float = 1.0) -> float:
+    """
+    Convert a position in the original recording to the optimized audio
+
+    Positions inside removed silence map to the start of the next kept segment.
+
+    Args:
+        source_seconds: Time in the original recording
+        timestamp_map: Map from build_timestamp_map
+        tempo: Tempo factor used when optimizing
+
+    Returns:
+        Time in the optimized audio
+    """
+    if not timestamp_map:
+        return source_seconds
+
+    for entry in timestamp_map:
+        if source_seconds < entry['source_end']:
+            return entry['output_start'] + max(source_seconds - entry['source_start'], 0.0) / tempo
+
+    last = timestamp_map[-1]
+    return last['output_start'] + (last['source_end'] - last['source_start']) / tempo
+
+
+def choose_bitrate(duration_seconds: float) -> str:
+    """Pick an Opus bitrate for speech of the given (optimized) duration"""
+    for max_duration, bitrate in BITRATE_TIERS:
+        if max_duration is None or duration_seconds <= max_duration:
+            return bitrate
+    return BITRATE_TIERS[-1][1]
+
+
+def _build_filter(segments: List[Tuple[float, float]], tempo: float) -> str:
+    """ffmpeg audio filter keeping the segments and applying tempo"""
+    keep = "+".join(f"between(t,{start:.3f},{end:.3f})" for start, end in segments)
+    filters = [f"aselect='{keep}'", "asetpts=N/SR/TB"]
+    if tempo != 1.0:
+        filters.append(f"atempo={tempo:.3f}")
+    return ",".join(filters)
+
+
+async def detect_silences(file_path: str, duration_seconds: float) -> List[Tuple[float, float]]:
+    """Run silencedetect over a file and return the silent ranges"""
+    result = await transcode_pool.run_ffmpeg(
+        [
+            '-i', file_path,
+            '-vn',
+            '-af', (
+                f"silencedetect=noise={settings.SPEECH_SILENCE_THRESHOLD_DB}dB"
+                f":d={settings.SPEECH_MIN_SILENCE_SECONDS}"
+            ),
+            '-f', 'null', '-'
+        ],
+        label=f"silencedetect {os.path.basename(file_path)}",
+        duration_seconds=duration_seconds
+    )
+    if result['returncode'] != 0:
+        raise RuntimeError(f"silencedetect failed: {result['stderr'][-500:]}")
+    return parse_silences(result['stderr'], duration_seconds)
+
+
+async def optimize_speech_file(file_path: str, tempo: Optional[float] = None) -> Optional[Dict]:
+    """
+    Trim silence, optionally speed up and encode speech audio as Opus
+
+    Args:
+        file_path: Original audio file
+        tempo: Speed factor (default: SPEECH_TEMPO, 1.0 keeps original speed)
+
+    Returns:
+        Dict with path (temporary file, caller deletes), bitrate, original_seconds,
+        optimized_seconds, silence_seconds, removed_seconds (silence + tempo)
+        and timestamp_map - or None if the file could not be optimized and
+        the caller should fall back
+    """
+    # atempo accepts 0.5-2.0 per instance
+    tempo = min(max(tempo or settings.SPEECH_TEMPO, 0.5), 2.0)
+
+    header_info = await asyncio.to_thread(read_media_info, file_path)
+    if not header_info:
+        logger.info(f"[SPEECH] Unknown duration for {file_path}, skipping optimization")
+        return None
+    duration = header_info['duration_seconds']
+
+    temp_path = None
+    try:
+        silences = await detect_silences(file_path, duration)
+        segments = build_speech_segments(silences, duration, settings.SPEECH_SILENCE_PADDING_SECONDS)
+        if not segments:
+            logger.info(f"[SPEECH] No speech detected in {file_path}, skipping optimization")
+            return None
+
+        kept_seconds = sum(end - start for start, end in segments)
+        optimized_seconds = kept_seconds / tempo
+        bitrate = choose_bitrate(optimized_seconds)
+
+        temp_fd, temp_path = tempfile.mkstemp(suffix='.ogg')
+        os.close(temp_fd)
+
+        result = await transcode_pool.run_ffmpeg(
+            [
+                '-y',
+                '-i', file_path,
+                '-vn',
+                '-af', _build_filter(segments, tempo),
+                '-ac', '1',
+                '-ar', '16000',
+                '-c:a', 'libopus',
+                '-b:a', bitrate,
+                temp_path
+            ],
+            label=f"speech {os.path.basename(file_path)}",
+            duration_seconds=duration
+        )
+        if result['returncode'] != 0:
+            raise RuntimeError(f"ffmpeg failed: {result['stderr'][-500:]}")
+
+        optimized = {
+            'path': temp_path,
+            'bitrate': bitrate,
+            'tempo': tempo,
+            'original_seconds': round(duration, 2),
+            'optimized_seconds': round(optimized_seconds, 2),
+            'silence_seconds': round(duration - kept_seconds, 2),
+            'removed_seconds': round(duration - optimized_seconds, 2),
+            'timestamp_map': build_timestamp_map(segments, tempo),
+        }
+        logger.info(
+            f"[SPEECH] {os.path.basename(file_path)}: {duration:.0f}s -> {optimized_seconds:.0f}s "
+            f"({optimized['removed_seconds']:.0f}s removed, {len(segments)} segments, {bitrate})"
+        )
+        return optimized
+
+    except Exception as e:
+        logger.warning(f"[SPEECH] Optimization failed for {file_path}: {str(e)}")
+        if temp_path and os.path.exists(temp_path):
+            os.remove(temp_path)
+        return None
+
+
+def plan_has_speech_optimization(features) -> bool:
+    """
+    Check a plan's features for the speech optimization toggle
+
+    Plan.features is stored either as a dict ({"speech_optimization": true})
+    or as a list of feature names.
+    """
+    if isinstance(features, dict):
+        return bool(features.get('speech_optimization'))
+    if isinstance(features, list):
+        return 'speech_optimization' in features
+    return False
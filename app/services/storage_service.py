@@ -0,0 +1,303 @@
+"""
+Upload Storage Service
+Streams uploaded files to disk in bounded chunks and stores them by content hash
+
+Layout inside UPLOAD_DIR:
+    tmp/<uuid><ext>                 files still being received
+    objects/<aa>/<sha256><ext>      finished uploads, one copy per distinct content
+"""
+import hashlib
+import logging
+import os
+import time
+import uuid
+from typing import AsyncIterator, Dict, Optional
+
+import aiofiles
+from fastapi import UploadFile
+from starlette.requests import ClientDisconnect
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class UploadTooLargeError(Exception):
+    """Raised when an uploaded file exceeds MAX_UPLOAD_SIZE"""
+    pass
+
+
+# Accepted uploads (audio, image and browser voice recordings saved as video)
+ALLOWED_CONTENT_TYPE_PREFIXES = [
+    'audio/', 'image/',
+    'video/',  # برای ویس که به صورت ویدیو ذخیره میشه
+    'application/octet-stream'  # بعضی مرورگرها این رو میفرستن
+]
+ALLOWED_EXTENSIONS = ['.mp3', '.wav', '.m4a', '.ogg', '.webm', '.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp']
+
+
+def is_allowed_upload_type(file_name: Optional[str], content_type: Optional[str]) -> bool:
+    """
+    Check whether an upload is an accepted audio/image/voice file
+
+    Args:
+        file_name: File name sent by the client
+        content_type: MIME type sent by the client
+
+    Returns:
+        True if the file may be uploaded
+    """
+    content_type = content_type or ''
+    if any(content_type.startswith(t) for t in ALLOWED_CONTENT_TYPE_PREFIXES):
+        return True
+
+    # Check by extension if content_type not reliable
+    ext = os.path.splitext(file_name or '')[1].lower()
+    return ext in ALLOWED_EXTENSIONS
+
+
+class UploadStorage:
+    """
+    Writes incoming uploads to UPLOAD_DIR without holding whole files in memory
+
+    Each file is copied in chunks of UPLOAD_CHUNK_SIZE bytes. The size limit is
+    enforced while copying and the SHA-256 checksum is computed on the fly.
+    Finished files are moved into a content-addressed store so identical
+    uploads share one copy on disk; Upload rows pointing at the same
+    storage_path act as its reference count. Requests never delete stored
+    objects: scripts/gc_upload_store.py removes unreferenced ones after a
+    grace period.
+    """
+
+    TMP_DIR = "tmp"
+    OBJECTS_DIR = "objects"
+
+    @staticmethod
+    def build_temp_path(original_file_name: Optional[str]) -> str:
+        """
+        Build a unique temporary path for a file that is still being received
+
+        Args:
+            original_file_name: File name sent by the client
+
+        Returns:
+            Path inside UPLOAD_DIR/tmp keeping the original extension
+        """
+        file_extension = os.path.splitext(original_file_name or "")[1].lower()
+        unique_filename = f"{uuid.uuid4()}{file_extension}"
+        return os.path.join(settings.UPLOAD_DIR, UploadStorage.TMP_DIR, unique_filename)
+
+    @staticmethod
+    def build_object_path(content_sha256: str, file_extension: str = "") -> str:
+        """
+        Build the content-addressed path for a file
+
+        The extension is kept in the name because MIME detection for the AI
+        pipeline is extension based.
+
+        Args:
+            content_sha256: Hex SHA-256 of the file
+            file_extension: Extension including the dot (e.g. ".mp3")
+
+        Returns:
+            Path inside UPLOAD_DIR/objects
+        """
+        return os.path.join(
+            settings.UPLOAD_DIR,
+            UploadStorage.OBJECTS_DIR,
+            content_sha256[:2],
+            f"{content_sha256}{file_extension.lower()}"
+        )
+
+    @staticmethod
+    def commit_to_store(temp_path: str, content_sha256: str) -> Dict:
+        """
+        Move a fully received file into the content-addressed store (blocking)
+
+        If the same content is already stored the temporary file is dropped.
+
+        Args:
+            temp_path: File written by save_upload_file / write_range
+            content_sha256: Hex SHA-256 of the file
+
+        Returns:
+            Dict with storage_path and deduplicated flag
+        """
+        file_extension = os.path.splitext(temp_path)[1]
+        object_path = UploadStorage.build_object_path(content_sha256, file_extension)
+
+        if os.path.exists(object_path):
+            UploadStorage.remove_file(temp_path)
+            # Refresh mtime so the garbage collector's grace period restarts
+            os.utime(object_path, None)
+            logger.info(f"Dedup hit for {content_sha256[:12]}: reusing {object_path}")
+            return {'storage_path': object_path, 'deduplicated': True}
+
+        os.makedirs(os.path.dirname(object_path), exist_ok=True)
+        # Atomic on the same filesystem; concurrent identical uploads both win harmlessly
+        os.replace(temp_path, object_path)
+        return {'storage_path': object_path, 'deduplicated': False}
+
+    @staticmethod
+    async def save_upload_file(
+        file: UploadFile,
+        max_size: Optional[int] = None,
+        chunk_size: Optional[int] = None
+    ) -> Dict:
+        """
+        Stream an UploadFile into UPLOAD_DIR
+
+        Args:
+            file: Incoming multipart file
+            max_size: Maximum allowed size in bytes (default: MAX_UPLOAD_SIZE)
+            chunk_size: Read/write chunk size in bytes (default: UPLOAD_CHUNK_SIZE)
+
+        Returns:
+            Dict with storage_path, file_size_bytes, content_sha256 and deduplicated
+
+        Raises:
+            UploadTooLargeError: If the file is larger than max_size
+        """
+        max_size = max_size or settings.MAX_UPLOAD_SIZE
+        chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+
+        # Starlette knows the spooled size for most clients - reject early
+        if file.size is not None and file.size > max_size:
+            raise UploadTooLargeError(
+                f"حجم فایل {file.filename} بیش از حد مجاز است ({max_size // (1024 * 1024)} مگابایت)"
+            )
+
+        file_path = UploadStorage.build_temp_path(file.filename)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+        digest = hashlib.sha256()
+        file_size = 0
+
+        try:
+            async with aiofiles.open(file_path, 'wb') as out:
+                while True:
+                    chunk = await file.read(chunk_size)
+                    if not chunk:
+                        break
+
+                    file_size += len(chunk)
+                    if file_size > max_size:
+                        raise UploadTooLargeError(
+                            f"حجم فایل {file.filename} بیش از حد مجاز است ({max_size // (1024 * 1024)} مگابایت)"
+                        )
+
+                    digest.update(chunk)
+                    await out.write(chunk)
+        except BaseException:
+            # Never leave partially written files behind
+            UploadStorage.remove_file(file_path)
+            raise
+
+        content_sha256 = digest.hexdigest()
+        stored = UploadStorage.commit_to_store(file_path, content_sha256)
+
+        logger.info(f"Stored upload {file.filename} -> {stored['storage_path']} ({file_size} bytes)")
+
+        return {
+            'storage_path': stored['storage_path'],
+            'file_size_bytes': file_size,
+            'content_sha256': content_sha256,
+            'deduplicated': stored['deduplicated']
+        }
+
+    @staticmethod
+    async def write_range(
+        file_path: str,
+        offset: int,
+        stream: AsyncIterator[bytes],
+        max_length: int
+    ) -> Dict:
+        """
+        Write a byte range of a resumable upload at the given offset
+
+        Writing at an explicit offset (instead of appending) makes a resent
+        chunk idempotent. A client disconnect is not an error: the bytes that
+        did arrive are kept so the client can resume after them.
+
+        Args:
+            file_path: Destination file (created if missing)
+            offset: Byte offset to start writing at
+            stream: Async iterator of request body chunks
+            max_length: Maximum number of bytes this range may contain
+
+        Returns:
+            Dict with bytes_written and disconnected flag
+
+        Raises:
+            UploadTooLargeError: If the body is longer than max_length
+        """
+        os.makedirs(os.path.dirname(file_path) or '.', exist_ok=True)
+        if not os.path.exists(file_path):
+            async with aiofiles.open(file_path, 'wb'):
+                pass
+
+        bytes_written = 0
+        disconnected = False
+
+        async with aiofiles.open(file_path, 'r+b') as out:
+            await out.seek(offset)
+            try:
+                async for chunk in stream:
+                    if not chunk:
+                        continue
+                    if bytes_written + len(chunk) > max_length:
+                        raise UploadTooLargeError("حجم داده ارسالی بیش از بازه اعلام شده است")
+                    await out.write(chunk)
+                    bytes_written += len(chunk)
+            except ClientDisconnect:
+                disconnected = True
+
+        return {
+            'bytes_written': bytes_written,
+            'disconnected': disconnected
+        }
+
+    @staticmethod
+    def hash_file(file_path: str, chunk_size: Optional[int] = None) -> str:
+        """
+        Compute the SHA-256 of a stored file in bounded chunks (blocking)
+
+        Args:
+            file_path: File to hash
+            chunk_size: Read size in bytes (default: UPLOAD_CHUNK_SIZE)
+
+        Returns:
+            Hex digest
+        """
+        chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def is_older_than(file_path: str, seconds: int) -> bool:
+        """Check whether a file was last modified more than `seconds` ago"""
+        try:
+            return time.time() - os.path.getmtime(file_path) > seconds
+        except OSError:
+            return False
+
+    @staticmethod
+    def remove_file(file_path: str):
+        """
+        Remove a stored file, ignoring missing files
+
+        Args:
+            file_path: Path to remove
+        """
+        try:
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+        except OSError as e:
+            logger.warning(f"Failed to remove stored file {file_path}: {str(e)}")
+
+
+# Singleton instance
+upload_storage = UploadStorage()
@@ -0,0 +1,160 @@
+"""
+Transcode Pool - Runs ffmpeg as asyncio subprocesses with a host-wide cap
+
+Celery runs several worker processes per host, so an in-process semaphore
+is not enough to stop them from oversubscribing the CPU. Each running
+ffmpeg holds an exclusive flock on one of FFMPEG_MAX_CONCURRENCY slot files
+in FFMPEG_SLOT_DIR; the kernel releases the lock if the process dies.
+"""
+import asyncio
+import fcntl
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# How often a waiting transcode retries the slot files
+SLOT_POLL_INTERVAL_SECONDS = 0.2
+
+
+class TranscodeTimeoutError(Exception):
+    """Raised when ffmpeg runs longer than its timeout"""
+    pass
+
+
+class TranscodePool:
+    """Limits concurrent ffmpeg processes across all workers on a host"""
+
+    @staticmethod
+    def _try_acquire_slot() -> Optional[int]:
+        """
+        Try to lock a free slot file without waiting
+
+        Returns:
+            Open file descriptor holding the lock, or None if all slots are busy
+        """
+        os.makedirs(settings.FFMPEG_SLOT_DIR, exist_ok=True)
+        for slot in range(max(1, settings.FFMPEG_MAX_CONCURRENCY)):
+            slot_path = os.path.join(settings.FFMPEG_SLOT_DIR, f"slot-{slot}.lock")
+            fd = os.open(slot_path, os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except BlockingIOError:
+                os.close(fd)
+        return None
+
+    @staticmethod
+    @asynccontextmanager
+    async def slot():
+        """Wait for a free ffmpeg slot on this host and hold it"""
+        fd = TranscodePool._try_acquire_slot()
+        while fd is None:
+            await asyncio.sleep(SLOT_POLL_INTERVAL_SECONDS)
+            fd = TranscodePool._try_acquire_slot()
+        try:
+            yield
+        finally:
+            # Closing the descriptor releases the flock
+            os.close(fd)
+
+    @staticmethod
+    async def run_ffmpeg(
+        args: List[str],
+        label: str,
+        duration_seconds: Optional[float] = None,
+        timeout: Optional[int] = None
+    ) -> Dict:
+        """
+        Run ffmpeg once a slot is free, logging progress
+
+        Args:
+            args: ffmpeg arguments (without the 'ffmpeg' executable)
+            label: Name used in log lines (usually the input file)
+            duration_seconds: Input duration, enables percentage progress
+            timeout: Seconds before ffmpeg is killed (default: FFMPEG_TIMEOUT_SECONDS)
+
+        Returns:
+            Dict with returncode, stderr, wait_seconds and run_seconds
+
+        Raises:
+            TranscodeTimeoutError: If ffmpeg exceeds the timeout
+        """
+        timeout = timeout or settings.FFMPEG_TIMEOUT_SECONDS
+        queued_at = time.monotonic()
+
+        async with TranscodePool.slot():
+            started_at = time.monotonic()
+            wait_seconds = started_at - queued_at
+
+            process = await asyncio.create_subprocess_exec(
+                'ffmpeg', '-nostats', '-progress', 'pipe:1', *args,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+
+            try:
+                stderr = await asyncio.wait_for(
+                    TranscodePool._watch_progress(process, label, duration_seconds),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                await TranscodePool._kill(process)
+                raise TranscodeTimeoutError(f"ffmpeg timed out after {timeout}s: {label}")
+            except asyncio.CancelledError:
+                # A cancelled caller must not leave ffmpeg running in its slot
+                await TranscodePool._kill(process)
+                raise
+
+            run_seconds = time.monotonic() - started_at
+
+        logger.info(
+            f"[TRANSCODE] {label}: exit={process.returncode}, "
+            f"waited {wait_seconds:.1f}s, ran {run_seconds:.1f}s"
+        )
+        return {
+            'returncode': process.returncode,
+            'stderr': stderr,
+            'wait_seconds': wait_seconds,
+            'run_seconds': run_seconds
+        }
+
+    @staticmethod
+    async def _kill(process):
+        """Kill ffmpeg if it is still running and reap it"""
+        if process.returncode is None:
+            process.kill()
+        await process.wait()
+
+    @staticmethod
+    async def _watch_progress(process, label: str, duration_seconds: Optional[float]) -> str:
+        """Read ffmpeg -progress output until exit; return stderr text"""
+        stderr_task = asyncio.create_task(process.stderr.read())
+        last_reported = -1
+
+        async for raw_line in process.stdout:
+            line = raw_line.decode(errors='ignore').strip()
+            # out_time_ms is also in microseconds (older ffmpeg naming)
+            if not line.startswith(('out_time_us=', 'out_time_ms=')) or not duration_seconds:
+                continue
+            try:
+                out_seconds = int(line.split('=', 1)[1]) / 1_000_000
+            except ValueError:
+                continue
+            percent = min(100, int(out_seconds * 100 / duration_seconds))
+            # Log in 25% steps to keep worker logs readable
+            if percent // 25 > last_reported:
+                last_reported = percent // 25
+                logger.info(f"[TRANSCODE] {label}: {percent}%")
+
+        await process.wait()
+        return (await stderr_task).decode(errors='ignore')
+
+
+# Singleton instance
+transcode_pool = TranscodePool()
@@ -0,0 +1,240 @@
+"""
+AI Usage - Token and latency records of every model call
+
+Each generation and chat call is recorded with its token counts (prompt,
+audio, output), model, finish reason and timings, against the note or chat
+message it was made for, in the ai_usage table. The admin dashboard
+aggregates it to see which notes and chats are expensive or slow.
+
+Calls are collected in memory while a note or chat message is processed -
+ai_service and rag_service append to the list started by the caller (the
+list is shared through a context variable, so it follows asyncio tasks and
+to_thread calls) - and saved by the caller with its own session. Saving
+errors are logged and never fail a note or a chat.
+"""
+import logging
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, func, desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.models import AIUsage
+from app.services.ai_provider import GenerationResult
+
+logger = logging.getLogger(__name__)
+
+_usage_records: ContextVar[Optional[List[Dict]]] = ContextVar('ai_usage_records', default=None)
+
+
+class UsageService:
+    """Collects model call usage and stores it in ai_usage"""
+
+    @staticmethod
+    def start_collecting() -> List[Dict]:
+        """
+        Start collecting the calls made from the current context
+
+        Returns:
+            The list calls are appended to (pass it to save/save_async)
+        """
+        records = []
+        _usage_records.set(records)
+        return records
+
+    @staticmethod
+    def record(
+        call_type: str,
+        model: str,
+        provider: str,
+        result: GenerationResult,
+        generation_seconds: float,
+        upload_seconds: Optional[float] = None
+    ) -> None:
+        """
+        Add one call to the records being collected (no-op when not collecting)
+
+        Args:
+            call_type: note, continuation, segment, segment_merge or chat
+            model: Model name
+            provider: AI provider name
+            result: Result of the call (tokens, finish reason, rate limit wait)
+            generation_seconds: Time from the request until the last chunk
+            upload_seconds: File upload time the call waited for
+        """
+        records = _usage_records.get()
+        if records is None:
+            return
+        records.append({
+            'call_type': call_type,
+            'model': model,
+            'provider': provider,
+            'prompt_tokens': result.usage.get('prompt_tokens', 0),
+            'audio_tokens': result.usage.get('audio_tokens', 0),
+            'output_tokens': result.usage.get('output_tokens', 0),
+            'total_tokens': result.usage.get('total_tokens', 0),
+            'finish_reason': result.finish_reason.value,
+            'rate_limit_wait_seconds': round(result.rate_limit_wait_seconds, 2),
+            'upload_seconds': round(upload_seconds, 2) if upload_seconds is not None else None,
+            'generation_seconds': round(generation_seconds, 2),
+        })
+
+    @staticmethod
+    def _rows(
+        records: List[Dict],
+        note_id: Optional[int],
+        chat_message_id: Optional[int],
+        user_id: Optional[int],
+        queue_wait_seconds: Optional[float]
+    ) -> List[AIUsage]:
+        rows = []
+        for i, entry in enumerate(records):
+            rows.append(AIUsage(
+                note_id=note_id,
+                chat_message_id=chat_message_id,
+                user_id=user_id,
+                # Queue wait belongs to the attempt, not to each call
+                queue_wait_seconds=queue_wait_seconds if i == 0 else None,
+                **entry
+            ))
+        return rows
+
+    @staticmethod
+    def save(
+        db: Session,
+        records: List[Dict],
+        note_id: Optional[int] = None,
+        user_id: Optional[int] = None,
+        queue_wait_seconds: Optional[float] = None
+    ) -> int:
+        """
+        Store collected calls of a note (sync session, used by the worker)
+
+        Returns:
+            Number of rows written
+        """
+        if not records:
+            return 0
+        try:
+            db.add_all(UsageService._rows(records, note_id, None, user_id, queue_wait_seconds))
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            logger.warning(f"[USAGE] Could not save usage of note {note_id}: {str(e)}")
+            return 0
+        saved = len(records)
+        records.clear()
+        return saved
+
+    @staticmethod
+    async def save_async(
+        db: AsyncSession,
+        records: List[Dict],
+        chat_message_id: Optional[int] = None,
+        user_id: Optional[int] = None
+    ) -> int:
+        """
+        Store collected calls of a chat message
+
+        Returns:
+            Number of rows written
+        """
+        if not records:
+            return 0
+        try:
+            db.add_all(UsageService._rows(records, None, chat_message_id, user_id, None))
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            logger.warning(f"[USAGE] Could not save usage of chat message {chat_message_id}: {str(e)}")
+            return 0
+        saved = len(records)
+        records.clear()
+        return saved
+
+    @staticmethod
+    async def get_summary(db: AsyncSession, time_window_hours: int = 24, limit: int = 10) -> Dict:
+        """
+        Aggregate usage for the admin dashboard
+
+        Args:
+            time_window_hours: Time window to aggregate
+            limit: Number of most expensive / slowest notes to list
+
+        Returns:
+            Totals per call type and model, plus the notes with the most
+            tokens and the longest generation time
+        """
+        since = datetime.utcnow() - timedelta(hours=time_window_hours)
+        in_window = AIUsage.created_at >= since
+
+        totals = (
+            func.count(AIUsage.id).label('calls'),
+            func.coalesce(func.sum(AIUsage.prompt_tokens), 0).label('prompt_tokens'),
+            func.coalesce(func.sum(AIUsage.audio_tokens), 0).label('audio_tokens'),
+            func.coalesce(func.sum(AIUsage.output_tokens), 0).label('output_tokens'),
+            func.coalesce(func.sum(AIUsage.total_tokens), 0).label('total_tokens'),
+            func.avg(AIUsage.generation_seconds).label('avg_generation_seconds'),
+            func.max(AIUsage.generation_seconds).label('max_generation_seconds'),
+            func.avg(AIUsage.rate_limit_wait_seconds).label('avg_rate_limit_wait_seconds'),
+        )
+
+        def as_dict(row, *keys) -> Dict:
+            values = {key: getattr(row, key) for key in keys}
+            for key in ('calls', 'prompt_tokens', 'audio_tokens', 'output_tokens', 'total_tokens'):
+                values[key] = int(getattr(row, key) or 0)
+            for key in ('avg_generation_seconds', 'max_generation_seconds', 'avg_rate_limit_wait_seconds'):
+                values[key] = round(float(getattr(row, key) or 0), 2)
+            return values
+
+        by_call_type = (await db.execute(
+            select(AIUsage.call_type, *totals).where(in_window).group_by(AIUsage.call_type)
+        )).all()
+        by_model = (await db.execute(
+            select(AIUsage.model, *totals).where(in_window).group_by(AIUsage.model)
+        )).all()
+        queue = (await db.execute(
+            select(
+                func.avg(AIUsage.queue_wait_seconds).label('avg'),
+                func.max(AIUsage.queue_wait_seconds).label('max')
+            ).where(in_window, AIUsage.queue_wait_seconds.isnot(None))
+        )).one()
+
+        note_totals = (
+            select(
+                AIUsage.note_id,
+                func.count(AIUsage.id).label('calls'),
+                func.sum(AIUsage.total_tokens).label('total_tokens'),
+                func.sum(AIUsage.generation_seconds).label('generation_seconds'),
+                func.sum(AIUsage.upload_seconds).label('upload_seconds'),
+            )
+            .where(in_window, AIUsage.note_id.isnot(None))
+            .group_by(AIUsage.note_id)
+        )
+        most_tokens = (await db.execute(note_totals.order_by(desc('total_tokens')).limit(limit))).all()
+        slowest = (await db.execute(note_totals.order_by(desc('generation_seconds')).limit(limit))).all()
+
+        def note_dict(row) -> Dict:
+            return {
+                'note_id': row.note_id,
+                'calls': row.calls,
+                'total_tokens': int(row.total_tokens or 0),
+                'generation_seconds': round(float(row.generation_seconds or 0), 2),
+                'upload_seconds': round(float(row.upload_seconds or 0), 2),
+            }
+
+        return {
+            'time_window_hours': time_window_hours,
+            'by_call_type': [as_dict(row, 'call_type') for row in by_call_type],
+            'by_model': [as_dict(row, 'model') for row in by_model],
+            'avg_queue_wait_seconds': round(float(queue.avg or 0), 2),
+            'max_queue_wait_seconds': round(float(queue.max or 0), 2),
+            'most_tokens_notes': [note_dict(row) for row in most_tokens],
+            'slowest_notes': [note_dict(row) for row in slowest],
+        }
+
+
+# Singleton instance
+usage_service = UsageService()
@@ -0,0 +1,279 @@
+"""
+Video Preprocessor - Turns a video upload into speech audio (plus keyframes)
+
+Raw video is the most expensive input to upload and to send to the model,
+while most of our videos are browser voice notes (video/webm) or lecture
+recordings where only the speech and the slides matter. VIDEO_PREPROCESSING_POLICY
+chooses what is sent instead:
+
+- original:     upload the video unchanged
+- audio:        only the speech track, as low-bitrate Opus
+- audio_frames: the speech track plus de-duplicated scene-change keyframes
+- auto:         audio_frames when the video has real visual content
+                (at least VIDEO_MIN_DISTINCT_FRAMES distinct frames), otherwise audio
+
+Each keyframe is sent after a short text label with its position in the
+uploaded audio (after speech optimization), so the model can tie slides to
+what is said while they are shown.
+"""
+import asyncio
+import logging
+import os
+import re
+import shutil
+import tempfile
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+from app.services.media_headers import read_media_info
+from app.services.segmented_processing import format_timestamp
+from app.services.transcode_service import transcode_pool
+
+logger = logging.getLogger(__name__)
+
+VIDEO_POLICIES = ('original', 'audio', 'audio_frames', 'auto')
+
+SHOWINFO_PTS_PATTERN = re.compile(r"Parsed_showinfo.*?pts_time:\s*([\d.]+)")
+
+# Frames whose difference hashes differ in fewer bits are treated as duplicates
+DUPLICATE_HASH_DISTANCE = 6
+
+
+def get_video_policy() -> str:
+    """Configured policy, falling back to 'auto' for unknown values"""
+    policy = (settings.VIDEO_PREPROCESSING_POLICY or '').lower()
+    if policy not in VIDEO_POLICIES:
+        logger.warning(f"[VIDEO] Unknown VIDEO_PREPROCESSING_POLICY '{policy}', using 'auto'")
+        return 'auto'
+    return policy
+
+
+def parse_frame_times(ffmpeg_stderr: str) -> List[float]:
+    """Parse showinfo output into the timestamps of the extracted frames"""
+    return [float(match.group(1)) for match in SHOWINFO_PTS_PATTERN.finditer(ffmpeg_stderr)]
+
+
+def keyframe_label(timestamp: Optional[float], has_audio: bool) -> str:
+    """Text sent right before a keyframe telling the model where it was shown"""
+    if timestamp is None:
+        return "Keyframe from the video:"
+    where = "of the audio track" if has_audio else "of the video"
+    return f"Keyframe shown at {format_timestamp(timestamp)} {where}:"
+
+
+def difference_hash(image, hash_size: int = 8) -> int:
+    """
+    Perceptual difference hash of a PIL image
+
+    Neighbouring pixels of a tiny grayscale copy are compared, so the hash
+    survives re-encoding, small camera shake and lighting changes.
+    """
+    from PIL import Image
+
+    pixels = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR).tobytes()
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            offset = row * (hash_size + 1) + col
+            value = (value << 1) | (pixels[offset] > pixels[offset + 1])
+    return value
+
+
+def deduplicate_frames(frame_paths: List[str]) -> List[str]:
+    """
+    Drop frames that look like an already kept frame (blocking)
+
+    A slide that is shown, left and shown again is only kept once.
+
+    Returns:
+        Kept frame paths in their original order (the others are deleted)
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        logger.warning("[VIDEO] Pillow is not installed, keyframes are not de-duplicated")
+        return frame_paths
+
+    kept = []
+    kept_hashes = []
+    for path in frame_paths:
+        with Image.open(path) as frame:
+            frame_hash = difference_hash(frame)
+        if any(bin(frame_hash ^ other).count('1') < DUPLICATE_HASH_DISTANCE for other in kept_hashes):
+            os.remove(path)
+            continue
+        kept.append(path)
+        kept_hashes.append(frame_hash)
+    return kept
+
+
+async def extract_audio_track(file_path: str, duration_seconds: Optional[float] = None) -> Optional[str]:
+    """
+    Extract the speech track of a video as mono Opus
+
+    Returns:
+        Temporary .ogg path (caller deletes), or None if the video has no audio
+    """
+    temp_fd, temp_path = tempfile.mkstemp(suffix='.ogg')
+    os.close(temp_fd)
+
+    result = await transcode_pool.run_ffmpeg(
+        [
+            '-y',
+            '-i', file_path,
+            '-vn',
+            '-ac', '1',
+            '-ar', '16000',
+            '-c:a', 'libopus',
+            '-b:a', settings.VIDEO_AUDIO_BITRATE,
+            '-application', 'voip',
+            temp_path
+        ],
+        label=f"video audio {os.path.basename(file_path)}",
+        duration_seconds=duration_seconds
+    )
+    if result['returncode'] != 0 or os.path.getsize(temp_path) == 0:
+        os.remove(temp_path)
+        if 'does not contain any stream' in result['stderr'] or 'matches no streams' in result['stderr']:
+            return None
+        raise RuntimeError(f"ffmpeg failed to extract audio: {result['stderr'][-500:]}")
+    return temp_path
+
+
+async def extract_keyframes(file_path: str, duration_seconds: Optional[float] = None) -> List[Dict]:
+    """
+    Sample de-duplicated keyframes on scene change
+
+    The first frame is always taken; after that a frame is taken whenever
+    the scene score exceeds VIDEO_SCENE_THRESHOLD, up to VIDEO_MAX_FRAMES.
+
+    Returns:
+        List of {'path', 'timestamp'} for the kept frames (temporary files,
+        caller deletes); empty if the file has no video stream
+    """
+    frame_dir = tempfile.mkdtemp(prefix='neviso-frames-')
+    max_edge = settings.VIDEO_FRAME_MAX_EDGE
+    video_filter = (
+        f"select='eq(n,0)+gt(scene,{settings.VIDEO_SCENE_THRESHOLD})',"
+        f"scale='min({max_edge},iw)':'min({max_edge},ih)':force_original_aspect_ratio=decrease,"
+        "showinfo"
+    )
+
+    try:
+        result = await transcode_pool.run_ffmpeg(
+            [
+                '-y',
+                '-i', file_path,
+                '-an',
+                '-vf', video_filter,
+                '-vsync', 'vfr',
+                '-frames:v', str(settings.VIDEO_MAX_FRAMES),
+                '-q:v', '4',
+                os.path.join(frame_dir, 'frame-%04d.jpg')
+            ],
+            label=f"keyframes {os.path.basename(file_path)}",
+            duration_seconds=duration_seconds
+        )
+        frame_paths = sorted(
+            os.path.join(frame_dir, name) for name in os.listdir(frame_dir) if name.endswith('.jpg')
+        )
+        if result['returncode'] != 0 and not frame_paths:
+            if 'matches no streams' in result['stderr'] or 'does not contain any stream' in result['stderr']:
+                return []
+            raise RuntimeError(f"ffmpeg failed to extract keyframes: {result['stderr'][-500:]}")
+
+        timestamps = dict(zip(frame_paths, parse_frame_times(result['stderr'])))
+        kept_paths = await asyncio.to_thread(deduplicate_frames, frame_paths)
+
+        # Move the kept frames out so the directory can be removed
+        frames = []
+        for path in kept_paths:
+            temp_fd, frame_path = tempfile.mkstemp(suffix='.jpg')
+            os.close(temp_fd)
+            shutil.move(path, frame_path)
+            frames.append({'path': frame_path, 'timestamp': timestamps.get(path)})
+        return frames
+
+    finally:
+        shutil.rmtree(frame_dir, ignore_errors=True)
+
+
+async def preprocess_video(file_path: str, speech_optimization: bool = False) -> Optional[Dict]:
+    """
+    Replace a video upload with its speech track and (optionally) keyframes
+
+    Args:
+        file_path: Original video file
+        speech_optimization: Trim silence / speed up the extracted speech
+
+    Returns:
+        Dict with path (audio, or the first keyframe for silent videos),
+        extra_paths (keyframes), labels (text part per path, None for the
+        audio), frame_timestamps (seconds into the uploaded audio), policy
+        and speech (optimizer stats or None) - all paths are temporary. None if the
+        policy is 'original' or the video could not be processed and the
+        caller should upload it as is.
+    """
+    from app.services.speech_optimizer import optimize_speech_file, map_to_output
+
+    policy = get_video_policy()
+    if policy == 'original':
+        return None
+
+    header_info = await asyncio.to_thread(read_media_info, file_path)
+    duration = header_info['duration_seconds'] if header_info else None
+
+    audio_path = None
+    frames = []
+    speech = None
+    try:
+        if speech_optimization:
+            # The speech optimizer drops the video stream itself (-vn)
+            speech = await optimize_speech_file(file_path)
+            audio_path = speech['path'] if speech else None
+        if not audio_path:
+            audio_path = await extract_audio_track(file_path, duration)
+
+        if policy in ('audio_frames', 'auto'):
+            frames = await extract_keyframes(file_path, duration)
+            if policy == 'auto' and len(frames) < settings.VIDEO_MIN_DISTINCT_FRAMES:
+                # Static picture or no video stream (e.g. a browser voice note)
+                for frame in frames:
+                    os.remove(frame['path'])
+                frames = []
+
+        paths = ([audio_path] if audio_path else []) + [frame['path'] for frame in frames]
+        if not paths:
+            logger.info(f"[VIDEO] Nothing extracted from {file_path}, uploading original")
+            return None
+
+        original_size = os.path.getsize(file_path)
+        optimized_size = sum(os.path.getsize(path) for path in paths)
+        logger.info(
+            f"[VIDEO] {os.path.basename(file_path)} ({policy}): {original_size / 1024 / 1024:.1f} MB -> "
+            f"{optimized_size / 1024 / 1024:.1f} MB (audio: {'yes' if audio_path else 'no'}, "
+            f"{len(frames)} keyframe(s))"
+        )
+        # Keyframe times in the uploaded audio, which speech optimization shortens
+        frame_timestamps = [
+            map_to_output(frame['timestamp'], speech['timestamp_map'], speech['tempo'])
+            if speech and frame['timestamp'] is not None else frame['timestamp']
+            for frame in frames
+        ]
+        return {
+            'path': paths[0],
+            'extra_paths': paths[1:],
+            'labels': ([None] if audio_path else []) + [
+                keyframe_label(timestamp, audio_path is not None) for timestamp in frame_timestamps
+            ],
+            'frame_timestamps': frame_timestamps,
+            'policy': 'audio_frames' if frames else 'audio',
+            'speech': speech,
+        }
+
+    except Exception as e:
+        logger.warning(f"[VIDEO] Preprocessing failed for {file_path}: {str(e)}, uploading original")
+        for path in [audio_path] + [frame['path'] for frame in frames]:
+            if path and os.path.exists(path):
+                os.remove(path)
+        return None
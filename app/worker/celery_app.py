@@ -5,7 +5,8 @@ celery_app = Celery(
     "neviso_worker",
     broker=settings.CELERY_BROKER_URL,
     backend=settings.CELERY_RESULT_BACKEND,
-    include=['app.worker.tasks', 'app.worker.tasks_with_credits_fixed']
+    include=['app.worker.tasks', 'app.worker.tasks_with_credits_fixed', 'app.worker.tasks_with_credits',
+             'app.worker.note_pipeline']
 )
 
 celery_app.conf.update(
@@ -17,4 +18,30 @@ celery_app.conf.update(
     task_track_started=True,
     task_time_limit=3600,  # 1 hour
     task_soft_time_limit=3300,  # 55 minutes
+    beat_schedule={
+        'cleanup-remote-files': {
+            'task': 'cleanup_remote_files',
+            'schedule': settings.REMOTE_FILE_JANITOR_INTERVAL_MINUTES * 60,
+        },
+        'process-queue': {
+            'task': 'process_queue',
+            'schedule': settings.QUEUE_PROCESSOR_INTERVAL,
+        },
+        'reap-expired-leases': {
+            'task': 'reap_expired_leases',
+            'schedule': settings.QUEUE_LEASE_REAPER_INTERVAL_SECONDS,
+        },
+    },
 )
+
+# Each note stage runs on workers of its own queue (see note_pipeline)
+NOTE_PIPELINE_ROUTES = {
+    'process_file_with_credits': {'queue': 'preprocess'},
+    'note_pipeline.ai_generate': {'queue': 'ai_generate'},
+    'note_pipeline.postprocess': {'queue': 'postprocess'},
+    'note_pipeline.index': {'queue': 'index'},
+    'note_pipeline.notify': {'queue': 'notify'},
+}
+
+if settings.NOTE_PIPELINE_STAGED:
+    celery_app.conf.task_routes = NOTE_PIPELINE_ROUTES
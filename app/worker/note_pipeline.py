@@ -0,0 +1,655 @@
+"""
+Note Pipeline - Note processing as a chain of stages on dedicated queues
+
+Processing a note used to be one task, so CPU-heavy ffmpeg and embedding
+work and I/O-bound waiting for the model competed for the same worker
+slots. A note now moves through five stages, each a Celery task routed to
+its own queue (NOTE_PIPELINE_ROUTES), so every stage runs on workers with
+its own pool type and concurrency and can be scaled on its own:
+
+- preprocess:  result cache lookup, credits, ffmpeg / image preparation (CPU)
+- ai_generate: File API upload and generation, or segmented processing (I/O)
+- postprocess: HTML post-processing and saving the note (CPU)
+- index:       embeddings for RAG chat (CPU)
+- notify:      notifying the user (I/O)
+
+Each stage hands a JSON state dict to the next one. Prepared files are moved
+under UPLOAD_DIR/pipeline/<note_id>, which every worker mounts, so another
+worker can upload them. With NOTE_PIPELINE_STAGED off, the stages run one
+after another in the worker that received the note.
+
+After each stage the next stage's input is stored (pipeline_state), so a
+retry continues at the stage that failed: a failed upload or generation
+keeps the credits and prepared files, a failed save keeps the paid model
+response. An error before the note is saved retries the note that way or,
+once retries run out, refunds the credits and fails it
+(handle_processing_error); indexing and notification errors are only
+logged.
+
+Notes claimed from the processing queue hold a lease on their processing
+slot: each stage renews it with a heartbeat, hands the note off to the
+next stage or retry (the reaper then keeps the lease until it is picked
+up), and the end of the note releases it (see QueueManager).
+"""
+import asyncio
+import logging
+import os
+import shutil
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.db.models import (
+    NoteStatus, Note, Notification, NotificationType, Upload,
+    Plan, UserSubscription, SubscriptionStatus, ProcessingQueue
+)
+from app.db.session import SyncSessionLocal
+from app.worker.celery_app import celery_app
+from app.worker.error_handler import ProcessingError
+from app.worker.worker_runtime import worker_runtime
+
+logger = logging.getLogger(__name__)
+
+STAGES = ['preprocess', 'ai_generate', 'postprocess', 'index', 'notify']
+# Stages after the note is saved as completed: their errors never retry or fail it
+AFTER_SAVE_STAGES = STAGES[STAGES.index('postprocess') + 1:]
+
+
+def _speech_optimization_enabled(db, user_id: int) -> bool:
+    """Check whether any active plan of the user enables speech optimization"""
+    from app.services.speech_optimizer import plan_has_speech_optimization
+
+    if not settings.SPEECH_OPTIMIZATION_ENABLED:
+        return False
+
+    features = db.execute(
+        select(Plan.features)
+        .join(UserSubscription, UserSubscription.plan_id == Plan.id)
+        .where(
+            UserSubscription.user_id == user_id,
+            UserSubscription.status == SubscriptionStatus.active,
+            UserSubscription.end_date > datetime.utcnow()
+        )
+    ).scalars().all()
+    return any(plan_has_speech_optimization(f) for f in features)
+
+
+def _queue_wait_seconds(db, note_id: int):
+    """Time the note waited in the processing queue before a worker started it"""
+    try:
+        entry = db.execute(
+            select(ProcessingQueue.added_at, ProcessingQueue.started_at).where(ProcessingQueue.note_id == note_id)
+        ).one_or_none()
+    except Exception as e:
+        logger.warning(f"[WORKER] Could not read queue wait of note {note_id}: {str(e)}")
+        return None
+    if not entry or not entry.added_at or not entry.started_at:
+        return None
+    return max((entry.started_at - entry.added_at).total_seconds(), 0.0)
+
+
+def get_work_dir(note_id: int) -> str:
+    """Shared directory for files a note passes between stages"""
+    return os.path.join(settings.UPLOAD_DIR, 'pipeline', str(note_id))
+
+
+def _move_to_work_dir(outcome: Dict, work_dir: str) -> Dict:
+    """Move a prepared file (and its extra files) where every worker can read them"""
+    os.makedirs(work_dir, exist_ok=True)
+
+    def move(path: str) -> str:
+        target = os.path.join(work_dir, os.path.basename(path))
+        shutil.move(path, target)
+        return target
+
+    moved = dict(outcome)
+    if outcome['is_temporary']:
+        moved['path'] = move(outcome['path'])
+    moved['extra_paths'] = [move(path) for path in outcome.get('extra_paths', [])]
+    return moved
+
+
+def _get_uploads(db, note_id: int) -> List[Upload]:
+    return db.execute(
+        select(Upload).where(Upload.note_id == note_id).order_by(Upload.id)
+    ).scalars().all()
+
+
+async def preprocess(db, state: Dict) -> Optional[Dict]:
+    """
+    Stage 1: result cache lookup, credits and file preparation
+
+    Returns:
+        State for ai_generate, or None if the note stops here
+    """
+    from app.services.ai_service import get_prompt_version, find_registered_files, prepare_files
+    from app.services.credit_service import credit_manager, InsufficientCreditsError
+    from app.services.progress_service import note_progress
+    from app.services.result_cache_service import result_cache
+    from app.services.segmented_processing import should_segment
+
+    note_id = state['note_id']
+    logger.info("=" * 80)
+    logger.info(f"[WORKER] Starting processing for note {note_id} with credit management")
+    logger.info("=" * 80)
+
+    note = db.execute(select(Note).where(Note.id == note_id)).scalar_one_or_none()
+    if not note:
+        logger.error(f"[WORKER] Note {note_id} not found")
+        return None
+
+    user_id = note.user_id
+    state['user_id'] = user_id
+
+    # Step 0: Look for a stored result from identical input files
+    uploads = _get_uploads(db, note_id)
+    speech_optimization = _speech_optimization_enabled(db, user_id)
+    segment_files = [(u.storage_path, u.file_type, u.duration_seconds) for u in uploads]
+    segmented = should_segment(segment_files)
+    prompt_version = get_prompt_version(speech_optimization, segmented)
+    cache_key = None
+    cached_output = None
+    if settings.AI_RESULT_CACHE_ENABLED:
+        cache_key = result_cache.build_cache_key(
+            [upload.content_sha256 for upload in uploads], prompt_version
+        )
+        if cache_key:
+            cached_output = result_cache.get_result(db, cache_key)
+            if cached_output is not None:
+                logger.info(f"[WORKER] Result cache hit for note {note_id}")
+
+    charge_credits = cached_output is None or settings.AI_RESULT_CACHE_CHARGE_CREDITS
+    required_credits = 0.0
+    already_paid = False
+
+    # Step 1: Calculate required credits
+    logger.info(f"[WORKER] Calculating required credits for note {note_id}")
+
+    async with worker_runtime.session_factory() as async_db:
+        try:
+            # A note requeued after its worker died has paid already
+            paid_credits = await credit_manager.get_note_charge(async_db, note_id)
+            if paid_credits > 0:
+                required_credits = paid_credits
+                already_paid = True
+                logger.info(f"[WORKER] Note {note_id} already paid {paid_credits:.2f} minutes")
+            elif charge_credits:
+                required_credits = await credit_manager.calculate_note_credits(async_db, note_id)
+            logger.info(f"[WORKER] Required credits: {required_credits:.2f} minutes")
+        except Exception as e:
+            logger.error(f"[WORKER] Failed to calculate credits: {str(e)}")
+            note.status = NoteStatus.failed
+            note.error_message = "خطا در محاسبه اعتبار"
+            note.error_detail = str(e)
+            db.commit()
+            return None
+
+    # Step 2 & 3: Check balance and deduct credits
+    logger.info(f"[WORKER] Deducting {required_credits:.2f} minutes from user {user_id}")
+
+    async with worker_runtime.session_factory() as async_db:
+        try:
+            if required_credits > 0 and not already_paid:
+                await credit_manager.deduct_credits(
+                    async_db,
+                    user_id,
+                    required_credits,
+                    note_id=note_id,
+                    description=f"پردازش یادداشت: {note.title}"
+                )
+                logger.info(f"[WORKER] Credits deducted successfully")
+        except InsufficientCreditsError as e:
+            logger.error(f"[WORKER] Insufficient credits: {str(e)}")
+            note.status = NoteStatus.failed
+            note.error_message = "اعتبار کافی نیست"
+            note.error_detail = str(e)
+            db.commit()
+
+            # Create notification
+            notification = Notification(
+                user_id=user_id,
+                type=NotificationType.quota_warning,
+                title="اعتبار ناکافی",
+                message=f"برای پردازش '{note.title}' اعتبار کافی ندارید. لطفا اشتراک خود را تمدید کنید.",
+                related_note_id=note_id
+            )
+            db.add(notification)
+            db.commit()
+            return None
+
+    # From here on, errors refund the credits
+    state.update(
+        required_credits=required_credits,
+        speech_optimization=speech_optimization,
+        segmented=segmented,
+        prompt_version=prompt_version,
+        cache_key=cache_key,
+        cached_output=cached_output,
+        prepared=None
+    )
+
+    if not uploads:
+        raise Exception("No uploads found")
+
+    # Step 4: Prepare files (segmented notes cut their segments while generating)
+    if cached_output is None and not segmented:
+        note_progress.publish(note_id, 'preparing')
+        file_paths = [upload.storage_path for upload in uploads]
+        _, reused = await find_registered_files(
+            file_paths, note_id, [upload.content_sha256 for upload in uploads], speech_optimization
+        )
+        prepared = await prepare_files(
+            file_paths, [i for i in range(len(file_paths)) if i not in reused], speech_optimization
+        )
+        work_dir = get_work_dir(note_id)
+        state['prepared'] = [
+            _move_to_work_dir(prepared[i], work_dir) if i in prepared else None
+            for i in range(len(file_paths))
+        ]
+    return state
+
+
+async def ai_generate(db, state: Dict) -> Optional[Dict]:
+    """
+    Stage 2: File API upload and generation
+
+    Returns:
+        State for postprocess, with the model output
+    """
+    from app.services.ai_service import process_files_with_gemini
+    from app.services.result_cache_service import result_cache
+    from app.services.segmented_processing import process_segmented
+
+    note_id = state['note_id']
+    uploads = _get_uploads(db, note_id)
+    cache_key = state['cache_key']
+    logger.info(f"[WORKER] Processing with Gemini AI...")
+
+    if state['cached_output'] is not None:
+        gemini_output = state['cached_output']
+    elif state['segmented']:
+        # Long recording: concurrent per-segment calls merged into one note
+        logger.info(f"[WORKER] Using segmented processing for note {note_id}")
+        gemini_output = await process_segmented(
+            [(u.storage_path, u.file_type, u.duration_seconds) for u in uploads]
+        )
+
+        if gemini_output.get('partial'):
+            # A part was cut short; keep the note but don't cache it
+            logger.warning(f"[WORKER] Saving partial segmented note {note_id}")
+        elif cache_key:
+            result_cache.store_result(db, cache_key, state['prompt_version'], gemini_output)
+    else:
+        file_paths = [upload.storage_path for upload in uploads]
+        logger.info(f"[WORKER] Processing {len(file_paths)} file(s)")
+
+        # Files prepared before a retry may have been cleaned up since; those are prepared again
+        prepared_uploads = [
+            outcome if outcome and all(os.path.exists(path) for path in [outcome['path']] + outcome.get('extra_paths', []))
+            else None
+            for outcome in (state['prepared'] or [])
+        ]
+
+        # Process with Gemini
+        prepared_files = []
+        gemini_output = await process_files_with_gemini(
+            file_paths,
+            speech_optimization=state['speech_optimization'],
+            prepared_files=prepared_files,
+            note_id=note_id,
+            content_hashes=[upload.content_sha256 for upload in uploads],
+            prepared_uploads=prepared_uploads
+        )
+
+        # Keep speech timing so positions can be mapped back to the recording
+        for upload, prepared in zip(uploads, prepared_files):
+            if prepared['speech']:
+                upload.speech_removed_seconds = prepared['speech']['removed_seconds']
+                upload.speech_timestamp_map = prepared['speech']['timestamp_map']
+        db.commit()
+
+        if gemini_output.get('partial'):
+            # Stream was cut short; keep what arrived but don't cache it
+            logger.warning(f"[WORKER] Saving partial note {note_id} from an interrupted stream")
+        elif cache_key:
+            result_cache.store_result(db, cache_key, state['prompt_version'], gemini_output)
+
+    return {
+        'note_id': note_id,
+        'user_id': state['user_id'],
+        'required_credits': state['required_credits'],
+        'output': gemini_output,
+    }
+
+
+async def postprocess(db, state: Dict) -> Optional[Dict]:
+    """
+    Stage 3: HTML post-processing and saving the note
+
+    Returns:
+        State for index
+    """
+    from app.services.html_processor import html_processor
+    from app.services.progress_service import note_progress
+    from app.services.remote_file_registry import remote_file_registry
+
+    note_id = state['note_id']
+    note = db.execute(select(Note).where(Note.id == note_id)).scalar_one()
+
+    # Update note with results
+    title = state['output'].get('title', note.title)
+    processed_html = html_processor.process_gemini_output(state['output'].get('note', ''))
+
+    note.title = title
+    note.gemini_output_text = processed_html
+    note.user_edited_text = processed_html
+    note.status = NoteStatus.completed
+    db.commit()
+
+    note_progress.publish(note_id, 'completed', title=title, note_chars=len(processed_html))
+
+    # Remote and prepared files are no longer needed once the note is done
+    await asyncio.to_thread(remote_file_registry.release_note, note_id)
+    shutil.rmtree(get_work_dir(note_id), ignore_errors=True)
+
+    return {'note_id': note_id, 'user_id': state['user_id']}
+
+
+async def index(db, state: Dict) -> Optional[Dict]:
+    """
+    Stage 4: Index the note for RAG chat (failures only logged)
+
+    Returns:
+        State for notify
+    """
+    try:
+        from app.services.vector_service import index_note as index_note_for_rag
+        note = db.execute(select(Note).where(Note.id == state['note_id'])).scalar_one()
+        chunks_indexed = index_note_for_rag(
+            notebook_id=note.notebook_id,
+            note_id=note.id,
+            title=note.title,
+            html_content=note.gemini_output_text
+        )
+        logger.info(f"[WORKER] Indexed {chunks_indexed} chunks for RAG chat")
+    except Exception as index_error:
+        # Don't fail the note if indexing fails, just log it
+        db.rollback()
+        logger.warning(f"[WORKER] Failed to index note for RAG: {str(index_error)}")
+    return state
+
+
+async def notify(db, state: Dict) -> Optional[Dict]:
+    """Stage 5: Tell the user the note is ready (failures only logged)"""
+    note_id = state['note_id']
+    try:
+        note = db.execute(select(Note).where(Note.id == note_id)).scalar_one()
+        notification = Notification(
+            user_id=note.user_id,
+            type=NotificationType.note_completed,
+            title="یادداشت آماده است",
+            message=f"یادداشت '{note.title}' با موفقیت پردازش شد",
+            related_note_id=note_id
+        )
+        db.add(notification)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.warning(f"[WORKER] Failed to notify about note {note_id}: {str(e)}")
+
+    logger.info("=" * 80)
+    logger.info(f"[WORKER] Successfully completed note {note_id}")
+    logger.info("=" * 80)
+    return None
+
+
+STAGE_FUNCTIONS = {
+    'preprocess': preprocess,
+    'ai_generate': ai_generate,
+    'postprocess': postprocess,
+    'index': index,
+    'notify': notify,
+}
+
+
+async def release_slot(note_id: int, success: bool, error_message: Optional[str] = None) -> None:
+    """Finish the note's queue entry and let the dispatcher start the next note"""
+    from app.services.queue_service import queue_manager
+    from app.worker.tasks_with_credits import process_queue
+
+    async with worker_runtime.session_factory() as async_db:
+        await queue_manager.mark_completed(async_db, note_id, success=success, error_message=error_message)
+    process_queue.delay()
+
+
+async def handle_processing_error(db, state: Dict, processing_error: Exception, usage_records: List[Dict]) -> None:
+    """Refund the note's credits, then schedule a retry or mark it failed"""
+    from app.services.credit_service import credit_manager
+    from app.services.pipeline_state_service import pipeline_state
+    from app.services.progress_service import note_progress
+    from app.services.queue_service import queue_manager
+    from app.services.remote_file_registry import remote_file_registry
+    from app.services.usage_service import usage_service
+
+    note_id = state['note_id']
+    logger.error("=" * 80)
+    logger.error(f"[WORKER] Processing failed for note {note_id}")
+    logger.error(f"[WORKER] Error: {str(processing_error)}")
+    logger.error("=" * 80)
+
+    # Rollback any pending transaction to clear the session state
+    db.rollback()
+
+    # Re-fetch the note to ensure clean state
+    note = db.execute(select(Note).where(Note.id == note_id)).scalar_one_or_none()
+    if not note:
+        logger.error(f"[WORKER] Note {note_id} not found after rollback")
+        return
+
+    user_id = note.user_id
+    required_credits = state.get('required_credits') or 0.0
+
+    # Calls of a failed attempt were still made (and billed)
+    usage_service.save(db, usage_records, note_id, user_id, _queue_wait_seconds(db, note_id))
+
+    # Handle retry logic
+    category, user_message, error_detail, retryable = ProcessingError.classify_error(
+        processing_error
+    )
+    current_retry = note.retry_count or 0
+
+    should_retry = ProcessingError.should_retry(
+        processing_error, current_retry, max_retries=3
+    )
+
+    # A retry from a checkpoint keeps the credits and files of the completed stages
+    checkpoint = pipeline_state.load(db, note_id)
+    resume = should_retry and checkpoint is not None
+
+    # Step 5: Refund credits on error
+    if required_credits > 0 and not resume:
+        logger.info(f"[WORKER] Refunding {required_credits:.2f} minutes to user {user_id}")
+
+        async with worker_runtime.session_factory() as async_db:
+            try:
+                await credit_manager.refund_credits(
+                    async_db,
+                    user_id,
+                    required_credits,
+                    note_id=note_id,
+                    description=f"بازگشت اعتبار به دلیل خطا: {note.title}"
+                )
+                logger.info(f"[WORKER] Credits refunded successfully")
+            except Exception as refund_error:
+                logger.error(f"[WORKER] Failed to refund credits: {str(refund_error)}")
+
+    if not resume:
+        # Prepared files are made again by the retry
+        pipeline_state.clear(db, note_id)
+        shutil.rmtree(get_work_dir(note_id), ignore_errors=True)
+
+    if should_retry:
+        retry_delay = ProcessingError.get_retry_delay(current_retry)
+        if resume:
+            logger.info(f"[WORKER] Scheduling retry after stage {checkpoint[0]} in {retry_delay} seconds")
+        else:
+            logger.info(f"[WORKER] Scheduling retry in {retry_delay} seconds")
+
+        note.retry_count = current_retry + 1
+        note.error_message = user_message
+        note.error_detail = error_detail
+        note.last_error_at = datetime.now()
+        note.status = NoteStatus.processing
+        db.commit()
+
+        note_progress.publish(note_id, 'retrying', retry_in_seconds=retry_delay)
+
+        # Schedule retry (continues from the checkpoint, if any); the note keeps its slot
+        from app.worker.tasks_with_credits_fixed import process_file_with_credits
+        queue_manager.hand_off(note_id, retry_delay)
+        process_file_with_credits.apply_async((note_id,), countdown=retry_delay)
+
+    else:
+        logger.info(f"[WORKER] Max retries reached. Marking as failed.")
+
+        note.status = NoteStatus.failed
+        note.error_message = user_message
+        note.error_detail = error_detail
+        note.error_type = category
+        note.last_error_at = datetime.now()
+        db.commit()
+
+        # Create failure notification
+        notification = Notification(
+            user_id=user_id,
+            type=NotificationType.note_failed,
+            title="خطا در پردازش",
+            message=f"یادداشت '{note.title}' با خطا مواجه شد: {user_message}",
+            related_note_id=note_id
+        )
+        db.add(notification)
+        db.commit()
+
+        note_progress.publish(note_id, 'failed')
+        await asyncio.to_thread(remote_file_registry.release_note, note_id)
+
+        await release_slot(note_id, success=False, error_message=user_message)
+
+
+def run_stage(stage: str, state: Dict) -> Optional[Dict]:
+    """
+    Run one stage in this worker
+
+    Returns:
+        State for the next stage, or None when the note is done or failed
+    """
+    from app.services.pipeline_state_service import pipeline_state
+    from app.services.queue_service import queue_manager
+    from app.services.usage_service import usage_service
+
+    note_id = state['note_id']
+    db = SyncSessionLocal()
+
+    async def run():
+        # Model calls made by this stage (saved to ai_usage)
+        usage_records = usage_service.start_collecting()
+        try:
+            next_state = await STAGE_FUNCTIONS[stage](db, state)
+        except Exception as processing_error:
+            if stage not in AFTER_SAVE_STAGES:
+                await handle_processing_error(db, state, processing_error, usage_records)
+                return None
+            db.rollback()
+            logger.warning(f"[WORKER] Stage {stage} failed for completed note {note_id}: {str(processing_error)}")
+            next_state = None if stage == STAGES[-1] else state
+        if usage_records:
+            # Queue wait belongs to the attempt; its model calls start in ai_generate
+            queue_wait = _queue_wait_seconds(db, state['note_id']) if stage == 'ai_generate' else None
+            usage_service.save(db, usage_records, state['note_id'], state.get('user_id'), queue_wait)
+
+        # Checkpoint: a retry continues with the next stage
+        if next_state is None:
+            pipeline_state.clear(db, note_id)
+            # Done (or stopped): free the note's processing slot
+            await release_slot(note_id, success=stage == STAGES[-1])
+        else:
+            pipeline_state.save(db, note_id, stage, next_state)
+            # Keep the slot while the note waits for its next stage
+            queue_manager.hand_off(note_id)
+        return next_state
+
+    try:
+        # Heartbeat: the lease runs out within seconds if this worker dies
+        with queue_manager.hold_lease(note_id):
+            return worker_runtime.run(run())
+    finally:
+        db.close()
+
+
+def dispatch(stage: str, state: Dict) -> None:
+    """Hand the note to a stage (its queue, or this worker when not staged)"""
+    if settings.NOTE_PIPELINE_STAGED and stage in STAGE_TASKS:
+        STAGE_TASKS[stage].delay(state)
+    else:
+        advance(stage, state)
+
+
+def advance(stage: str, state: Dict) -> None:
+    """Run a stage, then hand the note to the next one"""
+    next_state = run_stage(stage, state)
+    position = STAGES.index(stage)
+    if next_state is None or position + 1 == len(STAGES):
+        return
+    dispatch(STAGES[position + 1], next_state)
+
+
+def start_note_pipeline(note_id: int) -> None:
+    """Process a note from its first stage, or continue after its last completed stage"""
+    from app.services.pipeline_state_service import pipeline_state
+
+    db = SyncSessionLocal()
+    try:
+        checkpoint = pipeline_state.load(db, note_id)
+        if checkpoint is not None:
+            pipeline_state.mark_resumed(db, note_id)
+    finally:
+        db.close()
+
+    if checkpoint is None:
+        advance('preprocess', {'note_id': note_id})
+        return
+
+    completed_stage, state, _ = checkpoint
+    next_stage = STAGES[STAGES.index(completed_stage) + 1]
+    logger.info(f"[WORKER] Resuming note {note_id} at {next_stage} (completed {completed_stage})")
+    dispatch(next_stage, state)
+
+
+@celery_app.task(name="note_pipeline.ai_generate")
+def ai_generate_task(state: Dict):
+    advance('ai_generate', state)
+
+
+@celery_app.task(name="note_pipeline.postprocess")
+def postprocess_task(state: Dict):
+    advance('postprocess', state)
+
+
+@celery_app.task(name="note_pipeline.index")
+def index_task(state: Dict):
+    advance('index', state)
+
+
+@celery_app.task(name="note_pipeline.notify")
+def notify_task(state: Dict):
+    advance('notify', state)
+
+
+STAGE_TASKS = {
+    'ai_generate': ai_generate_task,
+    'postprocess': postprocess_task,
+    'index': index_task,
+    'notify': notify_task,
+}
@@ -2,11 +2,11 @@ from app.worker.celery_app import celery_app
 from app.db.session import SyncSessionLocal
 from app.db.models import NoteStatus, Note, Notification, NotificationType
 from app.worker.error_handler import ProcessingError
+from app.worker.worker_runtime import worker_runtime
 from app.services.exceptions import AIProcessingError
 from sqlalchemy import select, func
 from sqlalchemy.exc import OperationalError
 from datetime import datetime
-import asyncio
 import time
 
 
@@ -96,13 +96,8 @@ def process_file_task(note_id: int):
         try:
             from app.services.ai_service import process_files_with_gemini
 
-            # Create new event loop for async AI processing
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            try:
-                gemini_output = loop.run_until_complete(process_files_with_gemini(file_paths))
-            finally:
-                loop.close()
+            # Run on the worker process's event loop
+            gemini_output = worker_runtime.run(process_files_with_gemini(file_paths))
 
             print(f"[WORKER] ✓ Gemini processing successful for note {note_id}")
             print(f"[WORKER] Gemini output keys: {list(gemini_output.keys())}")
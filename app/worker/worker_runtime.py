@@ -0,0 +1,154 @@
+"""
+Worker Runtime - One event loop and one database pool per worker process
+
+Tasks used to build a new event loop and a new async engine for every note
+and tear both down again, so each note paid for engine construction and
+fresh MySQL handshakes. Each worker process now creates them once, when
+Celery starts the process (worker_process_init), and disposes them when the
+process shuts down (worker_process_shutdown / worker_shutdown):
+
+- an event loop tasks run their async code on (run)
+- an async engine with a pool of WORKER_DB_POOL_SIZE connections, and its
+  session factory (session_factory)
+
+Workers using the threads pool (the I/O-bound pipeline stages) get one loop
+and engine per pool thread instead, created on the thread's first task: a
+loop can only run one task at a time and the engine's connections belong to
+their loop.
+
+The sync engine's pool inherited from the parent process is dropped so each
+child opens its own connections. Outside a Celery worker (solo pool,
+scripts, tests) the runtime starts on first use.
+"""
+import asyncio
+import logging
+import threading
+from typing import List, Optional
+
+from celery.signals import worker_process_init, worker_process_shutdown, worker_shutdown
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+from app.db.session import sync_engine
+
+logger = logging.getLogger(__name__)
+
+
+class _ThreadRuntime:
+    """Loop, engine and session factory of one thread"""
+
+    def __init__(self):
+        self.engine: AsyncEngine = create_async_engine(
+            settings.DATABASE_URL,
+            echo=False,
+            # Always a real pool, whatever the dialect would pick by default
+            poolclass=AsyncAdaptedQueuePool,
+            pool_pre_ping=True,
+            pool_size=settings.WORKER_DB_POOL_SIZE,
+            max_overflow=settings.WORKER_DB_MAX_OVERFLOW,
+            pool_recycle=3600
+        )
+        self.loop = asyncio.new_event_loop()
+        self.session_factory = async_sessionmaker(self.engine, class_=AsyncSession, expire_on_commit=False)
+
+
+class WorkerRuntime:
+    """Event loop, async engine and session factory of the worker (per thread)"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._runtimes: List[_ThreadRuntime] = []
+
+    @property
+    def _current(self) -> Optional[_ThreadRuntime]:
+        return getattr(self._local, 'runtime', None)
+
+    @property
+    def started(self) -> bool:
+        return self._current is not None
+
+    @property
+    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
+        return self._current.loop if self.started else None
+
+    @property
+    def engine(self) -> Optional[AsyncEngine]:
+        return self._current.engine if self.started else None
+
+    def start(self) -> None:
+        """Create the calling thread's loop and engine (no-op if already started)"""
+        if self.started:
+            return
+        runtime = _ThreadRuntime()
+        asyncio.set_event_loop(runtime.loop)
+        self._local.runtime = runtime
+        with self._lock:
+            self._runtimes.append(runtime)
+        logger.info(f"[WORKER RUNTIME] Started event loop and database pool (size {settings.WORKER_DB_POOL_SIZE})")
+
+    @property
+    def session_factory(self) -> async_sessionmaker:
+        """Async session factory bound to the thread's engine"""
+        self.start()
+        return self._current.session_factory
+
+    def run(self, coro):
+        """
+        Run a coroutine to completion on the thread's event loop
+
+        Returns:
+            The coroutine's result
+        """
+        self.start()
+        loop = self._current.loop
+        try:
+            return loop.run_until_complete(coro)
+        finally:
+            # Tasks left behind by this run must not leak into the next one
+            pending = [task for task in asyncio.all_tasks(loop) if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+
+    def shutdown(self) -> None:
+        """Dispose every thread's engine and close their loops"""
+        with self._lock:
+            runtimes, self._runtimes = self._runtimes, []
+        self._local = threading.local()
+        if not runtimes:
+            return
+        for runtime in runtimes:
+            try:
+                runtime.loop.run_until_complete(runtime.engine.dispose())
+                runtime.loop.run_until_complete(runtime.loop.shutdown_asyncgens())
+            except Exception as e:
+                logger.warning(f"[WORKER RUNTIME] Error while disposing the database pool: {str(e)}")
+            finally:
+                runtime.loop.close()
+        sync_engine.dispose()
+        logger.info(f"[WORKER RUNTIME] Disposed {len(runtimes)} event loop(s) and database pool(s)")
+
+
+# Singleton instance
+worker_runtime = WorkerRuntime()
+
+
+@worker_process_init.connect
+def _start_worker_process(**kwargs):
+    # Connections opened by the parent must not be shared with forked children
+    sync_engine.dispose(close=False)
+    worker_runtime.start()
+
+
+@worker_process_shutdown.connect
+def _stop_worker_process(**kwargs):
+    worker_runtime.shutdown()
+
+
+@worker_shutdown.connect
+def _stop_worker(**kwargs):
+    # Threads and solo pools run tasks in the main process
+    worker_runtime.shutdown()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Script to compare the in-process header reader with ffprobe.
+
+Reads every file in a corpus directory with both paths, prints the
+duration each one reports and the average time per call.
+
+Usage:
+    python scripts/benchmark_media_duration.py <corpus_dir> [--iterations 5]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.media_headers import read_media_info
+from app.services.media_service import media_probe, MediaProbeError
+
+
+async def time_ffprobe(file_path: str, iterations: int):
+    """Return (duration, seconds per call) for ffprobe"""
+    duration = None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            duration = (await media_probe.probe_with_ffprobe(file_path))['duration_seconds']
+        except MediaProbeError:
+            duration = None
+    return duration, (time.perf_counter() - start) / iterations
+
+
+def time_headers(file_path: str, iterations: int):
+    """Return (duration, seconds per call) for the header reader"""
+    info = None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        info = read_media_info(file_path)
+    return (info['duration_seconds'] if info else None), (time.perf_counter() - start) / iterations
+
+
+def format_duration(duration):
+    """Format a duration for the table ('-' if unknown)"""
+    return f"{duration:.2f}" if duration is not None else "-"
+
+
+async def benchmark(corpus_dir: str, iterations: int):
+    """Run both readers over every file in the corpus"""
+    files = sorted(
+        os.path.join(corpus_dir, name) for name in os.listdir(corpus_dir)
+        if os.path.isfile(os.path.join(corpus_dir, name))
+    )
+    if not files:
+        print(f"No files found in {corpus_dir}")
+        return
+
+    total_headers = 0.0
+    total_ffprobe = 0.0
+    header_hits = 0
+
+    print(f"{'file':40} {'headers (s)':>12} {'ffprobe (s)':>12} {'headers ms':>11} {'ffprobe ms':>11}")
+    for file_path in files:
+        header_duration, header_time = time_headers(file_path, iterations)
+        ffprobe_duration, ffprobe_time = await time_ffprobe(file_path, iterations)
+
+        total_headers += header_time
+        total_ffprobe += ffprobe_time
+        header_hits += header_duration is not None
+
+        print(
+            f"{os.path.basename(file_path)[:40]:40} "
+            f"{format_duration(header_duration):>12} "
+            f"{format_duration(ffprobe_duration):>12} "
+            f"{header_time * 1000:>11.2f} {ffprobe_time * 1000:>11.2f}"
+        )
+
+    print("\n" + "=" * 50)
+    print(f"Files: {len(files)} (header reader handled {header_hits})")
+    print(f"Header reader: {total_headers * 1000 / len(files):.2f} ms/file")
+    print(f"ffprobe:       {total_ffprobe * 1000 / len(files):.2f} ms/file")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark media duration readers")
+    parser.add_argument("corpus_dir", help="Directory of sample media files")
+    parser.add_argument("--iterations", type=int, default=5, help="Calls per file and reader")
+    args = parser.parse_args()
+
+    asyncio.run(benchmark(args.corpus_dir, args.iterations))
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark the tolerant note parser on a corpus of model outputs.
+
+For every sample it reports whether strict json.loads accepts it, whether
+the tolerant parser recovered a note, and the average time per parse.
+Defaults to the malformed-output corpus used by the tests.
+
+Usage:
+    python scripts/benchmark_note_parser.py [corpus_dir] [--iterations 200]
+"""
+
+import sys
+import os
+import json
+import time
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.note_stream_parser import parse_note_output
+
+DEFAULT_CORPUS = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tests", "fixtures", "model_outputs"
+)
+
+
+def time_call(func, text: str, iterations: int):
+    """Return (last result or exception, seconds per call)"""
+    result = None
+    start = time.perf_counter()
+    for _ in range(iterations):
+        try:
+            result = func(text)
+        except ValueError as e:
+            result = e
+    return result, (time.perf_counter() - start) / iterations
+
+
+def benchmark(corpus_dir: str, iterations: int):
+    """Run strict and tolerant parsing over every sample"""
+    files = sorted(
+        name for name in os.listdir(corpus_dir)
+        if name.endswith(".txt") and os.path.isfile(os.path.join(corpus_dir, name))
+    )
+    if not files:
+        print(f"No .txt samples found in {corpus_dir}")
+        return
+
+    recovered = 0
+    strict_ok = 0
+    total_chars = 0
+    total_seconds = 0.0
+
+    print(f"{'sample':36} {'chars':>7} {'json.loads':>10} {'tolerant':>9} {'µs/parse':>9}")
+    for name in files:
+        with open(os.path.join(corpus_dir, name), encoding="utf-8") as f:
+            text = f.read()
+
+        strict_result, _ = time_call(json.loads, text, 1)
+        (fields, complete), seconds = time_call(parse_note_output, text, iterations)
+
+        strict_ok += not isinstance(strict_result, ValueError)
+        recovered += bool(fields.get("note"))
+        total_chars += len(text)
+        total_seconds += seconds
+
+        status = ("complete" if complete else "partial") if fields.get("note") else "failed"
+        print(
+            f"{name[:36]:36} {len(text):>7} "
+            f"{'ok' if not isinstance(strict_result, ValueError) else 'error':>10} "
+            f"{status:>9} {seconds * 1e6:>9.1f}"
+        )
+
+    print("\n" + "=" * 50)
+    print(f"Samples: {len(files)}")
+    print(f"json.loads accepted: {strict_ok}")
+    print(f"Tolerant parser recovered a note: {recovered}")
+    print(f"Throughput: {total_chars / total_seconds / 1024 / 1024:.1f} MB/s")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the tolerant note parser")
+    parser.add_argument("corpus_dir", nargs="?", default=DEFAULT_CORPUS, help="Directory of raw model outputs (.txt)")
+    parser.add_argument("--iterations", type=int, default=200, help="Parses per sample")
+    args = parser.parse_args()
+
+    benchmark(args.corpus_dir, args.iterations)
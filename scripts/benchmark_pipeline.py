@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark note generation against the fake AI provider.
+
+Runs many notes through process_files_with_gemini concurrently, with the
+fake provider's latency and fault settings, and reports throughput,
+latency percentiles and how the notes ended. No API key or spend needed;
+fault rates can be overridden on the command line.
+
+Usage:
+    python scripts/benchmark_pipeline.py [files...] [--notes 50] [--concurrency 10]
+        [--failure-rate 0.0] [--rate-limit-rate 0.0] [--truncation-rate 0.0]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+
+settings.AI_PROVIDER = "fake"
+
+from app.services.ai_provider import get_ai_provider
+from app.services.ai_service import process_files_with_gemini
+
+
+async def run_note(files, semaphore, results):
+    """Process one note and record its outcome and duration"""
+    async with semaphore:
+        started = time.perf_counter()
+        try:
+            result = await process_files_with_gemini(files)
+            outcome = "partial" if result.get("partial") else "ok"
+        except Exception as e:
+            outcome = type(e).__name__
+        results.append((outcome, time.perf_counter() - started))
+
+
+async def benchmark(files, notes: int, concurrency: int):
+    """Run the notes and print a summary"""
+    semaphore = asyncio.Semaphore(concurrency)
+    results = []
+    started = time.perf_counter()
+    await asyncio.gather(*(run_note(files, semaphore, results) for _ in range(notes)))
+    elapsed = time.perf_counter() - started
+
+    durations = sorted(seconds for _, seconds in results)
+    outcomes = {}
+    for outcome, _ in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+    print("\n" + "=" * 50)
+    print(f"Notes: {notes} (concurrency {concurrency}, {len(files)} file(s) each)")
+    print(f"Elapsed: {elapsed:.1f}s - {notes / elapsed * 60:.1f} notes/minute")
+    print(
+        f"Latency p50: {durations[len(durations) // 2]:.2f}s  "
+        f"p95: {durations[min(int(len(durations) * 0.95), len(durations) - 1)]:.2f}s  "
+        f"max: {durations[-1]:.2f}s"
+    )
+    for outcome, count in sorted(outcomes.items()):
+        print(f"  {outcome}: {count}")
+    provider = get_ai_provider()
+    # Unwrap the rate limiter, if enabled
+    print(f"Provider calls: {getattr(provider, 'provider', provider).calls}")
+    print("=" * 50)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark note generation with the fake AI provider")
+    parser.add_argument("files", nargs="*", help="Input files for every note (default: one small generated file)")
+    parser.add_argument("--notes", type=int, default=50, help="Notes to process")
+    parser.add_argument("--concurrency", type=int, default=10, help="Notes processed at once")
+    parser.add_argument("--failure-rate", type=float, help="Override FAKE_AI_FAILURE_RATE")
+    parser.add_argument("--rate-limit-rate", type=float, help="Override FAKE_AI_RATE_LIMIT_RATE")
+    parser.add_argument("--truncation-rate", type=float, help="Override FAKE_AI_TRUNCATION_RATE")
+    args = parser.parse_args()
+
+    if args.failure_rate is not None:
+        settings.FAKE_AI_FAILURE_RATE = args.failure_rate
+    if args.rate_limit_rate is not None:
+        settings.FAKE_AI_RATE_LIMIT_RATE = args.rate_limit_rate
+    if args.truncation_rate is not None:
+        settings.FAKE_AI_TRUNCATION_RATE = args.truncation_rate
+
+    input_files = args.files
+    if not input_files:
+        # Plain text passes through preparation untouched
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".txt")
+        with os.fdopen(temp_fd, "w") as f:
+            f.write("benchmark input\n" * 100)
+        input_files = [temp_path]
+
+    try:
+        asyncio.run(benchmark(input_files, args.notes, args.concurrency))
+    finally:
+        if not args.files:
+            os.remove(input_files[0])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Script to benchmark the worker's per-task overhead with the fake AI provider.
+
+Runs the same simulated note task - two database round trips around a note
+generated by the fake provider - one after another, the way a worker
+process handles its tasks, in two modes:
+
+- per-task:   a new event loop and async engine for every task, disposed
+              afterwards (how tasks used to run)
+- persistent: the worker process's loop and pooled engine (worker_runtime)
+
+and reports tasks/second for both. Point --database-url at the production
+database type (MySQL) for realistic connection costs; fake AI latency is 0
+by default so the overhead is what gets measured.
+
+Usage:
+    python scripts/benchmark_worker.py [--tasks 200] [--database-url URL] [--ai-latency 0.0]
+"""
+
+import sys
+import os
+import time
+import asyncio
+import argparse
+import tempfile
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.core.config import settings
+from app.worker.worker_runtime import WorkerRuntime
+
+settings.AI_PROVIDER = "fake"
+settings.AI_RATE_LIMIT_ENABLED = False
+
+
+async def note_task(session_factory, files):
+    """Database work and generation of one note"""
+    async with session_factory() as db:
+        await db.execute(text("SELECT 1"))  # credits check
+    from app.services.ai_service import process_files_with_gemini
+    await process_files_with_gemini(files)
+    async with session_factory() as db:
+        await db.execute(text("SELECT 1"))  # refund / bookkeeping
+
+
+def run_per_task(files, tasks: int) -> float:
+    """Old behaviour: loop and engine built and torn down for every task"""
+    started = time.perf_counter()
+    for _ in range(tasks):
+        async def run():
+            engine = create_async_engine(settings.DATABASE_URL, echo=False, pool_pre_ping=True)
+            try:
+                await note_task(async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False), files)
+            finally:
+                await engine.dispose()
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(run())
+        finally:
+            loop.close()
+    return time.perf_counter() - started
+
+
+def run_persistent(files, tasks: int) -> float:
+    """New behaviour: one loop and pooled engine for the whole process"""
+    runtime = WorkerRuntime()
+    runtime.start()
+    try:
+        started = time.perf_counter()
+        for _ in range(tasks):
+            runtime.run(note_task(runtime.session_factory, files))
+        return time.perf_counter() - started
+    finally:
+        runtime.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark per-task vs persistent worker runtime")
+    parser.add_argument("--tasks", type=int, default=200, help="Tasks per mode")
+    parser.add_argument("--database-url", help="Override DATABASE_URL (async driver URL)")
+    parser.add_argument("--ai-latency", type=float, default=0.0, help="Fake generation latency in seconds")
+    args = parser.parse_args()
+
+    if args.database_url:
+        settings.DATABASE_URL = args.database_url
+    settings.FAKE_AI_GENERATE_LATENCY_SECONDS = args.ai_latency
+    settings.FAKE_AI_UPLOAD_LATENCY_SECONDS = 0.0
+    settings.FAKE_AI_FILE_PROCESSING_SECONDS = 0.0
+    settings.FAKE_AI_CHUNK_LATENCY_SECONDS = 0.0
+    settings.FAKE_AI_FAILURE_RATE = 0.0
+    settings.FAKE_AI_RATE_LIMIT_RATE = 0.0
+    settings.FAKE_AI_TRUNCATION_RATE = 0.0
+
+    # Plain text passes through preparation untouched
+    temp_fd, temp_path = tempfile.mkstemp(suffix=".txt")
+    with os.fdopen(temp_fd, "w") as f:
+        f.write("benchmark input\n" * 100)
+
+    try:
+        per_task = run_per_task([temp_path], args.tasks)
+        persistent = run_persistent([temp_path], args.tasks)
+    finally:
+        os.remove(temp_path)
+
+    print("\n" + "=" * 50)
+    print(f"Tasks per mode: {args.tasks} (fake AI latency {args.ai_latency}s)")
+    print(f"Per-task loop and engine:   {args.tasks / per_task:.1f} tasks/s ({per_task / args.tasks * 1000:.1f} ms/task)")
+    print(f"Persistent loop and engine: {args.tasks / persistent:.1f} tasks/s ({persistent / args.tasks * 1000:.1f} ms/task)")
+    print(f"Speedup: {per_task / persistent:.2f}x")
+    print("=" * 50)
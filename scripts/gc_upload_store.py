@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Script to delete stored upload files that no Upload or UploadSession row references.
+
+Uploads are stored once per distinct content under UPLOAD_DIR/objects and
+shared between notes, so a file may only be removed when its reference
+count (rows pointing at its storage_path) drops to zero.
+Files younger than the grace period are kept because a request may have
+stored them but not yet committed its Upload row.
+
+Usage:
+    python scripts/gc_upload_store.py [--dry-run] [--grace-hours 24]
+"""
+
+import sys
+import os
+import argparse
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.config import settings
+from app.db.session import SyncSessionLocal
+from app.db.models import Upload, UploadSession
+from app.services.storage_service import upload_storage
+from sqlalchemy import select
+
+
+def collect_stored_files():
+    """Yield every file under the temporary and object directories"""
+    for sub_dir in (upload_storage.TMP_DIR, upload_storage.OBJECTS_DIR):
+        root = os.path.join(settings.UPLOAD_DIR, sub_dir)
+        for dir_path, _, file_names in os.walk(root):
+            for file_name in file_names:
+                yield os.path.join(dir_path, file_name)
+
+
+def gc_upload_store(dry_run: bool, grace_hours: int):
+    """Remove unreferenced stored files older than the grace period"""
+    db = SyncSessionLocal()
+
+    try:
+        referenced = set(db.execute(select(Upload.storage_path)).scalars().all())
+        referenced.update(db.execute(select(UploadSession.storage_path)).scalars().all())
+        referenced = {os.path.normpath(p) for p in referenced}
+
+        print(f"Found {len(referenced)} referenced storage paths")
+
+        removed_count = 0
+        removed_bytes = 0
+
+        for file_path in collect_stored_files():
+            if os.path.normpath(file_path) in referenced:
+                continue
+            if not upload_storage.is_older_than(file_path, grace_hours * 3600):
+                continue
+
+            size = os.path.getsize(file_path)
+            if dry_run:
+                print(f"  Would remove {file_path} ({size} bytes)")
+            else:
+                upload_storage.remove_file(file_path)
+                print(f"  ✓ Removed {file_path} ({size} bytes)")
+            removed_count += 1
+            removed_bytes += size
+
+        print("\n" + "=" * 50)
+        print(f"{'Dry run' if dry_run else 'Cleanup'} complete!")
+        print(f"  Files: {removed_count}")
+        print(f"  Space: {removed_bytes / (1024 * 1024):.1f} MB")
+        print("=" * 50)
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Garbage collect unreferenced uploads")
+    parser.add_argument("--dry-run", action="store_true", help="Only list files that would be removed")
+    parser.add_argument("--grace-hours", type=int, default=24, help="Keep files younger than this")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("Collecting unreferenced uploads...")
+    print("=" * 50 + "\n")
+    gc_upload_store(args.dry_run, args.grace_hours)
@@ -0,0 +1,167 @@
+"""
+Test Cases for the AI rate limiter
+"""
+import pytest
+
+from app.core.config import settings
+from app.services import ai_rate_limiter as rate_limiter_module
+from app.services.ai_provider import GenerationResult, RemoteFile, FileState
+from app.services.ai_rate_limiter import (
+    AIRateLimiter,
+    AIRateLimitTimeout,
+    RateLimitedProvider,
+    is_rate_limit_error,
+)
+from app.services.fake_ai_provider import FakeAIError
+
+
+class BrokenRedis:
+    """Redis client whose every call fails"""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("Redis is down")
+        return fail
+
+
+class ScriptedLimiter(AIRateLimiter):
+    """Limiter whose acquire script answers from a list of (granted, wait) replies"""
+
+    def __init__(self, replies):
+        super().__init__()
+        self.replies = list(replies)
+        self.acquired = []
+        self.adjustments = []
+        self.reconciled = []
+        self._scripts = {'acquire': self._acquire, 'adjust': self._adjust_multiplier}
+
+    def _acquire(self, keys, args):
+        self.acquired.append((keys[0], args))
+        return self.replies.pop(0)
+
+    def _adjust_multiplier(self, keys, args):
+        self.adjustments.append(args[0])
+        return "0.5" if args[0] == 'throttled' else "1"
+
+    def reconcile(self, model_name, estimated_tokens, actual_tokens):
+        self.reconciled.append((estimated_tokens, actual_tokens))
+
+
+class StubProvider:
+    """Provider returning a fixed result or raising an error"""
+
+    name = 'stub'
+
+    def __init__(self, error=None):
+        self.error = error
+
+    def generate(self, model_name, contents, **kwargs):
+        if self.error:
+            raise self.error
+        return GenerationResult(text='{}', usage={'prompt_tokens': 1200})
+
+    def chat(self, model_name, system_instruction, history, message):
+        return GenerationResult(text='answer', usage={'prompt_tokens': 50})
+
+    async def chat_async(self, model_name, system_instruction, history, message):
+        return self.chat(model_name, system_instruction, history, message)
+
+
+class TestAIRateLimiter:
+    """Test waiting, lanes and failure handling"""
+
+    def test_waits_until_granted(self, monkeypatch):
+        """Test a denied call sleeps for the reported time and tries again"""
+        sleeps = []
+        monkeypatch.setattr(rate_limiter_module.time, "sleep", sleeps.append)
+        limiter = ScriptedLimiter([[0, "0.5"], [1, "0"]])
+
+        limiter.acquire("gemini-2.5-flash", "batch", 1000)
+
+        assert len(limiter.acquired) == 2
+        assert 0.5 <= sleeps[0] <= 0.6
+
+    def test_lanes_reserve_headroom_for_chat(self, monkeypatch):
+        """Test only the batch lane leaves the chat reserve untouched"""
+        monkeypatch.setattr(settings, "AI_RATE_LIMIT_CHAT_RESERVE", 0.2)
+        limiter = ScriptedLimiter([[1, "0"], [1, "0"]])
+
+        limiter.acquire("m", "batch", 10)
+        limiter.acquire("m", "chat", 10)
+
+        assert [args[3] for _, args in limiter.acquired] == [0.2, 0.0]
+        assert limiter.acquired[0][0] == "neviso:ai_rate_limit:m:bucket"
+
+    def test_gives_up_after_max_wait(self, monkeypatch):
+        """Test a lane that would wait too long raises instead of sleeping"""
+        monkeypatch.setattr(settings, "AI_RATE_LIMIT_CHAT_MAX_WAIT_SECONDS", 5)
+        limiter = ScriptedLimiter([[0, "30"]])
+
+        with pytest.raises(AIRateLimitTimeout):
+            limiter.acquire("m", "chat", 10)
+
+    def test_redis_errors_allow_the_call(self):
+        """Test the limiter fails open when Redis is unavailable"""
+        limiter = AIRateLimiter()
+        limiter._redis_client = BrokenRedis()
+
+        assert limiter.acquire("m", "batch", 10) >= 0
+        assert limiter.record_throttled("m") is None
+
+    def test_rate_limit_errors_are_recognised(self):
+        """Test 429s are told apart from other API errors"""
+        assert is_rate_limit_error(FakeAIError("429 Resource has been exhausted (e.g. check quota)."))
+        assert not is_rate_limit_error(FakeAIError("503 The service is currently unavailable."))
+
+
+class TestRateLimitedProvider:
+    """Test the provider wrapper feeds outcomes back to the limiter"""
+
+    def test_success_increases_and_reconciles(self):
+        """Test a successful call is recorded and its real token count applied"""
+        limiter = ScriptedLimiter([[1, "0"]])
+        provider = RateLimitedProvider(StubProvider(), limiter)
+
+        provider.generate("m", ["x" * 400])
+
+        assert limiter.adjustments == ['success']
+        assert limiter.reconciled == [(100, 1200)]
+
+    def test_429_decreases(self):
+        """Test a quota error from the API shrinks the shared limit"""
+        limiter = ScriptedLimiter([[1, "0"]])
+        provider = RateLimitedProvider(StubProvider(FakeAIError("429 Resource has been exhausted")), limiter)
+
+        with pytest.raises(FakeAIError):
+            provider.generate("m", "prompt")
+
+        assert limiter.adjustments == ['throttled']
+
+    def test_chat_uses_chat_lane(self):
+        """Test chat calls are not held back by the batch reserve"""
+        limiter = ScriptedLimiter([[1, "0"]])
+        provider = RateLimitedProvider(StubProvider(), limiter)
+
+        assert provider.chat("m", "system", [], "question").text == 'answer'
+        assert limiter.acquired[0][1][3] == 0.0
+
+    def test_file_estimate(self, monkeypatch):
+        """Test uploaded files count with the configured estimate"""
+        monkeypatch.setattr(settings, "AI_RATE_LIMIT_FILE_TOKENS", 8000)
+        remote_file = RemoteFile(name="files/a", state=FileState.ACTIVE)
+
+        assert RateLimitedProvider.estimate_tokens(["abcd" * 10, remote_file], "sys!") == 8011
+
+    @pytest.mark.asyncio
+    async def test_async_chat_waits_without_blocking(self, monkeypatch):
+        """Test async chat sleeps with asyncio while waiting for capacity"""
+        monkeypatch.setattr(rate_limiter_module.time, "sleep", lambda seconds: pytest.fail("blocking sleep"))
+        limiter = ScriptedLimiter([[0, "0.05"], [1, "0"]])
+        provider = RateLimitedProvider(StubProvider(), limiter)
+
+        result = await provider.chat_async("m", "system", [], "question")
+
+        assert result.text == 'answer'
+        assert result.rate_limit_wait_seconds >= 0.05
+        assert limiter.adjustments == ['success']
+        assert limiter.reconciled == [(len("system") // 4 + len("question") // 4, 50)]
@@ -0,0 +1,137 @@
+"""
+Test Cases for AI Service file handling
+"""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_service
+from app.services.ai_service import (
+    upload_file_to_gemini,
+    wait_for_file_ready,
+    stitch_continuation,
+    is_max_tokens
+)
+from app.services.ai_provider import FinishReason, GenerationResult
+from app.services.exceptions import ContentGenerationError, QuotaExceededError
+
+
+def remote_file(name, state):
+    """Minimal stand-in for a File API handle"""
+    return SimpleNamespace(name=name, state=SimpleNamespace(name=state))
+
+
+class TestFileUpload:
+    """Test concurrent upload and readiness polling"""
+
+    @pytest.mark.asyncio
+    async def test_uploads_run_concurrently_within_limit(self, monkeypatch):
+        """Test uploads overlap but never exceed the semaphore"""
+        running = 0
+        peak = 0
+
+        def fake_upload(path, mime_type):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            time.sleep(0.05)
+            running -= 1
+            return remote_file(f"files/{path}", "ACTIVE")
+
+        monkeypatch.setattr(ai_service, "get_ai_provider", lambda: SimpleNamespace(upload_file=fake_upload))
+        semaphore = asyncio.Semaphore(2)
+
+        results = await asyncio.gather(*(
+            upload_file_to_gemini(f"{i}.ogg", False, f"{i}.ogg", i, 4, semaphore) for i in range(4)
+        ))
+
+        assert [f.name for f, _ in results] == [f"files/{i}.ogg" for i in range(4)]
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_upload_errors_are_classified(self, monkeypatch):
+        """Test quota errors from the SDK become QuotaExceededError"""
+        def fake_upload(path, mime_type):
+            raise RuntimeError("429 Resource has been exhausted (quota exceeded)")
+
+        monkeypatch.setattr(ai_service, "get_ai_provider", lambda: SimpleNamespace(upload_file=fake_upload))
+
+        with pytest.raises(QuotaExceededError):
+            await upload_file_to_gemini("a.ogg", False, "a.ogg", 1, 1, asyncio.Semaphore(1))
+
+    @pytest.mark.asyncio
+    async def test_polling_backs_off(self, monkeypatch):
+        """Test readiness polling doubles its delay"""
+        states = iter(["PROCESSING", "PROCESSING", "ACTIVE"])
+        delays = []
+
+        async def fake_sleep(seconds):
+            delays.append(seconds)
+
+        monkeypatch.setattr(settings, "GEMINI_FILE_POLL_INITIAL_SECONDS", 0.5)
+        monkeypatch.setattr(ai_service.asyncio, "sleep", fake_sleep)
+        monkeypatch.setattr(
+            ai_service, "get_ai_provider",
+            lambda: SimpleNamespace(get_file=lambda name: remote_file(name, next(states)))
+        )
+
+        ready, _ = await wait_for_file_ready(remote_file("files/a", "PROCESSING"), 1, time.monotonic() + 30)
+
+        assert ready.state.name == "ACTIVE"
+        assert delays == [0.5, 1.0, 2.0]
+
+    @pytest.mark.asyncio
+    async def test_failed_processing_raises(self):
+        """Test a file Gemini could not process stops the note"""
+        with pytest.raises(ContentGenerationError):
+            await wait_for_file_ready(remote_file("files/a", "FAILED"), 1, time.monotonic() + 30)
+
+
+class TestContinuation:
+    """Test stitching output truncated at MAX_TOKENS"""
+
+    def test_stitch_drops_repeated_text(self):
+        """Test text the model repeated is not duplicated"""
+        previous = '{"title": "t", "note": "<p>The budget for the next quarter'
+        continuation = 'budget for the next quarter was approved.</p>"}'
+
+        assert stitch_continuation(previous, continuation) == (
+            '{"title": "t", "note": "<p>The budget for the next quarter was approved.</p>"}'
+        )
+
+    def test_stitch_drops_code_fence(self):
+        """Test a continuation opened with a code fence is joined cleanly"""
+        assert stitch_continuation('{"note": "<p>ab', '```json\ncd</p>"}') == '{"note": "<p>abcd</p>"}'
+
+    def test_content_parts_label_files(self):
+        """Test labels are sent right before their files"""
+        parts = ai_service.build_content_parts(
+            "Make a note", ["audio", "frame"], [None, "Keyframe shown at 01:15 of the audio track:"]
+        )
+
+        assert parts == ["Make a note", "audio", "Keyframe shown at 01:15 of the audio track:", "frame"]
+
+    def test_is_max_tokens(self):
+        """Test truncated responses are recognised by finish reason"""
+        assert is_max_tokens(GenerationResult(text='{"note": "<p>a', finish_reason=FinishReason.MAX_TOKENS))
+        assert not is_max_tokens(GenerationResult(text='{}', finish_reason=FinishReason.STOP))
+        assert not is_max_tokens(GenerationResult(text='', finish_reason=FinishReason.OTHER))
+
+
+class TestPromptVersion:
+    """Test the result cache fingerprint"""
+
+    def test_segmented_ignores_speech_optimization(self):
+        """Test segmented notes share a version whether or not speech optimization is on"""
+        assert ai_service.get_prompt_version(True, segmented=True) == ai_service.get_prompt_version(False, segmented=True)
+        assert ai_service.get_prompt_version(True) != ai_service.get_prompt_version(False)
+
+    def test_segmented_follows_silence_detection(self, monkeypatch):
+        """Test changing where segments are cut invalidates segmented results"""
+        before = ai_service.get_prompt_version(segmented=True)
+        monkeypatch.setattr(settings, "SPEECH_MIN_SILENCE_SECONDS", settings.SPEECH_MIN_SILENCE_SECONDS + 1)
+
+        assert ai_service.get_prompt_version(segmented=True) != before
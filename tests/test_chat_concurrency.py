@@ -0,0 +1,90 @@
+"""
+Test Cases for chat concurrency (retrieval pool and async chat)
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.core.config import settings
+from app.services.chat_concurrency import ChatConcurrency
+from app.services.fake_ai_provider import FakeAIProvider
+
+
+async def count_ticks(stop: asyncio.Event) -> int:
+    """Event loop iterations until stop is set (stays 0 if the loop is blocked)"""
+    ticks = 0
+    while not stop.is_set():
+        await asyncio.sleep(0.01)
+        ticks += 1
+    return ticks
+
+
+class TestChatConcurrency:
+    """Test the retrieval pool and chat counters"""
+
+    @pytest.mark.asyncio
+    async def test_retrieval_is_bounded_and_off_the_loop(self, monkeypatch):
+        """Test retrieval runs in at most RAG_RETRIEVAL_WORKERS threads while the loop keeps running"""
+        monkeypatch.setattr(settings, "RAG_RETRIEVAL_WORKERS", 2)
+        concurrency = ChatConcurrency()
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def search(query):
+            with lock:
+                running.append(query)
+                peak.append(len(running))
+            time.sleep(0.1)
+            with lock:
+                running.remove(query)
+            return threading.current_thread().name
+
+        stop = asyncio.Event()
+        ticker = asyncio.create_task(count_ticks(stop))
+        names = await asyncio.gather(*(concurrency.run_retrieval(search, q) for q in range(4)))
+        stop.set()
+
+        assert max(peak) == 2
+        assert all(name.startswith('rag-retrieval') for name in names)
+        assert await ticker >= 5
+        stats = concurrency.get_stats()
+        assert stats['retrieval_completed'] == 4
+        assert stats['retrieval_running'] == 0 and stats['retrieval_queued'] == 0
+        assert stats['avg_retrieval_queue_seconds'] > 0
+
+    @pytest.mark.asyncio
+    async def test_chat_counters(self):
+        """Test finished and failed chats are counted and in-flight returns to zero"""
+        concurrency = ChatConcurrency()
+
+        async with concurrency.track_chat():
+            assert concurrency.get_stats()['chats_in_flight'] == 1
+        with pytest.raises(ValueError):
+            async with concurrency.track_chat():
+                raise ValueError("model error")
+
+        stats = concurrency.get_stats()
+        assert stats['chats_in_flight'] == 0
+        assert stats['chats_peak'] == 1
+        assert stats['chats_completed'] == 1
+        assert stats['chats_failed'] == 1
+
+    @pytest.mark.asyncio
+    async def test_async_chat_does_not_block_the_loop(self, monkeypatch):
+        """Test concurrent chat answers overlap instead of running one after another"""
+        monkeypatch.setattr(settings, "FAKE_AI_GENERATE_LATENCY_SECONDS", 0.2)
+        monkeypatch.setattr(settings, "FAKE_AI_FAILURE_RATE", 0)
+        monkeypatch.setattr(settings, "FAKE_AI_RATE_LIMIT_RATE", 0)
+        provider = FakeAIProvider(seed=1)
+
+        started = time.monotonic()
+        answers = await asyncio.gather(*(
+            provider.chat_async("m", "system", [], f"question {i}") for i in range(5)
+        ))
+
+        assert time.monotonic() - started < 0.5
+        assert all(answer.text.startswith("Fake answer to: question") for answer in answers)
+        assert provider.calls['chat'] == 5
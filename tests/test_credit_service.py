@@ -323,4 +323,57 @@ class TestCreditCalculation:
 
         assert credits == settings.IMAGE_CREDIT_COST
 
-    # Note: Audio/video tests would require actual files or mocking ffprobe
+    @pytest.mark.asyncio
+    async def test_calculate_audio_credits_from_stored_duration(self):
+        """Test stored duration is used without probing the file"""
+        credits = await credit_manager.calculate_file_credits(
+            "/path/to/missing.mp3",
+            "audio/mpeg",
+            duration_seconds=90
+        )
+
+        assert credits == 1.5
+
+    def test_estimate_upload_credits_skips_unknown_duration(self):
+        """Test estimate ignores files whose duration could not be probed"""
+        from app.core.config import settings
+
+        estimate = credit_manager.estimate_upload_credits([
+            ("audio/mpeg", 120),
+            ("audio/ogg", None),
+            ("image/png", None)
+        ])
+
+        assert estimate == 2.0 + settings.IMAGE_CREDIT_COST
+
+    # Note: Audio/video tests without a stored duration would require actual files or mocking ffprobe
+
+
+class TestNoteCharge:
+    """Test what a note has already paid"""
+
+    @pytest.mark.asyncio
+    async def test_note_charge_nets_refunds(self):
+        """Test deductions minus refunds of one note only"""
+        engine = create_async_engine(TEST_DATABASE_URL, echo=False)
+        async with engine.begin() as conn:
+            await conn.run_sync(CreditTransaction.__table__.create)
+        AsyncSessionLocal = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async with AsyncSessionLocal() as session:
+            for i, (note_id, transaction_type, amount) in enumerate([
+                (5, TransactionType.deduct, 30), (5, TransactionType.deduct, 10),
+                (6, TransactionType.deduct, 20), (6, TransactionType.refund, 20),
+                (7, TransactionType.purchase, 100),
+            ], 1):
+                session.add(CreditTransaction(
+                    id=i, user_id=1, note_id=note_id, transaction_type=transaction_type,
+                    amount=amount, balance_before=0, balance_after=0
+                ))
+            await session.commit()
+
+            assert await credit_manager.get_note_charge(session, 5) == 40.0
+            assert await credit_manager.get_note_charge(session, 6) == 0.0
+            assert await credit_manager.get_note_charge(session, 7) == 0.0
+
+        await engine.dispose()
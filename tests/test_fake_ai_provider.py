@@ -0,0 +1,132 @@
+"""
+Test Cases for the fake AI provider
+"""
+import json
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_service
+from app.services.ai_provider import FileState, FinishReason
+from app.services.fake_ai_provider import FakeAIError, FakeAIProvider
+from app.services.exceptions import QuotaExceededError
+
+
+@pytest.fixture(autouse=True)
+def no_latency(monkeypatch):
+    """Fake provider without delays or faults unless a test asks for them"""
+    for name in (
+        "FAKE_AI_UPLOAD_LATENCY_SECONDS", "FAKE_AI_FILE_PROCESSING_SECONDS",
+        "FAKE_AI_GENERATE_LATENCY_SECONDS", "FAKE_AI_CHUNK_LATENCY_SECONDS",
+        "FAKE_AI_FAILURE_RATE", "FAKE_AI_RATE_LIMIT_RATE", "FAKE_AI_TRUNCATION_RATE",
+    ):
+        monkeypatch.setattr(settings, name, 0)
+
+
+@pytest.fixture
+def uploaded(tmp_path):
+    """A provider with one uploaded file"""
+    path = tmp_path / "lecture.ogg"
+    path.write_bytes(b"fake audio" * 100)
+    provider = FakeAIProvider(seed=1)
+    return provider, provider.upload_file(str(path), "audio/ogg")
+
+
+class TestFakeAIProvider:
+    """Test the offline provider behaves like the File API and model"""
+
+    def test_generation_is_deterministic(self, uploaded):
+        """Test the same request gets the same note"""
+        provider, remote_file = uploaded
+
+        first = provider.generate("model", ["Make a note", remote_file])
+        second = provider.generate("model", ["Make a note", remote_file])
+
+        assert first.text == second.text
+        assert first.finish_reason == FinishReason.STOP
+        assert json.loads(first.text)["note"].startswith("<h2>")
+        assert first.usage["output_tokens"] > 0
+
+    def test_stream_matches_generate(self, uploaded):
+        """Test the streamed chunks add up to the full answer"""
+        provider, remote_file = uploaded
+
+        stream = provider.stream_generate("model", ["Make a note", remote_file])
+        text = "".join(stream)
+
+        assert text == provider.generate("model", ["Make a note", remote_file]).text
+        assert stream.result().finish_reason == FinishReason.STOP
+
+    def test_file_processing_state(self, uploaded, monkeypatch, tmp_path):
+        """Test uploads are PROCESSING until the configured delay passed"""
+        provider, remote_file = uploaded
+        assert remote_file.state == FileState.ACTIVE
+
+        monkeypatch.setattr(settings, "FAKE_AI_FILE_PROCESSING_SECONDS", 60)
+        path = tmp_path / "slide.png"
+        path.write_bytes(b"png")
+        assert provider.upload_file(str(path), "image/png").state == FileState.PROCESSING
+
+        provider.delete_file(remote_file.name)
+        with pytest.raises(FakeAIError):
+            provider.get_file(remote_file.name)
+
+    def test_rate_limit_burst(self, uploaded, monkeypatch):
+        """Test a 429 burst fails the configured number of consecutive calls"""
+        provider, remote_file = uploaded
+        monkeypatch.setattr(settings, "FAKE_AI_RATE_LIMIT_RATE", 1.0)
+        monkeypatch.setattr(settings, "FAKE_AI_RATE_LIMIT_BURST", 3)
+
+        for _ in range(3):
+            with pytest.raises(FakeAIError, match="429"):
+                provider.generate("model", ["Make a note", remote_file])
+        assert provider.calls["generate"] == 3
+
+    def test_truncation_and_continuation(self, uploaded, monkeypatch):
+        """Test a truncated answer is completed by a continuation request"""
+        provider, remote_file = uploaded
+        full = provider.generate("model", ["Make a note", remote_file]).text
+        monkeypatch.setattr(settings, "FAKE_AI_TRUNCATION_RATE", 1.0)
+
+        truncated = provider.generate("model", ["Make a note", remote_file])
+        continuation = provider.generate("model", ai_service.build_continuation_contents(
+            ["Make a note", remote_file], truncated.text
+        ))
+
+        assert truncated.finish_reason == FinishReason.MAX_TOKENS
+        assert continuation.finish_reason == FinishReason.STOP
+        assert truncated.text + continuation.text == full
+
+
+class TestPipelineWithFakeProvider:
+    """Test note generation end to end without the live API"""
+
+    @pytest.mark.asyncio
+    async def test_truncated_note_is_continued(self, monkeypatch, tmp_path):
+        """Test a note cut at MAX_TOKENS comes back complete"""
+        provider = FakeAIProvider(seed=3)
+        monkeypatch.setattr(ai_service, "get_ai_provider", lambda: provider)
+        monkeypatch.setattr(settings, "FAKE_AI_TRUNCATION_RATE", 1.0)
+        monkeypatch.setattr(settings, "IMAGE_OPTIMIZATION_ENABLED", False)
+        path = tmp_path / "board.png"
+        path.write_bytes(b"not really a png")
+
+        result = await ai_service.process_files_with_gemini([str(path)])
+
+        assert result["title"].startswith("Fake note")
+        assert result["note"].count("<h2>") >= 2
+        assert not result.get("partial")
+        assert provider.calls["upload"] == 1
+
+    @pytest.mark.asyncio
+    async def test_quota_errors_are_classified(self, monkeypatch, tmp_path):
+        """Test an injected 429 surfaces as QuotaExceededError"""
+        provider = FakeAIProvider(seed=3)
+        monkeypatch.setattr(ai_service, "get_ai_provider", lambda: provider)
+        monkeypatch.setattr(settings, "FAKE_AI_RATE_LIMIT_RATE", 1.0)
+        monkeypatch.setattr(settings, "IMAGE_OPTIMIZATION_ENABLED", False)
+        path = tmp_path / "board.png"
+        path.write_bytes(b"not really a png")
+
+        with pytest.raises(QuotaExceededError):
+            await ai_service.process_files_with_gemini([str(path)])
@@ -177,3 +177,11 @@ public class A {
         # Content preserved
         assert 'public class A' in result
         assert 'System.out.println' in result
+
+    def test_repair_truncated_html(self):
+        """Test HTML cut off mid-tag is closed properly"""
+        html = '<h1>Meeting</h1><ul><li>x &amp; y</li><li><strong>Ali:</str'
+
+        result = html_processor.repair_truncated_html(html)
+
+        assert result == '<h1>Meeting</h1><ul><li>x &amp; y</li><li><strong>Ali:</strong></li></ul>'
@@ -0,0 +1,102 @@
+"""
+Test Cases for Image Optimizer
+"""
+import os
+import pytest
+
+from app.core.config import settings
+from app.services.image_optimizer import optimize_image, detect_document_box
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def webp_output(monkeypatch):
+    """Default optimization settings"""
+    monkeypatch.setattr(settings, "IMAGE_MAX_EDGE", 1024)
+    monkeypatch.setattr(settings, "IMAGE_OUTPUT_FORMAT", "webp")
+    monkeypatch.setattr(settings, "IMAGE_QUALITY", 80)
+    monkeypatch.setattr(settings, "IMAGE_DOCUMENT_CROP", False)
+
+
+class TestOptimizeImage:
+    """Test image normalization before upload"""
+
+    def test_rotates_downscales_and_strips_exif(self, tmp_path, webp_output):
+        """Test EXIF orientation is applied and metadata dropped"""
+        source = tmp_path / "board.jpg"
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Rotated 90° clockwise
+        Image.new("RGB", (4000, 3000), "white").save(source, exif=exif)
+
+        path, is_temporary = optimize_image(str(source))
+
+        assert is_temporary
+        with Image.open(path) as optimized:
+            assert optimized.format == "WEBP"
+            assert optimized.size == (768, 1024)
+            assert 0x0112 not in optimized.getexif()
+        os.remove(path)
+
+    def test_original_fallback_drops_metadata(self, tmp_path, webp_output):
+        """Test a photo that re-encoding cannot shrink is still sent without EXIF/GPS"""
+        source = tmp_path / "slide.jpg"
+        exif = Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        exif.get_ifd(0x8825)[2] = (35.0, 41.0, 0.0)  # GPSLatitude
+        # Noise at low quality: WebP at IMAGE_QUALITY comes out larger
+        Image.effect_noise((64, 64), 100).convert("RGB").save(source, quality=10, exif=exif)
+
+        path, is_temporary = optimize_image(str(source))
+
+        assert is_temporary and path != str(source)
+        with Image.open(path) as stripped:
+            assert stripped.format == "JPEG"
+            assert stripped.size == (64, 64)
+            assert not stripped.getexif()
+        os.remove(path)
+
+    def test_keeps_original_without_metadata(self, tmp_path, webp_output):
+        """Test a small image without metadata is uploaded as is"""
+        source = tmp_path / "slide.jpg"
+        Image.effect_noise((64, 64), 100).convert("RGB").save(source, quality=10)
+
+        assert optimize_image(str(source)) == (str(source), False)
+
+    def test_keeps_animated_original(self, tmp_path, webp_output):
+        """Test animated images are uploaded as is"""
+        source = tmp_path / "slides.gif"
+        frames = [Image.new("RGB", (64, 64), color) for color in ("red", "blue")]
+        frames[0].save(source, save_all=True, append_images=frames[1:])
+
+        path, is_temporary = optimize_image(str(source))
+
+        assert (path, is_temporary) == (str(source), False)
+
+    def test_crops_document(self, tmp_path, webp_output, monkeypatch):
+        """Test the photo is cropped to the board when enabled"""
+        monkeypatch.setattr(settings, "IMAGE_DOCUMENT_CROP", True)
+        source = tmp_path / "board.png"
+        photo = Image.new("RGB", (1000, 800), (20, 20, 20))
+        photo.paste(Image.new("RGB", (600, 400), (240, 240, 240)), (200, 200))
+        photo.save(source)
+
+        path, is_temporary = optimize_image(str(source))
+
+        with Image.open(path) as optimized:
+            assert abs(optimized.width - 600) < 20
+            assert abs(optimized.height - 400) < 20
+        os.remove(path)
+
+
+def test_detect_document_box():
+    """Test a bright board on a dark background is found"""
+    photo = Image.new("RGB", (1000, 800), (20, 20, 20))
+    photo.paste(Image.new("RGB", (600, 400), (240, 240, 240)), (200, 200))
+
+    box = detect_document_box(photo)
+
+    assert box is not None
+    left, top, right, bottom = box
+    assert abs(left - 200) < 20 and abs(top - 200) < 20
+    assert abs(right - 800) < 20 and abs(bottom - 600) < 20
@@ -0,0 +1,129 @@
+"""
+Test Cases for Container Header Duration Reader
+"""
+import struct
+import wave
+
+import pytest
+
+from app.services.media_headers import read_media_info
+
+
+def _write(path, data: bytes):
+    path.write_bytes(data)
+    return str(path)
+
+
+def _mp3_frame(payload: bytes = b"") -> bytes:
+    """MPEG1 Layer III, 128 kbps, 44.1 kHz, stereo, no padding (417 bytes)"""
+    header = bytes([0xFF, 0xFB, 0x90, 0x00])
+    return header + payload.ljust(417 - 4, b"\x00")
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def _ogg_page(serial: int, granule: int, packet: bytes, header_type: int = 0) -> bytes:
+    return (
+        b"OggS" + bytes([0, header_type]) + struct.pack("<qIII", granule, serial, 0, 0)
+        + bytes([1, len(packet)]) + packet
+    )
+
+
+def _ebml(element_id: bytes, payload: bytes) -> bytes:
+    # One-byte sizes are enough for these small fixtures
+    return element_id + bytes([0x80 | len(payload)]) + payload
+
+
+class TestReadMediaInfo:
+    """Test duration read from container headers"""
+
+    def test_wav(self, tmp_path):
+        """Test WAV duration from data size and byte rate"""
+        path = str(tmp_path / "a.wav")
+        with wave.open(path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(8000)
+            w.writeframes(b"\x00\x00" * 8000 * 3)
+
+        info = read_media_info(path)
+
+        assert info["duration_seconds"] == pytest.approx(3.0)
+        assert info["codec"] == "pcm_s16le"
+        assert info["bitrate"] == 128000
+
+    def test_mp3_cbr(self, tmp_path):
+        """Test CBR MP3 duration estimated from the first frame's bitrate"""
+        frames = _mp3_frame() * 100
+        id3 = b"ID3\x03\x00\x00\x00\x00\x00\x0a" + b"\x00" * 10
+        path = _write(tmp_path / "a.mp3", id3 + frames)
+
+        info = read_media_info(path)
+
+        assert info["duration_seconds"] == pytest.approx(len(frames) * 8 / 128000)
+        assert info["codec"] == "mp3"
+
+    def test_mp3_xing(self, tmp_path):
+        """Test VBR MP3 duration from the Xing frame count"""
+        xing = b"\x00" * 32 + b"Xing" + struct.pack(">II", 0x01, 1000)
+        path = _write(tmp_path / "a.mp3", _mp3_frame(xing) + _mp3_frame() * 10)
+
+        info = read_media_info(path)
+
+        assert info["duration_seconds"] == pytest.approx(1000 * 1152 / 44100)
+
+    def test_mp4_mvhd(self, tmp_path):
+        """Test MP4 duration from mvhd, with moov after mdat"""
+        mvhd = _box(b"mvhd", b"\x00\x00\x00\x00" + struct.pack(">IIII", 0, 0, 1000, 90500) + b"\x00" * 80)
+        data = _box(b"ftyp", b"M4A \x00\x00\x00\x00") + _box(b"mdat", b"\x00" * 512) + _box(b"moov", mvhd)
+        path = _write(tmp_path / "a.m4a", data)
+
+        info = read_media_info(path)
+
+        assert info["duration_seconds"] == pytest.approx(90.5)
+
+    def test_ogg_opus(self, tmp_path):
+        """Test Opus duration from the last page granule minus pre-skip"""
+        head = b"OpusHead" + bytes([1, 1]) + struct.pack("<HI", 312, 48000) + b"\x00\x00\x00"
+        data = (
+            _ogg_page(7, 0, head, header_type=2)
+            + _ogg_page(7, 48000, b"\x00" * 50)
+            + _ogg_page(7, 48000 * 5 + 312, b"\x00" * 50, header_type=4)
+        )
+        path = _write(tmp_path / "a.opus", data)
+
+        info = read_media_info(path)
+
+        assert info["duration_seconds"] == pytest.approx(5.0)
+        assert info["codec"] == "opus"
+
+    def test_webm_duration(self, tmp_path):
+        """Test Matroska duration from Segment Info"""
+        header = _ebml(b"\x1a\x45\xdf\xa3", _ebml(b"\x42\x82", b"webm"))
+        info_element = _ebml(
+            b"\x15\x49\xa9\x66",
+            _ebml(b"\x2a\xd7\xb1", struct.pack(">I", 1000000)) + _ebml(b"\x44\x89", struct.pack(">d", 12345.0))
+        )
+        segment = b"\x18\x53\x80\x67" + b"\x01\xff\xff\xff\xff\xff\xff\xff" + info_element
+        path = _write(tmp_path / "a.webm", header + segment)
+
+        info = read_media_info(path)
+
+        assert info["duration_seconds"] == pytest.approx(12.345)
+
+    def test_webm_without_duration_falls_back(self, tmp_path):
+        """Test recordings without a Duration element return None"""
+        header = _ebml(b"\x1a\x45\xdf\xa3", _ebml(b"\x42\x82", b"webm"))
+        info_element = _ebml(b"\x15\x49\xa9\x66", _ebml(b"\x2a\xd7\xb1", struct.pack(">I", 1000000)))
+        segment = b"\x18\x53\x80\x67" + b"\x01\xff\xff\xff\xff\xff\xff\xff" + info_element
+        path = _write(tmp_path / "a.webm", header + segment)
+
+        assert read_media_info(path) is None
+
+    def test_unknown_container(self, tmp_path):
+        """Test unknown files return None so ffprobe is used"""
+        path = _write(tmp_path / "a.bin", b"\x00" * 1024)
+
+        assert read_media_info(path) is None
@@ -0,0 +1,166 @@
+"""
+Test Cases for the staged note pipeline
+"""
+from unittest.mock import patch
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.models import NotePipelineState
+from app.services.pipeline_state_service import pipeline_state
+from app.worker import note_pipeline
+from app.worker.celery_app import NOTE_PIPELINE_ROUTES
+
+
+@pytest.fixture
+def db():
+    """SQLite session with the pipeline state table"""
+    engine = create_engine("sqlite:///:memory:")
+    NotePipelineState.__table__.create(engine)
+    session = sessionmaker(engine)()
+    yield session
+    session.close()
+    engine.dispose()
+
+
+@pytest.fixture
+def stages(db, monkeypatch):
+    """Replace stage bodies and tasks with recorders"""
+    ran = []
+    dispatched = []
+
+    def fake_run_stage(stage, state):
+        ran.append(stage)
+        if state.get('stop_at') == stage:
+            return None
+        return dict(state, last=stage)
+
+    class FakeTask:
+        def __init__(self, stage):
+            self.stage = stage
+
+        def delay(self, state):
+            dispatched.append((self.stage, state['last']))
+
+    monkeypatch.setattr(note_pipeline, 'run_stage', fake_run_stage)
+    monkeypatch.setattr(note_pipeline, 'SyncSessionLocal', lambda: db)
+    monkeypatch.setattr(db, 'close', lambda: None)
+    monkeypatch.setattr(
+        note_pipeline, 'STAGE_TASKS', {stage: FakeTask(stage) for stage in note_pipeline.STAGE_TASKS}
+    )
+    return ran, dispatched
+
+
+class TestNotePipeline:
+    """Test how a note moves between stages"""
+
+    def test_staged_dispatches_next_stage(self, stages, monkeypatch):
+        """Test a stage hands the note to the next stage's task"""
+        monkeypatch.setattr(settings, 'NOTE_PIPELINE_STAGED', True)
+        ran, dispatched = stages
+
+        note_pipeline.start_note_pipeline(5)
+
+        assert ran == ['preprocess']
+        assert dispatched == [('ai_generate', 'preprocess')]
+
+    def test_unstaged_runs_every_stage_in_order(self, stages, monkeypatch):
+        """Test all stages run in-process when staging is off"""
+        monkeypatch.setattr(settings, 'NOTE_PIPELINE_STAGED', False)
+        ran, dispatched = stages
+
+        note_pipeline.start_note_pipeline(5)
+
+        assert ran == note_pipeline.STAGES
+        assert dispatched == []
+
+    def test_stage_can_stop_the_note(self, stages, monkeypatch):
+        """Test a stage returning None ends the pipeline"""
+        monkeypatch.setattr(settings, 'NOTE_PIPELINE_STAGED', False)
+        ran, dispatched = stages
+
+        note_pipeline.advance('preprocess', {'note_id': 5, 'stop_at': 'ai_generate'})
+
+        assert ran == ['preprocess', 'ai_generate']
+        assert dispatched == []
+
+    def test_every_stage_has_a_queue(self):
+        """Test each stage task is routed to its own queue"""
+        queues = [route['queue'] for route in NOTE_PIPELINE_ROUTES.values()]
+
+        assert queues == note_pipeline.STAGES
+        assert set(note_pipeline.STAGE_TASKS) == set(note_pipeline.STAGES[1:])
+        assert all(task.name in NOTE_PIPELINE_ROUTES for task in note_pipeline.STAGE_TASKS.values())
+
+    def test_failed_index_keeps_the_note_completed(self, db, monkeypatch):
+        """Test errors after the note is saved skip retry handling and go on to notify"""
+        fakeredis = pytest.importorskip("fakeredis")
+        # The queue manager connects its singleton on import
+        with patch("redis.from_url", lambda *args, **kwargs: fakeredis.FakeRedis(decode_responses=True)):
+            from app.services import queue_service  # noqa: F401
+        handled = []
+
+        async def broken_index(db, state):
+            raise RuntimeError("vector store is down")
+
+        async def handle_processing_error(*args):
+            handled.append(args)
+
+        monkeypatch.setitem(note_pipeline.STAGE_FUNCTIONS, 'index', broken_index)
+        monkeypatch.setattr(note_pipeline, 'handle_processing_error', handle_processing_error)
+        monkeypatch.setattr(note_pipeline, 'SyncSessionLocal', lambda: db)
+        state = {'note_id': 5, 'user_id': 1}
+
+        assert note_pipeline.run_stage('index', state) == state
+        assert handled == []
+        assert pipeline_state.load(db, 5)[0] == 'index'
+
+    def test_prepared_files_move_to_work_dir(self, tmp_path, monkeypatch):
+        """Test temporary files are moved and original uploads left in place"""
+        monkeypatch.setattr(settings, 'UPLOAD_DIR', str(tmp_path))
+        original = tmp_path / 'lecture.m4a'
+        converted = tmp_path / 'tmp_converted.ogg'
+        extra = tmp_path / 'tmp_part.ogg'
+        for path in (original, converted, extra):
+            path.write_bytes(b'audio')
+        work_dir = note_pipeline.get_work_dir(5)
+
+        moved = note_pipeline._move_to_work_dir(
+            {'path': str(converted), 'is_temporary': True, 'extra_paths': [str(extra)]}, work_dir
+        )
+        kept = note_pipeline._move_to_work_dir({'path': str(original), 'is_temporary': False}, work_dir)
+
+        assert moved['path'].startswith(work_dir) and not converted.exists()
+        assert moved['extra_paths'][0].startswith(work_dir) and not extra.exists()
+        assert kept['path'] == str(original) and original.exists()
+
+
+class TestPipelineState:
+    """Test checkpoints and resuming from them"""
+
+    def test_save_overwrites_previous_stage(self, db):
+        """Test a note keeps only its latest checkpoint"""
+        assert pipeline_state.load(db, 5) is None
+
+        pipeline_state.save(db, 5, 'preprocess', {'note_id': 5, 'prepared': [None]})
+        pipeline_state.save(db, 5, 'ai_generate', {'note_id': 5, 'output': {'title': 't', 'note': 'n'}})
+        pipeline_state.mark_resumed(db, 5)
+
+        assert pipeline_state.load(db, 5) == ('ai_generate', {'note_id': 5, 'output': {'title': 't', 'note': 'n'}}, 1)
+
+        pipeline_state.clear(db, 5)
+        assert pipeline_state.load(db, 5) is None
+
+    def test_retry_resumes_after_completed_stage(self, db, stages, monkeypatch):
+        """Test a retried note skips the stages it already completed"""
+        monkeypatch.setattr(settings, 'NOTE_PIPELINE_STAGED', True)
+        ran, dispatched = stages
+        pipeline_state.save(db, 5, 'preprocess', {'note_id': 5, 'last': 'preprocess'})
+
+        note_pipeline.start_note_pipeline(5)
+
+        assert ran == []
+        assert dispatched == [('ai_generate', 'preprocess')]
+        assert pipeline_state.load(db, 5)[2] == 1
@@ -0,0 +1,71 @@
+"""
+Test Cases for Note Stream Parser
+"""
+import json
+import os
+
+from app.services.note_stream_parser import NoteEnvelopeParser, parse_note_output
+
+CORPUS_DIR = os.path.join(os.path.dirname(__file__), "fixtures", "model_outputs")
+
+
+NOTE = {
+    "title": "جلسه \"بودجه\" 😀",
+    "note": "<h1 class=\"main\">سلام</h1>\n<p>C:\\\\temp</p>",
+}
+
+
+def feed_in_chunks(text, size):
+    """Feed text to a new parser in fixed-size chunks"""
+    parser = NoteEnvelopeParser()
+    for start in range(0, len(text), size):
+        parser.feed(text[start:start + size])
+    return parser
+
+
+class TestNoteEnvelopeParser:
+    """Test incremental decoding of the streamed envelope"""
+
+    def test_any_chunking_gives_same_result(self):
+        """Test escapes split across chunks are decoded correctly"""
+        for ensure_ascii in (True, False):
+            text = "```json\n" + json.dumps(NOTE, ensure_ascii=ensure_ascii) + "\n```"
+            for size in (1, 2, 3, 7, len(text)):
+                parser = feed_in_chunks(text, size)
+
+                assert parser.complete
+                assert parser.result() == NOTE
+
+    def test_partial_stream_keeps_what_arrived(self):
+        """Test a stream cut short still yields the title and partial note"""
+        text = json.dumps({"title": "Lecture 5", "note": "<h1>Trees</h1><p>A binary tree"})
+        parser = feed_in_chunks(text[:-10], 4)
+
+        assert not parser.complete
+        assert parser.get("title") == "Lecture 5"
+        assert parser.get("note") == "<h1>Trees</h1><p>A bin"
+
+    def test_non_string_values_are_skipped(self):
+        """Test numbers, arrays and objects do not confuse the parser"""
+        text = '{"n": 3, "tags": ["a", "}"], "meta": {"x": "\\""}, "note": "<p>ok</p>"}'
+        parser = feed_in_chunks(text, 5)
+
+        assert parser.complete
+        assert parser.result() == {"note": "<p>ok</p>"}
+
+
+class TestMalformedOutputCorpus:
+    """Test recovery of broken model answers collected in tests/fixtures/model_outputs"""
+
+    def test_corpus(self):
+        """Test every sample parses to its expected fields"""
+        with open(os.path.join(CORPUS_DIR, "expected.json"), encoding="utf-8") as f:
+            expected = json.load(f)
+
+        for name, fields in expected.items():
+            with open(os.path.join(CORPUS_DIR, name), encoding="utf-8") as f:
+                result, complete = parse_note_output(f.read())
+
+            fields = dict(fields)
+            assert complete == fields.pop("complete"), name
+            assert result == fields, name
@@ -0,0 +1,216 @@
+"""
+Test Cases for claiming tasks and leasing processing slots
+"""
+import asyncio
+import time
+from unittest.mock import patch
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.db.models import ProcessingQueue, QueueStatus
+
+fakeredis = pytest.importorskip("fakeredis")
+
+# The module connects its singleton on import
+with patch("redis.from_url", lambda *args, **kwargs: fakeredis.FakeRedis(decode_responses=True)):
+    from app.services.queue_service import QueueManager
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    """SQLite sessions with the processing_queue table"""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        await conn.run_sync(ProcessingQueue.__table__.create)
+    yield sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    await engine.dispose()
+
+
+@pytest.fixture
+def manager():
+    """Queue manager on an empty fake Redis"""
+    with patch("redis.from_url", lambda *args, **kwargs: fakeredis.FakeRedis(decode_responses=True)):
+        return QueueManager()
+
+
+def live_lease(manager, note_id, seconds=600):
+    manager.redis_client.zadd(manager.LEASES_KEY, {str(note_id): time.time() + seconds})
+
+
+async def enqueue(session_factory, manager, note_id, score, status=QueueStatus.waiting):
+    async with session_factory() as db:
+        db.add(ProcessingQueue(id=note_id, note_id=note_id, user_id=1, priority=0, status=status))
+        await db.commit()
+    manager.redis_client.zadd(manager.QUEUE_KEY, {str(note_id): score})
+
+
+class TestClaimTasks:
+    """Test atomic claims"""
+
+    @pytest.mark.asyncio
+    async def test_batch_claim_respects_capacity_and_priority(self, session_factory, manager, monkeypatch):
+        """Test a batch takes the highest scores and only the free slots"""
+        monkeypatch.setattr(settings, "MAX_CONCURRENT_PROCESSING", 3)
+        live_lease(manager, 99)
+        for note_id, score in ((1, 10), (2, 30), (3, 20), (4, 5)):
+            await enqueue(session_factory, manager, note_id, score)
+
+        async with session_factory() as db:
+            tasks = await manager.claim_tasks(db, 5)
+
+        assert [task['note_id'] for task in tasks] == [2, 3]
+        assert manager.count_live_leases() == 3
+        assert manager.redis_client.zrange(manager.QUEUE_KEY, 0, -1) == ['4', '1']
+
+        async with session_factory() as db:
+            assert await manager.get_next_task(db) is None
+
+    @pytest.mark.asyncio
+    async def test_concurrent_dispatchers_never_share_a_note(self, session_factory, manager, monkeypatch):
+        """Test parallel claims split the queue without exceeding capacity"""
+        monkeypatch.setattr(settings, "MAX_CONCURRENT_PROCESSING", 5)
+        for note_id in range(1, 9):
+            await enqueue(session_factory, manager, note_id, note_id)
+
+        async def dispatcher():
+            async with session_factory() as db:
+                return await manager.claim_tasks(db, 2)
+
+        batches = await asyncio.gather(*(dispatcher() for _ in range(4)))
+        claimed = [task['note_id'] for batch in batches for task in batch]
+
+        assert len(claimed) == len(set(claimed)) == 5
+        assert manager.count_live_leases() == 5
+
+    @pytest.mark.asyncio
+    async def test_stale_items_free_their_slots(self, session_factory, manager):
+        """Test notes no longer waiting are dropped without holding a slot"""
+        await enqueue(session_factory, manager, 1, 20, status=QueueStatus.completed)
+        await enqueue(session_factory, manager, 2, 10)
+
+        async with session_factory() as db:
+            tasks = await manager.claim_tasks(db, 2)
+
+        assert [task['note_id'] for task in tasks] == [2]
+        assert manager.count_live_leases() == 1
+        async with session_factory() as db:
+            entry = (await db.execute(select(ProcessingQueue).where(ProcessingQueue.note_id == 2))).scalar_one()
+        assert entry.status == QueueStatus.processing and entry.started_at is not None
+
+    @pytest.mark.asyncio
+    async def test_failed_claim_returns_notes_to_queue(self, session_factory, manager):
+        """Test a database error puts the popped notes back and frees their slots"""
+        await enqueue(session_factory, manager, 1, 20)
+
+        class BrokenSession:
+            async def execute(self, *args, **kwargs):
+                raise RuntimeError("database is gone")
+
+            async def rollback(self):
+                pass
+
+        assert await manager.claim_tasks(BrokenSession(), 1) == []
+        assert manager.redis_client.zscore(manager.QUEUE_KEY, '1') == 20
+        assert manager.count_live_leases() == 0
+
+
+class TestLeases:
+    """Test processing slot leases"""
+
+    @pytest.mark.asyncio
+    async def test_expired_leases_free_capacity(self, session_factory, manager, monkeypatch):
+        """Test a dead worker's lease stops counting once it runs out"""
+        monkeypatch.setattr(settings, "MAX_CONCURRENT_PROCESSING", 1)
+        manager.redis_client.zadd(manager.LEASES_KEY, {'99': 1})
+        await enqueue(session_factory, manager, 1, 10)
+
+        async with session_factory() as db:
+            tasks = await manager.claim_tasks(db, 1)
+
+        assert [task['note_id'] for task in tasks] == [1]
+
+    def test_renew_extends_but_never_shortens_or_revives(self, manager):
+        """Test heartbeats keep the longest lease and ignore released notes"""
+        live_lease(manager, 1)
+        handoff = manager.redis_client.zscore(manager.LEASES_KEY, '1')
+
+        assert manager.renew_lease(1, 5)
+        assert manager.redis_client.zscore(manager.LEASES_KEY, '1') == handoff
+
+        manager.release_leases([1])
+        assert not manager.renew_lease(1)
+        assert manager.count_live_leases() == 0
+
+    def test_hold_lease_heartbeats(self, manager, monkeypatch):
+        """Test the heartbeat renews the lease while the note is processed"""
+        monkeypatch.setattr(settings, "QUEUE_LEASE_HEARTBEAT_SECONDS", 0.01)
+        monkeypatch.setattr(settings, "QUEUE_LEASE_SECONDS", 60)
+        manager.redis_client.zadd(manager.LEASES_KEY, {'1': time.time() + 1})
+
+        with manager.hold_lease(1):
+            time.sleep(0.05)
+
+        assert manager.redis_client.zscore(manager.LEASES_KEY, '1') > time.time() + 50
+
+    @pytest.mark.asyncio
+    async def test_reaper_requeues_expired_notes(self, session_factory, manager, monkeypatch):
+        """Test notes whose lease ran out go back into the queue, or fail after the last retry"""
+        monkeypatch.setattr(settings, "MAX_RETRY_ATTEMPTS", 1)
+        for note_id in (1, 2):
+            await enqueue(session_factory, manager, note_id, 10)
+        async with session_factory() as db:
+            await manager.claim_tasks(db, 2)
+            entry = (await db.execute(select(ProcessingQueue).where(ProcessingQueue.note_id == 2))).scalar_one()
+            entry.retry_count = 1
+            await db.commit()
+        manager.redis_client.zadd(manager.LEASES_KEY, {'1': 1, '2': 1})
+
+        async with session_factory() as db:
+            assert await manager.reap_expired_leases(db) == 2
+
+        async with session_factory() as db:
+            statuses = dict((await db.execute(select(ProcessingQueue.note_id, ProcessingQueue.status))).all())
+        assert statuses == {1: QueueStatus.waiting, 2: QueueStatus.failed}
+        assert manager.redis_client.zrange(manager.QUEUE_KEY, 0, -1) == ['1']
+        assert manager.redis_client.zcard(manager.LEASES_KEY) == 0
+
+    @pytest.mark.asyncio
+    async def test_reaper_keeps_handed_off_notes(self, session_factory, manager):
+        """Test a note waiting for its next stage keeps its slot until a worker picks it up"""
+        await enqueue(session_factory, manager, 1, 10)
+        async with session_factory() as db:
+            await manager.claim_tasks(db, 1)
+        assert manager.hand_off(1, 30)
+        manager.redis_client.zadd(manager.LEASES_KEY, {'1': 1})
+
+        async with session_factory() as db:
+            assert await manager.reap_expired_leases(db) == 0
+        assert manager.count_live_leases() == 1
+
+        with manager.hold_lease(1):
+            pass
+        assert manager.redis_client.hget(manager.HANDOFFS_KEY, '1') is None
+        assert not manager.hand_off(2)
+
+    @pytest.mark.asyncio
+    async def test_reaper_requeues_lost_hand_offs(self, session_factory, manager):
+        """Test a hand-off nobody picked up in time is requeued once its lease runs out"""
+        await enqueue(session_factory, manager, 1, 10)
+        async with session_factory() as db:
+            await manager.claim_tasks(db, 1)
+        manager.hand_off(1)
+        manager.redis_client.hset(manager.HANDOFFS_KEY, '1', 1)
+        manager.redis_client.zadd(manager.LEASES_KEY, {'1': 1})
+
+        async with session_factory() as db:
+            assert await manager.reap_expired_leases(db) == 1
+
+        async with session_factory() as db:
+            entry = (await db.execute(select(ProcessingQueue).where(ProcessingQueue.note_id == 1))).scalar_one()
+        assert entry.status == QueueStatus.waiting
+        assert manager.redis_client.hlen(manager.HANDOFFS_KEY) == 0
@@ -0,0 +1,67 @@
+"""
+Test Cases for Remote File Registry
+"""
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from app.core.config import settings
+from app.services.remote_file_registry import RemoteFileRegistry
+
+
+class BrokenRedis:
+    """Redis client whose every call fails"""
+
+    def __getattr__(self, name):
+        def fail(*args, **kwargs):
+            raise ConnectionError("Redis is down")
+        return fail
+
+
+class StoredEntryRedis:
+    """Redis client returning one stored entry"""
+
+    def __init__(self, entry):
+        self.entry = entry
+
+    def get(self, key):
+        return json.dumps(self.entry)
+
+
+class TestRemoteFileRegistry:
+    """Test keys, expiry and failure handling"""
+
+    def test_fingerprint_depends_on_preparation(self):
+        """Test changed preparation settings do not reuse old uploads"""
+        first = RemoteFileRegistry.build_fingerprint("a" * 64, "prep-1")
+
+        assert first == RemoteFileRegistry.build_fingerprint("a" * 64, "prep-1")
+        assert first != RemoteFileRegistry.build_fingerprint("a" * 64, "prep-2")
+        assert RemoteFileRegistry.build_fingerprint(None, "prep-1") is None
+
+    def test_expiry_is_earliest_handle(self):
+        """Test an entry expires with its first remote file"""
+        soon = datetime.now(timezone.utc) + timedelta(hours=1)
+        later = datetime.now(timezone.utc) + timedelta(hours=40)
+        handles = [SimpleNamespace(expiration_time=later), SimpleNamespace(expiration_time=soon)]
+
+        assert RemoteFileRegistry.expiry_from_handles(handles) == soon.timestamp()
+
+    def test_entry_close_to_expiry_is_not_reused(self, monkeypatch):
+        """Test handles about to expire are uploaded again"""
+        monkeypatch.setattr(settings, "REMOTE_FILE_EXPIRY_MARGIN_SECONDS", 3600)
+        registry = RemoteFileRegistry()
+        registry._redis_client = StoredEntryRedis({'remote_names': ['files/a'], 'expire_at': time.time() + 600})
+
+        assert registry.get(1, "fingerprint") is None
+
+    def test_redis_errors_do_not_raise(self):
+        """Test a Redis outage only disables reuse"""
+        registry = RemoteFileRegistry()
+        registry._redis_client = BrokenRedis()
+
+        assert registry.get(1, "fingerprint") is None
+        registry.register(1, "fingerprint", ["files/a"], time.time() + 7200)
+        registry.forget(1, "fingerprint")
+        assert registry.stale_notes(60) == []
@@ -0,0 +1,93 @@
+"""
+Test Cases for Segmented Processing
+"""
+import pytest
+
+from app.core.config import settings
+from app.services import segmented_processing
+from app.services.segmented_processing import plan_segments, should_segment, extract_headings
+
+
+class TestPlanSegments:
+    """Test choosing cut points for long recordings"""
+
+    def test_cuts_in_nearby_silence(self):
+        """Test cuts land in the silence closest to each mark"""
+        segments = plan_segments(
+            duration_seconds=3600,
+            silences=[(1190.0, 1194.0), (2430.0, 2432.0)],
+            segment_seconds=1200,
+            window_seconds=60
+        )
+
+        assert segments == [(0.0, 1192.0), (1192.0, 2431.0), (2431.0, 3600)]
+
+    def test_hard_cut_without_silence_and_short_tail_folded(self):
+        """Test a hard cut at the mark and no tiny last segment"""
+        segments = plan_segments(
+            duration_seconds=2500,
+            silences=[],
+            segment_seconds=1200,
+            window_seconds=60
+        )
+
+        assert segments == [(0.0, 1200.0), (1200.0, 2500)]
+
+
+class TestShouldSegment:
+    """Test which notes use the segmented pipeline"""
+
+    def test_only_long_audio_only_notes(self, monkeypatch):
+        """Test images or short audio keep the single-call path"""
+        monkeypatch.setattr(settings, "SEGMENTED_PROCESSING_ENABLED", True)
+        monkeypatch.setattr(settings, "SEGMENT_MIN_TOTAL_MINUTES", 45)
+
+        assert should_segment([("a.mp3", "audio/mpeg", 3600)])
+        assert not should_segment([("a.mp3", "audio/mpeg", 600)])
+        assert not should_segment([("a.mp3", "audio/mpeg", 3600), ("b.jpg", "image/jpeg", None)])
+        assert not should_segment([("a.mp3", "audio/mpeg", None)])
+
+
+def test_extract_headings():
+    """Test heading text is extracted without tags"""
+    html = "<h1>Sorting</h1><p>x</p><h2 class='a'>Quick <strong>sort</strong></h2><h3>skip</h3>"
+
+    assert extract_headings(html) == ["Sorting", "Quick sort"]
+
+
+class TestProcessSegmented:
+    """Test merging the parts of a long recording"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("cut_short", [False, True])
+    async def test_partial_part_marks_the_note_partial(self, monkeypatch, tmp_path, cut_short):
+        """Test a part cut short makes the merged note partial"""
+        monkeypatch.setattr(settings, "SEGMENT_MINUTES", 20)
+
+        async def no_silences(path, duration):
+            return []
+
+        async def cut_segment(path, start, end):
+            segment = tmp_path / f"{start:.0f}.ogg"
+            segment.write_bytes(b"audio")
+            return str(segment)
+
+        async def map_segment(index, total, segment, semaphore):
+            part = {'title': f"Part {index}", 'note': f"<h2>Part {index}</h2>"}
+            if cut_short and index == 2:
+                part['partial'] = True
+            return part
+
+        async def reduce(partials):
+            return {'title': "Lecture", 'overview': ""}
+
+        monkeypatch.setattr(segmented_processing, "detect_silences", no_silences)
+        monkeypatch.setattr(segmented_processing, "cut_segment", cut_segment)
+        monkeypatch.setattr(segmented_processing, "_map_segment", map_segment)
+        monkeypatch.setattr(segmented_processing, "_reduce", reduce)
+
+        note = await segmented_processing.process_segmented([("a.mp3", "audio/mpeg", 3600)])
+
+        assert note['note'] == "<h2>Part 1</h2><h2>Part 2</h2><h2>Part 3</h2>"
+        assert note.get('partial', False) is cut_short
+        assert list(tmp_path.iterdir()) == []
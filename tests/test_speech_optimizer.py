@@ -0,0 +1,85 @@
+"""
+Test Cases for Speech Optimizer
+"""
+import pytest
+
+from app.services.speech_optimizer import (
+    parse_silences,
+    build_speech_segments,
+    build_timestamp_map,
+    map_to_source,
+    map_to_output,
+    choose_bitrate,
+    plan_has_speech_optimization
+)
+
+
+SILENCEDETECT_OUTPUT = """
+[silencedetect @ 0x55] silence_start: 10.5
+[silencedetect @ 0x55] silence_end: 20.5 | silence_duration: 10
+[silencedetect @ 0x55] silence_start: 50
+"""
+
+
+class TestSilenceTrimming:
+    """Test turning silencedetect output into speech segments"""
+
+    def test_parse_silences_closes_trailing_silence(self):
+        """Test silence open at end of file ends at the duration"""
+        silences = parse_silences(SILENCEDETECT_OUTPUT, duration_seconds=60)
+
+        assert silences == [(10.5, 20.5), (50.0, 60)]
+
+    def test_segments_are_padded_and_merged(self):
+        """Test padding keeps word edges and merges close segments"""
+        segments = build_speech_segments(
+            [(10.0, 20.0), (20.5, 30.0), (50.0, 60.0)],
+            duration_seconds=60,
+            padding_seconds=0.5
+        )
+
+        assert segments == [(0.0, 10.5), (19.5, 21.0), (29.5, 50.5)]
+
+
+class TestTimestampMap:
+    """Test mapping optimized audio time back to the recording"""
+
+    def test_map_to_source_skips_removed_silence(self):
+        """Test a time after a trimmed pause maps past the pause"""
+        timestamp_map = build_timestamp_map([(0.0, 10.0), (30.0, 40.0)])
+
+        assert map_to_source(5.0, timestamp_map) == pytest.approx(5.0)
+        assert map_to_source(12.0, timestamp_map) == pytest.approx(32.0)
+
+    def test_map_to_source_with_tempo(self):
+        """Test tempo-up is undone when mapping"""
+        timestamp_map = build_timestamp_map([(0.0, 10.0), (30.0, 40.0)], tempo=2.0)
+
+        # Second segment starts at 5s in the 2x audio
+        assert timestamp_map[1]['output_start'] == pytest.approx(5.0)
+        assert map_to_source(6.0, timestamp_map, tempo=2.0) == pytest.approx(32.0)
+
+    def test_map_to_output(self):
+        """Test recording time maps into the optimized audio, pauses to the next segment"""
+        timestamp_map = build_timestamp_map([(0.0, 10.0), (30.0, 40.0)], tempo=2.0)
+
+        assert map_to_output(32.0, timestamp_map, tempo=2.0) == pytest.approx(6.0)
+        assert map_to_output(20.0, timestamp_map, tempo=2.0) == pytest.approx(5.0)
+        assert map_to_output(50.0, timestamp_map, tempo=2.0) == pytest.approx(10.0)
+
+
+class TestSpeechSettings:
+    """Test bitrate choice and plan toggle"""
+
+    def test_choose_bitrate_by_duration(self):
+        """Test longer recordings get lower bitrates"""
+        assert choose_bitrate(10 * 60) == "32k"
+        assert choose_bitrate(45 * 60) == "24k"
+        assert choose_bitrate(3 * 60 * 60) == "16k"
+
+    def test_plan_toggle_dict_and_list(self):
+        """Test both stored shapes of Plan.features"""
+        assert plan_has_speech_optimization({"speech_optimization": True})
+        assert plan_has_speech_optimization(["speech_optimization"])
+        assert not plan_has_speech_optimization({"type": "welcome_bonus"})
+        assert not plan_has_speech_optimization(None)
@@ -0,0 +1,120 @@
+"""
+Test Cases for Upload Storage Service
+"""
+import hashlib
+import io
+import os
+import pytest
+from fastapi import UploadFile
+from starlette.requests import ClientDisconnect
+
+from app.core.config import settings
+from app.services.storage_service import upload_storage, UploadTooLargeError
+
+
+@pytest.fixture
+def upload_dir(tmp_path, monkeypatch):
+    """Point UPLOAD_DIR to a temporary directory"""
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    return tmp_path
+
+
+class TestSaveUploadFile:
+    """Test streaming uploads to disk"""
+
+    @pytest.mark.asyncio
+    async def test_streams_in_chunks(self, upload_dir):
+        """Test file is copied completely with size and checksum"""
+        data = os.urandom(10_000)
+        file = UploadFile(file=io.BytesIO(data), filename="lecture.mp3")
+
+        stored = await upload_storage.save_upload_file(file, chunk_size=1024)
+
+        assert stored['file_size_bytes'] == len(data)
+        assert stored['content_sha256'] == hashlib.sha256(data).hexdigest()
+        assert stored['storage_path'].endswith(f"{stored['content_sha256']}.mp3")
+        with open(stored['storage_path'], 'rb') as f:
+            assert f.read() == data
+
+    @pytest.mark.asyncio
+    async def test_rejects_oversized_file(self, upload_dir):
+        """Test size limit is enforced while streaming and partial file removed"""
+        file = UploadFile(file=io.BytesIO(b"x" * 5000), filename="big.wav")
+
+        with pytest.raises(UploadTooLargeError):
+            await upload_storage.save_upload_file(file, max_size=4096, chunk_size=1024)
+
+        assert os.listdir(upload_dir / "tmp") == []
+
+    @pytest.mark.asyncio
+    async def test_identical_content_stored_once(self, upload_dir):
+        """Test identical uploads share one content-addressed file"""
+        data = os.urandom(2048)
+        first = await upload_storage.save_upload_file(
+            UploadFile(file=io.BytesIO(data), filename="a.mp3")
+        )
+        second = await upload_storage.save_upload_file(
+            UploadFile(file=io.BytesIO(data), filename="b.mp3")
+        )
+
+        assert first['deduplicated'] is False
+        assert second['deduplicated'] is True
+        assert first['storage_path'] == second['storage_path']
+        assert os.listdir(upload_dir / "tmp") == []
+
+
+async def _body(*chunks, disconnect=False):
+    """Request body stream, optionally dropping the connection at the end"""
+    for chunk in chunks:
+        yield chunk
+    if disconnect:
+        raise ClientDisconnect()
+
+
+class TestWriteRange:
+    """Test resumable byte range writes"""
+
+    @pytest.mark.asyncio
+    async def test_writes_at_offset(self, upload_dir):
+        """Test ranges land at their offsets, whatever order they arrive in"""
+        path = str(upload_dir / "tmp" / "part.mp3")
+
+        second = await upload_storage.write_range(path, offset=4, stream=_body(b"efgh"), max_length=4)
+        first = await upload_storage.write_range(path, offset=0, stream=_body(b"ab", b"cd"), max_length=4)
+
+        assert first == {'bytes_written': 4, 'disconnected': False}
+        assert second['bytes_written'] == 4
+        with open(path, 'rb') as f:
+            assert f.read() == b"abcdefgh"
+
+    @pytest.mark.asyncio
+    async def test_resent_range_is_idempotent(self, upload_dir):
+        """Test writing the same range twice leaves the file unchanged"""
+        path = str(upload_dir / "tmp" / "part.mp3")
+
+        for _ in range(2):
+            await upload_storage.write_range(path, offset=0, stream=_body(b"abcd"), max_length=4)
+
+        with open(path, 'rb') as f:
+            assert f.read() == b"abcd"
+
+    @pytest.mark.asyncio
+    async def test_disconnect_keeps_received_bytes(self, upload_dir):
+        """Test a dropped connection is not an error and keeps what arrived"""
+        path = str(upload_dir / "tmp" / "part.mp3")
+
+        written = await upload_storage.write_range(
+            path, offset=0, stream=_body(b"abc", disconnect=True), max_length=10
+        )
+
+        assert written == {'bytes_written': 3, 'disconnected': True}
+        with open(path, 'rb') as f:
+            assert f.read() == b"abc"
+
+    @pytest.mark.asyncio
+    async def test_rejects_body_longer_than_range(self, upload_dir):
+        """Test a body larger than its Content-Range is refused"""
+        path = str(upload_dir / "tmp" / "part.mp3")
+
+        with pytest.raises(UploadTooLargeError):
+            await upload_storage.write_range(path, offset=0, stream=_body(b"abc", b"def"), max_length=4)
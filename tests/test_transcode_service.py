@@ -0,0 +1,75 @@
+"""
+Test Cases for Transcode Pool
+"""
+import asyncio
+import pytest
+
+from app.core.config import settings
+from app.services.transcode_service import transcode_pool
+
+
+@pytest.fixture
+def one_slot(tmp_path, monkeypatch):
+    """Allow a single ffmpeg process in a temporary slot directory"""
+    monkeypatch.setattr(settings, "FFMPEG_SLOT_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "FFMPEG_MAX_CONCURRENCY", 1)
+
+
+class TestTranscodeSlots:
+    """Test host-wide ffmpeg slot limiting"""
+
+    @pytest.mark.asyncio
+    async def test_slots_limit_concurrency(self, one_slot):
+        """Test holders of the only slot run one after another"""
+        running = 0
+        peak = 0
+
+        async def hold_slot():
+            nonlocal running, peak
+            async with transcode_pool.slot():
+                running += 1
+                peak = max(peak, running)
+                await asyncio.sleep(0.05)
+                running -= 1
+
+        await asyncio.gather(hold_slot(), hold_slot(), hold_slot())
+
+        assert peak == 1
+
+    @pytest.mark.asyncio
+    async def test_slot_released_on_error(self, one_slot):
+        """Test a failing holder frees its slot"""
+        with pytest.raises(RuntimeError):
+            async with transcode_pool.slot():
+                raise RuntimeError("ffmpeg crashed")
+
+        async with transcode_pool.slot():
+            pass
+
+
+class TestRunFfmpeg:
+    """Test ffmpeg process handling"""
+
+    @pytest.mark.asyncio
+    async def test_cancel_kills_ffmpeg(self, one_slot, monkeypatch):
+        """Test cancelling the caller kills ffmpeg and frees the slot"""
+        create_subprocess_exec = asyncio.create_subprocess_exec
+        processes = []
+
+        async def fake_ffmpeg(*args, **kwargs):
+            process = await create_subprocess_exec('sleep', '30', **kwargs)
+            processes.append(process)
+            return process
+
+        monkeypatch.setattr(asyncio, "create_subprocess_exec", fake_ffmpeg)
+
+        task = asyncio.create_task(transcode_pool.run_ffmpeg(['-i', 'lecture.mp4'], 'lecture.mp4'))
+        while not processes:
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert processes[0].returncode is not None
+        async with transcode_pool.slot():
+            pass
@@ -0,0 +1,245 @@
+"""
+Test Cases for the Resumable Upload API
+"""
+import hashlib
+import os
+from unittest.mock import patch
+
+import httpx
+import pytest
+import pytest_asyncio
+from fastapi import FastAPI
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.core.config import settings
+from app.core.dependencies import get_current_user_from_cookie
+from app.db.models import Note, Notebook, Upload, UploadSession, User
+from app.db.session import get_db
+
+fakeredis = pytest.importorskip("fakeredis")
+
+# The queue manager connects its singleton on import
+with patch("redis.from_url", lambda *args, **kwargs: fakeredis.FakeRedis(decode_responses=True)):
+    from app.api.v1 import uploads
+    from app.services.queue_service import queue_manager
+
+DATA = b"0123456789abcdef"
+
+
+@pytest_asyncio.fixture
+async def session_factory():
+    """SQLite sessions with the tables the upload endpoints touch"""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with engine.begin() as conn:
+        for model in (Notebook, Note, Upload, UploadSession):
+            await conn.run_sync(model.__table__.create)
+    factory = sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with factory() as db:
+        db.add(Notebook(id=1, user_id=1, title="Physics"))
+        await db.commit()
+    yield factory
+    await engine.dispose()
+
+
+@pytest.fixture
+def submitted(monkeypatch):
+    """Notes sent to the processing queue"""
+    notes = []
+
+    async def submit_note(db, note_id, user_id, estimated_credits=None):
+        notes.append(note_id)
+
+    async def ensure_sufficient_credits(db, user_id, required_credits):
+        return True
+
+    async def check_user_rate_limit(db, user_id):
+        return True
+
+    monkeypatch.setattr(queue_manager, "submit_note", submit_note)
+    monkeypatch.setattr(queue_manager, "check_user_rate_limit", check_user_rate_limit)
+    monkeypatch.setattr(uploads.credit_manager, "ensure_sufficient_credits", ensure_sufficient_credits)
+    return notes
+
+
+@pytest.fixture
+def app(session_factory, submitted, tmp_path, monkeypatch):
+    """Upload router with a test user and database"""
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+
+    async def get_test_db():
+        async with session_factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(uploads.router, prefix="/uploads")
+    app.dependency_overrides[get_db] = get_test_db
+    app.dependency_overrides[get_current_user_from_cookie] = lambda: User(id=1, phone_number="09120000000")
+    return app
+
+
+@pytest_asyncio.fixture
+async def client(app):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        yield client
+
+
+async def create_session(client, size=len(DATA)):
+    response = await client.post(
+        "/uploads/sessions",
+        json={"file_name": "slide.png", "file_type": "image/png", "total_size_bytes": size}
+    )
+    assert response.status_code == 201
+    return response.json()["id"]
+
+
+async def put_range(client, session_id, start, body, total=len(DATA)):
+    return await client.put(
+        f"/uploads/sessions/{session_id}",
+        content=body,
+        headers={"Content-Range": f"bytes {start}-{start + len(body) - 1}/{total}"}
+    )
+
+
+async def put_dropped(app, session_id, start, received, total=len(DATA)):
+    """Send a range whose connection drops after `received` bytes"""
+    messages = [
+        {"type": "http.request", "body": received, "more_body": True},
+        {"type": "http.disconnect"},
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "PUT",
+        "scheme": "http",
+        "path": f"/uploads/sessions/{session_id}",
+        "raw_path": f"/uploads/sessions/{session_id}".encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"content-range", f"bytes {start}-{total - 1}/{total}".encode())],
+        "client": ("test", 1),
+        "server": ("test", 80),
+    }
+    await app(scope, receive, send)
+    return sent[0]["status"]
+
+
+async def finalize(client, session_ids):
+    return await client.post(
+        "/uploads/finalize",
+        json={"title": "Lecture", "notebook_id": 1, "session_ids": session_ids}
+    )
+
+
+class TestUploadChunk:
+    """Test uploading byte ranges"""
+
+    @pytest.mark.asyncio
+    async def test_chunks_complete_the_upload(self, client):
+        """Test the last range moves the file into the store"""
+        session_id = await create_session(client)
+
+        first = await put_range(client, session_id, 0, DATA[:10])
+        last = await put_range(client, session_id, 10, DATA[10:])
+
+        assert first.json()["received_bytes"] == 10 and first.json()["status"] == "uploading"
+        assert last.json()["status"] == "completed"
+        content_sha256 = hashlib.sha256(DATA).hexdigest()
+        with open(os.path.join(settings.UPLOAD_DIR, "objects", content_sha256[:2], f"{content_sha256}.png"), "rb") as f:
+            assert f.read() == DATA
+
+    @pytest.mark.asyncio
+    async def test_out_of_order_range_conflicts(self, client):
+        """Test a range not starting at the offset gets 409 with the offset to resume from"""
+        session_id = await create_session(client)
+        await put_range(client, session_id, 0, DATA[:4])
+
+        ahead = await put_range(client, session_id, 8, DATA[8:])
+        resent = await put_range(client, session_id, 0, DATA[:4])
+
+        for response in (ahead, resent):
+            assert response.status_code == 409
+            assert response.json()["detail"]["received_bytes"] == 4
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("content_range", [
+        "bytes 0-15/32",   # Wrong total
+        "bytes 8-4/16",    # End before start
+        "bytes 0-16/16",   # Past the end
+    ])
+    async def test_unsatisfiable_range(self, client, content_range):
+        """Test ranges that do not fit the file get 416"""
+        session_id = await create_session(client)
+
+        response = await client.put(
+            f"/uploads/sessions/{session_id}", content=DATA, headers={"Content-Range": content_range}
+        )
+
+        assert response.status_code == 416
+
+    @pytest.mark.asyncio
+    async def test_dropped_connection_keeps_received_bytes(self, app, client):
+        """Test the client resumes after the bytes that arrived before the drop"""
+        session_id = await create_session(client)
+
+        assert await put_dropped(app, session_id, 0, DATA[:6]) == 200
+        progress = await client.get(f"/uploads/sessions/{session_id}")
+        resumed = await put_range(client, session_id, 6, DATA[6:])
+
+        assert progress.json()["received_bytes"] == 6
+        assert resumed.json()["status"] == "completed"
+
+    @pytest.mark.asyncio
+    async def test_failed_completion_is_finished_later(self, client, monkeypatch):
+        """Test a session stuck with every byte received completes on the next request"""
+        session_id = await create_session(client)
+
+        async def broken_probe(file_path, file_type):
+            raise RuntimeError("probe crashed")
+
+        with monkeypatch.context() as m:
+            m.setattr(uploads.media_probe, "probe_upload", broken_probe)
+            with pytest.raises(RuntimeError):
+                await put_range(client, session_id, 0, DATA)
+
+        progress = await client.get(f"/uploads/sessions/{session_id}")
+
+        assert progress.json()["status"] == "completed"
+        assert progress.json()["received_bytes"] == len(DATA)
+
+
+class TestFinalizeUpload:
+    """Test turning upload sessions into a note"""
+
+    @pytest.mark.asyncio
+    async def test_finalize_twice_returns_the_same_note(self, client, submitted):
+        """Test a retried finalize does not create or queue a second note"""
+        session_id = await create_session(client)
+        await put_range(client, session_id, 0, DATA)
+
+        first = await finalize(client, [session_id])
+        second = await finalize(client, [session_id])
+
+        assert first.status_code == second.status_code == 201
+        assert first.json()["id"] == second.json()["id"]
+        assert submitted == [first.json()["id"]]
+
+    @pytest.mark.asyncio
+    async def test_incomplete_upload_cannot_be_finalized(self, client, submitted):
+        """Test finalize waits for every byte"""
+        session_id = await create_session(client)
+        await put_range(client, session_id, 0, DATA[:8])
+
+        response = await finalize(client, [session_id])
+
+        assert response.status_code == 409
+        assert submitted == []
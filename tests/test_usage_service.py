@@ -0,0 +1,147 @@
+"""
+Test Cases for AI usage recording
+"""
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services import ai_service
+from app.services.ai_provider import FinishReason, GenerationResult, GenerationStream
+from app.services.fake_ai_provider import FakeAIProvider
+from app.services.usage_service import usage_service
+
+
+class RecordingSession:
+    """Sync session stand-in that keeps added rows"""
+
+    def __init__(self, fail=False):
+        self.rows = []
+        self.fail = fail
+        self.rolled_back = False
+
+    def add_all(self, rows):
+        self.rows.extend(rows)
+
+    def commit(self):
+        if self.fail:
+            raise RuntimeError("database is gone")
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+def result(prompt_tokens=100):
+    return GenerationResult(
+        text='{}',
+        finish_reason=FinishReason.STOP,
+        usage={'prompt_tokens': prompt_tokens, 'audio_tokens': 80, 'output_tokens': 20, 'total_tokens': prompt_tokens + 20},
+        rate_limit_wait_seconds=1.234
+    )
+
+
+class TestUsageService:
+    """Test collecting and saving usage records"""
+
+    def test_record_without_collecting_is_ignored(self):
+        """Test calls outside a note or chat are not kept anywhere"""
+        async def call():
+            usage_service.record('chat', 'model', 'fake', result(), generation_seconds=1.0)
+
+        asyncio.run(call())
+
+    @pytest.mark.asyncio
+    async def test_records_follow_tasks_and_threads(self):
+        """Test calls from gathered tasks and worker threads land in one list"""
+        records = usage_service.start_collecting()
+
+        def in_thread(tokens):
+            usage_service.record('segment', 'model', 'fake', result(tokens), generation_seconds=2.0)
+
+        await asyncio.gather(*(asyncio.to_thread(in_thread, tokens) for tokens in (100, 200)))
+
+        assert sorted(r['prompt_tokens'] for r in records) == [100, 200]
+        assert records[0]['audio_tokens'] == 80
+        assert records[0]['finish_reason'] == 'STOP'
+        assert records[0]['rate_limit_wait_seconds'] == 1.23
+
+    def test_save_sets_queue_wait_once(self):
+        """Test the queue wait of an attempt is stored on its first call only"""
+        records = [
+            {'call_type': 'note', 'model': 'm', 'provider': 'fake', 'generation_seconds': 3.0},
+            {'call_type': 'continuation', 'model': 'm', 'provider': 'fake', 'generation_seconds': 1.0},
+        ]
+        db = RecordingSession()
+
+        assert usage_service.save(db, records, note_id=7, user_id=3, queue_wait_seconds=12.5) == 2
+        assert [row.queue_wait_seconds for row in db.rows] == [12.5, None]
+        assert all(row.note_id == 7 and row.user_id == 3 for row in db.rows)
+        assert records == []
+
+    def test_save_errors_are_swallowed(self):
+        """Test a failing insert never fails the note"""
+        db = RecordingSession(fail=True)
+        records = [{'call_type': 'note', 'model': 'm', 'provider': 'fake', 'generation_seconds': 3.0}]
+
+        assert usage_service.save(db, records, note_id=7) == 0
+        assert db.rolled_back
+
+    @pytest.mark.asyncio
+    async def test_note_generation_is_recorded(self, monkeypatch, tmp_path):
+        """Test a truncated note records its generation and continuation calls"""
+        for name in (
+            "FAKE_AI_UPLOAD_LATENCY_SECONDS", "FAKE_AI_FILE_PROCESSING_SECONDS",
+            "FAKE_AI_GENERATE_LATENCY_SECONDS", "FAKE_AI_CHUNK_LATENCY_SECONDS",
+            "FAKE_AI_FAILURE_RATE", "FAKE_AI_RATE_LIMIT_RATE",
+        ):
+            monkeypatch.setattr(settings, name, 0)
+        monkeypatch.setattr(settings, "FAKE_AI_TRUNCATION_RATE", 1.0)
+        monkeypatch.setattr(settings, "IMAGE_OPTIMIZATION_ENABLED", False)
+        monkeypatch.setattr(ai_service, "get_ai_provider", lambda: FakeAIProvider(seed=5))
+        path = tmp_path / "board.png"
+        path.write_bytes(b"not really a png" * 200)
+
+        records = usage_service.start_collecting()
+        await ai_service.process_files_with_gemini([str(path)])
+
+        assert [r['call_type'] for r in records] == ['note', 'continuation']
+        assert records[0]['finish_reason'] == 'MAX_TOKENS'
+        assert records[0]['upload_seconds'] is not None
+        assert records[1]['upload_seconds'] is None
+        assert all(r['output_tokens'] > 0 for r in records)
+
+    @pytest.mark.asyncio
+    async def test_interrupted_stream_is_recorded(self, monkeypatch, tmp_path):
+        """Test a note kept from a broken stream still records its generation call"""
+        for name in (
+            "FAKE_AI_UPLOAD_LATENCY_SECONDS", "FAKE_AI_FILE_PROCESSING_SECONDS",
+            "FAKE_AI_GENERATE_LATENCY_SECONDS", "FAKE_AI_CHUNK_LATENCY_SECONDS",
+            "FAKE_AI_FAILURE_RATE", "FAKE_AI_RATE_LIMIT_RATE", "FAKE_AI_TRUNCATION_RATE",
+        ):
+            monkeypatch.setattr(settings, name, 0)
+        monkeypatch.setattr(settings, "GEMINI_STREAMING_ENABLED", True)
+        monkeypatch.setattr(settings, "IMAGE_OPTIMIZATION_ENABLED", False)
+
+        class BrokenStreamProvider(FakeAIProvider):
+            def stream_generate(self, *args, **kwargs):
+                stream = super().stream_generate(*args, **kwargs)
+
+                def chunks():
+                    for i, chunk in enumerate(stream):
+                        if i == settings.FAKE_AI_STREAM_CHUNKS // 2:
+                            raise ConnectionError("connection reset")
+                        yield chunk
+
+                return GenerationStream(chunks(), stream.result)
+
+        monkeypatch.setattr(ai_service, "get_ai_provider", lambda: BrokenStreamProvider(seed=5))
+        path = tmp_path / "board.png"
+        path.write_bytes(b"not really a png" * 200)
+
+        records = usage_service.start_collecting()
+        note = await ai_service.process_files_with_gemini([str(path)])
+
+        assert note['partial'] is True
+        assert [r['call_type'] for r in records] == ['note']
+        assert records[0]['finish_reason'] == 'OTHER'
+        assert records[0]['upload_seconds'] is not None
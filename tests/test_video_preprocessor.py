@@ -0,0 +1,125 @@
+"""
+Test Cases for Video Preprocessor
+"""
+import os
+import pytest
+
+from app.core.config import settings
+from app.services import video_preprocessor
+from app.services.video_preprocessor import (
+    parse_frame_times,
+    deduplicate_frames,
+    get_video_policy,
+    preprocess_video
+)
+
+
+SHOWINFO_OUTPUT = """
+[Parsed_showinfo_2 @ 0x55] n:   0 pts:      0 pts_time:0       duration:   512
+[Parsed_showinfo_2 @ 0x55] n:   1 pts: 614400 pts_time:48.5    duration:   512
+"""
+
+
+class TestKeyframes:
+    """Test keyframe timestamps and de-duplication"""
+
+    def test_parse_frame_times(self):
+        """Test showinfo lines give the frame timestamps"""
+        assert parse_frame_times(SHOWINFO_OUTPUT) == [0.0, 48.5]
+
+    def test_deduplicate_frames(self, tmp_path):
+        """Test a slide shown twice is only kept once"""
+        Image = pytest.importorskip("PIL.Image")
+        slide = Image.linear_gradient("L").rotate(90).convert("RGB")
+        other = Image.linear_gradient("L").rotate(-90).convert("RGB")
+        paths = []
+        for i, frame in enumerate([slide, other, slide]):
+            path = str(tmp_path / f"frame-{i}.jpg")
+            frame.save(path)
+            paths.append(path)
+
+        kept = deduplicate_frames(paths)
+
+        assert kept == paths[:2]
+        assert not os.path.exists(paths[2])
+
+
+class TestPolicy:
+    """Test choosing between audio only and audio plus frames"""
+
+    def test_unknown_policy_falls_back_to_auto(self, monkeypatch):
+        """Test a typo in the setting does not disable preprocessing"""
+        monkeypatch.setattr(settings, "VIDEO_PREPROCESSING_POLICY", "frames_only")
+
+        assert get_video_policy() == "auto"
+
+    @pytest.mark.asyncio
+    async def test_auto_drops_static_video_frames(self, tmp_path, monkeypatch):
+        """Test a voice note with one still picture is sent as audio only"""
+        video = tmp_path / "voice.webm"
+        video.write_bytes(b"\0" * 1024)
+        audio = tmp_path / "voice.ogg"
+        audio.write_bytes(b"\0" * 100)
+        frame = tmp_path / "frame.jpg"
+        frame.write_bytes(b"\0" * 10)
+
+        async def fake_audio(file_path, duration_seconds=None):
+            return str(audio)
+
+        async def fake_frames(file_path, duration_seconds=None):
+            return [{'path': str(frame), 'timestamp': 0.0}]
+
+        monkeypatch.setattr(settings, "VIDEO_PREPROCESSING_POLICY", "auto")
+        monkeypatch.setattr(video_preprocessor, "extract_audio_track", fake_audio)
+        monkeypatch.setattr(video_preprocessor, "extract_keyframes", fake_frames)
+
+        result = await preprocess_video(str(video))
+
+        assert result['path'] == str(audio)
+        assert result['extra_paths'] == []
+        assert result['policy'] == 'audio'
+        assert not frame.exists()
+
+    @pytest.mark.asyncio
+    async def test_keyframes_are_labelled_with_audio_time(self, tmp_path, monkeypatch):
+        """Test each keyframe gets its position in the speech-optimized audio"""
+        video = tmp_path / "lecture.mp4"
+        video.write_bytes(b"\0" * 1024)
+        audio = tmp_path / "lecture.ogg"
+        audio.write_bytes(b"\0" * 100)
+        frames = []
+        for i in range(2):
+            frame = tmp_path / f"frame-{i}.jpg"
+            frame.write_bytes(b"\0" * 10)
+            frames.append(str(frame))
+
+        async def fake_speech(file_path, tempo=None):
+            # 20s of silence removed at the start
+            return {'path': str(audio), 'tempo': 1.0, 'timestamp_map': [
+                {'output_start': 0.0, 'source_start': 20.0, 'source_end': 200.0}
+            ]}
+
+        async def fake_frames(file_path, duration_seconds=None):
+            return [{'path': frames[0], 'timestamp': 5.0}, {'path': frames[1], 'timestamp': 95.0}]
+
+        monkeypatch.setattr(settings, "VIDEO_PREPROCESSING_POLICY", "audio_frames")
+        monkeypatch.setattr(video_preprocessor, "read_media_info", lambda path: None)
+        monkeypatch.setattr(video_preprocessor, "extract_keyframes", fake_frames)
+        monkeypatch.setattr("app.services.speech_optimizer.optimize_speech_file", fake_speech)
+
+        result = await preprocess_video(str(video), speech_optimization=True)
+
+        assert result['extra_paths'] == frames
+        assert result['frame_timestamps'] == [0.0, 75.0]
+        assert result['labels'] == [
+            None,
+            "Keyframe shown at 00:00 of the audio track:",
+            "Keyframe shown at 01:15 of the audio track:",
+        ]
+
+    @pytest.mark.asyncio
+    async def test_original_policy_skips_preprocessing(self, tmp_path, monkeypatch):
+        """Test the original policy uploads the video unchanged"""
+        monkeypatch.setattr(settings, "VIDEO_PREPROCESSING_POLICY", "original")
+
+        assert await preprocess_video(str(tmp_path / "lecture.mp4")) is None
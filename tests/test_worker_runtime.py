@@ -0,0 +1,76 @@
+"""
+Test Cases for the per-process worker runtime
+"""
+import asyncio
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from app.core.config import settings
+from app.worker.worker_runtime import WorkerRuntime
+
+
+@pytest.fixture
+def runtime(monkeypatch, tmp_path):
+    """Runtime on a file-backed SQLite database"""
+    monkeypatch.setattr(settings, "DATABASE_URL", f"sqlite+aiosqlite:///{tmp_path / 'worker.db'}")
+    runtime = WorkerRuntime()
+    yield runtime
+    runtime.shutdown()
+
+
+class TestWorkerRuntime:
+    """Test the loop and engine are created once and reused"""
+
+    def test_runs_share_loop_and_engine(self, runtime):
+        """Test consecutive tasks use the same loop and pooled engine"""
+        async def query():
+            async with runtime.session_factory() as db:
+                value = (await db.execute(text("SELECT 1"))).scalar()
+            return value, asyncio.get_running_loop(), runtime.engine
+
+        first = runtime.run(query())
+        second = runtime.run(query())
+
+        assert first[0] == second[0] == 1
+        assert first[1] is second[1]
+        assert first[2] is second[2]
+
+    def test_leftover_tasks_are_cancelled(self, runtime):
+        """Test background tasks of one run do not survive into the next"""
+        leftovers = []
+
+        async def spawn():
+            leftovers.append(asyncio.create_task(asyncio.sleep(60)))
+
+        runtime.run(spawn())
+
+        assert leftovers[0].cancelled()
+
+    def test_shutdown_and_restart(self, runtime):
+        """Test a disposed runtime starts again on next use"""
+        async def noop():
+            return 'done'
+
+        runtime.run(noop())
+        runtime.shutdown()
+        assert not runtime.started
+
+        assert runtime.run(noop()) == 'done'
+        assert runtime.started
+
+    def test_threads_get_their_own_loop(self, runtime):
+        """Test each pool thread runs on its own loop and engine"""
+        async def current():
+            return asyncio.get_running_loop(), runtime.engine
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(runtime.run(current()))) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results[0][0] is not results[1][0]
+        assert results[0][1] is not results[1][1]